@@ -21,8 +21,6 @@ class UserResponse(UserBase):
     is_active: bool = Field(default=True, json_schema_extra={"example": True})
     created_at: datetime
     last_login_at: Optional[datetime] = None
-    api_call_count_today: int = Field(default=0, json_schema_extra={"example": 10})
-    last_api_call_date: Optional[datetime] = None # Store as datetime for ORM compatibility, handle date logic in service
 
     model_config = ConfigDict(from_attributes=True) # Replaces Config class in Pydantic v2
 
@@ -1,12 +1,26 @@
 # app/apis/v1/endpoints/tasks.py
+import json
+from typing import Iterator
 from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi.responses import StreamingResponse
 from celery.result import AsyncResult
 from app.celery_worker import celery_app # Your Celery app instance
 from app.apis.v1.schemas import UserResponse # For auth dependency
 from app.core.dependencies import get_current_active_user # For auth
+from app.core.result_store import (
+    search_result_store, search_progress_counters, is_result_pointer, iter_decoded_json
+)
 
 router = APIRouter()
 
+
+def _stream_stored_result(task_id: str, blob: bytes) -> Iterator[bytes]:
+    """Wrap the stored (compressed) search response in the SUCCESS envelope, decompressing chunk by chunk."""
+    yield b'{"task_id":' + json.dumps(task_id).encode() + b',"status":"SUCCESS","result":'
+    yield from iter_decoded_json(blob)
+    yield b'}'
+
+
 @router.get("/results/{task_id}", summary="Get Celery task status and result", response_model=dict) # Added response_model for clarity
 async def get_task_status_and_result(
     task_id: str,
@@ -24,9 +38,38 @@ async def get_task_status_and_result(
         # You might want to include metadata if your task provides it during STARTED state
         meta = task_result.info if isinstance(task_result.info, dict) else {}
         return {"task_id": task_id, "status": "STARTED", "message": "Task has started processing.", "meta": meta}
+    elif task_result.state == 'PROGRESS':
+        # Search tasks publish progress after the main search and after each probe,
+        # including partial results (direct flights) that can be shown before the task finishes
+        meta = task_result.info if isinstance(task_result.info, dict) else {}
+        progress = dict(meta.get("progress") or {})
+        try:
+            # Probes dispatched as a chord run on other workers and count their progress in Redis
+            progress.update(await search_progress_counters.load(task_id))
+        except Exception:
+            pass  # Progress counters are best-effort; fall back to the last published state
+        return {
+            "task_id": task_id,
+            "status": "PROGRESS",
+            "message": "Task is in progress; partial results are available.",
+            "stage": meta.get("stage"),
+            "search_id": meta.get("search_id"),
+            "progress": progress,
+            "partial_result": meta.get("partial_result"),
+        }
     elif task_result.state == 'SUCCESS':
         # Ensure the result is JSON-serializable if it's complex
         result_data = task_result.result
+        if is_result_pointer(result_data):
+            # Search responses are stored compressed under their own key; the task result is only a pointer
+            blob = await search_result_store.load(result_data)
+            if blob is None:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail={"task_id": task_id, "status": "EXPIRED", "message": "Task result has expired."}
+                )
+            # Sync iterator: Starlette runs it in the threadpool, so decompression stays off the event loop
+            return StreamingResponse(_stream_stored_result(task_id, blob), media_type="application/json")
         return {"task_id": task_id, "status": "SUCCESS", "result": result_data}
     elif task_result.state == 'FAILURE':
         # Log the failure internally
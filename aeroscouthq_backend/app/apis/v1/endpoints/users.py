@@ -5,6 +5,7 @@ from fastapi import APIRouter, Depends, Query, HTTPException
 from app.core.dependencies import get_current_active_user
 from app.core.config import settings
 from app.database.crud import search_crud, invitation_crud
+from app.services import rate_limit_service
 from app.apis.v1.schemas import (
     UserResponse,
     RecentSearch, RecentSearchesResponse,
@@ -82,25 +83,20 @@ async def get_usage_stats(current_user: UserResponse = Depends(get_current_activ
             poi_daily_limit = 999999  # 显示为无限制
             flight_daily_limit = 999999  # 显示为无限制
 
-        # 计算明天的日期作为重置日期
-        from datetime import timedelta
+        # 计数在每天 UTC 零点重置
         import logging
         logger = logging.getLogger(__name__)
 
-        today = datetime.now(timezone.utc).date()
-        tomorrow = today + timedelta(days=1)
-        reset_datetime = datetime.combine(tomorrow, datetime.min.time(), tzinfo=timezone.utc)
-
-        # 调试日志
-        logger.debug(f"API使用统计 - 用户总调用次数: {current_user.api_call_count_today}, 是否管理员: {current_user.is_admin}")
+        reset_datetime = rate_limit_service.next_reset_at()
 
-        # 目前系统使用统一计数器，暂时将总调用次数分配给POI和Flight
-        # TODO: 未来可以实现分别计数的功能
-        total_calls_today = current_user.api_call_count_today
+        # 读取限流器中 POI 与 Flight 各自的真实计数
+        usage_counts = await rate_limit_service.get_usage_counts(current_user.id, ["poi", "flight"])
+        poi_calls_today = usage_counts["poi"]
+        flight_calls_today = usage_counts["flight"]
+        total_calls_today = poi_calls_today + flight_calls_today
 
-        # 假设POI和Flight调用各占一半（简化处理）
-        poi_calls_estimated = total_calls_today // 2
-        flight_calls_estimated = total_calls_today - poi_calls_estimated
+        # 调试日志
+        logger.debug(f"API使用统计 - 用户今日调用次数: POI {poi_calls_today}, Flight {flight_calls_today}, 是否管理员: {current_user.is_admin}")
 
         # 计算使用百分比（基于总限制）
         if current_user.is_admin:
@@ -114,8 +110,8 @@ async def get_usage_stats(current_user: UserResponse = Depends(get_current_activ
 
         # 创建API使用统计对象
         usage_stats = ApiUsageStat(
-            poi_calls_today=poi_calls_estimated,
-            flight_calls_today=flight_calls_estimated,
+            poi_calls_today=poi_calls_today,
+            flight_calls_today=flight_calls_today,
             poi_daily_limit=poi_daily_limit,
             flight_daily_limit=flight_daily_limit,
             reset_date=reset_datetime,
@@ -185,14 +181,11 @@ async def get_usage_history(
 
         logger.info(f"获取用户 {current_user.id} 从 {start_date} 到 {end_date} 的API使用历史")
 
-        # 生成模拟数据（实际应该从数据库获取）
-        # TODO: 实现真实的数据库查询逻辑
+        # 读取限流器中按 UTC 日期保存的 POI 与 Flight 计数
         usage_history = []
-        for i in range(days):
-            current_date = start_date + timedelta(days=i)
-            # 模拟数据，实际应该从数据库查询
-            poi_calls = max(0, current_user.api_call_count_today - i * 2)
-            flight_calls = max(0, current_user.api_call_count_today - i * 3)
+        for current_date, counts in await rate_limit_service.get_usage_history(current_user.id, ["poi", "flight"], days):
+            poi_calls = counts["poi"]
+            flight_calls = counts["flight"]
 
             daily_usage = DailyApiUsage(
                 date=datetime.combine(current_date, datetime.min.time(), tzinfo=timezone.utc),
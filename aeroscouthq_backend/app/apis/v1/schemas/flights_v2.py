@@ -120,6 +120,7 @@ class PhaseOneSearchResponse(BaseModel):
     direct_flights: List[EnhancedFlightItinerary] = Field(..., description="直飞航班列表")
     hidden_city_flights: List[EnhancedFlightItinerary] = Field(..., description="甩尾航班列表")
     metrics: SearchPhaseResult = Field(..., description="搜索指标")
+    phase_metrics: Dict[str, Any] = Field({}, description="阶段指标（strategy_timings 为各策略耗时）")
     disclaimers: List[str] = Field([], description="免责声明")
     next_phase_available: bool = Field(..., description="是否可以执行第二阶段")
 
@@ -37,6 +37,17 @@ from app.core.search_strategies.base import SearchContext
 from app.core.search_strategies.direct_flight import DirectFlightStrategy
 from app.core.search_strategies.hidden_city import HiddenCityStrategy
 from app.core.search_strategies.hub_probe import HubProbeStrategy
+from app.core.search_strategies.executor import ConcurrentStrategyExecutor
+from app.core.strategy_cache import strategy_result_cache
+from app.core.kiwi_raw_cache import kiwi_raw_cache
+from app.core.singleflight import kiwi_search_singleflight
+from app.core.cpu_executor import cpu_executor
+from app.core.upstream_rate_limiter import kiwi_rate_limiter
+from app.core.upstream_guard import kiwi_upstream_guard
+from app.core.request_hedging import kiwi_request_hedger
+from app.core.retry_policy import kiwi_retry_policy
+from app.core import dynamic_fetcher
+from app.core.identity_pool import kiwi_identity_pool
 
 # 获取logger
 logger = logging.getLogger(__name__)
@@ -96,7 +107,7 @@ def create_search_context(request: FlightSearchBaseRequest, search_id: str, phas
         search_id=search_id,
         phase=phase,
         started_at=datetime.utcnow(),
-        cache_enabled=True,
+        cache_enabled=getattr(request, "enable_cache", True),
         kiwi_headers=None,
         api_call_count=0,
         cache_hits=0,
@@ -134,12 +145,23 @@ async def search_phase_one(
         results = []
         phase_metrics = {}
 
-        # 执行直飞搜索
+        # 并发执行直飞和throwaway搜索
+        strategy_jobs = {}
         if request.include_direct_flights:
             logger.info(f"执行直飞搜索 - 搜索ID: {search_id}")
-            direct_strategy = DirectFlightStrategy()
-            direct_result = await direct_strategy.execute(context)
+            strategy_jobs["direct_flight"] = DirectFlightStrategy().execute_cached(context)
+        if request.include_throwaway_tickets:
+            logger.info(f"执行throwaway搜索 - 搜索ID: {search_id}")
+            strategy_jobs["hidden_city"] = HiddenCityStrategy().execute_cached(context)
 
+        report = await ConcurrentStrategyExecutor(search_id).run(strategy_jobs)
+        phase_metrics["strategy_timings"] = report.timings
+        phase_metrics["wall_time_ms"] = report.wall_time_ms
+        phase_metrics["deadline_hit"] = report.deadline_hit
+
+        # 处理直飞搜索结果
+        direct_result = report.get("direct_flight")
+        if direct_result:
             if direct_result.flights:
                 results.extend(direct_result.flights)
                 phase_metrics["direct_flights"] = {
@@ -149,12 +171,9 @@ async def search_phase_one(
                 }
                 logger.info(f"直飞搜索完成 - 找到 {len(direct_result.flights)} 个航班")
 
-        # 执行throwaway搜索
-        if request.include_throwaway_tickets:
-            logger.info(f"执行throwaway搜索 - 搜索ID: {search_id}")
-            hidden_city_strategy = HiddenCityStrategy()
-            throwaway_result = await hidden_city_strategy.execute(context)
-
+        # 处理throwaway搜索结果
+        throwaway_result = report.get("hidden_city")
+        if throwaway_result:
             if throwaway_result.flights:
                 results.extend(throwaway_result.flights)
                 phase_metrics["throwaway_flights"] = {
@@ -182,7 +201,8 @@ async def search_phase_one(
         session_updates = {
             "status": "completed",
             "completed_at": datetime.now().isoformat(),
-            "results_count": len(results)
+            "results_count": len(results),
+            "phase_metrics": phase_metrics
         }
         await session_manager.update_session(search_id, session_updates)
 
@@ -209,7 +229,7 @@ async def search_phase_one(
             status="completed",
             execution_time_ms=execution_time_ms,
             results_count=len(results),
-            cache_hit=False,
+            cache_hit=any(r.cache_hit for r in report.results.values()),
             started_at=started_at,
             completed_at=datetime.now()
         )
@@ -219,6 +239,7 @@ async def search_phase_one(
             direct_flights=direct_flights,
             hidden_city_flights=hidden_city_flights,
             metrics=metrics,
+            phase_metrics=phase_metrics,
             disclaimers=[
                 "第一阶段搜索结果，包含直飞和throwaway票选项",
                 "价格可能发生变化，请以最终预订页面为准",
@@ -396,64 +417,69 @@ async def unified_search_sync(
         phase_metrics = {}
         probe_details = {}
 
-        # 第一阶段：直飞 + throwaway
-        if request.include_direct_flights or request.include_throwaway_tickets:
-            logger.info(f"执行第一阶段搜索 - 搜索ID: {search_id}")
-
-            # 直飞搜索
-            if request.include_direct_flights:
-                logger.info(f"[DEBUG V2] 开始执行直飞搜索 - 搜索ID: {search_id}")
-                direct_strategy = DirectFlightStrategy()
-                logger.info(f"[DEBUG V2] 直飞策略实例化完成")
-                logger.info(f"[DEBUG V2] 搜索上下文: {context}")
-
-                direct_result = await direct_strategy.execute(context)
-                logger.info(f"[DEBUG V2] 直飞搜索执行完成 - 状态: {direct_result.status}, 结果数: {len(direct_result.flights)}")
-
-                if direct_result.error_message:
-                    logger.error(f"[DEBUG V2] 直飞搜索错误: {direct_result.error_message}")
-
-                if direct_result.flights:
-                    direct_flights.extend(direct_result.flights)
-                    all_flights.extend(direct_result.flights)
-                    phase_metrics["direct_flights"] = {
-                        "count": len(direct_result.flights),
-                        "search_time_ms": direct_result.metrics.get("search_time_ms", 0)
-                    }
-                    logger.info(f"[DEBUG V2] 直飞航班添加完成，当前总数: {len(all_flights)}")
-                else:
-                    logger.warning(f"[DEBUG V2] 直飞搜索未返回任何结果")
-
-            # Throwaway搜索
-            if request.include_throwaway_tickets:
-                hidden_city_strategy = HiddenCityStrategy()
-                throwaway_result = await hidden_city_strategy.execute(context)
-                if throwaway_result.flights:
-                    combo_deals.extend(throwaway_result.flights)
-                    all_flights.extend(throwaway_result.flights)
-                    phase_metrics["throwaway_flights"] = {
-                        "count": len(throwaway_result.flights),
-                        "search_time_ms": throwaway_result.metrics.get("search_time_ms", 0)
-                    }
-
-        # 第二阶段：枢纽探测（如果启用）
-        if request.enable_hub_probe:
+        # 直飞、throwaway与枢纽探测互不依赖，作为任务并发执行
+        strategy_jobs = {}
+        # 上游熔断期间降级为仅直飞搜索，避免探测类扇出继续堆积请求
+        upstream_degraded = kiwi_upstream_guard.degraded
+        if upstream_degraded:
+            logger.warning(f"Kiwi熔断器状态为 {kiwi_upstream_guard.state}，本次搜索降级为仅直飞 - 搜索ID: {search_id}")
+        if request.include_direct_flights:
+            logger.info(f"[DEBUG V2] 开始执行直飞搜索 - 搜索ID: {search_id}")
+            strategy_jobs["direct_flight"] = DirectFlightStrategy().execute_cached(context)
+        if request.include_throwaway_tickets and not upstream_degraded:
+            strategy_jobs["hidden_city"] = HiddenCityStrategy().execute_cached(context)
+        if request.enable_hub_probe and not upstream_degraded:
             logger.info(f"执行第二阶段枢纽搜索 - 搜索ID: {search_id}")
-            hub_strategy = HubProbeStrategy()
-            hub_result = await hub_strategy.execute(context)
-
-            if hub_result.flights:
-                combo_deals.extend(hub_result.flights)
-                all_flights.extend(hub_result.flights)
-                phase_metrics["hub_exploration"] = {
-                    "count": len(hub_result.flights),
-                    "search_time_ms": hub_result.metrics.get("search_time_ms", 0),
-                    "hubs_explored": hub_result.metadata.get("hubs_explored", [])
+            strategy_jobs["hub_probe"] = HubProbeStrategy().execute_cached(context)
+
+        report = await ConcurrentStrategyExecutor(search_id).run(strategy_jobs)
+        phase_metrics["strategy_timings"] = report.timings
+        phase_metrics["wall_time_ms"] = report.wall_time_ms
+        phase_metrics["deadline_hit"] = report.deadline_hit
+
+        # 直飞搜索结果
+        direct_result = report.get("direct_flight")
+        if direct_result:
+            logger.info(f"[DEBUG V2] 直飞搜索执行完成 - 状态: {direct_result.status}, 结果数: {len(direct_result.flights)}")
+
+            if direct_result.error_message:
+                logger.error(f"[DEBUG V2] 直飞搜索错误: {direct_result.error_message}")
+
+            if direct_result.flights:
+                direct_flights.extend(direct_result.flights)
+                all_flights.extend(direct_result.flights)
+                phase_metrics["direct_flights"] = {
+                    "count": len(direct_result.flights),
+                    "search_time_ms": direct_result.metrics.get("search_time_ms", 0)
                 }
-                probe_details = hub_result.metadata.get("hub_details", {})
+                logger.info(f"[DEBUG V2] 直飞航班添加完成，当前总数: {len(all_flights)}")
+            else:
+                logger.warning(f"[DEBUG V2] 直飞搜索未返回任何结果")
+
+        # Throwaway搜索结果
+        throwaway_result = report.get("hidden_city")
+        if throwaway_result and throwaway_result.flights:
+            combo_deals.extend(throwaway_result.flights)
+            all_flights.extend(throwaway_result.flights)
+            phase_metrics["throwaway_flights"] = {
+                "count": len(throwaway_result.flights),
+                "search_time_ms": throwaway_result.metrics.get("search_time_ms", 0)
+            }
+
+        # 枢纽探测结果
+        hub_result = report.get("hub_probe")
+        if hub_result and hub_result.flights:
+            combo_deals.extend(hub_result.flights)
+            all_flights.extend(hub_result.flights)
+            phase_metrics["hub_exploration"] = {
+                "count": len(hub_result.flights),
+                "search_time_ms": hub_result.metrics.get("search_time_ms", 0),
+                "hubs_explored": hub_result.metadata.get("hubs_explored", [])
+            }
+            probe_details = hub_result.metadata.get("hub_details", {})
 
         # 增强的去重逻辑
-        unique_flights = deduplicate_flights_enhanced(all_flights)
+        unique_flights = await cpu_executor.run("dedupe", deduplicate_flights_enhanced, all_flights, items=len(all_flights))
 
         # 应用排序
         if request.sort_strategy == SortStrategy.PRICE_ASC:
@@ -490,6 +516,9 @@ async def unified_search_sync(
         if phase_metrics.get("hub_exploration"):
             disclaimers.append("枢纽探测结果可能涉及复杂中转，请注意航班衔接时间")
 
+        if upstream_degraded and (request.include_throwaway_tickets or request.enable_hub_probe):
+            disclaimers.append("航班数据源暂时不稳定，本次仅返回直飞搜索结果")
+
         # 更新搜索会话
         search_sessions[search_id].update({
             "status": "completed",
@@ -594,7 +623,20 @@ async def health_check(session_manager = Depends(get_search_session_manager)):
         "version": "v2",
         "message": "V2 API is running",
         "timestamp": datetime.now().isoformat(),
-        "search_session_storage": session_health
+        "search_session_storage": session_health,
+        "strategy_cache": strategy_result_cache.get_stats(),
+        "kiwi_raw_cache": kiwi_raw_cache.get_stats(),
+        "kiwi_search_singleflight": kiwi_search_singleflight.get_stats(),
+        "cpu_executor": cpu_executor.get_stats(),
+        "kiwi_rate_limiter": kiwi_rate_limiter.get_stats(),
+        "kiwi_upstream_guard": kiwi_upstream_guard.get_stats(),
+        "kiwi_request_hedger": kiwi_request_hedger.get_stats(),
+        "kiwi_retry_policy": kiwi_retry_policy.get_stats(),
+        "kiwi_identity_pool": kiwi_identity_pool.get_stats(),
+        "upstream_headers": {
+            "kiwi": dynamic_fetcher.kiwi_header_store.get_stats(),
+            "trip": dynamic_fetcher.trip_header_store.get_stats()
+        }
     }
 
 # 搜索会话管理端点
@@ -1,4 +1,6 @@
 from celery import Celery
+from celery.signals import worker_process_init, worker_process_shutdown
+from kombu import Queue
 from app.core.config import settings
 
 # Initialize Celery
@@ -16,10 +18,34 @@ celery_app = Celery(
     ]
 )
 
-# Optional configuration settings
-# Example: Set a default queue and route tasks starting with 'app.core.tasks.' to it.
+# Queues: session refresh, interactive searches and background probes are isolated so a probe
+# backlog cannot delay header refresh or user-facing searches. "main-queue" keeps its name for
+# interactive work so existing `-Q main-queue` workers still serve searches.
+QUEUE_SESSION = "session-queue"
+QUEUE_INTERACTIVE = "main-queue"
+QUEUE_PROBE = "probe-queue"
+
+# Redis transport priorities: 0 is served first
+PRIORITY_SESSION = 0
+PRIORITY_INTERACTIVE = 3
+PRIORITY_SEARCH_PROBE = 5  # throwaway probes of a running search: ahead of background hub probes
+PRIORITY_PROBE = 8
+
+celery_app.conf.task_queues = (
+    Queue(QUEUE_SESSION, routing_key=QUEUE_SESSION),
+    Queue(QUEUE_INTERACTIVE, routing_key=QUEUE_INTERACTIVE),
+    Queue(QUEUE_PROBE, routing_key=QUEUE_PROBE),
+)
+celery_app.conf.task_default_queue = QUEUE_INTERACTIVE
+celery_app.conf.task_default_priority = PRIORITY_INTERACTIVE
 celery_app.conf.task_routes = {
-    "app.core.tasks.*": "main-queue"
+    "app.core.tasks.fetch_kiwi_session_task": {"queue": QUEUE_SESSION, "priority": PRIORITY_SESSION},
+    "app.core.tasks.fetch_trip_session_task": {"queue": QUEUE_SESSION, "priority": PRIORITY_SESSION},
+    "app.core.tasks.find_flights_task": {"queue": QUEUE_INTERACTIVE, "priority": PRIORITY_INTERACTIVE},
+    "app.core.tasks.merge_throwaway_probes_task": {"queue": QUEUE_INTERACTIVE, "priority": PRIORITY_INTERACTIVE},
+    "app.core.tasks.throwaway_probe_task": {"queue": QUEUE_PROBE, "priority": PRIORITY_SEARCH_PROBE},
+    "app.core.tasks.probe_china_hubs_task": {"queue": QUEUE_PROBE, "priority": PRIORITY_PROBE},
+    "app.core.tasks.*": {"queue": QUEUE_INTERACTIVE, "priority": PRIORITY_INTERACTIVE},
 }
 
 # Configure JSON serialization to fix EncodeError issues with datetime objects
@@ -32,10 +58,47 @@ celery_app.conf.update(
     # Additional settings for better reliability
     task_acks_late=True,
     worker_prefetch_multiplier=1,
+    # A worker consuming several queues (e.g. a single --pool=solo worker without -Q) drains them in
+    # task_queues order, and messages within a queue by priority
+    broker_transport_options={
+        'priority_steps': list(range(10)),
+        'sep': ':',
+        'queue_order_strategy': 'priority',
+    },
 )
 
+# Per-queue worker pools (see start_celery.py): one worker per queue so probe concurrency
+# is bounded independently of session refresh and interactive searches
+WORKER_POOLS = {
+    QUEUE_SESSION: settings.CELERY_SESSION_WORKER_CONCURRENCY,
+    QUEUE_INTERACTIVE: settings.CELERY_INTERACTIVE_WORKER_CONCURRENCY,
+    QUEUE_PROBE: settings.CELERY_PROBE_WORKER_CONCURRENCY,
+}
+
+
+@worker_process_init.connect
+def init_worker_process(**kwargs):
+    """Reset process-wide clients after fork, then start the worker's long-lived event loop
+    so tasks share one connection pool instead of rebuilding it per asyncio.run."""
+    from app.core.kiwi_client import kiwi_client_manager
+    from app.core.worker_runtime import worker_runtime
+    kiwi_client_manager.reset()
+    worker_runtime.start()
+
+
+@worker_process_shutdown.connect
+def shutdown_worker_process(**kwargs):
+    """Release pooled Kiwi connections and the parse thread pool when the worker process exits."""
+    from app.core.kiwi_client import kiwi_client_manager
+    from app.core.cpu_executor import cpu_executor
+    from app.core.worker_runtime import worker_runtime
+    worker_runtime.shutdown()
+    kiwi_client_manager.shutdown()
+    cpu_executor.shutdown()
+
 if __name__ == '__main__':
     # This allows running the worker directly using: python -m app.celery_worker worker --loglevel=info
     # Note: Typically, you'd run Celery worker from the command line using the celery command.
-    # Example: celery -A app.celery_worker worker --loglevel=info -Q main-queue
+    # Example: celery -A app.celery_worker worker --loglevel=info -Q main-queue -c 4 -n search@%h
+    # Without -Q a worker consumes every queue above in priority order.
     celery_app.start()
\ No newline at end of file
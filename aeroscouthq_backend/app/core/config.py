@@ -25,6 +25,15 @@ class Settings(BaseSettings):
     # API Usage Limits - Specific limits per type
     POI_DAILY_LIMIT: int = 10 # Default daily limit for POI endpoints
     FLIGHT_DAILY_LIMIT: int = 5 # Default daily limit for flight search endpoints
+    POI_BURST_LIMIT: int = 0  # POI 接口滑动窗口内的最大调用次数（0 表示不限制突发）
+    FLIGHT_BURST_LIMIT: int = 0  # 航班搜索接口滑动窗口内的最大调用次数（0 表示不限制突发）
+    RATE_LIMIT_BURST_WINDOW_SECONDS: float = 60.0  # 突发限制的滑动窗口长度（秒）
+    USER_RATE_LIMIT_REDIS_ENABLED: bool = True  # 用户调用计数保存在 Redis（Lua 原子计数），不可用时回退进程内计数
+    RATE_LIMIT_HISTORY_DAYS: int = 30  # 每日计数键在当天结束后保留的天数（用于使用历史查询）
+    PRINCIPAL_CACHE_ENABLED: bool = True  # 缓存已认证用户，避免每个请求都查询用户表
+    PRINCIPAL_CACHE_TTL: int = 120  # Redis 中用户缓存的过期时间（秒）
+    PRINCIPAL_CACHE_LOCAL_TTL: int = 10  # 进程内 LRU 过期时间（秒），也是其他进程看到失效的最长延迟
+    PRINCIPAL_CACHE_LRU_SIZE: int = 1024  # 进程内用户缓存条目上限
 
     # Dynamic Fetcher Cache File Paths
     TRIP_COOKIE_FILE: str = "trip_cookies.json"
@@ -33,11 +42,107 @@ class Settings(BaseSettings):
     # Celery Configuration
     CELERY_BROKER_URL: str = "redis://localhost:6379/0"
     CELERY_RESULT_BACKEND: str = "redis://localhost:6379/1"
+    CELERY_PERSISTENT_LOOP_ENABLED: bool = True  # 每个 worker 进程复用一个长期事件循环及其 HTTP/Redis/数据库连接
+    TASK_PROGRESS_ENABLED: bool = True  # 搜索任务在主搜索/每个探测完成后发布 PROGRESS 状态与部分结果
+    TASK_PROGRESS_PARTIAL_LIMIT: int = 20  # PROGRESS 中携带的部分直飞结果数量上限（按价格排序）
+    CELERY_SESSION_WORKER_CONCURRENCY: int = 1  # 会话/请求头刷新队列的 worker 并发数
+    CELERY_INTERACTIVE_WORKER_CONCURRENCY: int = 4  # 交互式搜索队列的 worker 并发数
+    CELERY_PROBE_WORKER_CONCURRENCY: int = 2  # 后台枢纽探测队列的 worker 并发数（积压由该队列吸收）
+    CELERY_PROBE_CHORD_ENABLED: bool = True  # 搜索任务的甩尾探测拆分为 chord 子任务分发到各 worker，由回调合并比价
+    TASK_RESULT_STORE_ENABLED: bool = True  # 搜索结果压缩后存入独立 Redis 键，Celery 结果只保存指针
+    TASK_RESULT_TTL: int = 3600  # 压缩搜索结果的保存时间（秒）
+    TASK_RESULT_INLINE_MAX_BYTES: int = 4096  # 不超过该大小（编码后字节数）的结果直接内联返回
 
     # Redis Configuration for Search Sessions
     REDIS_URL: str = "redis://localhost:6379/2"  # 使用数据库2存储搜索会话
     REDIS_SESSION_TTL: int = 3600  # 搜索会话过期时间（秒），默认1小时
 
+    # Kiwi HTTP客户端连接池配置
+    KIWI_HTTP2_ENABLED: bool = True  # 是否启用HTTP/2（需要安装h2，未安装时自动回退HTTP/1.1）
+    KIWI_HTTP_MAX_CONNECTIONS: int = 20  # 到Kiwi API的最大并发连接数
+    KIWI_HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 10  # 保持活跃的空闲连接数
+    KIWI_HTTP_KEEPALIVE_EXPIRY: float = 30.0  # 空闲连接保持时间（秒）
+    KIWI_HTTP_TIMEOUT: float = 45.0  # 默认请求超时（秒）
+    KIWI_HTTP_CONNECT_TIMEOUT: float = 10.0  # 建立连接超时（秒）
+
+    # V2 搜索策略并发执行配置（秒）
+    DIRECT_FLIGHT_STRATEGY_TIMEOUT: float = 60.0  # 直飞策略超时预算
+    HIDDEN_CITY_STRATEGY_TIMEOUT: float = 120.0  # 甩尾策略超时预算
+    HUB_PROBE_STRATEGY_TIMEOUT: float = 150.0  # 枢纽探测策略超时预算
+    SEARCH_OVERALL_DEADLINE: float = 180.0  # 单次搜索整体截止时间，到期取消未完成策略
+
+    # 甩尾策略并发搜索配置
+    HIDDEN_CITY_MAX_CONCURRENCY: int = 4  # 同时搜索的甩尾目的地数量上限
+    HIDDEN_CITY_DESTINATION_TIMEOUT: float = 40.0  # 单个甩尾目的地搜索超时（秒）
+    HIDDEN_CITY_EARLY_STOP_RESULTS: int = 30  # 找到该数量的有效甩尾航班后提前结束，0表示不提前结束
+
+    # 中转探测网格并发配置
+    HUB_PROBE_MAX_CONCURRENCY: int = 6  # 同时执行的探测查询上限
+    HUB_PROBE_QUERY_TIMEOUT: float = 40.0  # 单个探测查询超时（秒）
+
+    # 策略结果缓存配置
+    STRATEGY_CACHE_LRU_SIZE: int = 256  # 进程内LRU缓存条目上限（Redis不可用时的回退）
+    STRATEGY_CACHE_MIN_TTL: int = 300  # 最短缓存时间（秒），用于临近出发的航线
+    STRATEGY_CACHE_MAX_TTL: int = 3600  # 最长缓存时间（秒），用于远期出发的航线
+
+    # Kiwi 原始行程缓存配置（按规范化查询变量缓存上游结果）
+    KIWI_RAW_CACHE_ENABLED: bool = True  # 是否启用原始行程缓存
+    KIWI_RAW_CACHE_TTL: int = 180  # 缓存时间（秒），价格变化快，保持较短
+    KIWI_RAW_CACHE_LRU_SIZE: int = 512  # 进程内LRU缓存条目上限
+
+    # 上游请求合并（singleflight）配置
+    SINGLEFLIGHT_ENABLED: bool = True  # 是否合并相同的并发上游搜索
+    SINGLEFLIGHT_REDIS_ENABLED: bool = True  # 是否通过Redis锁跨进程（uvicorn/Celery worker）合并
+    SINGLEFLIGHT_LOCK_TTL: float = 90.0  # 执行者锁过期时间（秒），应大于单次搜索会话耗时
+    SINGLEFLIGHT_WAIT_TIMEOUT: float = 60.0  # 等待其他进程结果的最长时间（秒），超时后自行执行
+    SINGLEFLIGHT_RESULT_TTL: int = 30  # 执行结果在Redis中的保留时间（秒），供晚到的等待者读取
+
+    # Kiwi 上游全局限速（令牌桶，替代分页之间的固定 sleep）
+    KIWI_RATE_LIMIT_ENABLED: bool = True  # 是否启用全局限速
+    KIWI_RATE_LIMIT_REDIS_ENABLED: bool = True  # 是否通过Redis在uvicorn与Celery worker之间共享令牌桶
+    KIWI_RATE_LIMIT_PER_SECOND: float = 4.0  # 每秒补充的令牌数（即稳定状态下每秒请求数）
+    KIWI_RATE_LIMIT_BURST: int = 8  # 令牌桶容量（允许的突发请求数）
+    KIWI_RATE_LIMIT_MAX_WAIT: float = 30.0  # 单次获取令牌的最长等待时间（秒），超时后抛出可重试的 KiwiRateLimitError，不发送请求
+
+    # Kiwi 自适应并发（AIMD）与熔断器配置
+    KIWI_ADAPTIVE_CONCURRENCY_ENABLED: bool = True  # 是否根据上游延迟/错误动态调整并发上限
+    KIWI_CONCURRENCY_INITIAL: int = 8  # 初始并发上限
+    KIWI_CONCURRENCY_MIN: int = 1  # 并发上限下界
+    KIWI_CONCURRENCY_MAX: int = 20  # 并发上限上界，不应超过 KIWI_HTTP_MAX_CONNECTIONS
+    KIWI_CONCURRENCY_LATENCY_TARGET: float = 8.0  # 单次请求延迟超过该值（秒）视为延迟突增，收缩并发
+    KIWI_CONCURRENCY_DECREASE_FACTOR: float = 0.5  # 出错或延迟突增时并发上限的乘性收缩系数
+    KIWI_BREAKER_ENABLED: bool = True  # 是否启用熔断器
+    KIWI_BREAKER_FAILURE_THRESHOLD: int = 5  # 连续失败（429/5xx/超时/网络错误）次数达到该值时熔断
+    KIWI_BREAKER_OPEN_SECONDS: float = 30.0  # 熔断持续时间（秒），之后放行单个试探请求
+
+    # Kiwi 对冲请求配置（慢页面超过延迟分位数后发送副本，取先返回者）
+    KIWI_HEDGING_ENABLED: bool = False  # 是否启用对冲请求（按需开启）
+    KIWI_HEDGE_PERCENTILE: float = 95.0  # 对冲等待时间取最近请求延迟的该分位数
+    KIWI_HEDGE_MIN_DELAY: float = 2.0  # 对冲等待时间下限（秒）
+    KIWI_HEDGE_BUDGET_RATIO: float = 0.05  # 对冲请求数占主请求数的比例上限（0.05 即最多多发 5%）
+    KIWI_HEDGE_MIN_SAMPLES: int = 20  # 延迟样本数少于该值时不对冲
+    KIWI_HEDGE_WINDOW: int = 200  # 计算分位数使用的最近延迟样本数
+
+    # Kiwi 请求身份池（分散单一身份的限流压力）
+    KIWI_IDENTITY_POOL_ENABLED: bool = True  # 是否按身份池分配请求身份
+    KIWI_IDENTITY_POOL_SIZE: int = 4  # 身份数量（User-Agent 取自 USER_AGENT_POOL）
+    KIWI_IDENTITY_TOKENS: List[str] = []  # 额外的 umbrella token（JSON 列表），为空时所有身份共用当前 token
+    KIWI_IDENTITY_COOLDOWN_SECONDS: float = 30.0  # 身份出错后的基础冷却时间（秒），连续出错时指数增长
+    KIWI_IDENTITY_MAX_COOLDOWN_SECONDS: float = 300.0  # 冷却时间上限（秒）
+
+    # Kiwi 上游统一重试策略
+    KIWI_RETRY_ENABLED: bool = True  # 关闭时上游错误不重试（仍按类型分类与统计）
+    KIWI_RETRY_MAX_ATTEMPTS: int = 3  # 单次请求最大尝试次数（含首次）
+    KIWI_RETRY_BASE_DELAY: float = 1.0  # 指数退避基准等待时间（秒）
+    KIWI_RETRY_MAX_DELAY: float = 15.0  # 单次退避等待上限（秒），Retry-After 同样受此限制
+    KIWI_RETRY_BUDGET_PER_SEARCH: int = 10  # 单次搜索所有上游请求共享的重试次数上限
+
+    # 搜索流水线 CPU 工作执行器（解析/分类/去重移出事件循环）
+    CPU_EXECUTOR_ENABLED: bool = True  # 关闭时在事件循环上直接执行
+    CPU_EXECUTOR_MAX_WORKERS: int = 4  # 线程池大小
+    CPU_EXECUTOR_MAX_QUEUE: int = 32  # 线程池满载后允许排队的任务数，超出时调用方异步等待
+    CPU_EXECUTOR_BATCH_SIZE: int = 50  # 解析时每批提交的行程数（约一页Kiwi结果）
+
     # Hub Probing Configuration
     # Default value is an empty list if the env var is not set or empty
     CHINA_HUB_CITIES_FOR_PROBE: List[str] = []
@@ -73,7 +178,7 @@ class Settings(BaseSettings):
         "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.0 Safari/605.1.15"
     ]
 
-    @field_validator('CHINA_HUB_CITIES_FOR_PROBE', 'THROWAWAY_DESTINATIONS', mode='before')
+    @field_validator('CHINA_HUB_CITIES_FOR_PROBE', 'THROWAWAY_DESTINATIONS', 'KIWI_IDENTITY_TOKENS', mode='before')
     @classmethod
     def parse_json_string_list(cls, value: Optional[Union[str, List[str]]], info) -> List[str]:
         """Parses a JSON string list from env var into a Python list."""
@@ -99,6 +204,9 @@ class Settings(BaseSettings):
     # Cookie Expiry Configuration
     TRIP_COOKIE_EXPIRY_SECONDS: int = 3600 # Default 1 hour
     KIWI_COOKIE_EXPIRY_SECONDS: int = 3600 # Default 1 hour
+    HEADER_REFRESH_AHEAD_ENABLED: bool = True  # 是否在请求头过期前后台预刷新
+    HEADER_REFRESH_AHEAD_RATIO: float = 0.2  # 剩余有效期低于该比例时预刷新（0.2 即 1 小时有效期剩余 12 分钟时刷新）
+    HEADER_REFRESH_CHECK_INTERVAL: float = 30.0  # 预刷新检查间隔（秒）
 
     # Kiwi 任务状态管理配置
     KIWI_TASK_STATUS_FILE: str = "cache/.kiwi_task_status.json"  # 任务状态文件路径
@@ -113,6 +221,7 @@ class Settings(BaseSettings):
     # 日志配置
     LOG_LEVEL: str = "WARNING"  # 默认日志级别，可选: DEBUG, INFO, WARNING, ERROR, CRITICAL
     ENABLE_SEARCH_DEBUG_LOGS: bool = False  # 是否启用搜索过程的详细调试日志
+    SEARCH_DEBUG_SAMPLE_RATE: float = 0.1  # 调试日志抽样比例（按行程计），1.0 表示全部输出
 
 # Create a single, reusable instance of the Settings class
 settings = Settings()
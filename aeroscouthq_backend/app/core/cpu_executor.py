@@ -0,0 +1,166 @@
+"""
+搜索流水线 CPU 工作执行器
+将行程解析、甩尾分类、去重、序列化等 CPU 密集步骤移出事件循环，在有界线程池中执行。
+解析按页大小分批提交，避免单次大搜索长时间占用事件循环导致其他请求（POI 自动补全、状态轮询）卡顿
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.itinerary_parser import parse_itineraries
+
+logger = logging.getLogger(__name__)
+
+
+class CPUWorkExecutor:
+    """有界的 CPU 工作执行器
+
+    线程池中执行的 Python 代码仍受 GIL 约束，但解释器每个切换间隔都会让出 GIL，
+    事件循环因此能在大批量解析期间继续处理其他请求。提交数量受信号量限制，
+    超出 max_workers + max_queue 的调用方在事件循环上异步等待（背压），不会无限堆积。
+    """
+
+    def __init__(self, max_workers: int, max_queue: int):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # 信号量绑定事件循环（Celery 任务每次 asyncio.run 都是新循环），按循环分别创建
+        self._slots: Optional[Tuple[asyncio.AbstractEventLoop, asyncio.Semaphore]] = None
+        self._waiting = 0
+        self._queued = 0
+        self._running = 0
+        self._lock = threading.Lock()
+        self.stage_stats: Dict[str, Dict[str, float]] = {}
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="search-cpu")
+        return self._executor
+
+    def _get_slots(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._slots is None or self._slots[0] is not loop:
+            self._slots = (loop, asyncio.Semaphore(self.max_workers + self.max_queue))
+        return self._slots[1]
+
+    def _record(self, stage: str, items: int, wait_ms: float, run_ms: float, failed: bool) -> None:
+        stats = self.stage_stats.setdefault(stage, {
+            "tasks": 0, "items": 0, "failed": 0,
+            "wait_ms_total": 0.0, "run_ms_total": 0.0, "run_ms_max": 0.0
+        })
+        stats["tasks"] += 1
+        stats["items"] += items
+        stats["failed"] += int(failed)
+        stats["wait_ms_total"] += wait_ms
+        stats["run_ms_total"] += run_ms
+        stats["run_ms_max"] = max(stats["run_ms_max"], run_ms)
+
+    async def run(self, stage: str, fn: Callable[..., Any], *args: Any, items: int = 1, **kwargs: Any) -> Any:
+        """在线程池中执行同步函数并返回结果
+
+        Args:
+            stage: 统计维度（parse / classify / dedupe / serialize）
+            fn: 同步函数
+            items: 本次处理的条目数（用于统计）
+        """
+        if not settings.CPU_EXECUTOR_ENABLED:
+            return fn(*args, **kwargs)
+
+        submitted_at = time.perf_counter()
+        slots = self._get_slots()
+        self._waiting += 1
+        try:
+            await slots.acquire()
+        finally:
+            self._waiting -= 1
+
+        with self._lock:
+            self._queued += 1
+        started_at: List[float] = []
+
+        def _timed_call():
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+            started_at.append(time.perf_counter())
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._running -= 1
+
+        failed = False
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._get_executor(), _timed_call)
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            if not started_at:
+                # 未开始执行（提交失败或排队期间被取消）
+                with self._lock:
+                    self._queued = max(0, self._queued - 1)
+            slots.release()
+            finished_at = time.perf_counter()
+            start = started_at[0] if started_at else finished_at
+            self._record(stage, items, (start - submitted_at) * 1000, (finished_at - start) * 1000, failed)
+
+    async def map_batches(
+        self,
+        stage: str,
+        fn: Callable[[List[Any]], List[Any]],
+        items: List[Any],
+        batch_size: Optional[int] = None
+    ) -> List[Any]:
+        """按批提交列表处理函数，按原顺序拼接结果"""
+        if not items:
+            return []
+        batch_size = batch_size or settings.CPU_EXECUTOR_BATCH_SIZE
+        batches = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+        results = await asyncio.gather(*(self.run(stage, fn, batch, items=len(batch)) for batch in batches))
+        merged: List[Any] = []
+        for batch_result in results:
+            merged.extend(batch_result)
+        return merged
+
+    async def parse_itineraries(
+        self,
+        raw_itineraries: List[dict],
+        is_one_way: bool,
+        requested_currency: str = "CNY",
+        cny_only: bool = True
+    ) -> List[Any]:
+        """分批解析原始行程（每批共享一个 PageLookups）"""
+        parse_batch = partial(
+            parse_itineraries, is_one_way=is_one_way, requested_currency=requested_currency, cny_only=cny_only
+        )
+        return await self.map_batches("parse", parse_batch, raw_itineraries)
+
+    def shutdown(self) -> None:
+        """关闭线程池（进程退出时调用）"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        self._slots = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取执行器指标"""
+        return {
+            "enabled": settings.CPU_EXECUTOR_ENABLED,
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "waiting": self._waiting,
+            "queue_depth": self._queued,
+            "running": self._running,
+            "stages": self.stage_stats
+        }
+
+
+# 全局 CPU 工作执行器实例
+cpu_executor = CPUWorkExecutor(settings.CPU_EXECUTOR_MAX_WORKERS, settings.CPU_EXECUTOR_MAX_QUEUE)
@@ -7,6 +7,7 @@ from jose import JWTError, jwt # Assuming jwt is needed for decode
 
 from app.core.security import decode_access_token # Assuming this handles decoding
 from app.database.crud import user_crud
+from app.core.principal_cache import principal_cache
 from app.apis.v1.schemas import UserResponse, TokenData
 from app.core.config import settings # Import settings
 from app.services import rate_limit_service
@@ -24,7 +25,7 @@ logger = logging.getLogger(__name__)
 
 async def get_current_user(token: str = Depends(oauth2_scheme)) -> Optional[dict]:
     """
-    Decodes the JWT token, validates it, and retrieves the user from the database.
+    Decodes the JWT token, validates it, and retrieves the user (principal cache first, then the database).
     Returns the user data as a dictionary or None if validation fails.
     """
     try:
@@ -53,14 +54,15 @@ async def get_current_user(token: str = Depends(oauth2_scheme)) -> Optional[dict
         logger.error(f"Unexpected error during token validation: {e}", exc_info=True)
         raise credentials_exception
 
-    # 从数据库获取用户信息
-    user = await user_crud.get_user_by_email(email=token_data.email)
+    # 获取用户信息（短 TTL 缓存未命中时查询数据库）
+    user = await principal_cache.get_or_load(
+        token_data.email, lambda: user_crud.get_user_by_email(email=token_data.email)
+    )
     if user is None:
         logger.error(f"User not found in database: {token_data.email}")
         raise credentials_exception
 
-    # 将用户信息转换为字典格式
-    return dict(user)
+    return user
 
 
 async def get_current_user_optional(authorization: Optional[str] = Header(None)) -> Optional[dict]:
@@ -95,14 +97,15 @@ async def get_current_user_optional(authorization: Optional[str] = Header(None))
         # 创建 token_data 对象
         token_data = TokenData(email=email)
 
-        # 从数据库获取用户信息
-        user = await user_crud.get_user_by_email(email=token_data.email)
+        # 获取用户信息（短 TTL 缓存未命中时查询数据库）
+        user = await principal_cache.get_or_load(
+            token_data.email, lambda: user_crud.get_user_by_email(email=token_data.email)
+        )
         if user is None:
             logger.warning(f"User not found in database for optional auth: {token_data.email}")
             return None
 
-        # 将用户信息转换为字典格式
-        return dict(user)
+        return user
 
     except JWTError:
         logger.warning("JWTError occurred during optional token decoding")
@@ -168,6 +171,8 @@ class RateLimiter:
         # Falls back to a default if the specific limit isn't defined (optional, adjust as needed)
         default_limit = getattr(settings, "DEFAULT_API_CALL_LIMIT", 15) # Provide a fallback default
         self.daily_limit = getattr(settings, f"{limit_type.upper()}_DAILY_LIMIT", default_limit)
+        # Optional sliding-window burst limit, e.g. settings.POI_BURST_LIMIT (0 disables)
+        self.burst_limit = getattr(settings, f"{limit_type.upper()}_BURST_LIMIT", 0)
 
     async def __call__(self, current_user: UserResponse = Depends(get_current_active_user)):
         """
@@ -188,7 +193,8 @@ class RateLimiter:
         await rate_limit_service.check_and_update_limit(
             user=current_user,
             limit_type=self.limit_type,
-            max_calls=self.daily_limit # Pass the limit fetched during initialization
+            max_calls=self.daily_limit, # Pass the limit fetched during initialization
+            burst_limit=self.burst_limit
         )
         # The service itself will raise HTTPException(429) if the limit is exceeded.
         # No need to check 'allowed' or raise exception here.
\ No newline at end of file
@@ -86,13 +86,20 @@ async def _fetch_trip_headers_http_fallback() -> Optional[Dict[str, str]]:
         return None
 
 from app.core.config import settings
+from app.core.upstream_rate_limiter import kiwi_rate_limiter, LANE_BACKGROUND
+from app.core.header_snapshot import HeaderStore, HeaderSnapshot
+from app.core.identity_pool import kiwi_identity_pool
 # Import Celery tasks moved into functions to avoid circular import
 
 logger = logging.getLogger(__name__)
 # --- Global State ---
-TRIP_CURRENT_HEADERS: Optional[Dict[str, str]] = None
-TRIP_LAST_FETCH_TIME: float = 0
-TRIP_FETCH_LOCK = asyncio.Lock()
+# 请求头以不可变快照保存：读取无锁，仅刷新路径加锁（见 header_snapshot）
+trip_header_store = HeaderStore(
+    "Trip.com",
+    required_keys=('cookie', 'user-agent'),
+    cache_file=lambda: settings.TRIP_COOKIE_FILE,
+    expiry_seconds=lambda: settings.TRIP_COOKIE_EXPIRY_SECONDS
+)
 
 # Ensure the cache directory exists
 Path(settings.TRIP_COOKIE_FILE).parent.mkdir(parents=True, exist_ok=True)
@@ -101,190 +108,109 @@ Path(settings.TRIP_COOKIE_FILE).parent.mkdir(parents=True, exist_ok=True)
 
 async def get_effective_trip_headers(force_refresh: bool = False) -> Dict[str, str]:
     """
-    Gets effective Trip.com headers. Handles caching (memory-first, then file-first)
-    and triggers background refresh via Celery only if both caches are invalid.
+    Gets effective Trip.com headers. Valid in-memory snapshots are returned without locking;
+    otherwise a single refresher loads the file cache or triggers a background refresh via
+    Celery, falling back to a direct HTTP fetch when no headers are available.
 
     Args:
-        force_refresh: If True, bypasses cache checks and forces a background refresh task,
-                       but still returns current cache if available.
+        force_refresh: If True, bypasses cache checks and forces a refresh.
 
     Returns:
-        A dictionary containing Trip.com headers (potentially stale if refresh is in progress).
+        A dictionary containing Trip.com headers.
 
     Raises:
         HTTPException:
             - 503 Service Unavailable: If no headers are available (neither memory nor file cache is valid)
-              and a background refresh has been triggered. Client should retry.
-            - 500 Internal Server Error: For unexpected errors like failing to enqueue the task when needed.
+              and all fetch methods failed. Client should retry.
     """
-    global TRIP_CURRENT_HEADERS, TRIP_LAST_FETCH_TIME
-
-    async with TRIP_FETCH_LOCK:
-        now = time.time()
-        headers_to_return: Optional[Dict[str, str]] = None
-        memory_cache_valid = False
-        file_cache_valid = False
-        file_mod_time = 0
-        expiry_seconds = settings.TRIP_COOKIE_EXPIRY_SECONDS
-        cache_file_path = settings.TRIP_COOKIE_FILE
-
-        # 1. Check in-memory cache (unless force_refresh)
-        memory_expired = (now - TRIP_LAST_FETCH_TIME) > expiry_seconds
-        if not force_refresh and TRIP_CURRENT_HEADERS and not memory_expired:
-            memory_cache_valid = True
-            headers_to_return = TRIP_CURRENT_HEADERS.copy()
-            logger.info("Using valid in-memory Trip.com headers.")
-
-        # 2. Check file cache if memory wasn't valid (unless force_refresh)
-        if not headers_to_return and not force_refresh and os.path.exists(cache_file_path):
-            try:
-                file_mod_time = os.path.getmtime(cache_file_path)
-                file_expired = (now - file_mod_time) > expiry_seconds
-                if not file_expired:
-                    with open(cache_file_path, 'r') as f:
-                        cached_headers = json.load(f)
-                        if isinstance(cached_headers, dict) and 'cookie' in cached_headers and 'user-agent' in cached_headers:
-                            file_cache_valid = True
-                            headers_to_return = cached_headers.copy() # Prepare to return file cache
-                            logger.info(f"Found valid Trip.com headers in file cache: {cache_file_path}")
-                        else:
-                            logger.warning(f"Invalid format in Trip.com cookie cache file: {cache_file_path}.")
-                else:
-                    logger.info(f"Trip.com cookie cache file expired: {cache_file_path}")
-            except Exception as e:
-                logger.warning(f"Error reading Trip.com cookie cache file {cache_file_path}: {e}.")
-
-        # 3. Determine if a background refresh task is needed
-        # Needed if forced OR if neither memory nor file cache was valid.
-        needs_background_refresh = force_refresh or not (memory_cache_valid or file_cache_valid)
-        task_triggered = False
-
-        # 4. Trigger task if needed
-        if needs_background_refresh:
-            logger.info(f"Triggering background fetch for Trip.com headers (Force: {force_refresh}, No Valid Cache: {not (memory_cache_valid or file_cache_valid)}).")
-            task_triggered = False
-
-            # Try to enqueue the async task
-            try:
-                from app.core.tasks import fetch_trip_session_task # Delayed import
-                fetch_trip_session_task.delay()
-                task_triggered = True
-                logger.info("Successfully enqueued fetch_trip_session_task.")
-            except Exception as e_async:
-                logger.error(f"Failed to enqueue fetch_trip_session_task: {e_async}", exc_info=True)
-
-                # If task enqueue fails AND we have no headers to return, try direct HTTP fetch
-                if not headers_to_return:
-                    logger.warning("No valid headers and task enqueue failed. Attempting direct HTTP fetch...")
-                    try:
-                        # 使用HTTP fallback方法
-                        logger.info("尝试使用HTTP fallback方法...")
-                        direct_headers = await _fetch_trip_headers_http_fallback()
-                        if direct_headers and 'cookie' in direct_headers and 'user-agent' in direct_headers:
-                            logger.info("HTTP fallback获取成功。使用这些headers。")
-                            headers_to_return = direct_headers.copy()
-                            TRIP_CURRENT_HEADERS = direct_headers.copy()
-                            TRIP_LAST_FETCH_TIME = time.time()
-                            task_triggered = True  # 防止503错误
-
-                            # 保存到文件
-                            try:
-                                with open(settings.TRIP_COOKIE_FILE, 'w') as f:
-                                    json.dump(direct_headers, f, indent=2)
-                                logger.info(f"HTTP fallback结果保存到文件: {settings.TRIP_COOKIE_FILE}")
-                            except Exception as e:
-                                logger.error(f"保存到文件失败: {e}")
-                        else:
-                            logger.error("HTTP fallback failed to get valid headers.")
-                            raise HTTPException(
-                                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                                detail="Trip.com session data is unavailable. HTTP fallback failed."
-                            )
-                    except Exception as e_direct:
-                        logger.error(f"HTTP fallback failed: {e_direct}", exc_info=True)
-                        raise HTTPException(
-                            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                            detail="Trip.com session data is unavailable. All fetch methods failed."
-                        )
-
-        # 5. Decide what to return or raise
-        if headers_to_return:
-            # If we loaded from file, update memory cache now
-            if file_cache_valid and not memory_cache_valid:
-                TRIP_CURRENT_HEADERS = headers_to_return.copy() # Use the copy we made
-                TRIP_LAST_FETCH_TIME = file_mod_time
-                logger.info("Updated in-memory Trip.com cache from file.")
-
-            if task_triggered: # Log if we are returning stale data while refresh runs
-                 logger.warning("Returning potentially stale Trip.com headers while background refresh is running.")
-            return headers_to_return
-        else:
-            # No valid cache found (memory or file).
-            # Background task should have been triggered (or failed to trigger).
-            logger.error("No valid Trip.com headers available. Background refresh initiated (or failed).")
-
-            # Last resort - try HTTP fallback inline
-            try:
-                logger.warning("Attempting last-resort HTTP fallback for Trip.com headers...")
-                direct_headers = await _fetch_trip_headers_http_fallback()
-                if direct_headers and 'cookie' in direct_headers and 'user-agent' in direct_headers:
-                    logger.info("HTTP fallback获取成功")
-                    # 更新内存缓存
-                    TRIP_CURRENT_HEADERS = direct_headers.copy()
-                    TRIP_LAST_FETCH_TIME = time.time()
-
-                    # 保存到文件
-                    try:
-                        with open(settings.TRIP_COOKIE_FILE, 'w') as f:
-                            json.dump(direct_headers, f, indent=2)
-                        logger.info(f"HTTP fallback结果保存到文件: {settings.TRIP_COOKIE_FILE}")
-                    except Exception as e:
-                        logger.error(f"保存到文件失败: {e}")
-
-                    return direct_headers
-                else:
-                    logger.error("HTTP fallback failed to get valid headers")
-                    raise HTTPException(
-                        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                        detail="Trip.com session data is unavailable or being refreshed. Please try again shortly."
-                    )
-            except Exception as e_last:
-                logger.error(f"HTTP fallback failed: {e_last}", exc_info=True)
-                raise HTTPException(
-                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                    detail="Trip.com session data is unavailable or being refreshed. Please try again shortly."
-                )
+    # 1. Lock-free fast path: immutable in-memory snapshot
+    if not force_refresh:
+        snapshot = trip_header_store.fresh_snapshot()
+        if snapshot is not None:
+            return dict(snapshot.headers)
+
+    snapshot = await _refresh_trip_snapshot(force_refresh)
+    return dict(snapshot.headers)
+
+
+async def _refresh_trip_snapshot(force_refresh: bool) -> HeaderSnapshot:
+    """Single-refresher slow path for Trip.com headers (file cache -> Celery task -> HTTP fallback)."""
+    requested_at = time.time()
+    async with trip_header_store.refresh_lock():
+        # 2. Another coroutine may have refreshed while we waited for the lock
+        current = trip_header_store.snapshot
+        if current is not None:
+            if force_refresh and current.fetched_at >= requested_at:
+                return current
+            if not force_refresh and current.is_fresh(trip_header_store.expiry_seconds):
+                return current
+
+        # 3. File cache (written by the Celery task or other processes)
+        if not force_refresh:
+            file_snapshot = trip_header_store.load_file()
+            if file_snapshot is not None:
+                return file_snapshot
+
+        # 4. Trigger background refresh task
+        logger.info(f"Triggering background fetch for Trip.com headers (Force: {force_refresh}, No Valid Cache: True).")
+        try:
+            from app.core.tasks import fetch_trip_session_task # Delayed import
+            fetch_trip_session_task.delay()
+            logger.info("Successfully enqueued fetch_trip_session_task.")
+        except Exception as e_async:
+            logger.error(f"Failed to enqueue fetch_trip_session_task: {e_async}", exc_info=True)
+
+        # 5. No valid headers available: fetch inline via HTTP fallback
+        logger.warning("No valid Trip.com headers available. Attempting direct HTTP fetch...")
+        try:
+            direct_headers = await _fetch_trip_headers_http_fallback()
+        except Exception as e_direct:
+            logger.error(f"HTTP fallback failed: {e_direct}", exc_info=True)
+            direct_headers = None
+
+        if not trip_header_store.is_valid(direct_headers):
+            trip_header_store.record_failure()
+            logger.error("HTTP fallback failed to get valid headers")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Trip.com session data is unavailable or being refreshed. Please try again shortly."
+            )
+
+        logger.info("HTTP fallback获取成功")
+        snapshot = trip_header_store.publish(direct_headers, source="http_fallback")
+        trip_header_store.save_file(direct_headers)
+        return snapshot
+
+
+async def refresh_trip_headers_ahead() -> bool:
+    """
+    Refresh-ahead for Trip.com headers (used by the token scheduler) via direct HTTP fetch.
+    Keeps the current snapshot on failure. Returns True on success.
+    """
+    async with trip_header_store.refresh_lock():
+        try:
+            direct_headers = await _fetch_trip_headers_http_fallback()
+        except Exception as e:
+            logger.warning(f"Trip.com headers 预刷新失败: {e}")
+            direct_headers = None
+        if not trip_header_store.is_valid(direct_headers):
+            trip_header_store.record_failure()
+            return False
+        trip_header_store.publish(direct_headers, source="refresh_ahead")
+        trip_header_store.save_file(direct_headers)
+        return True
+
 
 async def load_initial_trip_cookies():
     """
     Attempts to load Trip.com cookies from the cache file into memory on application startup.
     Does not trigger a fetch if the file is invalid or expired.
     """
-    global TRIP_CURRENT_HEADERS, TRIP_LAST_FETCH_TIME
     logger.info(f"Attempting to load initial Trip.com cookies from {settings.TRIP_COOKIE_FILE}...")
-    if os.path.exists(settings.TRIP_COOKIE_FILE):
-        try:
-            now = time.time()
-            file_mod_time = os.path.getmtime(settings.TRIP_COOKIE_FILE)
-            if (now - file_mod_time) <= settings.TRIP_COOKIE_EXPIRY_SECONDS:
-                with open(settings.TRIP_COOKIE_FILE, 'r') as f:
-                    cached_headers = json.load(f)
-                    if isinstance(cached_headers, dict) and 'cookie' in cached_headers and 'user-agent' in cached_headers:
-                        # Only load if memory is empty or file is newer
-                        if not TRIP_CURRENT_HEADERS or file_mod_time > TRIP_LAST_FETCH_TIME:
-                            TRIP_CURRENT_HEADERS = cached_headers
-                            TRIP_LAST_FETCH_TIME = file_mod_time
-                            logger.info("Successfully loaded initial Trip.com headers from valid cache file into memory.")
-                        else:
-                            logger.info("In-memory Trip.com headers are already present and up-to-date.")
-                    else:
-                        logger.warning("Initial Trip.com cookie cache file has invalid format. Skipping load.")
-            else:
-                logger.info("Initial Trip.com cookie cache file found but expired. Skipping load.")
-        except Exception as e:
-            logger.warning(f"Error loading initial Trip.com cookie cache file: {e}. Skipping load.")
+    if trip_header_store.load_file() is not None:
+        logger.info("Initial Trip.com headers are available in memory.")
     else:
-        logger.info("No initial Trip.com cookie cache file found. Headers will be fetched by the first request if needed.")
+        logger.info("No valid initial Trip.com cookie cache file. Headers will be fetched by the first request if needed.")
 
 # --- Application Startup Integration ---
 # Ensure load_initial_trip_cookies and load_initial_kiwi_token are called
@@ -303,9 +229,12 @@ async def load_initial_trip_cookies():
 #
 # app = FastAPI(lifespan=lifespan)
 # --- Global State for Kiwi.com ---
-KIWI_CURRENT_HEADERS: Optional[Dict[str, str]] = None
-KIWI_LAST_FETCH_TIME: float = 0
-KIWI_FETCH_LOCK = asyncio.Lock()
+kiwi_header_store = HeaderStore(
+    "Kiwi",
+    required_keys=('kw-umbrella-token',),
+    cache_file=lambda: settings.KIWI_TOKEN_FILE,
+    expiry_seconds=lambda: settings.KIWI_COOKIE_EXPIRY_SECONDS
+)
 
 # Ensure the Kiwi cache directory exists (assuming settings.KIWI_TOKEN_FILE is defined)
 # This should ideally be done once, maybe near the Trip.com check or in startup
@@ -325,13 +254,12 @@ async def get_effective_kiwi_headers(force_refresh: bool = False) -> Dict[str, s
     """
     获取有效的 Kiwi.com headers
 
-    新的简化策略：
-    1. 优先使用预获取的缓存（内存或文件）
-    2. 只在缓存完全无效时才触发立即获取
-    3. 依赖 token 调度器进行定期刷新，避免请求时延迟
+    1. 未过期的内存快照直接返回（无锁，每个探测都走这条路径）
+    2. 快照缺失/过期或强制刷新时由单个刷新者持锁：先读文件缓存，再立即获取
+    3. token 调度器在过期前后台预刷新（refresh-ahead），正常情况下不会进入第 2 步
 
     Args:
-        force_refresh: 如果为 True，强制立即获取新 token
+        force_refresh: 如果为 True，强制立即获取新 token（并发的强制刷新合并为一次）
 
     Returns:
         包含 Kiwi.com headers 的字典
@@ -339,114 +267,82 @@ async def get_effective_kiwi_headers(force_refresh: bool = False) -> Dict[str, s
     Raises:
         HTTPException: 如果无法获取有效 headers
     """
-    global KIWI_CURRENT_HEADERS, KIWI_LAST_FETCH_TIME
+    if not force_refresh:
+        snapshot = kiwi_header_store.fresh_snapshot()
+        if snapshot is not None:
+            return dict(snapshot.headers)
+
+    snapshot = await _refresh_kiwi_snapshot(force_refresh)
+    return dict(snapshot.headers)
+
+
+async def _refresh_kiwi_snapshot(force_refresh: bool) -> HeaderSnapshot:
+    """Kiwi headers 刷新路径（单个刷新者）"""
+    requested_at = time.time()
+    async with kiwi_header_store.refresh_lock():
+        # 等锁期间其他协程可能已完成刷新
+        current = kiwi_header_store.snapshot
+        if current is not None:
+            if force_refresh and current.fetched_at >= requested_at:
+                return current
+            if not force_refresh and current.is_fresh(kiwi_header_store.expiry_seconds):
+                return current
+
+        # 检查文件缓存
+        if not force_refresh:
+            file_snapshot = kiwi_header_store.load_file()
+            if file_snapshot is not None:
+                return file_snapshot
+
+        # 缓存无效或强制刷新，立即获取
+        logger.warning("Kiwi 缓存无效或被强制刷新，开始立即获取...")
+        return await _fetch_and_publish_kiwi_headers(source="fetch")
 
-    # 检查配置
+
+async def _fetch_and_publish_kiwi_headers(source: str) -> HeaderSnapshot:
+    """获取新 headers 并发布为当前快照（调用方需持有刷新锁）"""
     try:
-        expiry_seconds = settings.KIWI_COOKIE_EXPIRY_SECONDS
-        cache_file_path = settings.KIWI_TOKEN_FILE
-    except AttributeError as e:
-        logger.critical(f"Missing required Kiwi settings: {e}")
+        fresh_headers = await _get_fresh_kiwi_headers_sync()
+    except Exception as e:
+        logger.error(f"立即获取 Kiwi headers 异常: {e}")
+        fresh_headers = None
+
+    if not kiwi_header_store.is_valid(fresh_headers):
+        kiwi_header_store.record_failure()
+        logger.error("立即获取 Kiwi headers 失败")
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Server configuration error: {e}"
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Unable to obtain fresh Kiwi.com session data"
         )
 
-    async with KIWI_FETCH_LOCK:
-        now = time.time()
-
-        # 1. 检查内存缓存（最快）
-        memory_expired = (now - KIWI_LAST_FETCH_TIME) > expiry_seconds
-        if not force_refresh and KIWI_CURRENT_HEADERS and not memory_expired:
-            logger.info("使用有效的内存 Kiwi headers")
-            return KIWI_CURRENT_HEADERS.copy()
-
-        # 2. 检查文件缓存
-        if not force_refresh and os.path.exists(cache_file_path):
-            try:
-                file_mod_time = os.path.getmtime(cache_file_path)
-                file_expired = (now - file_mod_time) > expiry_seconds
-                if not file_expired:
-                    with open(cache_file_path, 'r') as f:
-                        cached_headers = json.load(f)
-                        if isinstance(cached_headers, dict) and 'kw-umbrella-token' in cached_headers:
-                            # 更新内存缓存
-                            KIWI_CURRENT_HEADERS = cached_headers.copy()
-                            KIWI_LAST_FETCH_TIME = file_mod_time
-                            logger.info("从文件缓存加载有效的 Kiwi headers")
-                            return cached_headers.copy()
-            except Exception as e:
-                logger.warning(f"读取 Kiwi 缓存文件失败: {e}")
-
-        # 3. 缓存无效或强制刷新，立即获取
-        logger.warning("Kiwi 缓存无效或被强制刷新，开始立即获取...")
+    snapshot = kiwi_header_store.publish(fresh_headers, source=source)
+    kiwi_header_store.save_file(fresh_headers)
+    # 新请求头下的身份需重新验证（由 token 调度器执行）
+    kiwi_identity_pool.invalidate()
+    logger.info("获取 Kiwi headers 成功，已更新缓存")
+    return snapshot
+
+
+async def refresh_kiwi_headers_ahead() -> bool:
+    """过期前预刷新 Kiwi headers（token 调度器使用），失败时保留当前快照，返回是否成功"""
+    async with kiwi_header_store.refresh_lock():
         try:
-            fresh_headers = await _get_fresh_kiwi_headers_sync()
-            if fresh_headers and 'kw-umbrella-token' in fresh_headers:
-                # 更新内存缓存
-                KIWI_CURRENT_HEADERS = fresh_headers.copy()
-                KIWI_LAST_FETCH_TIME = time.time()
-
-                # 保存到文件缓存
-                try:
-                    with open(cache_file_path, 'w') as f:
-                        json.dump(fresh_headers, f, indent=2)
-                    logger.info("立即获取 Kiwi headers 成功，已更新缓存")
-                except Exception as e:
-                    logger.warning(f"保存 Kiwi 缓存失败: {e}")
-
-                return fresh_headers
-            else:
-                logger.error("立即获取 Kiwi headers 失败")
-                raise HTTPException(
-                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                    detail="Unable to obtain fresh Kiwi.com session data"
-                )
-        except Exception as e:
-            logger.error(f"立即获取 Kiwi headers 异常: {e}")
-            raise HTTPException(
-                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                detail="Kiwi.com session data temporarily unavailable"
-            )
+            await _fetch_and_publish_kiwi_headers(source="refresh_ahead")
+            return True
+        except HTTPException:
+            return False
+
 
 async def load_initial_kiwi_token():
     """
     Attempts to load Kiwi.com token/headers from the cache file into memory on application startup.
     Does not trigger a fetch if the file is invalid or expired.
     """
-    global KIWI_CURRENT_HEADERS, KIWI_LAST_FETCH_TIME
-    logger.info(f"Attempting to load initial Kiwi.com token from settings.KIWI_TOKEN_FILE...")
-
-    try:
-        token_file = settings.KIWI_TOKEN_FILE
-        expiry_seconds = settings.KIWI_COOKIE_EXPIRY_SECONDS
-    except AttributeError as e:
-        logger.error(f"Missing required Kiwi settings for initial load: {e}. Cannot load initial token.")
-        return # Cannot proceed without settings
-
-    if os.path.exists(token_file):
-        try:
-            now = time.time()
-            file_mod_time = os.path.getmtime(token_file)
-            if (now - file_mod_time) <= expiry_seconds:
-                with open(token_file, 'r') as f:
-                    cached_headers = json.load(f)
-                    if isinstance(cached_headers, dict) and 'kw-umbrella-token' in cached_headers:
-                         # Only load if memory is empty or file is newer
-                        if not KIWI_CURRENT_HEADERS or file_mod_time > KIWI_LAST_FETCH_TIME:
-                            KIWI_CURRENT_HEADERS = cached_headers
-                            KIWI_LAST_FETCH_TIME = file_mod_time
-                            logger.info("Successfully loaded initial Kiwi.com headers from valid cache file into memory.")
-                        else:
-                            logger.info("In-memory Kiwi.com headers are already present and up-to-date.")
-                    else:
-                        logger.warning("Initial Kiwi.com token cache file has invalid format. Skipping load.")
-            else:
-                logger.info("Initial Kiwi.com token cache file found but expired. Skipping load.")
-        except Exception as e:
-            logger.warning(f"Error loading initial Kiwi.com token cache file: {e}. Skipping load.")
+    logger.info(f"Attempting to load initial Kiwi.com token from {settings.KIWI_TOKEN_FILE}...")
+    if kiwi_header_store.load_file() is not None:
+        logger.info("Initial Kiwi.com headers are available in memory.")
     else:
-        logger.info("No initial Kiwi.com token cache file found. Headers will be fetched by the first request if needed.")
+        logger.info("No valid initial Kiwi.com token cache file. Headers will be fetched by the first request if needed.")
 
 # --- 同步 Kiwi Token 获取（基于工作代码的降级方案）---
 
@@ -477,6 +373,7 @@ async def _get_fresh_kiwi_headers_sync() -> Optional[Dict[str, str]]:
                     "query": "query { __typename }",
                     "variables": {}
                 }
+                await kiwi_rate_limiter.acquire(LANE_BACKGROUND)
                 response = await client.post(
                     "https://api.skypicker.com/umbrella/v2/graphql",
                     headers=fallback_headers,
@@ -598,6 +495,7 @@ async def debug_kiwi_api_request(origin: str = "PEK", destination: str = "LAX",
         api_url = "https://api.skypicker.com/umbrella/v2/graphql?featureName=SearchOneWayItinerariesQuery"
 
         async with httpx.AsyncClient(timeout=30.0) as client:
+            await kiwi_rate_limiter.acquire(LANE_BACKGROUND)
             response = await client.post(api_url, headers=headers, json=payload)
 
             logger.info(f"响应状态码: {response.status_code}")
@@ -620,8 +518,8 @@ async def debug_kiwi_api_request(origin: str = "PEK", destination: str = "LAX",
                             logger.info(f"第一个航班详情: {json.dumps(first_itinerary, indent=2, ensure_ascii=False)}")
 
                             # 尝试解析为我们的格式
-                            from app.services.kiwi_flight_service import _parse_kiwi_itinerary
-                            parsed = await _parse_kiwi_itinerary(first_itinerary, is_one_way=True)
+                            from app.core.itinerary_parser import parse_itinerary
+                            parsed = parse_itinerary(first_itinerary, is_one_way=True, requested_currency="CNY")
                             if parsed:
                                 logger.info(f"解析后的航班: {parsed.model_dump()}")
                             else:
@@ -0,0 +1,38 @@
+"""
+Kiwi 响应 JSON 快速编解码
+安装了 orjson 时直接从响应字节解码（不经过 str 中转，解码速度与临时分配都明显优于标准库），
+未安装时回退到标准库 json。orjson.JSONDecodeError 是 json.JSONDecodeError 的子类，
+调用方现有的 except json.JSONDecodeError 无需修改
+"""
+
+import json
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:  # 可选依赖
+    orjson = None
+
+
+def orjson_available() -> bool:
+    """是否启用了 orjson 快速路径"""
+    return orjson is not None
+
+
+def loads(data: Union[bytes, bytearray, memoryview, str]) -> Any:
+    """解码 JSON（bytes 或 str）"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps_bytes(obj: Any) -> bytes:
+    """紧凑编码为 UTF-8 字节（不转义非 ASCII 字符）"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def decode_response(response) -> Any:
+    """解码 httpx 响应体，替代 response.json()，避免先把整个响应体解码为 str"""
+    return loads(response.content)
@@ -0,0 +1,139 @@
+"""
+上游请求头快照
+- 当前请求头保存为不可变快照（headers + 获取时间 + 来源），刷新时整体替换引用，
+  读取方无需加锁、不会读到“新 headers + 旧时间”这类撕裂状态
+- 只有快照缺失/过期或强制刷新时才进入刷新路径，刷新路径由单个刷新者持锁执行，
+  等锁期间其他协程已完成的刷新直接复用
+- 提供请求头年龄等统计，用于健康检查
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Mapping, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class HeaderSnapshot:
+    """不可变的请求头快照"""
+    headers: Mapping[str, str]
+    fetched_at: float
+    source: str
+
+    def age(self, now: Optional[float] = None) -> float:
+        return (time.time() if now is None else now) - self.fetched_at
+
+    def is_fresh(self, expiry_seconds: float, now: Optional[float] = None) -> bool:
+        return self.age(now) <= expiry_seconds
+
+
+class HeaderStore:
+    """单个上游（Kiwi / Trip.com）的请求头快照与文件缓存"""
+
+    def __init__(
+        self,
+        name: str,
+        required_keys: Tuple[str, ...],
+        cache_file: Callable[[], str],
+        expiry_seconds: Callable[[], float]
+    ):
+        self.name = name
+        self.required_keys = required_keys
+        self._cache_file = cache_file
+        self._expiry_seconds = expiry_seconds
+        self.snapshot: Optional[HeaderSnapshot] = None
+        # asyncio.Lock 绑定事件循环，Celery 任务每次 asyncio.run 都是新循环
+        self._lock: Optional[Tuple[asyncio.AbstractEventLoop, asyncio.Lock]] = None
+        self.stats = {"fast_path": 0, "slow_path": 0, "refreshes": 0, "refresh_failures": 0, "file_loads": 0}
+
+    @property
+    def expiry_seconds(self) -> float:
+        return self._expiry_seconds()
+
+    def is_valid(self, headers: Any) -> bool:
+        return isinstance(headers, dict) and all(key in headers for key in self.required_keys)
+
+    def refresh_lock(self) -> asyncio.Lock:
+        """刷新者使用的锁（读取路径不使用）"""
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._lock[0] is not loop:
+            self._lock = (loop, asyncio.Lock())
+        return self._lock[1]
+
+    def fresh_snapshot(self, now: Optional[float] = None) -> Optional[HeaderSnapshot]:
+        """无锁读取：返回未过期的当前快照，否则返回 None"""
+        snapshot = self.snapshot
+        if snapshot is not None and snapshot.is_fresh(self.expiry_seconds, now):
+            self.stats["fast_path"] += 1
+            return snapshot
+        self.stats["slow_path"] += 1
+        return None
+
+    def publish(self, headers: Dict[str, str], fetched_at: Optional[float] = None, source: str = "fetch") -> HeaderSnapshot:
+        """发布新快照（单次引用替换）"""
+        snapshot = HeaderSnapshot(
+            headers=MappingProxyType(dict(headers)),
+            fetched_at=time.time() if fetched_at is None else fetched_at,
+            source=source
+        )
+        self.snapshot = snapshot
+        if source != "file":
+            self.stats["refreshes"] += 1
+        return snapshot
+
+    def record_failure(self) -> None:
+        self.stats["refresh_failures"] += 1
+
+    def load_file(self, max_age: Optional[float] = None) -> Optional[HeaderSnapshot]:
+        """读取文件缓存，未过期且格式有效时发布为当前快照（比当前快照旧时不覆盖）"""
+        cache_file_path = self._cache_file()
+        max_age = self.expiry_seconds if max_age is None else max_age
+        try:
+            if not os.path.exists(cache_file_path):
+                return None
+            file_mod_time = os.path.getmtime(cache_file_path)
+            if (time.time() - file_mod_time) > max_age:
+                logger.info(f"{self.name} 请求头缓存文件已过期: {cache_file_path}")
+                return None
+            current = self.snapshot
+            if current is not None and current.fetched_at >= file_mod_time:
+                return current if current.is_fresh(max_age) else None
+            with open(cache_file_path, 'r') as f:
+                cached_headers = json.load(f)
+            if not self.is_valid(cached_headers):
+                logger.warning(f"{self.name} 请求头缓存文件格式无效: {cache_file_path}")
+                return None
+        except Exception as e:
+            logger.warning(f"读取 {self.name} 请求头缓存文件失败 {cache_file_path}: {e}")
+            return None
+        self.stats["file_loads"] += 1
+        logger.info(f"从文件缓存加载 {self.name} 请求头: {cache_file_path}")
+        return self.publish(cached_headers, fetched_at=file_mod_time, source="file")
+
+    def save_file(self, headers: Dict[str, str]) -> None:
+        cache_file_path = self._cache_file()
+        try:
+            with open(cache_file_path, 'w') as f:
+                json.dump(headers, f, indent=2)
+        except Exception as e:
+            logger.warning(f"保存 {self.name} 请求头缓存文件失败 {cache_file_path}: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """请求头年龄与刷新统计（用于健康检查）"""
+        snapshot = self.snapshot
+        expiry = self.expiry_seconds
+        stats: Dict[str, Any] = {"has_headers": snapshot is not None, "expiry_seconds": expiry, **self.stats}
+        if snapshot is not None:
+            age = snapshot.age()
+            stats.update({
+                "age_seconds": round(age, 1),
+                "expires_in_seconds": round(expiry - age, 1),
+                "source": snapshot.source,
+            })
+        return stats
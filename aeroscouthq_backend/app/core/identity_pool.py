@@ -0,0 +1,212 @@
+"""
+Kiwi 请求身份池
+- 维护 N 组身份（User-Agent / 访客 ID / rand-id，配置了多个 umbrella token 时按身份分配 token），
+  叠加在当前有效的 Kiwi 请求头快照之上，避免所有上游请求共用一个身份与限流桶
+- 每个身份记录健康分、在途请求数，出错（401/403/429/5xx/超时）后进入指数增长的冷却期
+- 请求分配给在途数最少的健康身份；全部冷却时选择最早结束冷却的身份，不阻塞请求
+- 新身份由 token 调度器在请求头刷新后用轻量查询验证，未通过验证的身份进入冷却
+"""
+
+import logging
+import secrets
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+import httpx
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_VALIDATION_QUERY = {"query": "query { __typename }", "variables": {}}
+
+
+class KiwiIdentity:
+    """单个请求身份"""
+
+    def __init__(self, index: int, user_agent: str, token: Optional[str]):
+        self.index = index
+        self.user_agent = user_agent
+        self.token = token
+        self.visitor_id = str(uuid.uuid4())
+        self.rand_id = secrets.token_hex(4)
+        self.health = 1.0
+        self.inflight = 0
+        self.cooldown_until = 0.0
+        self.consecutive_failures = 0
+        self.validated = False
+        self.requests = 0
+        self.failures = 0
+
+    def is_cooling(self, now: float) -> bool:
+        return now < self.cooldown_until
+
+    def apply(self, base_headers: Dict[str, str]) -> Dict[str, str]:
+        """在基础请求头上覆盖本身份的字段"""
+        headers = dict(base_headers)
+        headers['user-agent'] = self.user_agent
+        headers['kw-skypicker-visitor-uniqid'] = self.visitor_id
+        headers['kw-x-rand-id'] = self.rand_id
+        if self.token:
+            headers['kw-umbrella-token'] = self.token
+        return headers
+
+    def to_dict(self, now: float) -> Dict[str, Any]:
+        return {
+            "index": self.index,
+            "health": round(self.health, 3),
+            "inflight": self.inflight,
+            "cooldown_remaining": round(max(0.0, self.cooldown_until - now), 1),
+            "validated": self.validated,
+            "requests": self.requests,
+            "failures": self.failures,
+        }
+
+
+class IdentityLease:
+    """一次请求占用的身份（由 lease() 上下文管理器使用）"""
+
+    def __init__(self, identity: Optional[KiwiIdentity], headers: Dict[str, str]):
+        self.identity = identity
+        self.headers = headers
+        self.status_code: Optional[int] = None
+
+    def observe(self, status_code: int) -> None:
+        """记录响应状态码，用于更新身份健康分"""
+        self.status_code = status_code
+
+
+class IdentityPool:
+    """Kiwi 请求身份池"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._identities: List[KiwiIdentity] = []
+        self.stats = {"leases": 0, "all_cooling": 0, "cooldowns": 0}
+
+    def _ensure_identities(self) -> List[KiwiIdentity]:
+        if not self._identities:
+            user_agents = settings.USER_AGENT_POOL or [None]
+            tokens = settings.KIWI_IDENTITY_TOKENS
+            size = max(1, settings.KIWI_IDENTITY_POOL_SIZE, len(tokens))
+            self._identities = [
+                KiwiIdentity(
+                    index=i,
+                    user_agent=user_agents[i % len(user_agents)],
+                    token=tokens[i % len(tokens)] if tokens else None
+                )
+                for i in range(size)
+            ]
+            logger.info(f"{self.name} 身份池已创建: {size} 个身份，{len(tokens) or 1} 个 umbrella token")
+        return self._identities
+
+    def _pick(self) -> KiwiIdentity:
+        identities = self._ensure_identities()
+        now = time.monotonic()
+        available = [identity for identity in identities if not identity.is_cooling(now)]
+        if not available:
+            self.stats["all_cooling"] += 1
+            return min(identities, key=lambda identity: identity.cooldown_until)
+        # 在途最少优先，其次健康分最高
+        return min(available, key=lambda identity: (identity.inflight, -identity.health))
+
+    @contextmanager
+    def lease(self, base_headers: Dict[str, str]) -> Iterator[IdentityLease]:
+        """为一次请求分配身份，返回叠加了身份字段的请求头"""
+        if not settings.KIWI_IDENTITY_POOL_ENABLED or not base_headers:
+            yield IdentityLease(None, base_headers)
+            return
+
+        identity = self._pick()
+        identity.inflight += 1
+        identity.requests += 1
+        self.stats["leases"] += 1
+        lease = IdentityLease(identity, identity.apply(base_headers))
+        try:
+            yield lease
+        except (httpx.TimeoutException, httpx.TransportError):
+            self._on_failure(identity, "transport")
+            raise
+        else:
+            status_code = lease.status_code
+            if status_code is not None and (status_code in (401, 403, 429) or status_code >= 500):
+                self._on_failure(identity, f"HTTP {status_code}", long=status_code in (401, 403, 429))
+            elif status_code is not None:
+                self._on_success(identity)
+        finally:
+            identity.inflight -= 1
+
+    def _on_success(self, identity: KiwiIdentity) -> None:
+        identity.consecutive_failures = 0
+        identity.validated = True
+        identity.health = min(1.0, identity.health + 0.1)
+
+    def _on_failure(self, identity: KiwiIdentity, reason: str, long: bool = False) -> None:
+        identity.failures += 1
+        identity.consecutive_failures += 1
+        identity.health *= 0.5
+        # 身份相关错误（认证/限流）冷却时间加倍，连续失败时指数增长
+        base = settings.KIWI_IDENTITY_COOLDOWN_SECONDS * (2 if long else 1)
+        cooldown = min(settings.KIWI_IDENTITY_MAX_COOLDOWN_SECONDS, base * 2 ** (identity.consecutive_failures - 1))
+        identity.cooldown_until = time.monotonic() + cooldown
+        self.stats["cooldowns"] += 1
+        logger.warning(f"{self.name} 身份 #{identity.index} 请求失败 ({reason})，冷却 {cooldown:.0f}s")
+
+    async def validate(self, base_headers: Dict[str, str]) -> int:
+        """用轻量查询验证尚未验证的身份，返回通过验证的数量（失败的身份进入冷却）"""
+        if not settings.KIWI_IDENTITY_POOL_ENABLED or not base_headers:
+            return 0
+        # 延迟导入，避免与限速器/客户端模块循环导入
+        from app.core.kiwi_client import kiwi_client_manager
+        from app.core.upstream_rate_limiter import kiwi_rate_limiter, KiwiRateLimitError, LANE_BACKGROUND
+
+        client = kiwi_client_manager.get_client()
+        passed = 0
+        now = time.monotonic()
+        for identity in self._ensure_identities():
+            # 冷却中的身份等冷却结束后再验证
+            if identity.validated or identity.is_cooling(now):
+                continue
+            try:
+                await kiwi_rate_limiter.acquire(LANE_BACKGROUND)
+            except KiwiRateLimitError:
+                # 限速预算紧张时让出给搜索请求，剩余身份下次再验证
+                logger.info(f"{self.name} 身份验证等待令牌超时，暂停本轮验证")
+                break
+            try:
+                response = await client.post(
+                    "https://api.skypicker.com/umbrella/v2/graphql",
+                    headers=identity.apply(base_headers), json=_VALIDATION_QUERY, timeout=10.0
+                )
+            except (httpx.TimeoutException, httpx.TransportError) as e:
+                self._on_failure(identity, f"validation {type(e).__name__}")
+                continue
+            if response.status_code == 200:
+                self._on_success(identity)
+                passed += 1
+            else:
+                self._on_failure(identity, f"validation HTTP {response.status_code}", long=True)
+        return passed
+
+    def invalidate(self) -> None:
+        """请求头刷新后重新验证所有身份"""
+        for identity in self._identities:
+            identity.validated = False
+
+    def get_stats(self) -> Dict[str, Any]:
+        """身份池状态（用于健康检查）"""
+        now = time.monotonic()
+        identities = self._identities
+        return {
+            "enabled": settings.KIWI_IDENTITY_POOL_ENABLED,
+            "size": len(identities),
+            "available": sum(1 for identity in identities if not identity.is_cooling(now)),
+            **self.stats,
+            "identities": [identity.to_dict(now) for identity in identities],
+        }
+
+
+# 全局实例
+kiwi_identity_pool = IdentityPool("Kiwi")
@@ -0,0 +1,342 @@
+"""
+Kiwi 行程批量解析器
+所有搜索路径（Celery 任务、V2 策略、kiwi_flight_service）共用的同步解析实现：
+以整页原始行程为单位解析，页内复用站点/承运人/时间解析结果，
+并使用 model_construct 构建可信数据的 Pydantic 模型以跳过重复校验
+"""
+
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.apis.v1 import schemas
+from app.core.search_debug import search_debug_sampled, emit_search_debug
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class PageLookups:
+    """单页内共享的站点、承运人与时间解析缓存
+
+    同一页的行程大量重复相同机场、航司与起降时间，按原始值缓存可避免重复的嵌套取值与 ISO 解析。
+    """
+
+    __slots__ = ("_stations", "_carriers", "_datetimes")
+
+    def __init__(self):
+        self._stations: Dict[str, Tuple[str, Optional[str], Optional[str]]] = {}
+        self._carriers: Dict[str, Tuple[str, Optional[str]]] = {}
+        self._datetimes: Dict[str, Optional[datetime]] = {}
+
+    def station(self, raw_station: Optional[dict]) -> Optional[Tuple[str, Optional[str], Optional[str]]]:
+        """返回 (code, name, city_name)，缺少代码时返回None"""
+        if not raw_station:
+            return None
+        code = raw_station.get("code")
+        if not code:
+            return None
+        cached = self._stations.get(code)
+        if cached is None:
+            city = raw_station.get("city") or {}
+            cached = (code, raw_station.get("name"), city.get("name"))
+            self._stations[code] = cached
+        return cached
+
+    def carrier(self, raw_carrier: Optional[dict]) -> Optional[Tuple[str, Optional[str]]]:
+        """返回 (code, name)，缺少代码时返回None"""
+        if not raw_carrier:
+            return None
+        code = raw_carrier.get("code")
+        if not code:
+            return None
+        cached = self._carriers.get(code)
+        if cached is None:
+            cached = (code, raw_carrier.get("name"))
+            self._carriers[code] = cached
+        return cached
+
+    def datetime(self, value: Optional[str]) -> Optional[datetime]:
+        """解析 ISO 8601 时间字符串（支持结尾的 Z）"""
+        if not value:
+            return None
+        cached = self._datetimes.get(value, _MISSING)
+        if cached is not _MISSING:
+            return cached
+        try:
+            parsed = datetime.fromisoformat(value[:-1] + "+00:00" if value.endswith("Z") else value)
+        except (ValueError, TypeError) as e:
+            logger.warning(f"Could not parse datetime string '{value}': {e}")
+            parsed = None
+        self._datetimes[value] = parsed
+        return parsed
+
+
+def collect_hack_destinations(raw_itinerary_data: dict) -> List[tuple]:
+    """收集携带 hiddenDestination/throwawayDestination 的航段：(leg, segment_index, field, value)"""
+    found = []
+    for leg_name in ("sector", "outbound", "inbound"):
+        leg_data = raw_itinerary_data.get(leg_name)
+        if not leg_data:
+            continue
+        for i, segment_data in enumerate(leg_data.get("sectorSegments") or ()):
+            segment = segment_data.get("segment") or {}
+            hidden_dest = segment.get("hiddenDestination")
+            if hidden_dest:
+                found.append((leg_name, i, "hiddenDestination", hidden_dest))
+            throwaway_dest = segment.get("throwawayDestination")
+            if throwaway_dest:
+                found.append((leg_name, i, "throwawayDestination", throwaway_dest))
+    return found
+
+
+def parse_segment(raw_segment_data: dict, lookups: PageLookups) -> Optional[schemas.FlightSegment]:
+    """解析单个 sectorSegments 元素，关键字段缺失时返回None"""
+    segment = raw_segment_data.get("segment")
+    if not segment:
+        logger.warning("Segment data missing in raw_segment_data")
+        return None
+
+    source = segment.get("source") or {}
+    destination = segment.get("destination") or {}
+    source_station = lookups.station(source.get("station"))
+    dest_station = lookups.station(destination.get("station"))
+    carrier = lookups.carrier(segment.get("carrier"))
+    # operatingCarrier 可能为 null，回退为销售承运人
+    op_carrier = lookups.carrier(segment.get("operatingCarrier")) or carrier
+    if not (source_station and dest_station and carrier and op_carrier):
+        logger.warning("Missing critical segment codes (departure, arrival, carrier, operating carrier)")
+        return None
+
+    # 航班号优先级：segment.code > carrier-flightNumber > 占位符
+    flight_number = segment.get("code")
+    if not flight_number:
+        flight_number_raw = segment.get("flightNumber")
+        flight_number = f"{carrier[0]}-{flight_number_raw}" if flight_number_raw else f"{carrier[0]}-?"
+
+    departure_time = lookups.datetime(source.get("localTime"))
+    arrival_time = lookups.datetime(destination.get("localTime"))
+    duration_seconds = segment.get("duration")
+    if departure_time is None or arrival_time is None or duration_seconds is None:
+        logger.warning(f"Missing critical parsed segment data (local times, duration) for segment {flight_number} from {source_station[0]} @ {source.get('localTime')}")
+        return None
+
+    layover = raw_segment_data.get("layover")
+    return schemas.FlightSegment.model_construct(
+        departure_airport=source_station[0],
+        arrival_airport=dest_station[0],
+        departure_airport_name=source_station[1],
+        arrival_airport_name=dest_station[1],
+        departure_city=source_station[2],
+        arrival_city=dest_station[2],
+        departure_time=departure_time,
+        arrival_time=arrival_time,
+        departure_time_utc=lookups.datetime(source.get("utcTimeIso")),
+        arrival_time_utc=lookups.datetime(destination.get("utcTimeIso")),
+        duration_minutes=int(duration_seconds) // 60,
+        carrier_code=carrier[0],
+        carrier_name=carrier[1],
+        operating_carrier_code=op_carrier[0],
+        operating_carrier_name=op_carrier[1],
+        flight_number=flight_number,
+        cabin_class=segment.get("cabinClass"),
+        aircraft=(segment.get("vehicle") or {}).get("type"),
+        departure_terminal=(source.get("station") or {}).get("terminal"),
+        arrival_terminal=(destination.get("station") or {}).get("terminal"),
+        layover_duration_minutes=int(layover["duration"]) // 60 if layover and layover.get("duration") is not None else None,
+        is_baggage_recheck=bool(layover.get("isBaggageRecheck")) if layover else None
+    )
+
+
+def _parse_leg(leg_data: dict, lookups: PageLookups) -> Tuple[List[schemas.FlightSegment], bool]:
+    """解析一个航程（sector/outbound/inbound），返回 (航段列表, 是否需要重新托运行李)"""
+    segments: List[schemas.FlightSegment] = []
+    baggage_recheck = False
+    for segment_data in leg_data.get("sectorSegments") or ():
+        parsed_segment = parse_segment(segment_data, lookups)
+        if parsed_segment is not None:
+            segments.append(parsed_segment)
+        layover = segment_data.get("layover")
+        if layover and layover.get("isBaggageRecheck"):
+            baggage_recheck = True
+
+    for current_seg, next_seg in zip(segments, segments[1:]):
+        current_seg.next_segment_requires_airport_change = current_seg.arrival_airport != next_seg.departure_airport
+    if segments:
+        segments[-1].next_segment_requires_airport_change = False
+    return segments, baggage_recheck
+
+
+def _resolve_price(raw_itinerary_data: dict, requested_currency: str, cny_only: bool) -> Tuple[Optional[float], str]:
+    """解析行程价格，返回 (价格, 货币)
+
+    cny_only 时仅接受请求 CNY 时 Kiwi 返回的 price 字段（不做汇率换算）；
+    否则 price 为请求货币价格，缺失时回退 priceEur。
+    """
+    currency = (requested_currency or "CNY").upper()
+    price_amount = (raw_itinerary_data.get("price") or {}).get("amount")
+    if cny_only:
+        if currency != "CNY" or price_amount is None:
+            return None, "CNY"
+        return float(price_amount), "CNY"
+
+    if price_amount is not None:
+        return float(price_amount), currency
+    price_eur = (raw_itinerary_data.get("priceEur") or {}).get("amount")
+    return (float(price_eur), "EUR") if price_eur is not None else (None, currency)
+
+
+def parse_itinerary(
+    raw_itinerary_data: dict,
+    is_one_way: bool,
+    requested_currency: str = "CNY",
+    lookups: Optional[PageLookups] = None,
+    cny_only: bool = True
+) -> Optional[schemas.FlightItinerary]:
+    """解析单条原始行程，无法解析或不满足价格要求时返回None
+
+    Args:
+        raw_itinerary_data: Kiwi 返回的单条行程
+        is_one_way: 单程（sector）或往返（outbound/inbound）
+        requested_currency: 请求 Kiwi 时使用的货币
+        lookups: 页内共享缓存，单独调用时可省略
+        cny_only: 仅保留 CNY 价格的行程（V2 策略与 Celery 任务的约定）
+    """
+    if not raw_itinerary_data or not isinstance(raw_itinerary_data, dict):
+        logger.warning("Received empty or invalid raw_itinerary_data")
+        return None
+    if lookups is None:
+        lookups = PageLookups()
+
+    itinerary_id = raw_itinerary_data.get("id")
+    try:
+        # 诊断信息只在调试通道开启且命中抽样时收集，避免热路径上的字符串格式化
+        debug_sampled = search_debug_sampled()
+
+        price, currency = _resolve_price(raw_itinerary_data, requested_currency, cny_only)
+        if price is None:
+            logger.debug("行程缺少请求货币价格，跳过 - itinerary_id: %s, requested_currency: %s", itinerary_id, requested_currency)
+            return None
+        if price <= 0:
+            logger.error(f"❌ 最终价格无效，跳过此航班 - itinerary_id: {itinerary_id}, price: {price}")
+            return None
+
+        total_duration_seconds = raw_itinerary_data.get("duration")
+        if not itinerary_id or total_duration_seconds is None:
+            logger.warning(f"Missing critical itinerary fields (id, duration) for itinerary data: {str(raw_itinerary_data)[:200]}")
+            return None
+
+        # 从 bookingOptions 中提取预订令牌与链接
+        booking_token = None
+        booking_url = None
+        edges = (raw_itinerary_data.get("bookingOptions") or {}).get("edges")
+        if edges:
+            first_option = edges[0].get("node") or {}
+            booking_token = first_option.get("token")
+            booking_url = first_option.get("bookingUrl")
+        if not booking_token:
+            # FlightItinerary.booking_token 为必填字段
+            logger.warning(f"Missing booking token for itinerary {itinerary_id}")
+            return None
+
+        # 解析航段
+        if is_one_way:
+            leg_names = ("sector",)
+        else:
+            leg_names = ("outbound", "inbound")
+        outbound_leg = raw_itinerary_data.get(leg_names[0])
+        if not outbound_leg or "sectorSegments" not in outbound_leg:
+            logger.warning(f"Itinerary {itinerary_id} missing '{leg_names[0]}.sectorSegments' structure.")
+            return None
+
+        outbound_segments, outbound_recheck = _parse_leg(outbound_leg, lookups)
+        if not outbound_segments:
+            logger.warning(f"Parsed 0 valid segments from {leg_names[0]} leg of itinerary {itinerary_id}.")
+            return None
+
+        inbound_segments: List[schemas.FlightSegment] = []
+        inbound_recheck = False
+        if not is_one_way:
+            inbound_leg = raw_itinerary_data.get("inbound")
+            # inbound 结构存在但没有航段是允许的
+            if inbound_leg and inbound_leg.get("sectorSegments"):
+                inbound_segments, inbound_recheck = _parse_leg(inbound_leg, lookups)
+
+        # PNR 数量或任一中转需要重新托运行李都视为自助中转
+        is_self_transfer = raw_itinerary_data.get("pnrCount", 1) > 1 or outbound_recheck or inbound_recheck
+
+        travel_hack_data = raw_itinerary_data.get("travelHack") or {}
+        is_hidden_city = travel_hack_data.get("isTrueHiddenCity", False)
+        is_throwaway_ticket = travel_hack_data.get("isThrowawayTicket", False)
+
+        # 发现 hiddenDestination 但 isTrueHiddenCity 为 False 时，强制标记为甩尾票
+        hack_destinations = collect_hack_destinations(raw_itinerary_data)
+        hidden_flag_forced = not is_hidden_city and any(field == "hiddenDestination" for _, _, field, _ in hack_destinations)
+        if hidden_flag_forced:
+            is_hidden_city = True
+
+        # 深度链接优先级：bookingUrl > booking token > shareId > 搜索链接
+        share_id = raw_itinerary_data.get("shareId")
+        if booking_url:
+            deep_link = booking_url
+        elif booking_token:
+            deep_link = f"https://www.kiwi.com/en/booking?token={booking_token}"
+        elif share_id:
+            deep_link = f"https://www.kiwi.com/deep?shareId={share_id}"
+        else:
+            deep_link = f"https://www.kiwi.com/search?id={itinerary_id}"
+
+        if debug_sampled:
+            emit_search_debug(
+                "itinerary_parsed",
+                itinerary_id=itinerary_id,
+                requested_currency=requested_currency,
+                price=raw_itinerary_data.get("price"),
+                price_eur=raw_itinerary_data.get("priceEur"),
+                final_price=price,
+                travel_hack=travel_hack_data,
+                hack_destinations=[
+                    {"leg": leg, "segment": index, "field": field, "value": value}
+                    for leg, index, field, value in hack_destinations
+                ],
+                hidden_flag_forced=hidden_flag_forced,
+                is_throwaway_ticket=is_throwaway_ticket
+            )
+
+        return schemas.FlightItinerary.model_construct(
+            id=itinerary_id,
+            price=price,
+            currency=currency,
+            booking_token=booking_token,
+            deep_link=deep_link,
+            outbound_segments=outbound_segments,
+            inbound_segments=inbound_segments or None,
+            segments=outbound_segments + inbound_segments,
+            total_duration_minutes=int(total_duration_seconds) // 60,
+            is_self_transfer=is_self_transfer,
+            is_hidden_city=is_hidden_city,
+            is_throwaway_deal=is_throwaway_ticket,
+            data_source="kiwi",
+            raw_data=None
+        )
+
+    except (KeyError, TypeError, ValueError, AttributeError) as e:
+        logger.error(f"Failed to parse Kiwi itinerary {itinerary_id or 'UNKNOWN_ID'}: {e}. Raw data snippet: {str(raw_itinerary_data)[:500]}", exc_info=True)
+        return None
+
+
+def parse_itineraries(
+    raw_itineraries: Iterable[dict],
+    is_one_way: bool,
+    requested_currency: str = "CNY",
+    cny_only: bool = True
+) -> List[schemas.FlightItinerary]:
+    """批量解析一页原始行程，丢弃无法解析的条目（保持原始顺序）"""
+    lookups = PageLookups()
+    parsed = []
+    for raw_itinerary in raw_itineraries:
+        itinerary = parse_itinerary(raw_itinerary, is_one_way, requested_currency, lookups, cny_only)
+        if itinerary is not None:
+            parsed.append(itinerary)
+    return parsed
@@ -0,0 +1,110 @@
+"""
+Kiwi HTTP客户端管理器
+负责管理访问 Kiwi GraphQL API 的共享 httpx.AsyncClient（连接池 / keep-alive / 可选 HTTP/2）
+"""
+
+import asyncio
+import importlib.util
+import logging
+from typing import Optional
+
+import httpx
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _http2_available() -> bool:
+    """检查是否安装了 HTTP/2 依赖 (h2)"""
+    return importlib.util.find_spec("h2") is not None
+
+
+class KiwiClientManager:
+    """Kiwi HTTP客户端管理器
+
+    httpx.AsyncClient 的连接绑定在创建它的事件循环上。FastAPI 进程中只有一个事件循环，
+    客户端在 lifespan 中创建；Celery worker 进程在长期事件循环上创建（见 worker_runtime），
+    跨任务复用连接池。事件循环变化时（如回退到 asyncio.run）会自动重建客户端。
+    """
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._http2: bool = False
+
+    def _create_client(self) -> httpx.AsyncClient:
+        """按配置创建新的 AsyncClient"""
+        self._http2 = settings.KIWI_HTTP2_ENABLED and _http2_available()
+        if settings.KIWI_HTTP2_ENABLED and not self._http2:
+            logger.warning("KIWI_HTTP2_ENABLED=True 但未安装 h2，Kiwi 客户端回退到 HTTP/1.1")
+
+        # 客户端只访问 Kiwi 单一域名，连接池上限即为每个主机的连接上限
+        limits = httpx.Limits(
+            max_connections=settings.KIWI_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.KIWI_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.KIWI_HTTP_KEEPALIVE_EXPIRY,
+        )
+        timeout = httpx.Timeout(settings.KIWI_HTTP_TIMEOUT, connect=settings.KIWI_HTTP_CONNECT_TIMEOUT)
+        return httpx.AsyncClient(http2=self._http2, limits=limits, timeout=timeout)
+
+    async def initialize(self) -> None:
+        """在当前事件循环上初始化共享客户端"""
+        if self._client is not None and not self._client.is_closed:
+            await self.close()
+        self._client = self._create_client()
+        self._loop = asyncio.get_running_loop()
+        logger.info(
+            f"Kiwi HTTP客户端初始化成功 (http2={self._http2}, "
+            f"max_connections={settings.KIWI_HTTP_MAX_CONNECTIONS})"
+        )
+
+    async def close(self) -> None:
+        """关闭共享客户端并释放连接池"""
+        client, self._client, self._loop = self._client, None, None
+        try:
+            if client is not None and not client.is_closed:
+                await client.aclose()
+                logger.info("Kiwi HTTP客户端已关闭")
+        except Exception as e:
+            logger.error(f"关闭Kiwi HTTP客户端时出错: {e}")
+
+    def reset(self) -> None:
+        """丢弃当前客户端引用（用于 fork 后的子进程，不能复用父进程的连接）"""
+        self._client = None
+        self._loop = None
+
+    def shutdown(self) -> None:
+        """同步关闭客户端，供没有运行中事件循环的场景（如 Celery worker 退出）使用"""
+        loop = self._loop
+        if self._client is None:
+            return
+        if loop is not None and not loop.is_closed() and not loop.is_running():
+            loop.run_until_complete(self.close())
+        else:
+            # 所属事件循环已结束，连接随循环一起失效，直接丢弃即可
+            self.reset()
+
+    def get_client(self) -> httpx.AsyncClient:
+        """获取绑定到当前事件循环的共享客户端，必要时懒加载创建"""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._loop is not loop:
+            if self._client is not None and self._loop is not loop:
+                logger.debug("事件循环已变化，重建Kiwi HTTP客户端")
+            self._client = self._create_client()
+            self._loop = loop
+        return self._client
+
+    @property
+    def http2_enabled(self) -> bool:
+        """当前客户端是否启用了 HTTP/2"""
+        return self._http2
+
+
+# 全局Kiwi客户端管理器实例
+kiwi_client_manager = KiwiClientManager()
+
+
+def get_kiwi_client() -> httpx.AsyncClient:
+    """获取共享Kiwi HTTP客户端"""
+    return kiwi_client_manager.get_client()
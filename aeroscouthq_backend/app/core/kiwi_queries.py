@@ -0,0 +1,78 @@
+"""
+Kiwi GraphQL 搜索查询构建
+字段投影为原 ONEWAY/RETURN_QUERY_TEMPLATE 的字段 + hiddenDestination，
+解析后的行程可直接按隐藏目的地判断甩尾。
+Kiwi 没有按 id 补全行程的查询，精简字段探测命中后只能整会话重新拉取，
+因此探测与普通搜索共用同一投影。
+"""
+
+from functools import lru_cache
+
+_SEGMENT_FIELDS = """
+              segment {
+                source { localTime utcTimeIso station { name code city { name } } }
+                destination { localTime utcTimeIso station { name code city { name } } }
+                hiddenDestination { code name }
+                code duration carrier { name code } operatingCarrier { name code } cabinClass
+              }
+              layover { duration isBaggageRecheck }"""
+
+_ITINERARY_FIELDS = """
+          id shareId
+          price { amount priceBeforeDiscount } priceEur { amount }
+          provider { name code } duration pnrCount
+          travelHack { isTrueHiddenCity isVirtualInterlining isThrowawayTicket }
+          bookingOptions {
+            edges {
+              node {
+                token
+                bookingUrl
+                price { amount }
+                priceEur { amount }
+              }
+            }
+          }"""
+
+_QUERY_SHELL = """
+query {operation}(
+  $search: {search_input}
+  $filter: ItinerariesFilterInput
+  $options: ItinerariesOptionsInput
+) {{
+  {root}(search: $search, filter: $filter, options: $options) {{
+    __typename
+    ... on AppError {{ error: message }}
+    ... on Itineraries {{
+      server {{ requestId packageVersion serverToken }}
+      metadata {{ itinerariesCount hasMorePending }}
+      itineraries {{
+        __typename
+        ... on {itinerary_type} {{{itinerary_fields}
+{legs}
+        }}
+      }}
+    }}
+  }}
+}}
+"""
+
+_LEG_SHELL = """          {leg} {{
+            duration
+            sectorSegments {{{segment_fields}
+            }}
+          }}"""
+
+
+@lru_cache(maxsize=None)
+def build_itinerary_query(is_one_way: bool) -> str:
+    """按行程类型生成搜索查询（结果缓存，同一类型始终返回同一字符串，缓存键保持稳定）"""
+    leg_names = ("sector",) if is_one_way else ("outbound", "inbound")
+    legs = "\n".join(_LEG_SHELL.format(leg=leg, segment_fields=_SEGMENT_FIELDS) for leg in leg_names)
+    return _QUERY_SHELL.format(
+        operation="SearchOneWayItinerariesQuery" if is_one_way else "SearchReturnItinerariesQuery",
+        search_input="SearchOnewayInput" if is_one_way else "SearchReturnInput",
+        root="onewayItineraries" if is_one_way else "returnItineraries",
+        itinerary_type="ItineraryOneWay" if is_one_way else "ItineraryReturn",
+        itinerary_fields=_ITINERARY_FIELDS,
+        legs=legs,
+    )
@@ -0,0 +1,136 @@
+"""
+Kiwi 原始行程缓存
+以规范化的 GraphQL 查询 + 变量（search/filter/options，排除 serverToken 与 search_id）为键，
+缓存压缩后的原始行程列表，使不同策略、不同用户的相同 A -> X 查询共享上游结果
+"""
+
+import base64
+import hashlib
+import json
+import logging
+import zlib
+from typing import Any, Dict, List, Optional
+
+from app.core import fast_json
+from app.core.config import settings
+from app.core.redis_manager import redis_manager
+from app.core.strategy_cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# 参与缓存键计算的变量字段；search_id 等内部字段不影响上游结果
+_KEY_VARIABLE_FIELDS = ("search", "filter", "options")
+# options 中与分页会话相关、不影响结果集合的字段
+_VOLATILE_OPTION_FIELDS = ("serverToken",)
+
+
+def canonical_variables(variables: Dict[str, Any]) -> Dict[str, Any]:
+    """提取参与缓存键计算的规范化变量"""
+    canonical = {field: variables.get(field) for field in _KEY_VARIABLE_FIELDS if field in variables}
+    options = canonical.get("options")
+    if isinstance(options, dict):
+        canonical["options"] = {k: v for k, v in options.items() if k not in _VOLATILE_OPTION_FIELDS}
+    return canonical
+
+
+def make_query_key(query: str, variables: Dict[str, Any], max_pages: int = 1) -> str:
+    """根据查询模板、规范化变量与最大页数生成缓存键"""
+    material = json.dumps(
+        {"query": query, "variables": canonical_variables(variables), "max_pages": max_pages},
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+        default=str
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def compress_itineraries(itineraries: List[dict]) -> str:
+    """压缩原始行程列表为 base64 字符串（Redis 客户端使用 decode_responses）"""
+    raw = fast_json.dumps_bytes(itineraries)
+    return base64.b64encode(zlib.compress(raw, 6)).decode("ascii")
+
+
+def decompress_itineraries(data: str) -> List[dict]:
+    """解压 base64 字符串为原始行程列表"""
+    return fast_json.loads(zlib.decompress(base64.b64decode(data)))
+
+
+class KiwiRawResultCache:
+    """Kiwi 原始行程缓存（Redis + 进程内 LRU 回退）"""
+
+    def __init__(self, key_prefix: str = "kiwi_raw:"):
+        self.key_prefix = key_prefix
+        self._local = LRUCache(settings.KIWI_RAW_CACHE_LRU_SIZE)
+        self.hits = 0
+        self.misses = 0
+
+    def _get_redis(self):
+        """获取Redis客户端，未初始化时返回None"""
+        try:
+            return redis_manager.get_client()
+        except RuntimeError:
+            return None
+
+    async def get(self, cache_key: str) -> Optional[List[dict]]:
+        """读取缓存的原始行程列表"""
+        if not settings.KIWI_RAW_CACHE_ENABLED:
+            return None
+
+        key = f"{self.key_prefix}{cache_key}"
+        data = self._local.get(key)
+        if data is None:
+            redis_client = self._get_redis()
+            if redis_client is not None:
+                try:
+                    data = await redis_client.get(key)
+                    if data:
+                        self._local.set(key, data, settings.KIWI_RAW_CACHE_TTL)
+                except Exception as e:
+                    logger.warning(f"Redis读取Kiwi原始缓存失败: {e}")
+
+        if not data:
+            self.misses += 1
+            return None
+
+        try:
+            itineraries = decompress_itineraries(data)
+        except Exception as e:
+            logger.warning(f"Kiwi原始缓存解压失败，忽略该条目: {e}")
+            self._local.delete(key)
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return itineraries
+
+    async def set(self, cache_key: str, itineraries: List[dict]) -> None:
+        """写入原始行程列表（空结果不缓存）"""
+        if not settings.KIWI_RAW_CACHE_ENABLED or not itineraries:
+            return
+
+        key = f"{self.key_prefix}{cache_key}"
+        data = compress_itineraries(itineraries)
+        ttl = settings.KIWI_RAW_CACHE_TTL
+        self._local.set(key, data, ttl)
+
+        redis_client = self._get_redis()
+        if redis_client is not None:
+            try:
+                await redis_client.setex(key, ttl, data)
+            except Exception as e:
+                logger.warning(f"Redis写入Kiwi原始缓存失败: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "local_entries": len(self._local)
+        }
+
+
+# 全局Kiwi原始行程缓存实例
+kiwi_raw_cache = KiwiRawResultCache()
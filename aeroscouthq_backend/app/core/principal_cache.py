@@ -0,0 +1,102 @@
+"""
+已认证用户（principal）缓存
+get_current_user 每次请求都按 token 的 sub（邮箱）查询用户表；轮询与 POI 输入等高频请求
+改为读取短 TTL 缓存：进程内 LRU（更短 TTL）→ Redis → 数据库。
+用户行变更（停用、管理员标记、登录等）时由 user_crud 主动失效：删除 Redis 键与本进程 LRU，
+其他进程的 LRU 条目最迟在 PRINCIPAL_CACHE_LOCAL_TTL 后过期。
+缓存内容不包含密码哈希。
+"""
+
+import json
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from app.core.config import settings
+from app.core.redis_manager import redis_manager
+from app.core.strategy_cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# 不写入缓存的敏感字段
+_EXCLUDED_FIELDS = ("hashed_password",)
+
+
+class PrincipalCache:
+    """已认证用户缓存（进程内 LRU + Redis）"""
+
+    def __init__(self, key_prefix: str = "principal:"):
+        self.key_prefix = key_prefix
+        self._local = LRUCache(settings.PRINCIPAL_CACHE_LRU_SIZE)
+        self.stats = {"local_hits": 0, "redis_hits": 0, "misses": 0, "invalidations": 0}
+
+    def _make_key(self, subject: str) -> str:
+        return f"{self.key_prefix}{subject.lower()}"
+
+    def _get_redis(self):
+        """获取Redis客户端，未初始化时返回None"""
+        try:
+            return redis_manager.get_loop_client()
+        except Exception:
+            return None
+
+    async def get_or_load(
+        self, subject: str, load: Callable[[], Awaitable[Optional[Any]]]
+    ) -> Optional[Dict[str, Any]]:
+        """按 token subject 读取用户，未命中时调用 load 查询数据库并写入缓存（用户不存在时不缓存）"""
+        if not settings.PRINCIPAL_CACHE_ENABLED:
+            user = await load()
+            return dict(user) if user is not None else None
+
+        key = self._make_key(subject)
+        data = self._local.get(key)
+        if data is not None:
+            self.stats["local_hits"] += 1
+            return json.loads(data)
+
+        redis_client = self._get_redis()
+        if redis_client is not None:
+            try:
+                data = await redis_client.get(key)
+            except Exception as e:
+                logger.warning(f"Redis读取用户缓存失败 {subject}: {e}")
+                data = None
+            if data:
+                self.stats["redis_hits"] += 1
+                self._local.set(key, data, settings.PRINCIPAL_CACHE_LOCAL_TTL)
+                return json.loads(data)
+
+        self.stats["misses"] += 1
+        user = await load()
+        if user is None:
+            return None
+        principal = {k: v for k, v in dict(user).items() if k not in _EXCLUDED_FIELDS}
+        data = json.dumps(principal, ensure_ascii=False, default=str)
+        self._local.set(key, data, settings.PRINCIPAL_CACHE_LOCAL_TTL)
+        if redis_client is not None:
+            try:
+                await redis_client.setex(key, settings.PRINCIPAL_CACHE_TTL, data)
+            except Exception as e:
+                logger.warning(f"Redis写入用户缓存失败 {subject}: {e}")
+        # 与缓存命中时的返回值保持一致（同样经过 JSON 往返）
+        return json.loads(data)
+
+    async def invalidate(self, subject: Optional[str]) -> None:
+        """用户行变更后失效该用户的缓存"""
+        if not subject:
+            return
+        key = self._make_key(subject)
+        self._local.delete(key)
+        self.stats["invalidations"] += 1
+        redis_client = self._get_redis()
+        if redis_client is not None:
+            try:
+                await redis_client.delete(key)
+            except Exception as e:
+                logger.warning(f"Redis删除用户缓存失败 {subject}: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"enabled": settings.PRINCIPAL_CACHE_ENABLED, "local_entries": len(self._local), **self.stats}
+
+
+# 全局实例
+principal_cache = PrincipalCache()
@@ -3,9 +3,10 @@ Redis连接管理器
 负责管理Redis连接池和提供Redis客户端实例
 """
 
+import asyncio
 import logging
 import redis.asyncio as redis
-from typing import Optional
+from typing import Optional, Set, Tuple
 from app.core.config import settings
 
 logger = logging.getLogger(__name__)
@@ -16,6 +17,11 @@ class RedisManager:
     def __init__(self):
         self._pool: Optional[redis.ConnectionPool] = None
         self._client: Optional[redis.Redis] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_client: Optional[Tuple[asyncio.AbstractEventLoop, redis.Redis]] = None
+        self._loop_binary_client: Optional[Tuple[asyncio.AbstractEventLoop, redis.Redis]] = None
+        # 正在断开的旧事件循环客户端（保留引用，避免任务被回收）
+        self._release_tasks: Set[asyncio.Task] = set()
     
     async def initialize(self) -> None:
         """初始化Redis连接池"""
@@ -36,6 +42,7 @@ class RedisManager:
             
             # 测试连接
             await self._client.ping()
+            self._loop = asyncio.get_running_loop()
             logger.info("Redis连接初始化成功")
             
         except Exception as e:
@@ -48,6 +55,12 @@ class RedisManager:
             if self._client:
                 await self._client.close()
                 logger.info("Redis连接已关闭")
+            loop = asyncio.get_running_loop()
+            for entry in (self._loop_client, self._loop_binary_client):
+                if entry is not None and entry[0] is loop:
+                    await entry[1].close()
+            self._loop_client = None
+            self._loop_binary_client = None
         except Exception as e:
             logger.error(f"关闭Redis连接时出错: {e}")
     
@@ -57,6 +70,64 @@ class RedisManager:
             raise RuntimeError("Redis客户端未初始化，请先调用initialize()")
         return self._client
     
+    def get_loop_client(self) -> redis.Redis:
+        """获取绑定当前事件循环的Redis客户端
+
+        应用进程中直接返回已初始化的客户端；Celery 任务等未调用 initialize() 或事件循环
+        已变化的场景，按当前事件循环懒加载创建一个独立客户端。
+        """
+        loop = asyncio.get_running_loop()
+        if self._client is not None and self._loop is loop:
+            return self._client
+
+        if self._loop_client is None or self._loop_client[0] is not loop:
+            client = redis.Redis.from_url(
+                settings.REDIS_URL,
+                decode_responses=True,
+                socket_connect_timeout=5,
+                socket_timeout=5
+            )
+            self._release_loop_client(self._loop_client)
+            self._loop_client = (loop, client)
+        return self._loop_client[1]
+
+    def get_loop_binary_client(self) -> redis.Redis:
+        """获取绑定当前事件循环、不解码响应的Redis客户端（用于压缩数据等二进制值）"""
+        loop = asyncio.get_running_loop()
+        if self._loop_binary_client is None or self._loop_binary_client[0] is not loop:
+            client = redis.Redis.from_url(
+                settings.REDIS_URL,
+                decode_responses=False,
+                socket_connect_timeout=5,
+                socket_timeout=5
+            )
+            self._release_loop_client(self._loop_binary_client)
+            self._loop_binary_client = (loop, client)
+        return self._loop_binary_client[1]
+
+    def _release_loop_client(self, entry: Optional[Tuple[asyncio.AbstractEventLoop, redis.Redis]]) -> None:
+        """事件循环变化时尽力断开旧客户端的连接池，避免每个任务循环泄漏一组连接
+
+        旧事件循环仍在其他线程运行时在其上断开；已结束（通常已关闭）时在当前循环上断开，
+        无法正常关闭的连接会被标记为断开，其 socket 随传输对象被回收时关闭。
+        """
+        if entry is None:
+            return
+        old_loop, old_client = entry
+        if not old_loop.is_closed() and old_loop.is_running():
+            asyncio.run_coroutine_threadsafe(self._disconnect_quietly(old_client), old_loop)
+            return
+        task = asyncio.get_running_loop().create_task(self._disconnect_quietly(old_client))
+        self._release_tasks.add(task)
+        task.add_done_callback(self._release_tasks.discard)
+
+    @staticmethod
+    async def _disconnect_quietly(client: redis.Redis) -> None:
+        try:
+            await client.connection_pool.disconnect()
+        except Exception as e:
+            logger.debug(f"断开旧事件循环的Redis连接失败（已忽略）: {e}")
+
     async def health_check(self) -> bool:
         """Redis健康检查"""
         try:
@@ -0,0 +1,143 @@
+"""
+上游对冲请求（request hedging）
+请求在最近延迟分位数对应的时间内仍未返回时，再发送一个相同的请求，取先返回的结果并取消另一个。
+对冲请求数受预算限制（相对主请求数的比例），避免上游变慢时请求量翻倍
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 对冲预算最多累积的额度，避免长时间空闲后集中发出大量对冲请求
+_MAX_BUDGET_CREDITS = 5.0
+
+
+def is_http_success(response: Any) -> bool:
+    """httpx 响应是否为 2xx（429/5xx/401/403 等响应不作为对冲竞争的胜者）"""
+    return response.is_success
+
+
+class RequestHedger:
+    """基于延迟分位数的对冲请求执行器"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._latencies: deque = deque(maxlen=settings.KIWI_HEDGE_WINDOW)
+        self._budget = 0.0
+        self.stats = {"calls": 0, "hedged": 0, "hedge_won": 0, "hedge_lost": 0, "budget_exhausted": 0}
+
+    def hedge_delay(self) -> Optional[float]:
+        """根据最近的延迟样本计算对冲等待时间，样本不足时返回None（不对冲）"""
+        if len(self._latencies) < settings.KIWI_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self._latencies)
+        index = int(round(settings.KIWI_HEDGE_PERCENTILE / 100 * (len(ordered) - 1)))
+        return max(settings.KIWI_HEDGE_MIN_DELAY, ordered[index])
+
+    def _take_budget(self) -> bool:
+        if self._budget >= 1.0:
+            self._budget -= 1.0
+            return True
+        self.stats["budget_exhausted"] += 1
+        return False
+
+    async def run(
+        self,
+        fn: Callable[[], Awaitable[Any]],
+        allow_hedge: bool = True,
+        is_success: Optional[Callable[[Any], bool]] = None
+    ) -> Any:
+        """执行请求，超过对冲等待时间仍未返回时发送一个副本
+
+        Args:
+            fn: 发送一次请求的协程函数（每次调用都应独立完成限速、熔断等处理）
+            allow_hedge: 为False时只发送主请求（如上游熔断期间）
+            is_success: 判断返回结果是否成功（如HTTP状态码为2xx），不成功的结果不参与竞争；
+                为None时任何正常返回都视为成功
+
+        Returns:
+            先成功返回的请求结果；两个请求都不成功时返回主请求的结果（或抛出主请求的异常）
+        """
+        if not settings.KIWI_HEDGING_ENABLED:
+            return await fn()
+
+        self.stats["calls"] += 1
+        self._budget = min(_MAX_BUDGET_CREDITS, self._budget + settings.KIWI_HEDGE_BUDGET_RATIO)
+        started_at = time.monotonic()
+        primary = asyncio.ensure_future(fn())
+        delay = self.hedge_delay() if allow_hedge else None
+
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait({primary}, timeout=delay)
+                if not done and self._take_budget():
+                    return await self._race(fn, primary, started_at, delay, is_success)
+            result = await primary
+        except BaseException:
+            primary.cancel()
+            raise
+        if is_success is None or is_success(result):
+            self._latencies.append(time.monotonic() - started_at)
+        return result
+
+    async def _race(
+        self,
+        fn: Callable[[], Awaitable[Any]],
+        primary: asyncio.Future,
+        started_at: float,
+        delay: float,
+        is_success: Optional[Callable[[Any], bool]] = None
+    ) -> Any:
+        """主请求与对冲请求竞争，返回先成功的结果；都不成功时优先返回主请求的失败结果"""
+        self.stats["hedged"] += 1
+        logger.debug(f"{self.name} 请求超过 {delay:.2f}s 未返回，发送对冲请求")
+        hedge = asyncio.ensure_future(fn())
+        pending = {primary, hedge}
+        errors: Dict[str, BaseException] = {}
+        failed_results: Dict[str, Any] = {}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.cancelled():
+                        continue
+                    label = "primary" if task is primary else "hedge"
+                    error = task.exception()
+                    if error is not None:
+                        errors[label] = error
+                        continue
+                    if is_success is not None and not is_success(task.result()):
+                        # 如 429/5xx 响应：等待另一个副本，两个都不成功时才返回
+                        failed_results[label] = task.result()
+                        continue
+                    self.stats["hedge_won" if task is hedge else "hedge_lost"] += 1
+                    self._latencies.append(time.monotonic() - started_at)
+                    return task.result()
+            for label in ("primary", "hedge"):
+                if label in failed_results:
+                    return failed_results[label]
+            raise errors.get("primary") or errors.get("hedge") or asyncio.CancelledError()
+        finally:
+            for task in (primary, hedge):
+                if not task.done():
+                    task.cancel()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取对冲统计"""
+        delay = self.hedge_delay()
+        return {
+            "enabled": settings.KIWI_HEDGING_ENABLED,
+            "hedge_delay_ms": round(delay * 1000) if delay is not None else None,
+            "samples": len(self._latencies),
+            **self.stats
+        }
+
+
+# 全局Kiwi对冲请求执行器实例
+kiwi_request_hedger = RequestHedger("kiwi")
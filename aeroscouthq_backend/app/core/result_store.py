@@ -0,0 +1,148 @@
+"""
+搜索任务结果存储
+Celery 结果后端只保存一个小指针，完整的 FlightSearchResponse 以紧凑 JSON（orjson）+ 压缩
+（安装了 zstandard 时用 zstd，否则 zlib）写入 Redis 独立键并设置 TTL，只编码一次。
+任务结果接口按需读取压缩数据并流式解压输出，不在 API 进程中重建整个结果字典。
+分布式探测（chord）子任务的进度计数写入按父任务 id 聚合的 Redis 哈希，任务结果接口读取后合并到 PROGRESS 中。
+"""
+
+import io
+import logging
+import zlib
+from typing import Any, Dict, Iterator, Optional
+
+from app.core import fast_json
+from app.core.config import settings
+from app.core.cpu_executor import cpu_executor
+from app.core.redis_manager import redis_manager
+
+try:
+    import zstandard
+except ImportError:  # 可选依赖
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# 指针中标识结果键的字段
+RESULT_REF_FIELD = "result_ref"
+
+CODEC_ZSTD = "zstd"
+CODEC_ZLIB = "zlib"
+
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+_ZSTD_LEVEL = 3
+_ZLIB_LEVEL = 6
+_STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def default_codec() -> str:
+    return CODEC_ZSTD if zstandard is not None else CODEC_ZLIB
+
+
+def compress_json(raw: bytes, codec: Optional[str] = None) -> bytes:
+    """压缩已编码的 JSON 字节"""
+    if (codec or default_codec()) == CODEC_ZSTD:
+        return zstandard.ZstdCompressor(level=_ZSTD_LEVEL).compress(raw)
+    return zlib.compress(raw, _ZLIB_LEVEL)
+
+
+def encode_result(result: Dict[str, Any], codec: Optional[str] = None) -> bytes:
+    """紧凑 JSON 编码并压缩"""
+    return compress_json(fast_json.dumps_bytes(result), codec)
+
+
+def iter_decoded_json(blob: bytes, chunk_size: int = _STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+    """流式解压，逐块产出 JSON 字节（按帧头识别编码格式）"""
+    if blob[:4] == _ZSTD_MAGIC:
+        if zstandard is None:
+            raise RuntimeError("结果使用 zstd 压缩，但当前环境未安装 zstandard")
+        yield from zstandard.ZstdDecompressor().read_to_iter(io.BytesIO(blob), write_size=chunk_size)
+        return
+    decompressor = zlib.decompressobj()
+    for offset in range(0, len(blob), chunk_size):
+        chunk = decompressor.decompress(blob[offset:offset + chunk_size])
+        if chunk:
+            yield chunk
+    tail = decompressor.flush()
+    if tail:
+        yield tail
+
+
+def decode_result(blob: bytes) -> Dict[str, Any]:
+    """完整解码（供需要结果字典的调用方使用）"""
+    return fast_json.loads(b"".join(iter_decoded_json(blob)))
+
+
+def is_result_pointer(result: Any) -> bool:
+    return isinstance(result, dict) and RESULT_REF_FIELD in result
+
+
+class SearchResultStore:
+    """搜索结果的压缩存储（Redis 键 + TTL），Celery 结果只保存指针"""
+
+    def __init__(self, key_prefix: str = "search_result:"):
+        self.key_prefix = key_prefix
+
+    async def store(self, task_id: Optional[str], result: Dict[str, Any]) -> Dict[str, Any]:
+        """保存结果并返回指针；禁用、结果较小或 Redis 不可用时原样返回结果"""
+        if not settings.TASK_RESULT_STORE_ENABLED or not task_id or not isinstance(result, dict):
+            return result
+
+        codec = default_codec()
+        try:
+            raw = await cpu_executor.run("result_encode", fast_json.dumps_bytes, result)
+            raw_size = len(raw)
+            if raw_size <= settings.TASK_RESULT_INLINE_MAX_BYTES:
+                return result
+            blob = await cpu_executor.run("result_compress", compress_json, raw, codec)
+            key = f"{self.key_prefix}{task_id}"
+            await redis_manager.get_loop_binary_client().setex(key, settings.TASK_RESULT_TTL, blob)
+        except Exception as e:
+            # 存储失败时退回到通过 Celery 结果后端返回完整结果
+            logger.warning(f"保存搜索结果失败，改为内联返回 (task {task_id}): {e}")
+            return result
+
+        logger.info(f"搜索结果已压缩保存: {key} ({raw_size} -> {len(blob)} bytes, {codec})")
+        return {
+            RESULT_REF_FIELD: key,
+            "codec": codec,
+            "raw_bytes": raw_size,
+            "stored_bytes": len(blob),
+            "search_id": result.get("search_id"),
+            "direct_flights_count": len(result.get("direct_flights") or []),
+            "combo_deals_count": len(result.get("combo_deals") or []),
+        }
+
+    async def load(self, pointer: Dict[str, Any]) -> Optional[bytes]:
+        """按指针读取压缩结果，过期或不存在时返回 None"""
+        return await redis_manager.get_loop_binary_client().get(pointer[RESULT_REF_FIELD])
+
+
+class SearchProgressCounters:
+    """按父任务 id 聚合的进度计数（Redis 哈希）
+
+    chord 子任务运行在其他 worker 上，无法安全地改写父任务的 PROGRESS 状态（并发读改写会丢失更新），
+    因此各子任务只对计数做 HINCRBY，由任务结果接口读取后合并到 PROGRESS 的 progress 字段中。
+    """
+
+    def __init__(self, key_prefix: str = "search_progress:"):
+        self.key_prefix = key_prefix
+
+    async def incr(self, task_id: str, **deltas: int) -> None:
+        """原子累加计数并刷新 TTL"""
+        key = f"{self.key_prefix}{task_id}"
+        async with redis_manager.get_loop_client().pipeline(transaction=True) as pipe:
+            for field, delta in deltas.items():
+                pipe.hincrby(key, field, delta)
+            pipe.expire(key, settings.TASK_RESULT_TTL)
+            await pipe.execute()
+
+    async def load(self, task_id: str) -> Dict[str, int]:
+        """读取计数，不存在时返回空字典"""
+        counters = await redis_manager.get_loop_client().hgetall(f"{self.key_prefix}{task_id}")
+        return {field: int(value) for field, value in counters.items()}
+
+
+# 全局实例
+search_result_store = SearchResultStore()
+search_progress_counters = SearchProgressCounters()
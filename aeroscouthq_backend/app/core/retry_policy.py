@@ -0,0 +1,257 @@
+"""
+Kiwi 上游请求统一重试策略
+- 错误分类：token（刷新请求头后重试）、throttled（429，按 Retry-After 或退避等待）、
+  transient（超时/连接错误/5xx）、permanent（参数错误、熔断打开等，不重试）
+- 指数退避 + 全抖动（full jitter），避免大量探测在同一时刻集中重试
+- 重试发生在单页请求上，已获取的分页结果与 serverToken 不会因一次失败而整体重跑
+- 同一次搜索共享一个重试预算（ContextVar 会随 create_task 传递到并发的策略/探测任务），
+  单个不稳定的探测无法成倍放大上游负载
+"""
+
+import asyncio
+import logging
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional, TypeVar
+
+import httpx
+
+from app.core.config import settings
+from app.core.upstream_guard import CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+ERROR_TOKEN = "token"
+ERROR_THROTTLED = "throttled"
+ERROR_TRANSIENT = "transient"
+ERROR_PERMANENT = "permanent"
+
+_ERROR_KINDS = (ERROR_TOKEN, ERROR_THROTTLED, ERROR_TRANSIENT, ERROR_PERMANENT)
+
+
+class UpstreamError(Exception):
+    """已分类的上游错误"""
+    kind = ERROR_PERMANENT
+
+    def __init__(self, message: str = "", status_code: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class UpstreamTokenError(UpstreamError):
+    """请求头/会话令牌失效，刷新后可重试"""
+    kind = ERROR_TOKEN
+
+
+class UpstreamThrottledError(UpstreamError):
+    """上游限流（429）"""
+    kind = ERROR_THROTTLED
+
+
+class UpstreamTransientError(UpstreamError):
+    """超时、连接错误或 5xx 等暂时性故障"""
+    kind = ERROR_TRANSIENT
+
+
+def classify_status(status_code: int) -> Optional[str]:
+    """按 HTTP 状态码分类，成功响应返回 None"""
+    if status_code < 400:
+        return None
+    if status_code in (401, 403):
+        return ERROR_TOKEN
+    if status_code == 429:
+        return ERROR_THROTTLED
+    if status_code == 408 or status_code >= 500:
+        return ERROR_TRANSIENT
+    return ERROR_PERMANENT
+
+
+def classify_error(exc: BaseException) -> str:
+    """将异常归类为 token / throttled / transient / permanent"""
+    if isinstance(exc, UpstreamError):
+        return exc.kind
+    if isinstance(exc, CircuitOpenError):
+        # 熔断期间重试只会继续被拒绝
+        return ERROR_PERMANENT
+    if isinstance(exc, (httpx.TimeoutException, httpx.TransportError)):
+        return ERROR_TRANSIENT
+    if isinstance(exc, httpx.HTTPStatusError):
+        return classify_status(exc.response.status_code) or ERROR_PERMANENT
+    # 获取请求头失败时抛出的 HTTPException（如 503）
+    status_code = getattr(exc, "status_code", None)
+    if isinstance(status_code, int):
+        return classify_status(status_code) or ERROR_PERMANENT
+    return ERROR_PERMANENT
+
+
+def parse_retry_after(response: httpx.Response) -> Optional[float]:
+    """解析 Retry-After 头（仅支持秒数形式）"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+def raise_for_upstream_status(response: httpx.Response, message: str) -> None:
+    """对可重试的错误状态码抛出对应的已分类异常，其他状态码由调用方自行处理"""
+    kind = classify_status(response.status_code)
+    if kind == ERROR_TOKEN:
+        raise UpstreamTokenError(message, status_code=response.status_code)
+    if kind == ERROR_THROTTLED:
+        raise UpstreamThrottledError(message, status_code=response.status_code, retry_after=parse_retry_after(response))
+    if kind == ERROR_TRANSIENT:
+        raise UpstreamTransientError(message, status_code=response.status_code)
+
+
+class RetryBudget:
+    """单次搜索内所有上游请求共享的重试次数预算"""
+
+    def __init__(self, search_id: str, max_retries: int):
+        self.search_id = search_id
+        self.max_retries = max_retries
+        self.spent = 0
+        self.denied = 0
+
+    @property
+    def remaining(self) -> int:
+        return max(0, self.max_retries - self.spent)
+
+    def try_spend(self) -> bool:
+        """消耗一次重试机会，预算用尽时返回 False"""
+        if self.spent >= self.max_retries:
+            self.denied += 1
+            return False
+        self.spent += 1
+        return True
+
+
+_current_budget: ContextVar[Optional[RetryBudget]] = ContextVar("kiwi_retry_budget", default=None)
+
+
+class RetryPolicy:
+    """上游请求重试引擎"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._stats: Dict[str, Any] = {
+            "calls": 0,
+            "retries": 0,
+            "token_refreshes": 0,
+            "gave_up": 0,
+            "budget_exhausted": 0,
+            "errors": {kind: 0 for kind in _ERROR_KINDS},
+        }
+
+    @contextmanager
+    def search_budget(self, search_id: str, max_retries: Optional[int] = None) -> Iterator[RetryBudget]:
+        """为一次搜索设置共享重试预算；在此期间创建的子任务继承同一预算"""
+        budget = RetryBudget(
+            search_id, settings.KIWI_RETRY_BUDGET_PER_SEARCH if max_retries is None else max_retries
+        )
+        token = _current_budget.set(budget)
+        try:
+            yield budget
+        finally:
+            _current_budget.reset(token)
+            if budget.spent or budget.denied:
+                logger.info(
+                    f"[{search_id}] {self.name} 重试预算: 使用 {budget.spent}/{budget.max_retries}，拒绝 {budget.denied} 次"
+                )
+
+    async def with_search_budget(self, search_id: str, awaitable: Awaitable[T]) -> T:
+        """在共享重试预算内等待整个搜索协程"""
+        with self.search_budget(search_id):
+            return await awaitable
+
+    def backoff_delay(self, attempt: int, kind: str, retry_after: Optional[float] = None) -> float:
+        """第 attempt 次失败后的等待时间：指数退避上限内全抖动，429 至少等待 Retry-After"""
+        if kind == ERROR_TOKEN:
+            # 已刷新请求头，无需等待
+            return 0.0
+        cap = min(settings.KIWI_RETRY_MAX_DELAY, settings.KIWI_RETRY_BASE_DELAY * (2 ** (attempt - 1)))
+        delay = random.uniform(0, cap)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, settings.KIWI_RETRY_MAX_DELAY))
+        return delay
+
+    async def run(
+        self,
+        fn: Callable[[], Awaitable[T]],
+        desc: str,
+        on_token_error: Optional[Callable[[], Awaitable[Any]]] = None,
+        max_attempts: Optional[int] = None
+    ) -> T:
+        """执行 fn，按错误类型决定是否重试
+
+        Args:
+            fn: 每次尝试调用一次的协程函数
+            desc: 日志前缀
+            on_token_error: token 类错误时刷新请求头的回调；未提供时 token 错误不重试。
+                每次 run 最多刷新一次，避免令牌持续无效时反复刷新
+            max_attempts: 最大尝试次数（含首次），默认 KIWI_RETRY_MAX_ATTEMPTS
+
+        Raises:
+            最后一次尝试的异常（不可重试、次数或预算用尽）
+        """
+        attempts_allowed = max_attempts or settings.KIWI_RETRY_MAX_ATTEMPTS
+        self._stats["calls"] += 1
+        token_refreshed = False
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return await fn()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                kind = classify_error(exc)
+                self._stats["errors"][kind] += 1
+                retryable = (
+                    settings.KIWI_RETRY_ENABLED
+                    and kind != ERROR_PERMANENT
+                    and attempt < attempts_allowed
+                    and not (kind == ERROR_TOKEN and (on_token_error is None or token_refreshed))
+                )
+                if not retryable:
+                    if kind != ERROR_PERMANENT:
+                        self._stats["gave_up"] += 1
+                    raise
+
+                budget = _current_budget.get()
+                if budget is not None and not budget.try_spend():
+                    self._stats["budget_exhausted"] += 1
+                    logger.warning(f"[{desc}] 本次搜索重试预算已用尽 ({budget.max_retries})，放弃重试: {exc}")
+                    raise
+
+                delay = self.backoff_delay(attempt, kind, getattr(exc, "retry_after", None))
+                logger.warning(
+                    f"[{desc}] 第 {attempt}/{attempts_allowed} 次尝试失败 ({kind}: {exc})，{delay:.2f}s 后重试"
+                )
+                self._stats["retries"] += 1
+                if kind == ERROR_TOKEN:
+                    token_refreshed = True
+                    self._stats["token_refreshes"] += 1
+                    await on_token_error()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """重试统计（用于健康检查）"""
+        return {
+            "enabled": settings.KIWI_RETRY_ENABLED,
+            "max_attempts": settings.KIWI_RETRY_MAX_ATTEMPTS,
+            "budget_per_search": settings.KIWI_RETRY_BUDGET_PER_SEARCH,
+            **self._stats,
+            "errors": dict(self._stats["errors"]),
+        }
+
+
+# 全局实例
+kiwi_retry_policy = RetryPolicy("kiwi")
@@ -0,0 +1,39 @@
+"""
+搜索调试日志通道
+解析器等热路径的诊断信息统一经由该通道输出：仅在 ENABLE_SEARCH_DEBUG_LOGS 开启时生效，
+并按 SEARCH_DEBUG_SAMPLE_RATE 抽样，关闭时调用方只需一次布尔判断，不会格式化任何字符串
+"""
+
+import json
+import logging
+import random
+from typing import Any
+
+from app.core.config import settings
+
+# 独立的日志器，级别不受全局 LOG_LEVEL 影响
+search_debug_logger = logging.getLogger("aeroscout.search_debug")
+search_debug_logger.setLevel(logging.DEBUG if settings.ENABLE_SEARCH_DEBUG_LOGS else logging.CRITICAL + 1)
+
+
+def search_debug_enabled() -> bool:
+    """调试通道是否开启"""
+    return settings.ENABLE_SEARCH_DEBUG_LOGS
+
+
+def search_debug_sampled() -> bool:
+    """调试通道开启且本次命中抽样时返回True
+
+    调用方应在构造诊断数据之前判断，以保证关闭时零开销。
+    """
+    if not settings.ENABLE_SEARCH_DEBUG_LOGS:
+        return False
+    rate = settings.SEARCH_DEBUG_SAMPLE_RATE
+    return rate >= 1.0 or random.random() < rate
+
+
+def emit_search_debug(event: str, **fields: Any) -> None:
+    """输出一条结构化调试事件（event + JSON 字段）"""
+    search_debug_logger.debug(
+        "%s %s", event, json.dumps(fields, ensure_ascii=False, default=str, separators=(",", ":"))
+    )
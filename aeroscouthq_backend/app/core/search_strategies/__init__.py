@@ -8,6 +8,7 @@ from .base import SearchStrategy, SearchContext, SearchResult
 from .direct_flight import DirectFlightStrategy
 from .hidden_city import HiddenCityStrategy
 from .hub_probe import HubProbeStrategy
+from .executor import ConcurrentStrategyExecutor, StrategyExecutionReport
 
 __all__ = [
     "SearchStrategy",
@@ -15,5 +16,7 @@ __all__ = [
     "SearchResult",
     "DirectFlightStrategy",
     "HiddenCityStrategy",
-    "HubProbeStrategy"
+    "HubProbeStrategy",
+    "ConcurrentStrategyExecutor",
+    "StrategyExecutionReport"
 ] 
\ No newline at end of file
@@ -8,12 +8,14 @@ from datetime import datetime
 from typing import List, Dict, Any, Optional, Set
 from enum import Enum
 import logging
+import time
 
 from app.apis.v1.schemas.flights_v2 import (
     FlightSearchBaseRequest,
     EnhancedFlightItinerary,
     SearchPhase
 )
+from app.core.cpu_executor import cpu_executor
 
 logger = logging.getLogger(__name__)
 
@@ -127,6 +129,99 @@ class SearchStrategy(ABC):
         """
         pass
 
+    async def execute_cached(self, context: SearchContext) -> SearchResult:
+        """
+        带结果缓存的策略执行入口
+
+        context.cache_enabled 为 False 时直接执行策略；否则先查策略结果缓存，
+        未命中时执行并缓存成功结果，同时更新上下文的命中/未命中计数。
+
+        Args:
+            context: 搜索上下文
+
+        Returns:
+            SearchResult: 搜索结果（命中缓存时状态为 CACHED）
+        """
+        if not context.cache_enabled:
+            return await self.execute(context)
+
+        from app.core.strategy_cache import strategy_result_cache, ttl_for_departure
+
+        start_time = time.time()
+        produced: Dict[str, SearchResult] = {}
+
+        async def compute():
+            result = await self.execute(context)
+            produced["result"] = result
+            payload = await cpu_executor.run("serialize", self._serialize_result, result, items=len(result.flights))
+            return payload, result.status == SearchResultStatus.SUCCESS
+
+        payload, cache_hit = await strategy_result_cache.get_or_compute(
+            self.get_cache_key(context),
+            compute,
+            ttl=ttl_for_departure(context.request.departure_date_from),
+            namespace=self.strategy_name
+        )
+
+        if not cache_hit and "result" in produced:
+            context.record_cache_miss()
+            return produced["result"]
+
+        result = await cpu_executor.run(
+            "deserialize", self._deserialize_result, payload, context, items=len(payload.get("flights", []))
+        )
+        if result is None:
+            # 缓存内容无法识别（如旧版本写入的未知状态），按未命中处理并重新执行
+            self.logger.warning(f"[{context.search_id}] 策略 {self.strategy_name} 缓存结果状态无效，重新执行")
+            context.record_cache_miss()
+            return await self.execute(context)
+
+        if not cache_hit:
+            # 合并等待同一计算的不可缓存结果（失败/部分结果），保留原状态
+            context.record_cache_miss()
+            return result
+
+        context.record_cache_hit()
+        result.status = SearchResultStatus.CACHED
+        result.cache_hit = True
+        result.execution_time_ms = int((time.time() - start_time) * 1000)
+        self.logger.debug(f"[{context.search_id}] 策略 {self.strategy_name} 命中缓存，结果数: {len(result.flights)}")
+        return result
+
+    def _serialize_result(self, result: SearchResult) -> Dict[str, Any]:
+        """将搜索结果转换为可缓存的字典"""
+        return {
+            "status": result.status.value if isinstance(result.status, Enum) else result.status,
+            "flights": [flight.model_dump(mode='json') for flight in result.flights],
+            "execution_time_ms": result.execution_time_ms,
+            "error_message": result.error_message,
+            "metadata": result.metadata,
+            "disclaimers": result.disclaimers
+        }
+
+    def _deserialize_result(self, payload: Dict[str, Any], context: SearchContext) -> Optional[SearchResult]:
+        """从缓存字典恢复搜索结果，状态无法识别时返回 None（视为缓存未命中）"""
+        try:
+            status = SearchResultStatus(payload.get("status"))
+        except ValueError:
+            return None
+
+        flights = []
+        for flight_data in payload.get("flights", []):
+            flight = EnhancedFlightItinerary.model_validate(flight_data)
+            if flight.raw_data and "search_id" in flight.raw_data:
+                flight.raw_data["search_id"] = context.search_id
+            flights.append(flight)
+
+        return SearchResult(
+            status=status,
+            flights=flights,
+            execution_time_ms=payload.get("execution_time_ms", 0),
+            error_message=payload.get("error_message"),
+            metadata=payload.get("metadata") or {},
+            disclaimers=payload.get("disclaimers") or []
+        )
+
     def get_cache_key(self, context: SearchContext) -> str:
         """
         生成缓存键
@@ -146,7 +241,8 @@ class SearchStrategy(ABC):
             request.departure_date_to,
             request.cabin_class,
             str(request.adults),
-            request.preferred_currency
+            request.preferred_currency,
+            request.market or ""
         ]
 
         # 为往返票添加返程日期
@@ -12,9 +12,9 @@ from app.apis.v1.schemas import FlightItinerary
 # 导入现有的任务函数
 from app.core.tasks import (
     _task_build_kiwi_variables,
-    _task_run_search_with_retry,
-    _task_parse_kiwi_itinerary
+    _task_run_search_with_retry
 )
+from app.core.cpu_executor import cpu_executor
 
 class DirectFlightStrategy(SearchStrategy):
     """直飞航班搜索策略"""
@@ -132,19 +132,9 @@ class DirectFlightStrategy(SearchStrategy):
             class MockSelf:
                 def __init__(self):
                     self.request = type('MockRequest', (), {'id': context.search_id})()
-                    self.max_retries = 3  # 添加重试次数
-
-                def retry(self, exc=None, countdown=30):
-                    """模拟Celery任务的retry方法"""
-                    self.logger.warning(f"MockSelf.retry called with exc={exc}, countdown={countdown}")
-                    # 对于非Celery环境，我们直接抛出异常而不是重试
-                    if exc:
-                        raise exc
-                    else:
-                        raise Exception("Retry requested but no exception provided")
 
+            # 重试由 kiwi_retry_policy 统一处理，无需模拟 Celery 的 retry
             mock_self = MockSelf()
-            mock_self.logger = self.logger  # 添加logger引用
 
             # 创建临时请求对象
             from app.apis.v1.schemas import FlightSearchRequest
@@ -179,21 +169,13 @@ class DirectFlightStrategy(SearchStrategy):
         flights = []
         requested_currency = context.request.preferred_currency or "CNY"
 
-        for raw_itinerary in raw_results:
-            try:
-                parsed = await _task_parse_kiwi_itinerary(raw_itinerary, is_one_way, requested_currency)
-                if parsed:
-                    # 验证确实是直飞（虽然我们已经在查询中限制了）
-                    if self._is_direct_flight(parsed):
-                        flights.append(parsed)
-                    else:
-                        self.logger.debug(f"[{context.search_id}] 过滤非直飞航班: {parsed.id}")
-                else:
-                    self.logger.warning(f"[{context.search_id}] 解析航班失败: {raw_itinerary.get('id', 'UNKNOWN')}")
-
-            except Exception as e:
-                self.logger.warning(f"[{context.search_id}] 解析航班时出错: {e}")
-                continue
+        parsed_flights = await cpu_executor.parse_itineraries(raw_results, is_one_way, requested_currency)
+        for parsed in parsed_flights:
+            # 验证确实是直飞（虽然我们已经在查询中限制了）
+            if self._is_direct_flight(parsed):
+                flights.append(parsed)
+            else:
+                self.logger.debug(f"[{context.search_id}] 过滤非直飞航班: {parsed.id}")
 
         self.logger.debug(f"[{context.search_id}] 直飞搜索解析完成: {len(flights)}/{len(raw_results)} 有效")
         return flights
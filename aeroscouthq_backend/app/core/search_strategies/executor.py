@@ -0,0 +1,137 @@
+"""
+搜索策略并发执行器
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Dict, Any, Optional
+
+from app.core.config import settings
+from app.core.retry_policy import kiwi_retry_policy
+from .base import SearchResult, SearchResultStatus
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class StrategyExecutionReport:
+    """并发执行结果汇总"""
+    results: Dict[str, SearchResult] = field(default_factory=dict)
+    timings: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    wall_time_ms: int = 0
+    deadline_hit: bool = False
+
+    def get(self, name: str) -> Optional[SearchResult]:
+        """获取指定策略的结果"""
+        return self.results.get(name)
+
+
+class ConcurrentStrategyExecutor:
+    """将多个搜索策略作为任务并发执行
+
+    - 每个策略有独立的超时预算（超时视为失败，不影响其他策略）
+    - 整体截止时间到达时取消仍未完成的策略
+    - 记录每个策略的耗时，用于填充 phase_metrics
+    """
+
+    def __init__(
+        self,
+        search_id: str,
+        strategy_timeouts: Optional[Dict[str, float]] = None,
+        overall_deadline: Optional[float] = None
+    ):
+        self.search_id = search_id
+        self.strategy_timeouts = strategy_timeouts or {
+            'direct_flight': settings.DIRECT_FLIGHT_STRATEGY_TIMEOUT,
+            'hidden_city': settings.HIDDEN_CITY_STRATEGY_TIMEOUT,
+            'hub_probe': settings.HUB_PROBE_STRATEGY_TIMEOUT,
+        }
+        self.overall_deadline = overall_deadline if overall_deadline is not None else settings.SEARCH_OVERALL_DEADLINE
+
+    async def run(self, jobs: Dict[str, Awaitable[SearchResult]]) -> StrategyExecutionReport:
+        """并发执行策略协程
+
+        Args:
+            jobs: 策略名 -> 策略执行协程（如 strategy.execute(context)）
+
+        Returns:
+            StrategyExecutionReport: 各策略结果及耗时
+        """
+        report = StrategyExecutionReport()
+        if not jobs:
+            return report
+
+        start = time.perf_counter()
+        # 策略任务在创建时复制上下文，同一次搜索的所有策略共享一个上游重试预算；
+        # 预算在所有策略结束（或被取消）后才退出，退出时记录的使用量才完整
+        with kiwi_retry_policy.search_budget(self.search_id):
+            tasks = {
+                name: asyncio.create_task(self._run_single(name, job, report), name=f"{self.search_id}:{name}")
+                for name, job in jobs.items()
+            }
+
+            done, pending = await asyncio.wait(tasks.values(), timeout=self.overall_deadline)
+
+            if pending:
+                report.deadline_hit = True
+                logger.warning(
+                    f"[{self.search_id}] 到达整体截止时间 {self.overall_deadline}s，取消 {len(pending)} 个未完成策略"
+                )
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+
+        elapsed_total = int((time.perf_counter() - start) * 1000)
+        for name, task in tasks.items():
+            if name in report.results:
+                continue
+            # 被整体截止时间取消的策略
+            report.results[name] = SearchResult(
+                status=SearchResultStatus.FAILED,
+                flights=[],
+                execution_time_ms=elapsed_total,
+                error_message=f"策略 {name} 因整体截止时间被取消",
+                metadata={"cancelled": True}
+            )
+            report.timings[name] = {"elapsed_ms": elapsed_total, "outcome": "cancelled"}
+
+        report.wall_time_ms = int((time.perf_counter() - start) * 1000)
+        logger.debug(f"[{self.search_id}] 策略并发执行完成，用时 {report.wall_time_ms}ms: {report.timings}")
+        return report
+
+    async def _run_single(self, name: str, job: Awaitable[SearchResult], report: StrategyExecutionReport) -> None:
+        """在超时预算内执行单个策略，并记录结果与耗时"""
+        timeout = self.strategy_timeouts.get(name)
+        start = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(job, timeout=timeout)
+            outcome = "completed"
+        except asyncio.TimeoutError:
+            logger.warning(f"[{self.search_id}] 策略 {name} 超时 ({timeout}s)")
+            result = SearchResult(
+                status=SearchResultStatus.FAILED,
+                flights=[],
+                execution_time_ms=int((time.perf_counter() - start) * 1000),
+                error_message=f"策略 {name} 执行超时",
+                metadata={"timed_out": True}
+            )
+            outcome = "timeout"
+        except Exception as e:
+            logger.error(f"[{self.search_id}] 策略 {name} 执行异常: {e}", exc_info=True)
+            result = SearchResult(
+                status=SearchResultStatus.FAILED,
+                flights=[],
+                execution_time_ms=int((time.perf_counter() - start) * 1000),
+                error_message=f"策略 {name} 执行失败: {str(e)}"
+            )
+            outcome = "error"
+
+        report.results[name] = result
+        report.timings[name] = {
+            "elapsed_ms": int((time.perf_counter() - start) * 1000),
+            "outcome": outcome,
+            "timeout_s": timeout,
+            "results_count": len(result.flights),
+        }
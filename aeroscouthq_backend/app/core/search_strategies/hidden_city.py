@@ -2,19 +2,23 @@
 甩尾航班（隐藏城市票）搜索策略
 """
 
+import asyncio
 import time
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
 
 from .base import SearchStrategy, SearchContext, SearchResult, SearchResultStatus
 from app.apis.v1.schemas.flights_v2 import EnhancedFlightItinerary, SearchPhase
 from app.apis.v1.schemas import FlightItinerary
+from app.core.config import settings
 
 # 导入现有的任务函数
 from app.core.tasks import (
     _task_build_kiwi_variables,
     _task_run_search_with_retry,
-    _task_parse_kiwi_itinerary
+    KiwiSearchIncompleteError
 )
+from app.core.cpu_executor import cpu_executor
+from app.core.upstream_rate_limiter import kiwi_rate_limiter, LANE_PROBE
 
 class HiddenCityStrategy(SearchStrategy):
     """甩尾航班（隐藏城市票）搜索策略"""
@@ -202,43 +206,94 @@ class HiddenCityStrategy(SearchStrategy):
                 )
 
             is_one_way = context.request.return_date_from is None
-            all_hidden_city_flights = []
+            # 按完成顺序增量合并：id -> 航班（同一航班先到先得，与原去重规则一致）
+            merged_flights: Dict[str, FlightItinerary] = {}
             search_summary = {
                 "destinations_searched": [],
                 "total_raw_results": 0,
                 "valid_hidden_city_flights": 0
             }
 
-            # 对每个甩尾目的地进行搜索
-            for dest_code in throwaway_destinations:
-                try:
-                    self.logger.info(f"[{context.search_id}] 搜索甩尾路线: {context.request.origin_iata} -> {dest_code}")
-
-                    # 构建查询变量（搜索 A -> X）
-                    variables = self._build_throwaway_variables(context, dest_code, is_one_way)
-
-                    # 执行搜索
-                    context.increment_api_calls()
-                    raw_results = await self._perform_search(context, variables, is_one_way)
-                    search_summary["total_raw_results"] += len(raw_results)
-                    search_summary["destinations_searched"].append(dest_code)
-
-                    # 解析结果并筛选出经过目标城市的航班
-                    hidden_flights = await self._extract_hidden_city_flights(
-                        context, raw_results, dest_code, is_one_way
-                    )
-
-                    all_hidden_city_flights.extend(hidden_flights)
-                    search_summary["valid_hidden_city_flights"] += len(hidden_flights)
-
-                    self.logger.info(f"[{context.search_id}] 目的地 {dest_code} 找到 {len(hidden_flights)} 个甩尾航班")
-
-                except Exception as e:
-                    self.logger.warning(f"[{context.search_id}] 搜索甩尾目的地 {dest_code} 失败: {e}")
-                    continue
+            # 对甩尾目的地并发搜索（受信号量限制），结果按完成顺序增量合并
+            max_concurrency = max(1, settings.HIDDEN_CITY_MAX_CONCURRENCY)
+            early_stop_threshold = settings.HIDDEN_CITY_EARLY_STOP_RESULTS
+            search_summary.update({
+                "destinations_timed_out": [],
+                "destinations_failed": [],
+                "destinations_cancelled": [],
+                "errors": [],
+                "early_stopped": False,
+                "max_concurrency": max_concurrency
+            })
+
+            semaphore = asyncio.Semaphore(max_concurrency)
+            tasks = {
+                asyncio.create_task(
+                    self._search_throwaway_destination(context, dest_code, is_one_way, semaphore)
+                ): dest_code
+                for dest_code in throwaway_destinations
+            }
+            pending = set(tasks)
 
-            # 去重和排序
-            unique_flights = self._deduplicate_flights(all_hidden_city_flights)
+            try:
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+
+                    for task in done:
+                        dest_code = tasks[task]
+                        try:
+                            raw_results, hidden_flights = task.result()
+                        except asyncio.TimeoutError:
+                            self.logger.warning(
+                                f"[{context.search_id}] 搜索甩尾目的地 {dest_code} 超时 "
+                                f"({settings.HIDDEN_CITY_DESTINATION_TIMEOUT}s)"
+                            )
+                            search_summary["destinations_timed_out"].append(dest_code)
+                            search_summary["errors"].append(f"甩尾目的地 {dest_code} 搜索超时")
+                            continue
+                        except KiwiSearchIncompleteError as e:
+                            # 已获取的部分结果照常合并，但记录覆盖不完整
+                            self.logger.warning(f"[{context.search_id}] 搜索甩尾目的地 {dest_code} 结果不完整: {e}")
+                            search_summary["destinations_failed"].append(dest_code)
+                            search_summary["errors"].append(f"甩尾目的地 {dest_code} 结果不完整: {e}")
+                            raw_results = e.partial
+                            hidden_flights = await self._extract_hidden_city_flights(
+                                context, raw_results, dest_code, is_one_way
+                            )
+                        except Exception as e:
+                            self.logger.warning(f"[{context.search_id}] 搜索甩尾目的地 {dest_code} 失败: {e}")
+                            search_summary["destinations_failed"].append(dest_code)
+                            search_summary["errors"].append(f"甩尾目的地 {dest_code} 搜索失败: {e}")
+                            continue
+                        else:
+                            search_summary["destinations_searched"].append(dest_code)
+
+                        search_summary["total_raw_results"] += len(raw_results)
+                        search_summary["valid_hidden_city_flights"] += len(hidden_flights)
+                        for flight in hidden_flights:
+                            merged_flights.setdefault(flight.id, flight)
+
+                        self.logger.info(f"[{context.search_id}] 目的地 {dest_code} 找到 {len(hidden_flights)} 个甩尾航班")
+
+                    # 已找到足够多的甩尾航班时提前结束，取消剩余目的地
+                    if pending and early_stop_threshold > 0 and len(merged_flights) >= early_stop_threshold:
+                        search_summary["early_stopped"] = True
+                        search_summary["destinations_cancelled"] = [tasks[task] for task in pending]
+                        self.logger.info(
+                            f"[{context.search_id}] 已找到 {len(merged_flights)} 个甩尾航班，"
+                            f"提前取消 {len(pending)} 个目的地搜索"
+                        )
+                        for task in pending:
+                            task.cancel()
+                        await asyncio.gather(*pending, return_exceptions=True)
+                        pending = set()
+            finally:
+                # 外层被取消（如策略超时）时，确保子任务一并取消
+                for task in pending:
+                    task.cancel()
+
+            # 已按 id 增量去重，按价格排序
+            unique_flights = sorted(merged_flights.values(), key=lambda x: x.price)
 
             # 增强航班信息
             enhanced_flights = []
@@ -259,8 +314,15 @@ class HiddenCityStrategy(SearchStrategy):
 
             execution_time = int((time.time() - start_time) * 1000)
 
+            # 有目的地超时/失败或提前结束时结果不完整，标记为部分成功（不写入策略结果缓存）
+            incomplete = (
+                search_summary["destinations_timed_out"]
+                or search_summary["errors"]
+                or search_summary["early_stopped"]
+            )
+
             result = SearchResult(
-                status=SearchResultStatus.SUCCESS,
+                status=SearchResultStatus.PARTIAL_SUCCESS if incomplete else SearchResultStatus.SUCCESS,
                 flights=enhanced_flights,
                 execution_time_ms=execution_time,
                 metadata={
@@ -285,6 +347,33 @@ class HiddenCityStrategy(SearchStrategy):
                 error_message=f"甩尾搜索执行失败: {str(e)}"
             )
 
+    async def _search_throwaway_destination(
+        self,
+        context: SearchContext,
+        dest_code: str,
+        is_one_way: bool,
+        semaphore: asyncio.Semaphore
+    ) -> Tuple[List[Dict[str, Any]], List[FlightItinerary]]:
+        """在并发限制内搜索单个甩尾目的地，超时时间不包含排队等待"""
+        async with semaphore:
+            self.logger.info(f"[{context.search_id}] 搜索甩尾路线: {context.request.origin_iata} -> {dest_code}")
+
+            # 构建查询变量（搜索 A -> X）
+            variables = self._build_throwaway_variables(context, dest_code, is_one_way)
+
+            # 执行搜索
+            context.increment_api_calls()
+            raw_results = await asyncio.wait_for(
+                self._perform_search(context, variables, is_one_way),
+                timeout=settings.HIDDEN_CITY_DESTINATION_TIMEOUT
+            )
+
+            # 解析结果并筛选出经过目标城市的航班
+            hidden_flights = await self._extract_hidden_city_flights(
+                context, raw_results, dest_code, is_one_way
+            )
+            return raw_results, hidden_flights
+
     def _get_throwaway_destinations(self, context: SearchContext) -> List[str]:
         """获取适合的甩尾目的地列表"""
         origin = context.request.origin_iata.upper()
@@ -394,7 +483,12 @@ class HiddenCityStrategy(SearchStrategy):
 
         return variables
 
-    async def _perform_search(self, context: SearchContext, variables: Dict[str, Any], is_one_way: bool) -> List[Dict[str, Any]]:
+    async def _perform_search(
+        self,
+        context: SearchContext,
+        variables: Dict[str, Any],
+        is_one_way: bool
+    ) -> List[Dict[str, Any]]:
         """执行Kiwi API搜索"""
         try:
             # 创建模拟的self对象
@@ -418,13 +512,14 @@ class HiddenCityStrategy(SearchStrategy):
             )
 
             # 使用现有的搜索函数
-            raw_results = await _task_run_search_with_retry(
-                self=mock_self,
-                variables=variables,
-                attempt_desc="hidden_city",
-                request_params=temp_request,
-                force_one_way=is_one_way
-            )
+            with kiwi_rate_limiter.lane(LANE_PROBE):
+                raw_results = await _task_run_search_with_retry(
+                    self=mock_self,
+                    variables=variables,
+                    attempt_desc="hidden_city",
+                    request_params=temp_request,
+                    force_one_way=is_one_way
+                )
 
             return raw_results
 
@@ -444,10 +539,10 @@ class HiddenCityStrategy(SearchStrategy):
         target_destination = context.request.destination_iata.upper()
         requested_currency = context.request.preferred_currency or "CNY"
 
-        for raw_itinerary in raw_results:
+        parsed_flights = await cpu_executor.parse_itineraries(raw_results, is_one_way, requested_currency)
+        for parsed in parsed_flights:
             try:
-                parsed = await _task_parse_kiwi_itinerary(raw_itinerary, is_one_way, requested_currency)
-                if not parsed or not parsed.segments:
+                if not parsed.segments:
                     continue
 
                 # 检查航班路径是否经过目标城市（但不是最终目的地）
@@ -478,7 +573,7 @@ class HiddenCityStrategy(SearchStrategy):
                     )
 
             except Exception as e:
-                self.logger.warning(f"[{context.search_id}] 解析甩尾航班时出错: {e}")
+                self.logger.warning(f"[{context.search_id}] 处理甩尾航班 {parsed.id} 时出错: {e}")
                 continue
 
         return hidden_flights
@@ -527,20 +622,6 @@ class HiddenCityStrategy(SearchStrategy):
         self.logger.info(f"  - ❌ 未找到有效的甩尾路径")
         return False
 
-    def _deduplicate_flights(self, flights: List[FlightItinerary]) -> List[FlightItinerary]:
-        """去除重复的航班"""
-        seen_ids = set()
-        unique_flights = []
-
-        for flight in flights:
-            if flight.id not in seen_ids:
-                seen_ids.add(flight.id)
-                unique_flights.append(flight)
-
-        # 按价格排序
-        unique_flights.sort(key=lambda x: x.price)
-        return unique_flights
-
     def _convert_to_enhanced_flight(self, flight: FlightItinerary, context: SearchContext) -> EnhancedFlightItinerary:
         """将FlightItinerary转换为EnhancedFlightItinerary"""
 
@@ -2,8 +2,11 @@
 中转城市探测策略 - 第二阶段搜索
 """
 
+import asyncio
+import hashlib
+import json
 import time
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 
 from .base import SearchStrategy, SearchContext, SearchResult, SearchResultStatus
 from app.apis.v1.schemas.flights_v2 import (
@@ -13,13 +16,15 @@ from app.apis.v1.schemas.flights_v2 import (
     PhaseTwoSearchRequest
 )
 from app.apis.v1.schemas import FlightItinerary
+from app.core.config import settings
 
 # 导入现有的任务函数
 from app.core.tasks import (
     _task_build_kiwi_variables,
-    _task_run_search_with_retry,
-    _task_parse_kiwi_itinerary
+    _task_run_search_with_retry
 )
+from app.core.cpu_executor import cpu_executor
+from app.core.upstream_rate_limiter import kiwi_rate_limiter, LANE_PROBE
 
 class HubProbeStrategy(SearchStrategy):
     """中转城市探测策略"""
@@ -64,6 +69,8 @@ class HubProbeStrategy(SearchStrategy):
                 {'iata': 'YVR', 'name': '温哥华国际机场', 'city': '温哥华'},
             ]
         }
+        # 经中转城市搜索甩尾票时使用的甩尾目的地
+        self.throwaway_destinations = ['HKG', 'TPE', 'NRT', 'SIN', 'BKK']
 
     def can_execute(self, context: SearchContext) -> bool:
         """检查是否可以执行中转城市探测"""
@@ -100,18 +107,11 @@ class HubProbeStrategy(SearchStrategy):
                 )
 
             is_one_way = context.request.return_date_from is None
-            all_hub_flights = []
-            hub_analysis = {}
-
-            # 对每个中转城市进行探测
-            for hub_info in hubs_to_probe:
-                hub_iata = hub_info['iata']
-                hub_results = await self._probe_single_hub(
-                    context, hub_info, is_one_way, phase_two_config
-                )
 
-                all_hub_flights.extend(hub_results['flights'])
-                hub_analysis[hub_iata] = hub_results['analysis']
+            # 将 (中转城市, 甩尾目的地) 网格展开为去重后的查询任务并发执行
+            all_hub_flights, hub_analysis, grid_stats = await self._run_probe_grid(
+                context, hubs_to_probe, is_one_way, phase_two_config
+            )
 
             # 去重和排序
             unique_flights = self._deduplicate_flights(all_hub_flights)
@@ -124,13 +124,19 @@ class HubProbeStrategy(SearchStrategy):
 
             execution_time = int((time.time() - start_time) * 1000)
 
+            # 有查询超时或失败时结果不完整，标记为部分成功（不写入策略结果缓存）
+            incomplete = grid_stats['timed_out_queries'] or any(
+                analysis['errors'] for analysis in hub_analysis.values()
+            )
+
             result = SearchResult(
-                status=SearchResultStatus.SUCCESS,
+                status=SearchResultStatus.PARTIAL_SUCCESS if incomplete else SearchResultStatus.SUCCESS,
                 flights=enhanced_flights,
                 execution_time_ms=execution_time,
                 metadata={
                     "hubs_probed": [h['iata'] for h in hubs_to_probe],
                     "hub_analysis": hub_analysis,
+                    "probe_grid": grid_stats,
                     "enhanced_flights": len(enhanced_flights),
                     "is_one_way": is_one_way
                 },
@@ -151,6 +157,14 @@ class HubProbeStrategy(SearchStrategy):
                 error_message=f"中转城市探测执行失败: {str(e)}"
             )
 
+    def get_cache_key(self, context: SearchContext) -> str:
+        """生成缓存键（探测结果取决于第二阶段配置，需纳入键中）"""
+        config = self._extract_phase_two_config(context)
+        config_digest = hashlib.md5(
+            json.dumps(config, sort_keys=True, default=str).encode("utf-8")
+        ).hexdigest()[:12]
+        return f"{super().get_cache_key(context)}:{config_digest}"
+
     def _extract_phase_two_config(self, context: SearchContext) -> Dict[str, Any]:
         """从搜索上下文中提取第二阶段配置"""
         # 如果context中有phase_two相关配置，使用它
@@ -212,128 +226,183 @@ class HubProbeStrategy(SearchStrategy):
 
         return filtered_hubs[:max_hubs]
 
-    async def _probe_single_hub(
+    def _build_probe_grid(
         self,
         context: SearchContext,
-        hub_info: Dict[str, Any],
-        is_one_way: bool,
+        hubs_to_probe: List[Dict[str, Any]],
         config: Dict[str, Any]
-    ) -> Dict[str, Any]:
-        """探测单个中转城市"""
-        hub_iata = hub_info['iata']
-        probe_results = {
-            'flights': [],
-            'analysis': {
-                'hub_info': hub_info,
-                'direct_to_hub_count': 0,
-                'hub_to_destination_count': 0,
-                'throwaway_via_hub_count': 0,
-                'errors': []
-            }
-        }
+    ) -> Dict[str, List[Tuple[str, str]]]:
+        """展开 (中转城市, 甩尾目的地) 网格
 
-        try:
-            self.logger.info(f"[{context.search_id}] 探测中转城市: {hub_iata}")
+        所有查询都从同一起始地出发，只有目的地不同，因此按目的地去重：
+        多个中转城市共享的 Origin -> X 查询只会执行一次。
+
+        Returns:
+            目的地 -> [(用途, 中转城市)]，用途为 'hub'（Origin -> Hub）或 'throwaway'（Origin -> X via Hub）
+        """
+        origin = context.request.origin_iata.upper()
+        grid: Dict[str, List[Tuple[str, str]]] = {}
+
+        for hub_info in hubs_to_probe:
+            hub_iata = hub_info['iata']
 
             # 策略1: 搜索 Origin -> Hub
-            origin_to_hub_flights = await self._search_origin_to_hub(
-                context, hub_iata, is_one_way, config
-            )
-            probe_results['flights'].extend(origin_to_hub_flights)
-            probe_results['analysis']['direct_to_hub_count'] = len(origin_to_hub_flights)
+            grid.setdefault(hub_iata, []).append(('hub', hub_iata))
 
             # 策略2: 搜索 Hub -> Destination（可选，主要用于分析）
             # 这里暂时跳过，因为用户主要关心从起始地出发的完整行程
 
             # 策略3: 搜索甩尾票（Origin -> X via Hub，X为甩尾目的地）
             if config.get('enable_throwaway_ticketing', True):
-                throwaway_flights = await self._search_throwaway_via_hub(
-                    context, hub_iata, is_one_way, config
-                )
-                probe_results['flights'].extend(throwaway_flights)
-                probe_results['analysis']['throwaway_via_hub_count'] = len(throwaway_flights)
-
-            self.logger.info(
-                f"[{context.search_id}] 中转城市 {hub_iata} 探测完成: "
-                f"直飞到中转 {probe_results['analysis']['direct_to_hub_count']}, "
-                f"甩尾经中转 {probe_results['analysis']['throwaway_via_hub_count']}"
-            )
-
-        except Exception as e:
-            error_msg = f"探测中转城市 {hub_iata} 时出错: {str(e)}"
-            probe_results['analysis']['errors'].append(error_msg)
-            self.logger.warning(f"[{context.search_id}] {error_msg}")
+                for dest in self.throwaway_destinations:
+                    if dest == hub_iata or dest == origin:
+                        continue
+                    grid.setdefault(dest, []).append(('throwaway', hub_iata))
 
-        return probe_results
+        return grid
 
-    async def _search_origin_to_hub(
+    async def _run_probe_grid(
         self,
         context: SearchContext,
-        hub_iata: str,
+        hubs_to_probe: List[Dict[str, Any]],
         is_one_way: bool,
         config: Dict[str, Any]
-    ) -> List[FlightItinerary]:
-        """搜索从起始地到中转城市的航班"""
-        try:
-            # 构建查询变量（搜索 Origin -> Hub）
-            variables = self._build_hub_variables(context, hub_iata, is_one_way)
-
-            # 执行搜索
-            context.increment_api_calls()
-            raw_results = await self._perform_search(context, variables, is_one_way)
-
-            # 解析结果
-            flights = await self._parse_hub_results(context, raw_results, is_one_way)
+    ) -> Tuple[List[FlightItinerary], Dict[str, Any], Dict[str, Any]]:
+        """在全局并发限制下执行探测网格，并随任务完成增量更新 hub_analysis"""
+        grid = self._build_probe_grid(context, hubs_to_probe, config)
+        total_jobs = sum(len(consumers) for consumers in grid.values())
+
+        hub_analysis: Dict[str, Any] = {}
+        for hub_info in hubs_to_probe:
+            hub_jobs = sum(
+                1 for consumers in grid.values() for _, hub in consumers if hub == hub_info['iata']
+            )
+            hub_analysis[hub_info['iata']] = {
+                'hub_info': hub_info,
+                'direct_to_hub_count': 0,
+                'hub_to_destination_count': 0,
+                'throwaway_via_hub_count': 0,
+                'errors': [],
+                'jobs_total': hub_jobs,
+                'jobs_completed': 0,
+                'status': 'running'
+            }
 
-            # 标记为中转航班
-            for flight in flights:
-                flight.isProbeSuggestion = True
-                flight.probeHub = hub_iata
-                flight.probeDisclaimer = f"此航班到达{hub_iata}，您需要另行安排前往最终目的地的交通"
+        # 部分结果通过上下文对外可见（配合进度回调实现流式更新）
+        context.metadata['hub_analysis'] = hub_analysis
+        progress_callback = context.metadata.get('on_hub_progress')
 
-            return flights
+        grid_stats = {
+            'total_jobs': total_jobs,
+            'unique_queries': len(grid),
+            'deduplicated_queries': total_jobs - len(grid),
+            'timed_out_queries': [],
+            'max_concurrency': max(1, settings.HUB_PROBE_MAX_CONCURRENCY)
+        }
+        self.logger.info(
+            f"[{context.search_id}] 探测网格: {len(hubs_to_probe)} 个中转城市, "
+            f"{total_jobs} 个任务, 去重后 {len(grid)} 个查询"
+        )
 
-        except Exception as e:
-            self.logger.error(f"[{context.search_id}] 搜索到中转城市 {hub_iata} 失败: {e}")
-            return []
+        semaphore = asyncio.Semaphore(grid_stats['max_concurrency'])
+        tasks = {
+            asyncio.create_task(self._run_grid_query(context, dest, is_one_way, semaphore)): dest
+            for dest in grid
+        }
+        pending = set(tasks)
+        all_flights: List[FlightItinerary] = []
 
-    async def _search_throwaway_via_hub(
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+
+                for task in done:
+                    dest = tasks[task]
+                    consumers = grid[dest]
+                    error_msg = None
+                    parsed_flights: List[FlightItinerary] = []
+                    try:
+                        raw_results = task.result()
+                        # 同一查询可能被多个中转城市共享，只解析一次再分发给各个消费者
+                        parsed_flights = await self._parse_hub_results(context, raw_results, is_one_way)
+                    except asyncio.TimeoutError:
+                        error_msg = f"查询 {context.request.origin_iata} -> {dest} 超时"
+                        grid_stats['timed_out_queries'].append(dest)
+                    except Exception as e:
+                        error_msg = f"查询 {context.request.origin_iata} -> {dest} 失败: {str(e)}"
+
+                    for role, hub_iata in consumers:
+                        analysis = hub_analysis[hub_iata]
+                        analysis['jobs_completed'] += 1
+                        if error_msg:
+                            analysis['errors'].append(error_msg)
+                            self.logger.warning(f"[{context.search_id}] 探测中转城市 {hub_iata}: {error_msg}")
+                        elif role == 'hub':
+                            flights = self._process_origin_to_hub(parsed_flights, hub_iata)
+                            all_flights.extend(flights)
+                            analysis['direct_to_hub_count'] += len(flights)
+                        else:
+                            flights = self._extract_throwaway_via_hub(context, parsed_flights, hub_iata, dest)
+                            all_flights.extend(flights)
+                            analysis['throwaway_via_hub_count'] += len(flights)
+
+                        if analysis['jobs_completed'] >= analysis['jobs_total']:
+                            analysis['status'] = 'completed'
+                            self.logger.info(
+                                f"[{context.search_id}] 中转城市 {hub_iata} 探测完成: "
+                                f"直飞到中转 {analysis['direct_to_hub_count']}, "
+                                f"甩尾经中转 {analysis['throwaway_via_hub_count']}"
+                            )
+
+                    if progress_callback:
+                        try:
+                            await progress_callback(hub_analysis)
+                        except Exception as e:
+                            self.logger.warning(f"[{context.search_id}] 推送中转探测进度失败: {e}")
+        finally:
+            # 外层被取消（如策略超时）时，确保子任务一并取消
+            for task in pending:
+                task.cancel()
+
+        return all_flights, hub_analysis, grid_stats
+
+    async def _run_grid_query(
         self,
         context: SearchContext,
-        hub_iata: str,
+        dest: str,
         is_one_way: bool,
-        config: Dict[str, Any]
-    ) -> List[FlightItinerary]:
-        """搜索经过中转城市的甩尾票"""
-        throwaway_destinations = ['HKG', 'TPE', 'NRT', 'SIN', 'BKK']  # 常用甩尾目的地
-        all_throwaway_flights = []
-
-        for dest in throwaway_destinations:
-            if dest == hub_iata or dest == context.request.origin_iata.upper():
-                continue
-
-            try:
-                # 构建查询变量（搜索 Origin -> Dest via Hub）
-                variables = self._build_throwaway_via_hub_variables(
-                    context, dest, hub_iata, is_one_way
-                )
-
-                # 执行搜索
-                context.increment_api_calls()
-                raw_results = await self._perform_search(context, variables, is_one_way)
+        semaphore: asyncio.Semaphore
+    ) -> List[Dict[str, Any]]:
+        """在并发限制内执行一次 Origin -> dest 查询，超时时间不包含排队等待"""
+        async with semaphore:
+            variables = self._build_grid_variables(context, dest, is_one_way)
+            context.increment_api_calls()
+            return await asyncio.wait_for(
+                self._perform_search(context, variables, is_one_way),
+                timeout=settings.HUB_PROBE_QUERY_TIMEOUT
+            )
 
-                # 解析并筛选经过目标城市的航班
-                throwaway_flights = await self._extract_throwaway_via_hub(
-                    context, raw_results, hub_iata, dest, is_one_way
-                )
+    def _process_origin_to_hub(
+        self,
+        parsed_flights: List[FlightItinerary],
+        hub_iata: str
+    ) -> List[FlightItinerary]:
+        """标记从起始地到中转城市的航班（在副本上修改，解析结果可被其他中转城市复用）"""
+        flights = [flight.model_copy() for flight in parsed_flights]
 
-                all_throwaway_flights.extend(throwaway_flights)
+        # 标记为中转航班
+        for flight in flights:
+            flight.isProbeSuggestion = True
+            flight.probeHub = hub_iata
+            flight.probeDisclaimer = f"此航班到达{hub_iata}，您需要另行安排前往最终目的地的交通"
 
-            except Exception as e:
-                self.logger.warning(f"[{context.search_id}] 搜索甩尾路线经 {hub_iata} 到 {dest} 失败: {e}")
-                continue
+        return flights
 
-        return all_throwaway_flights
+    def _build_grid_variables(self, context: SearchContext, dest: str, is_one_way: bool) -> Dict[str, Any]:
+        """构建网格查询变量（Origin -> dest，允许最多3次中转）"""
+        variables = self._build_hub_variables(context, dest, is_one_way)
+        variables["search_id"] = f"{context.search_id}_probe_{dest}"
+        return variables
 
     def _build_hub_variables(self, context: SearchContext, hub_iata: str, is_one_way: bool) -> Dict[str, Any]:
         """构建中转城市搜索变量"""
@@ -358,36 +427,12 @@ class HubProbeStrategy(SearchStrategy):
 
         return variables
 
-    def _build_throwaway_via_hub_variables(
+    async def _perform_search(
         self,
         context: SearchContext,
-        final_dest: str,
-        hub_iata: str,
+        variables: Dict[str, Any],
         is_one_way: bool
-    ) -> Dict[str, Any]:
-        """构建经过中转城市的甩尾搜索变量"""
-        from app.apis.v1.schemas import FlightSearchRequest
-
-        temp_request = FlightSearchRequest(
-            origin_iata=context.request.origin_iata,
-            destination_iata=final_dest,  # 甩尾目的地
-            departure_date_from=context.request.departure_date_from,
-            departure_date_to=context.request.departure_date_to,
-            return_date_from=context.request.return_date_from,
-            return_date_to=context.request.return_date_to,
-            cabin_class=context.request.cabin_class,
-            adults=context.request.adults,
-            preferred_currency=context.request.preferred_currency,
-            market=context.request.market
-        )
-
-        variables = _task_build_kiwi_variables(temp_request, is_one_way)
-        variables["filter"]["maxStopsCount"] = 3  # 允许更多中转以找到经过hub的路线
-        variables["search_id"] = f"{context.search_id}_throwaway_via_{hub_iata}_to_{final_dest}"
-
-        return variables
-
-    async def _perform_search(self, context: SearchContext, variables: Dict[str, Any], is_one_way: bool) -> List[Dict[str, Any]]:
+    ) -> List[Dict[str, Any]]:
         """执行Kiwi API搜索"""
         try:
             class MockSelf:
@@ -408,13 +453,14 @@ class HubProbeStrategy(SearchStrategy):
                 adults=context.request.adults
             )
 
-            raw_results = await _task_run_search_with_retry(
-                self=mock_self,
-                variables=variables,
-                attempt_desc="hub_probe",
-                request_params=temp_request,
-                force_one_way=is_one_way
-            )
+            with kiwi_rate_limiter.lane(LANE_PROBE):
+                raw_results = await _task_run_search_with_retry(
+                    self=mock_self,
+                    variables=variables,
+                    attempt_desc="hub_probe",
+                    request_params=temp_request,
+                    force_one_way=is_one_way
+                )
 
             return raw_results
 
@@ -424,44 +470,30 @@ class HubProbeStrategy(SearchStrategy):
 
     async def _parse_hub_results(self, context: SearchContext, raw_results: List[Dict[str, Any]], is_one_way: bool) -> List[FlightItinerary]:
         """解析中转搜索结果"""
-        flights = []
         requested_currency = context.request.preferred_currency or "CNY"
+        return await cpu_executor.parse_itineraries(raw_results, is_one_way, requested_currency)
 
-        for raw_itinerary in raw_results:
-            try:
-                parsed = await _task_parse_kiwi_itinerary(raw_itinerary, is_one_way, requested_currency)
-                if parsed:
-                    flights.append(parsed)
-            except Exception as e:
-                self.logger.warning(f"[{context.search_id}] 解析中转航班时出错: {e}")
-                continue
-
-        return flights
-
-    async def _extract_throwaway_via_hub(
+    def _extract_throwaway_via_hub(
         self,
         context: SearchContext,
-        raw_results: List[Dict[str, Any]],
+        parsed_flights: List[FlightItinerary],
         hub_iata: str,
-        final_dest: str,
-        is_one_way: bool
+        final_dest: str
     ) -> List[FlightItinerary]:
-        """提取经过中转城市的甩尾航班"""
+        """从已解析的查询结果中提取经过中转城市的甩尾航班（命中的航班复制后再标记）"""
         throwaway_flights = []
         target_destination = context.request.destination_iata.upper()
-        requested_currency = context.request.preferred_currency or "CNY"
 
         self.logger.info(f"🔍 甩尾票提取诊断 - search_id: {context.search_id}")
         self.logger.info(f"  - 中转城市: {hub_iata}")
         self.logger.info(f"  - 目标城市: {target_destination}")
         self.logger.info(f"  - 甩尾目的地: {final_dest}")
-        self.logger.info(f"  - 原始结果数量: {len(raw_results)}")
+        self.logger.info(f"  - 解析结果数量: {len(parsed_flights)}")
 
-        for i, raw_itinerary in enumerate(raw_results):
+        for i, parsed in enumerate(parsed_flights):
             try:
-                parsed = await _task_parse_kiwi_itinerary(raw_itinerary, is_one_way, requested_currency)
-                if not parsed or not parsed.segments:
-                    self.logger.info(f"  - 航班{i}: 解析失败或无航段")
+                if not parsed.segments:
+                    self.logger.info(f"  - 航班{i}: 无航段")
                     continue
 
                 # 打印航班路径
@@ -478,6 +510,7 @@ class HubProbeStrategy(SearchStrategy):
                 is_throwaway_from_api = getattr(parsed, 'is_throwaway_deal', False) or parsed.is_hidden_city
 
                 if passes_validation or is_throwaway_from_api:
+                    parsed = parsed.model_copy()
                     parsed.is_hidden_city = True
                     parsed.is_throwaway_deal = True
                     parsed.isProbeSuggestion = True
@@ -490,7 +523,7 @@ class HubProbeStrategy(SearchStrategy):
                     self.logger.info(f"    - ❌ 未识别为甩尾票")
 
             except Exception as e:
-                self.logger.warning(f"[{context.search_id}] 解析甩尾航班时出错: {e}")
+                self.logger.warning(f"[{context.search_id}] 处理甩尾航班 {parsed.id} 时出错: {e}")
                 continue
 
         self.logger.info(f"  - 最终甩尾票数量: {len(throwaway_flights)}")
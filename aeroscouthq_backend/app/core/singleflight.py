@@ -0,0 +1,217 @@
+"""
+上游请求合并（singleflight）
+相同键的并发调用只执行一次：进程内共享同一个 Future，跨进程（uvicorn / Celery worker）
+通过 Redis 锁选出执行者，其余进程订阅结果频道等待结果
+"""
+
+import asyncio
+import logging
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from app.core.config import settings
+from app.core.redis_manager import redis_manager
+
+logger = logging.getLogger(__name__)
+
+# 仅当锁仍由自己持有时才删除，避免误删其他进程续上的锁
+_RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+else
+    return 0
+end
+"""
+
+# 抢锁成功时同时删除上一轮的结果值（原子执行），等待者读到的值只可能来自当前或之后的执行者
+_ACQUIRE_LOCK_SCRIPT = """
+if redis.call("set", KEYS[1], ARGV[1], "NX", "PX", ARGV[2]) then
+    redis.call("del", KEYS[2])
+    return 1
+else
+    return 0
+end
+"""
+
+# 执行者失败时发布的标记，等待者收到后自行执行
+_FAILURE_MARKER = "__singleflight_failed__"
+
+
+def _current_task_cancelling() -> bool:
+    """当前任务自身是否正在被取消（Python 3.11+ 可判断，低版本视为否）"""
+    task = asyncio.current_task()
+    cancelling = getattr(task, "cancelling", None)
+    return bool(cancelling and cancelling())
+
+
+class SingleFlight:
+    """按键合并并发的上游调用"""
+
+    def __init__(self, namespace: str):
+        self.namespace = namespace
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.stats = {"leader": 0, "local_shared": 0, "remote_shared": 0, "remote_fallback": 0, "leader_cancelled": 0}
+
+    def _lock_key(self, key: str) -> str:
+        return f"singleflight:{self.namespace}:lock:{key}"
+
+    def _value_key(self, key: str) -> str:
+        return f"singleflight:{self.namespace}:value:{key}"
+
+    def _channel(self, key: str) -> str:
+        return f"singleflight:{self.namespace}:channel:{key}"
+
+    def _get_redis(self):
+        """获取当前事件循环可用的Redis客户端，不可用时返回None"""
+        if not settings.SINGLEFLIGHT_REDIS_ENABLED:
+            return None
+        try:
+            return redis_manager.get_loop_client()
+        except Exception as e:
+            logger.debug(f"singleflight 无法获取Redis客户端: {e}")
+            return None
+
+    async def do(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[Any]],
+        encode: Callable[[Any], str],
+        decode: Callable[[str], Any]
+    ) -> Any:
+        """执行或等待同键调用的结果
+
+        Args:
+            key: 合并键（规范化后的请求标识）
+            fn: 实际执行上游调用的协程函数
+            encode: 结果序列化为字符串（用于跨进程传递）
+            decode: 字符串反序列化为结果
+
+        Returns:
+            fn 的返回值（可能来自其他调用者的执行）
+        """
+        if not settings.SINGLEFLIGHT_ENABLED:
+            return await fn()
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.stats["local_shared"] += 1
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled() or _current_task_cancelling():
+                    raise
+                # 执行者被取消（提前停止、整体截止时间、对冲落败等），等待者属于其他搜索：重新执行或成为新的执行者
+                self.stats["leader_cancelled"] += 1
+                return await self.do(key, fn, encode, decode)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await self._do_distributed(key, fn, encode, decode)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # 避免无人等待时出现 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _do_distributed(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[Any]],
+        encode: Callable[[Any], str],
+        decode: Callable[[str], Any]
+    ) -> Any:
+        """跨进程合并：抢到 Redis 锁的进程执行，其余进程等待结果频道"""
+        redis_client = self._get_redis()
+        if redis_client is None:
+            self.stats["leader"] += 1
+            return await fn()
+
+        token = uuid.uuid4().hex
+        lock_key = self._lock_key(key)
+        try:
+            acquired = await redis_client.eval(
+                _ACQUIRE_LOCK_SCRIPT, 2, lock_key, self._value_key(key),
+                token, int(settings.SINGLEFLIGHT_LOCK_TTL * 1000)
+            )
+        except Exception as e:
+            logger.warning(f"singleflight 获取Redis锁失败，直接执行: {e}")
+            self.stats["leader"] += 1
+            return await fn()
+
+        if acquired:
+            return await self._lead(redis_client, key, token, fn, encode)
+
+        encoded = await self._wait_for_remote(redis_client, key)
+        if encoded is not None and encoded != _FAILURE_MARKER:
+            self.stats["remote_shared"] += 1
+            return decode(encoded)
+
+        # 执行者失败或等待超时，自行执行
+        self.stats["remote_fallback"] += 1
+        return await fn()
+
+    async def _lead(self, redis_client, key: str, token: str, fn, encode) -> Any:
+        """作为执行者运行 fn，并将结果发布给其他进程"""
+        self.stats["leader"] += 1
+        payload = _FAILURE_MARKER
+        try:
+            result = await fn()
+            payload = encode(result)
+            return result
+        finally:
+            try:
+                # 先写值再发布，订阅晚于发布的等待者可直接读取值
+                await redis_client.setex(self._value_key(key), settings.SINGLEFLIGHT_RESULT_TTL, payload)
+                await redis_client.publish(self._channel(key), payload)
+                await redis_client.eval(_RELEASE_LOCK_SCRIPT, 1, self._lock_key(key), token)
+            except Exception as e:
+                logger.warning(f"singleflight 发布结果失败: {e}")
+
+    async def _wait_for_remote(self, redis_client, key: str) -> Optional[str]:
+        """订阅结果频道等待其他进程的执行结果"""
+        pubsub = redis_client.pubsub()
+        deadline = time.monotonic() + settings.SINGLEFLIGHT_WAIT_TIMEOUT
+        try:
+            await pubsub.subscribe(self._channel(key))
+
+            # 订阅前结果可能已经发布
+            existing = await redis_client.get(self._value_key(key))
+            if existing is not None:
+                return existing
+
+            while time.monotonic() < deadline:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if message and message.get("type") == "message":
+                    return message.get("data")
+                # 执行者崩溃导致锁过期且未发布结果时，停止等待
+                if not await redis_client.exists(self._lock_key(key)):
+                    return await redis_client.get(self._value_key(key))
+
+            logger.warning(f"singleflight 等待 {self.namespace} 结果超时")
+            return None
+        except Exception as e:
+            logger.warning(f"singleflight 等待结果失败: {e}")
+            return None
+        finally:
+            try:
+                await pubsub.unsubscribe()
+                await pubsub.close()
+            except Exception:
+                pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取合并统计信息"""
+        return {"inflight": len(self._inflight), **self.stats}
+
+
+# Kiwi 搜索会话合并实例
+kiwi_search_singleflight = SingleFlight("kiwi_search")
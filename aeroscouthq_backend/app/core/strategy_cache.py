@@ -0,0 +1,199 @@
+"""
+搜索策略结果缓存
+Redis 作为共享缓存后端，Redis 不可用时回退到进程内 LRU；
+TTL 随出发日期远近伸缩，并对同一进程内的并发相同搜索做防击穿合并
+"""
+
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from app.core.config import settings
+from app.core.redis_manager import redis_manager
+
+logger = logging.getLogger(__name__)
+
+# (距出发天数上限, TTL秒)：出发越近价格变化越快，缓存越短
+DEPARTURE_TTL_TIERS = [
+    (3, 300),
+    (14, 900),
+    (60, 1800),
+]
+
+
+class LRUCache:
+    """带过期时间的进程内 LRU 缓存"""
+
+    def __init__(self, max_size: int):
+        self._max_size = max_size
+        self._data: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[str]:
+        """获取未过期的缓存值"""
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if time.monotonic() > expires_at:
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: str, ttl: int) -> None:
+        """写入缓存值，超出容量时淘汰最久未使用的条目"""
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self._max_size:
+            self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        """删除缓存值"""
+        self._data.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+def ttl_for_departure(departure_date: Optional[str]) -> int:
+    """根据出发日期距今天数计算缓存TTL"""
+    if not departure_date:
+        return settings.STRATEGY_CACHE_MIN_TTL
+    try:
+        days_ahead = (datetime.strptime(departure_date, "%Y-%m-%d").date() - datetime.now().date()).days
+    except ValueError:
+        return settings.STRATEGY_CACHE_MIN_TTL
+
+    for max_days, ttl in DEPARTURE_TTL_TIERS:
+        if days_ahead <= max_days:
+            return max(settings.STRATEGY_CACHE_MIN_TTL, min(ttl, settings.STRATEGY_CACHE_MAX_TTL))
+    return settings.STRATEGY_CACHE_MAX_TTL
+
+
+class StrategyResultCache:
+    """策略结果缓存（Redis + 进程内 LRU 回退）"""
+
+    def __init__(self, key_prefix: str = "strategy_cache:"):
+        self.key_prefix = key_prefix
+        self._local = LRUCache(settings.STRATEGY_CACHE_LRU_SIZE)
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+    def _make_key(self, cache_key: str) -> str:
+        """生成缓存键名"""
+        return f"{self.key_prefix}{cache_key}"
+
+    def _get_redis(self):
+        """获取Redis客户端，未初始化时返回None（如 Celery worker 中）"""
+        try:
+            return redis_manager.get_client()
+        except RuntimeError:
+            return None
+
+    def _record(self, namespace: str, outcome: str) -> None:
+        """记录命中/未命中计数"""
+        counters = self.stats.setdefault(namespace, {"hits": 0, "misses": 0, "coalesced": 0})
+        counters[outcome] += 1
+
+    async def get(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        """读取缓存，优先Redis，其次进程内LRU"""
+        key = self._make_key(cache_key)
+        redis_client = self._get_redis()
+        if redis_client is not None:
+            try:
+                data = await redis_client.get(key)
+                if data:
+                    return json.loads(data)
+            except Exception as e:
+                logger.warning(f"Redis读取策略缓存失败 {cache_key}: {e}")
+
+        data = self._local.get(key)
+        return json.loads(data) if data else None
+
+    async def set(self, cache_key: str, value: Dict[str, Any], ttl: int) -> None:
+        """写入缓存（Redis 与进程内 LRU 同时写入）"""
+        key = self._make_key(cache_key)
+        data = json.dumps(value, ensure_ascii=False, default=str)
+        self._local.set(key, data, ttl)
+
+        redis_client = self._get_redis()
+        if redis_client is not None:
+            try:
+                await redis_client.setex(key, ttl, data)
+            except Exception as e:
+                logger.warning(f"Redis写入策略缓存失败 {cache_key}: {e}")
+
+    async def get_or_compute(
+        self,
+        cache_key: str,
+        compute: Callable[[], Awaitable[Tuple[Dict[str, Any], bool]]],
+        ttl: int,
+        namespace: str = "default"
+    ) -> Tuple[Dict[str, Any], bool]:
+        """读取缓存，未命中时计算并写入
+
+        同一进程内的并发相同请求只会触发一次 compute，其余调用者等待同一个 Future。
+
+        Args:
+            cache_key: 缓存键
+            compute: 返回 (可序列化结果, 是否可缓存) 的协程函数
+            ttl: 过期时间（秒）
+            namespace: 统计维度（如策略名）
+
+        Returns:
+            Tuple[结果, 是否命中缓存]；合并等待的调用者仅在结果可缓存时视为命中
+        """
+        cached = await self.get(cache_key)
+        if cached is not None:
+            self._record(namespace, "hits")
+            return cached, True
+
+        inflight = self._inflight.get(cache_key)
+        if inflight is not None:
+            self._record(namespace, "coalesced")
+            try:
+                value, cacheable = await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise
+                # 领头的调用被取消（例如其客户端断开），等待者自行重新计算
+                return await self.get_or_compute(cache_key, compute, ttl, namespace)
+            # 不可缓存的结果（如失败/部分结果）不算缓存命中
+            return value, cacheable
+
+        self._record(namespace, "misses")
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[cache_key] = future
+        try:
+            value, cacheable = await compute()
+            if cacheable:
+                await self.set(cache_key, value, ttl)
+            future.set_result((value, cacheable))
+            return value, False
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # 避免无人等待时出现 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(cache_key, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        return {
+            "backend": "redis" if self._get_redis() is not None else "memory",
+            "local_entries": len(self._local),
+            "inflight": len(self._inflight),
+            "namespaces": self.stats
+        }
+
+
+# 全局策略结果缓存实例
+strategy_result_cache = StrategyResultCache()
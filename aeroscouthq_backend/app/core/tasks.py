@@ -7,10 +7,28 @@ from typing import List, Tuple # Add List and Tuple
 import httpx
 from fastapi import HTTPException, status # For handling header fetch errors
 from app.core import dynamic_fetcher
+from app.core.kiwi_client import kiwi_client_manager
+from app.core.worker_runtime import worker_runtime
+from app.core.result_store import search_result_store, search_progress_counters
+from app.core.kiwi_raw_cache import (
+    kiwi_raw_cache, make_query_key, compress_itineraries, decompress_itineraries
+)
+from app.core.singleflight import kiwi_search_singleflight
+from app.core.upstream_rate_limiter import kiwi_rate_limiter, LANE_PROBE, LANE_BACKGROUND
+from app.core.upstream_guard import kiwi_upstream_guard, CircuitOpenError
+from app.core.request_hedging import is_http_success, kiwi_request_hedger
+from app.core.identity_pool import kiwi_identity_pool
+from app.core.retry_policy import (
+    kiwi_retry_policy, raise_for_upstream_status, UpstreamError, UpstreamTokenError, UpstreamTransientError
+)
+from app.core import fast_json
+from app.core.kiwi_queries import build_itinerary_query
+from app.core.itinerary_parser import parse_itineraries
 from app.apis.v1 import schemas # Import schemas for request/response types
 from app.database.crud import hub_crud # Import hub_crud for probing
 from typing import Optional, Dict, Any
 
+from celery import Task, chord, group
 from celery.exceptions import MaxRetriesExceededError, Retry
 
 from app.celery_worker import celery_app
@@ -30,7 +48,7 @@ def fetch_trip_session_task(self) -> Optional[Dict[str, str]]:
     Retries on failure.
     """
     # Run the async logic in a new event loop
-    return asyncio.run(_fetch_trip_session_task_async(self))
+    return worker_runtime.run(_fetch_trip_session_task_async(self))
 
 
 async def _fetch_trip_session_task_async(self) -> Optional[Dict[str, str]]:
@@ -116,7 +134,7 @@ def fetch_kiwi_session_task(self) -> Optional[Dict[str, str]]:
     Retries on failure.
     """
     # Run the async logic in a new event loop
-    return asyncio.run(_fetch_kiwi_session_task_async(self))
+    return worker_runtime.run(_fetch_kiwi_session_task_async(self))
 
 
 async def _fetch_kiwi_session_task_async(self) -> Optional[Dict[str, str]]:
@@ -145,6 +163,7 @@ async def _fetch_kiwi_session_task_async(self) -> Optional[Dict[str, str]]:
                     "query": "query { __typename }",
                     "variables": {}
                 }
+                await kiwi_rate_limiter.acquire(LANE_BACKGROUND)
                 response = await client.post(
                     "https://api.skypicker.com/umbrella/v2/graphql",
                     headers=captured_headers_dict,
@@ -192,465 +211,37 @@ async def _fetch_kiwi_session_task_async(self) -> Optional[Dict[str, str]]:
 
 # --- Kiwi API Configuration (Copied from service) ---
 KIWI_GRAPHQL_ENDPOINT = "https://api.skypicker.com/umbrella/v2/graphql"
-ONEWAY_QUERY_TEMPLATE = """
-query SearchOneWayItinerariesQuery(
-  $search: SearchOnewayInput
-  $filter: ItinerariesFilterInput
-  $options: ItinerariesOptionsInput
-) {
-  onewayItineraries(search: $search, filter: $filter, options: $options) {
-    __typename
-    ... on AppError { error: message }
-    ... on Itineraries {
-      server { requestId packageVersion serverToken }
-      metadata { itinerariesCount hasMorePending }
-      itineraries {
-        __typename
-        ... on ItineraryOneWay {
-          id shareId
-          price { amount priceBeforeDiscount } priceEur { amount }
-          provider { name code } duration pnrCount
-          travelHack { isTrueHiddenCity isVirtualInterlining isThrowawayTicket }
-          bookingOptions {
-            edges {
-              node {
-                token
-                bookingUrl
-                price { amount }
-                priceEur { amount }
-              }
-            }
-          }
-          sector {
-            duration
-            sectorSegments {
-              segment {
-                source { localTime utcTimeIso station { name code city { name } } }
-                destination { localTime utcTimeIso station { name code city { name } } }
-                code duration carrier { name code } operatingCarrier { name code } cabinClass
-              }
-              layover { duration isBaggageRecheck }
-            }
-          }
-        }
-      }
-    }
-  }
-}
-"""
-RETURN_QUERY_TEMPLATE = """
-query SearchReturnItinerariesQuery(
-  $search: SearchReturnInput
-  $filter: ItinerariesFilterInput
-  $options: ItinerariesOptionsInput
-) {
-  returnItineraries(search: $search, filter: $filter, options: $options) {
-    __typename
-    ... on AppError { error: message }
-    ... on Itineraries {
-      server { requestId packageVersion serverToken }
-      metadata { itinerariesCount hasMorePending }
-      itineraries {
-        __typename
-        ... on ItineraryReturn {
-          id shareId
-          price { amount priceBeforeDiscount } priceEur { amount }
-          provider { name code } duration pnrCount
-          travelHack { isTrueHiddenCity isVirtualInterlining isThrowawayTicket }
-          bookingOptions {
-            edges {
-              node {
-                token
-                bookingUrl
-                price { amount }
-                priceEur { amount }
-              }
-            }
-          }
-          outbound {
-            duration
-            sectorSegments {
-              segment {
-                source { localTime utcTimeIso station { name code city { name } } }
-                destination { localTime utcTimeIso station { name code city { name } } }
-                code duration carrier { name code } operatingCarrier { name code } cabinClass
-              }
-              layover { duration isBaggageRecheck }
-            }
-          }
-          inbound {
-            duration
-            sectorSegments {
-              segment {
-                source { localTime utcTimeIso station { name code city { name } } }
-                destination { localTime utcTimeIso station { name code city { name } } }
-                code duration carrier { name code } operatingCarrier { name code } cabinClass
-              }
-              layover { duration isBaggageRecheck }
-            }
-          }
-        }
-      }
-    }
-  }
-}
-"""
+ONEWAY_QUERY_TEMPLATE = build_itinerary_query(True)
+RETURN_QUERY_TEMPLATE = build_itinerary_query(False)
 
 # --- Custom Exception (Copied from service) ---
-class KiwiTokenError(Exception):
+class KiwiTokenError(UpstreamTokenError):
     """Custom exception for Kiwi API token-related errors."""
     pass
 
 
+class KiwiSearchIncompleteError(UpstreamError):
+    """A search session gave up after retries (headers unavailable or a page kept failing).
+
+    `partial` holds the itineraries fetched before the failure so callers can still use them,
+    but must report the search as incomplete (disclaimer or probe error).
+    """
+
+    def __init__(self, message: str, partial: Optional[List[dict]] = None, status_code: Optional[int] = None):
+        super().__init__(message, status_code=status_code)
+        self.partial = partial or []
+
+
 # --- Helper Functions for Flight Search Task ---
 
 import logging
 from datetime import datetime, timedelta, timezone # Import timezone
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Awaitable, Callable
 
 from app.apis.v1 import schemas
 
 logger = logging.getLogger(__name__)
 
-def _parse_datetime(dt_str: Optional[str]) -> Optional[datetime]:
-    """Safely parse ISO 8601 datetime strings."""
-    if not dt_str:
-        return None
-    try:
-        # Handle potential 'Z' for UTC
-        if dt_str.endswith('Z'):
-            dt_str = dt_str[:-1] + '+00:00'
-        # Pydantic v2 handles timezone-aware strings automatically if the model field is datetime
-        dt = datetime.fromisoformat(dt_str)
-        return dt
-    except (ValueError, TypeError) as e:
-        logger.warning(f"Could not parse datetime string '{dt_str}': {e}")
-        return None
-
-def _parse_duration_minutes(duration_seconds: Optional[int]) -> Optional[int]:
-    """Convert duration from seconds to minutes."""
-    if duration_seconds is None:
-        return None
-    try:
-        # Use floor division or round as appropriate, floor seems more common for duration
-        return duration_seconds // 60
-    except TypeError:
-        logger.warning(f"Invalid type for duration_seconds: {type(duration_seconds)}")
-        return None
-
-def _parse_segment(raw_segment_data: dict) -> Optional[schemas.FlightSegment]:
-    """Parses a single raw segment from Kiwi API into our FlightSegment schema."""
-    try:
-        segment = raw_segment_data.get('segment')
-        if not segment:
-            logger.warning("Segment data missing in raw_segment_data")
-            return None
-
-        source = segment.get('source', {})
-        destination = segment.get('destination', {})
-        source_station = source.get('station', {})
-        dest_station = destination.get('station', {})
-        carrier = segment.get('carrier', {})
-        op_carrier_data = segment.get('operatingCarrier') # Can be null
-        op_carrier = op_carrier_data if op_carrier_data else carrier # Fallback to carrier
-
-        # Check essential nested structures exist
-        if not all([source_station, dest_station, carrier, op_carrier]):
-             logger.warning("Missing critical segment sub-dictionaries (station, carrier, op_carrier)")
-             return None
-
-        # Check essential codes exist
-        dep_code = source_station.get('code')
-        arr_code = dest_station.get('code')
-        carrier_code = carrier.get('code')
-        op_carrier_code = op_carrier.get('code')
-        if not all([dep_code, arr_code, carrier_code, op_carrier_code]):
-             logger.warning("Missing critical segment codes (departure, arrival, carrier, operating carrier)")
-             return None
-
-        # --- Flight Number Logic ---
-        # Priority: 1. segment.code (from GraphQL), 2. segment.flightNumber (legacy/alternative), 3. Constructed placeholder
-        flight_number = segment.get('code') # Priority 1: segment.code from GraphQL
-        if not flight_number:
-            flight_number_raw = segment.get('flightNumber') # Priority 2: Check legacy/alternative field
-            if flight_number_raw:
-                 flight_number = f"{carrier_code}-{flight_number_raw}" # Construct if available
-            else:
-                 flight_number = f"{carrier_code}-?" # Priority 3: Fallback placeholder
-
-        # --- Time Parsing ---
-        departure_time_local = _parse_datetime(source.get('localTime'))
-        arrival_time_local = _parse_datetime(destination.get('localTime'))
-        departure_time_utc = _parse_datetime(source.get('utcTimeIso')) # Added UTC time parsing
-        arrival_time_utc = _parse_datetime(destination.get('utcTimeIso')) # Added UTC time parsing
-
-        # --- Duration Parsing ---
-        duration_minutes = _parse_duration_minutes(segment.get('duration'))
-
-        # --- Validation of Parsed Values ---
-        # Check local times and duration as they were checked before. UTC times are good to have but maybe not critical for skipping.
-        if not all([departure_time_local, arrival_time_local, duration_minutes is not None]):
-            logger.warning(f"Missing critical parsed segment data (local times, duration) for segment {flight_number} from {dep_code} @ {source.get('localTime')}")
-            return None
-
-        # --- Schema Instantiation ---
-        # 使用与base_schemas.py中FlightSegment类匹配的字段名称
-        return schemas.FlightSegment(
-            departure_airport=dep_code,
-            arrival_airport=arr_code,
-            departure_airport_name=source_station.get('name'),
-            arrival_airport_name=dest_station.get('name'),
-            departure_city=source_station.get('city', {}).get('name'),
-            arrival_city=dest_station.get('city', {}).get('name'),
-            departure_time=departure_time_local,
-            arrival_time=arrival_time_local,
-            departure_time_utc=departure_time_utc,
-            arrival_time_utc=arrival_time_utc,
-            duration_minutes=duration_minutes,
-            carrier_code=carrier_code,
-            carrier_name=carrier.get('name'),
-            operating_carrier_code=op_carrier_code,
-            operating_carrier_name=op_carrier.get('name'),
-            flight_number=flight_number,
-            cabin_class=segment.get('cabinClass'),
-            aircraft=None
-        )
-    except (KeyError, TypeError, AttributeError) as e:
-        logger.error(f"Error parsing flight segment: {e}. Data: {str(raw_segment_data)[:200]}", exc_info=True)
-        return None
-
-async def _task_parse_kiwi_itinerary(raw_itinerary_data: dict, is_one_way: bool, requested_currency: str = "EUR") -> Optional[schemas.FlightItinerary]:
-    """Parses a single raw itinerary from Kiwi API into our FlightItinerary schema."""
-    if not raw_itinerary_data or not isinstance(raw_itinerary_data, dict):
-        logger.warning("Received empty or invalid raw_itinerary_data")
-        return None
-
-    try:
-        itinerary_id = raw_itinerary_data.get('id')
-        share_id = raw_itinerary_data.get('shareId') # For deep link construction
-
-        # 解析价格信息 - 添加调试日志
-        price_eur_data = raw_itinerary_data.get('priceEur')
-        price_eur = price_eur_data.get('amount') if price_eur_data else None
-
-        # 获取主货币价格（根据API请求中的currency参数返回）
-        price_main_data = raw_itinerary_data.get('price')
-        price_main = price_main_data.get('amount') if price_main_data else None
-
-        # 调试：打印价格信息
-        logger.info(f"价格解析调试 - itinerary_id: {itinerary_id}")
-        logger.info(f"  - 请求货币: {requested_currency}")
-        logger.info(f"  - priceEur数据: {price_eur_data}")
-        logger.info(f"  - price数据: {price_main_data}")
-        logger.info(f"  - price_eur值: {price_eur}")
-        logger.info(f"  - price_main值: {price_main}")
-
-        # 直接使用Kiwi返回的CNY价格，不进行汇率转换
-        final_price_cny = None
-        if requested_currency.upper() == "CNY" and price_main is not None:
-            # 当请求CNY时，price字段就是CNY价格，直接使用
-            final_price_cny = float(price_main)
-            logger.info(f"  - 直接使用Kiwi返回的CNY价格: {final_price_cny}")
-        else:
-            # 如果请求的不是CNY或者没有price_main，跳过此航班
-            logger.warning(f"  - 未请求CNY货币或无CNY价格数据，跳过航班 - itinerary_id: {itinerary_id}")
-            logger.warning(f"  - requested_currency: {requested_currency}, price_main: {price_main}")
-            return None
-
-        total_duration_seconds = raw_itinerary_data.get('duration')
-        travel_hack_data = raw_itinerary_data.get('travelHack', {}) # Default to empty dict
-        is_hidden_city = travel_hack_data.get('isTrueHiddenCity', False) # Default to False
-        is_throwaway_ticket = travel_hack_data.get('isThrowawayTicket', False) # Check for throwaway ticket
-        pnr_count = raw_itinerary_data.get('pnrCount', 1) # Get PNR count for self-transfer check
-
-        # 🔍 甩尾票字段诊断日志
-        logger.info(f"🔍 甩尾票字段诊断 - itinerary_id: {itinerary_id}")
-        logger.info(f"  - travelHack数据: {travel_hack_data}")
-        logger.info(f"  - isTrueHiddenCity: {is_hidden_city}")
-        logger.info(f"  - isThrowawayTicket: {is_throwaway_ticket}")
-
-        # 检查 hiddenDestination 和 throwawayDestination 字段
-        hidden_destinations_found = []
-        throwaway_destinations_found = []
-
-        # 检查单程航班的 sector
-        if 'sector' in raw_itinerary_data:
-            sector = raw_itinerary_data['sector']
-            if 'sectorSegments' in sector:
-                for i, segment_data in enumerate(sector['sectorSegments']):
-                    segment = segment_data.get('segment', {})
-                    hidden_dest = segment.get('hiddenDestination')
-                    throwaway_dest = segment.get('throwawayDestination')
-                    if hidden_dest:
-                        hidden_destinations_found.append(f"航段{i}: {hidden_dest}")
-                        logger.info(f"  - 发现 hiddenDestination 航段{i}: {hidden_dest}")
-                    if throwaway_dest:
-                        throwaway_destinations_found.append(f"航段{i}: {throwaway_dest}")
-                        logger.info(f"  - 发现 throwawayDestination 航段{i}: {throwaway_dest}")
-
-        # 检查往返航班的 outbound/inbound
-        for leg_name in ['outbound', 'inbound']:
-            if leg_name in raw_itinerary_data:
-                leg_data = raw_itinerary_data[leg_name]
-                if 'sectorSegments' in leg_data:
-                    for i, segment_data in enumerate(leg_data['sectorSegments']):
-                        segment = segment_data.get('segment', {})
-                        hidden_dest = segment.get('hiddenDestination')
-                        throwaway_dest = segment.get('throwawayDestination')
-                        if hidden_dest:
-                            hidden_destinations_found.append(f"{leg_name}航段{i}: {hidden_dest}")
-                            logger.info(f"  - 发现 hiddenDestination {leg_name}航段{i}: {hidden_dest}")
-                        if throwaway_dest:
-                            throwaway_destinations_found.append(f"{leg_name}航段{i}: {throwaway_dest}")
-                            logger.info(f"  - 发现 throwawayDestination {leg_name}航段{i}: {throwaway_dest}")
-
-        # 汇总诊断结果
-        if hidden_destinations_found or throwaway_destinations_found:
-            logger.info(f"  - ✅ 发现甩尾票字段: hidden={len(hidden_destinations_found)}, throwaway={len(throwaway_destinations_found)}")
-        else:
-            logger.info(f"  - ❌ 未发现任何甩尾票字段")
-        provider_data = raw_itinerary_data.get('provider', {}) # Extract provider info
-        provider_code = provider_data.get('code') # Added
-        provider_name = provider_data.get('name') # Added
-
-        # Extract booking token from bookingOptions
-        booking_token = None
-        booking_url = None
-        booking_options = raw_itinerary_data.get('bookingOptions', {})
-        if booking_options and 'edges' in booking_options:
-            edges = booking_options['edges']
-            if edges and len(edges) > 0:
-                first_option = edges[0].get('node', {})
-                booking_token = first_option.get('token')
-                booking_url = first_option.get('bookingUrl')
-
-        # Basic validation - 确保至少有EUR价格
-        if not all([itinerary_id, final_price_cny is not None, total_duration_seconds is not None]):
-             logger.warning(f"Missing critical itinerary fields (id, final_price_cny, duration) for itinerary data: {str(raw_itinerary_data)[:200]}")
-             return None
-
-        total_duration_minutes = _parse_duration_minutes(total_duration_seconds)
-        if total_duration_minutes is None:
-             logger.warning(f"Could not parse total duration for itinerary ID {itinerary_id}")
-             return None
-
-        outbound_segments_list: List[schemas.FlightSegment] = []
-        inbound_segments_list: List[schemas.FlightSegment] = []
-        # Determine self-transfer based on PNR count OR baggage recheck flag
-        overall_self_transfer = (pnr_count > 1)
-
-        # --- Parse Segments ---
-        legs_to_parse = []
-        if is_one_way:
-            sector = raw_itinerary_data.get('sector')
-            if sector and 'sectorSegments' in sector:
-                legs_to_parse.append({'leg_data': sector, 'target_list': outbound_segments_list, 'name': 'oneway'})
-            else:
-                logger.warning(f"One-way itinerary {itinerary_id} missing 'sector' or 'sector.sectorSegments' structure.")
-                return None # Missing structure is an error
-        else: # Round trip
-            outbound_leg = raw_itinerary_data.get('outbound')
-            inbound_leg = raw_itinerary_data.get('inbound')
-
-            if outbound_leg and 'sectorSegments' in outbound_leg:
-                 legs_to_parse.append({'leg_data': outbound_leg, 'target_list': outbound_segments_list, 'name': 'outbound'})
-            else:
-                 logger.warning(f"Return itinerary {itinerary_id} missing 'outbound' or 'outbound.sectorSegments' structure.")
-                 return None # Missing outbound is critical
-
-            # Inbound is optional in terms of having segments, but the structure should ideally be there if 'inbound' key exists
-            if inbound_leg and 'sectorSegments' in inbound_leg:
-                 legs_to_parse.append({'leg_data': inbound_leg, 'target_list': inbound_segments_list, 'name': 'inbound'})
-            elif inbound_leg: # 'inbound' key exists but no 'sectorSegments' or it's empty/null
-                 logger.info(f"Return itinerary {itinerary_id} has 'inbound' leg structure but no segments found within.")
-                 # This is acceptable, inbound_segments_list will remain empty.
-            # If 'inbound' key doesn't exist at all, that's also fine (e.g., API error, or truly one-way data in return structure?)
-
-
-        # Process the legs
-        for leg_info in legs_to_parse:
-            leg_data = leg_info['leg_data']
-            target_list = leg_info['target_list']
-            leg_name = leg_info['name']
-            segment_count = 0
-            for segment_data in leg_data.get('sectorSegments', []):
-                parsed_segment = _parse_segment(segment_data)
-                if parsed_segment:
-                    target_list.append(parsed_segment)
-                    segment_count += 1
-                # Check for self-transfer *within* the leg via layover flag
-                # This adds to the pnr_count check
-                layover = segment_data.get('layover')
-                if layover and layover.get('isBaggageRecheck'):
-                    overall_self_transfer = True # Set flag if any segment requires recheck
-            if segment_count == 0 and leg_data.get('sectorSegments'):
-                 # Log if the list existed but we parsed nothing from it
-                 logger.warning(f"Parsed 0 valid segments from {leg_name} leg of itinerary {itinerary_id}, although sectorSegments list was present.")
-                 # Decide if this is fatal. If outbound fails, it's fatal. If inbound fails, maybe okay?
-                 if leg_name == 'outbound' or leg_name == 'oneway':
-                     return None # Cannot proceed without outbound/oneway segments if they were expected
-
-        # --- Final Checks and Object Creation ---
-        if not outbound_segments_list:
-             # This should only happen if the initial structure check failed or parsing failed for outbound/oneway
-             logger.error(f"Critical error: No outbound segments parsed for itinerary {itinerary_id}. Returning None.")
-             return None
-
-        # Construct deep link with priority: booking_url > booking_token > shareId > fallback
-        if booking_url:
-            deep_link = booking_url
-        elif booking_token:
-            deep_link = f"https://www.kiwi.com/en/booking?token={booking_token}"
-        elif share_id:
-            deep_link = f"https://www.kiwi.com/deep?shareId={share_id}"
-        else:
-            deep_link = f"https://www.kiwi.com/search?id={itinerary_id}"
-
-        # 使用与base_schemas.py中FlightItinerary类匹配的字段名称
-        # 添加最终价格验证调试
-        logger.info(f"🎯 最终价格验证 - itinerary_id: {itinerary_id}")
-        logger.info(f"  - final_price_cny: {final_price_cny} (类型: {type(final_price_cny)})")
-
-        # 确保价格是有效的正数
-        if final_price_cny is None or final_price_cny <= 0:
-            logger.error(f"❌ 最终价格无效，跳过此航班 - itinerary_id: {itinerary_id}, price: {final_price_cny}")
-            return None
-
-        # 🔍 最终甩尾票标记确认
-        logger.info(f"🔍 最终甩尾票标记确认 - itinerary_id: {itinerary_id}")
-        logger.info(f"  - is_hidden_city: {is_hidden_city}")
-        logger.info(f"  - is_throwaway_ticket: {is_throwaway_ticket}")
-        logger.info(f"  - hidden_destinations_found: {len(hidden_destinations_found)}")
-        logger.info(f"  - throwaway_destinations_found: {len(throwaway_destinations_found)}")
-
-        # 如果发现了 hiddenDestination 但 is_hidden_city 为 False，强制设置为 True
-        if hidden_destinations_found and not is_hidden_city:
-            logger.warning(f"  - ⚠️ 发现 hiddenDestination 但 isTrueHiddenCity=False，强制标记为甩尾票")
-            is_hidden_city = True
-
-        return schemas.FlightItinerary(
-            id=itinerary_id,
-            price=final_price_cny,  # 直接使用CNY价格
-            currency="CNY",  # 始终返回CNY
-            booking_token=booking_token,
-            deep_link=deep_link,
-            outbound_segments=outbound_segments_list, # 已检查非空
-            inbound_segments=inbound_segments_list if inbound_segments_list else None, # 如果为空则设为None
-            segments=outbound_segments_list + (inbound_segments_list if inbound_segments_list else []), # 同时设置segments字段以兼容
-            total_duration_minutes=total_duration_minutes,
-            is_self_transfer=overall_self_transfer,
-            is_hidden_city=is_hidden_city,
-            is_throwaway_deal=is_throwaway_ticket,  # 🔧 修复: 传递甩尾票标识
-            data_source="kiwi",
-            raw_data=None # 保持响应简洁，除非调试需要
-        )
-
-    except (KeyError, TypeError, ValueError, AttributeError) as e:
-        # Log the specific itinerary ID if available
-        it_id = raw_itinerary_data.get('id', 'UNKNOWN_ID') if isinstance(raw_itinerary_data, dict) else 'INVALID_DATA'
-        logger.error(f"Failed to parse Kiwi itinerary {it_id}: {e}. Raw data snippet: {str(raw_itinerary_data)[:500]}", exc_info=True)
-        return None
-
 async def _task_fetch_kiwi_itineraries_page(
     variables: dict,
     kiwi_headers: dict,
@@ -659,7 +250,13 @@ async def _task_fetch_kiwi_itineraries_page(
     attempt_prefix: str,
     page_num: int
 ) -> Tuple[List[dict], Optional[str], bool]:
-    """Fetches a single page of itineraries from Kiwi GraphQL API."""
+    """Fetches a single page of itineraries from Kiwi GraphQL API.
+
+    Every failure is raised: retryable ones (token, 429, 5xx, timeouts, transport errors, bad JSON)
+    as classified UpstreamError subclasses so the caller can retry this page, the rest (GraphQL/AppError
+    responses, unexpected payloads, open circuit) as permanent errors so the session is marked failed
+    instead of being cached as a complete, truncated result.
+    """
     if is_one_way:
         query_template = ONEWAY_QUERY_TEMPLATE
         feature_name = "SearchOneWayItinerariesQuery"
@@ -669,8 +266,8 @@ async def _task_fetch_kiwi_itineraries_page(
         feature_name = "SearchReturnItinerariesQuery"
         itineraries_key = "returnItineraries"
 
-    current_variables = json.loads(json.dumps(variables))
-    current_variables["options"]["serverToken"] = server_token
+    # Only options.serverToken changes between pages: copy that level instead of a JSON round-trip deep copy
+    current_variables = {**variables, "options": {**variables["options"], "serverToken": server_token}}
 
     payload = {
         "query": query_template,
@@ -680,71 +277,93 @@ async def _task_fetch_kiwi_itineraries_page(
     api_url = f"{KIWI_GRAPHQL_ENDPOINT}?featureName={feature_name}"
     request_timeout = 45.0
 
-    async with httpx.AsyncClient(timeout=request_timeout) as client:
-        try:
-            logger.debug(f"[{attempt_prefix}-P{page_num}] Sending request to {api_url} with token: {str(server_token)[:10]}...")
-            response = await client.post(api_url, headers=kiwi_headers, json=payload)
+    client = kiwi_client_manager.get_client()
 
-            if response.status_code != 200:
-                logger.error(f"[{attempt_prefix}-P{page_num}] Kiwi API HTTP Error: {response.status_code} - {response.text[:500]}")
-                if response.status_code in [401, 403]:
-                     logger.warning(f"[{attempt_prefix}-P{page_num}] Received HTTP {response.status_code}, potentially a token issue.")
-                     raise KiwiTokenError(f"Kiwi API returned HTTP {response.status_code}, likely token-related.")
-                return [], None, False
+    async def _send() -> httpx.Response:
+        # Global pacing across all Kiwi callers replaces fixed sleeps between pages
+        await kiwi_rate_limiter.acquire()
+        # Adaptive concurrency + circuit breaker: fail fast instead of waiting out timeouts when Kiwi is unhealthy
+        async with kiwi_upstream_guard.request() as call:
+            # Spread load across the identity pool: least-loaded healthy identity, cooled down after errors
+            with kiwi_identity_pool.lease(kiwi_headers) as identity:
+                response = await client.post(api_url, headers=identity.headers, json=payload, timeout=request_timeout)
+                identity.observe(response.status_code)
+            call.observe(response.status_code)
+        return response
 
-            try:
-                data = response.json()
-            except json.JSONDecodeError:
-                logger.error(f"[{attempt_prefix}-P{page_num}] Failed to decode JSON response: {response.text[:500]}")
-                return [], None, False
-
-            if 'errors' in data and data['errors']:
-                error_message = json.dumps(data['errors'])
-                logger.error(f"[{attempt_prefix}-P{page_num}] Kiwi GraphQL API Error: {error_message}")
-                if "token" in error_message.lower() or "authorization" in error_message.lower() or "session" in error_message.lower():
-                     logger.warning(f"[{attempt_prefix}-P{page_num}] GraphQL error suggests a token issue: {error_message}")
-                     raise KiwiTokenError(f"Kiwi GraphQL error indicates potential token issue: {error_message}")
-                return [], None, False
-
-            if 'data' not in data or not data['data'] or itineraries_key not in data['data']:
-                 logger.error(f"[{attempt_prefix}-P{page_num}] Invalid response structure. Missing '{itineraries_key}'. Response: {json.dumps(data, indent=2, ensure_ascii=False)[:500]}")
-                 return [], None, False
-
-            results_container = data['data'][itineraries_key]
-            if results_container is None:
-                logger.warning(f"[{attempt_prefix}-P{page_num}] '{itineraries_key}' field is null in response.")
-                return [], None, False
-
-            if results_container.get('__typename') == 'AppError':
-                error_message = results_container.get('error', 'Unknown AppError')
-                logger.error(f"[{attempt_prefix}-P{page_num}] Kiwi API returned AppError: {error_message}")
-                if "token" in error_message.lower() or "session" in error_message.lower() or "invalid parameters" in error_message.lower():
-                     logger.warning(f"[{attempt_prefix}-P{page_num}] AppError suggests a token issue: {error_message}")
-                     raise KiwiTokenError(f"Kiwi AppError indicates potential token issue: {error_message}")
-                return [], None, False
-
-            raw_itineraries = results_container.get('itineraries', [])
-            new_token = results_container.get('server', {}).get('serverToken')
-            has_more = results_container.get('metadata', {}).get('hasMorePending', False)
-
-            logger.info(f"[{attempt_prefix}-P{page_num}] Fetched {len(raw_itineraries)} itineraries. HasMore: {has_more}. NewToken: {str(new_token)[:10]}...")
-
-            if has_more and not new_token and server_token:
-                 logger.warning(f"[{attempt_prefix}-P{page_num}] hasMorePending is True, but no new serverToken received.")
-
-            return raw_itineraries, new_token, has_more
-
-        except httpx.TimeoutException:
-            logger.error(f"[{attempt_prefix}-P{page_num}] Request to Kiwi API timed out after {request_timeout}s.")
-            raise KiwiTokenError(f"Kiwi API request timed out (possible token/session issue).")
-        except httpx.RequestError as e:
-            logger.error(f"[{attempt_prefix}-P{page_num}] httpx RequestError contacting Kiwi API: {e}")
-            return [], None, False
-        except KiwiTokenError:
-             raise
-        except Exception as e:
-            logger.error(f"[{attempt_prefix}-P{page_num}] Unexpected error during Kiwi API fetch: {e}", exc_info=True)
-            return [], None, False
+    try:
+        logger.debug(f"[{attempt_prefix}-P{page_num}] Sending request to {api_url} with token: {str(server_token)[:10]}...")
+        # Slow pages get a duplicate request once they exceed the learned latency percentile (opt-in)
+        response = await kiwi_request_hedger.run(
+            _send, allow_hedge=not kiwi_upstream_guard.degraded, is_success=is_http_success
+        )
+
+        if response.status_code != 200:
+            logger.error(f"[{attempt_prefix}-P{page_num}] Kiwi API HTTP Error: {response.status_code} - {response.text[:500]}")
+            if response.status_code in [401, 403]:
+                 logger.warning(f"[{attempt_prefix}-P{page_num}] Received HTTP {response.status_code}, potentially a token issue.")
+                 raise KiwiTokenError(f"Kiwi API returned HTTP {response.status_code}, likely token-related.", status_code=response.status_code)
+            raise_for_upstream_status(response, f"Kiwi API returned HTTP {response.status_code}")
+            raise UpstreamError(f"Kiwi API returned HTTP {response.status_code}", status_code=response.status_code)
+
+        try:
+            data = fast_json.decode_response(response)
+        except json.JSONDecodeError:
+            logger.error(f"[{attempt_prefix}-P{page_num}] Failed to decode JSON response: {response.text[:500]}")
+            # Usually a truncated body: worth retrying the page
+            raise UpstreamTransientError("Kiwi API returned an invalid JSON response.")
+
+        if 'errors' in data and data['errors']:
+            error_message = json.dumps(data['errors'])
+            logger.error(f"[{attempt_prefix}-P{page_num}] Kiwi GraphQL API Error: {error_message}")
+            if "token" in error_message.lower() or "authorization" in error_message.lower() or "session" in error_message.lower():
+                 logger.warning(f"[{attempt_prefix}-P{page_num}] GraphQL error suggests a token issue: {error_message}")
+                 raise KiwiTokenError(f"Kiwi GraphQL error indicates potential token issue: {error_message}")
+            raise UpstreamError(f"Kiwi GraphQL error: {error_message}")
+
+        if 'data' not in data or not data['data'] or itineraries_key not in data['data']:
+             logger.error(f"[{attempt_prefix}-P{page_num}] Invalid response structure. Missing '{itineraries_key}'. Response: {response.text[:500]}")
+             raise UpstreamError(f"Invalid Kiwi response structure: missing '{itineraries_key}'.")
+
+        results_container = data['data'][itineraries_key]
+        if results_container is None:
+            logger.warning(f"[{attempt_prefix}-P{page_num}] '{itineraries_key}' field is null in response.")
+            raise UpstreamError(f"Kiwi response field '{itineraries_key}' is null.")
+
+        if results_container.get('__typename') == 'AppError':
+            error_message = results_container.get('error', 'Unknown AppError')
+            logger.error(f"[{attempt_prefix}-P{page_num}] Kiwi API returned AppError: {error_message}")
+            if "token" in error_message.lower() or "session" in error_message.lower() or "invalid parameters" in error_message.lower():
+                 logger.warning(f"[{attempt_prefix}-P{page_num}] AppError suggests a token issue: {error_message}")
+                 raise KiwiTokenError(f"Kiwi AppError indicates potential token issue: {error_message}")
+            raise UpstreamError(f"Kiwi AppError: {error_message}")
+
+        raw_itineraries = results_container.get('itineraries', [])
+        new_token = results_container.get('server', {}).get('serverToken')
+        has_more = results_container.get('metadata', {}).get('hasMorePending', False)
+
+        logger.info(f"[{attempt_prefix}-P{page_num}] Fetched {len(raw_itineraries)} itineraries. HasMore: {has_more}. NewToken: {str(new_token)[:10]}...")
+
+        if has_more and not new_token and server_token:
+             logger.warning(f"[{attempt_prefix}-P{page_num}] hasMorePending is True, but no new serverToken received.")
+
+        return raw_itineraries, new_token, has_more
+
+    except UpstreamError:
+        raise
+    except httpx.TimeoutException as e:
+        # A timeout is a transient network failure, not evidence of a bad token: retry the page, keep the headers
+        logger.error(f"[{attempt_prefix}-P{page_num}] Request to Kiwi API timed out after {request_timeout}s.")
+        raise UpstreamTransientError(f"Kiwi API request timed out after {request_timeout}s.") from e
+    except httpx.RequestError as e:
+        logger.error(f"[{attempt_prefix}-P{page_num}] httpx RequestError contacting Kiwi API: {e}")
+        raise UpstreamTransientError(f"Kiwi API request failed: {e}") from e
+    except CircuitOpenError as e:
+        logger.warning(f"[{attempt_prefix}-P{page_num}] Skipping Kiwi request: {e}")
+        raise
+    except Exception as e:
+        logger.error(f"[{attempt_prefix}-P{page_num}] Unexpected error during Kiwi API fetch: {e}", exc_info=True)
+        raise UpstreamError(f"Unexpected error during Kiwi API fetch: {e}") from e
 
 
 async def _task_perform_kiwi_search_session(
@@ -752,52 +371,100 @@ async def _task_perform_kiwi_search_session(
     kiwi_headers: dict,
     is_one_way: bool,
     max_pages: int,
-    attempt_prefix: str
+    attempt_prefix: str,
+    refresh_headers: Optional[Callable[[], Awaitable[dict]]] = None
 ) -> List[dict]:
-    """Performs a full paginated search session with Kiwi API."""
-    all_raw_itineraries = []
-    current_token = None
-    page = 1
-    has_more = True
+    """Performs a full paginated search session with Kiwi API.
 
-    while has_more and page <= max_pages:
-        try:
-            logger.info(f"[{attempt_prefix}] Requesting page {page}...")
-            raw_itineraries, new_token, has_more_pending = await _task_fetch_kiwi_itineraries_page(
-                variables=base_variables,
-                kiwi_headers=kiwi_headers,
-                server_token=current_token,
-                is_one_way=is_one_way,
-                attempt_prefix=attempt_prefix,
-                page_num=page
-            )
+    Results are cached by the normalized query variables (serverToken and search_id
+    excluded), so identical A->X sessions from other strategies or users are reused;
+    concurrent misses for the same key are coalesced into a single upstream session.
+
+    Each page is retried in place by kiwi_retry_policy; on a token error `refresh_headers`
+    is awaited and the same page (same serverToken) is re-requested with the new headers.
+    Sessions that end on an error raise KiwiSearchIncompleteError carrying the pages already
+    fetched; they are neither cached nor shared with other workers through the singleflight.
+    """
+    cache_key = make_query_key(
+        ONEWAY_QUERY_TEMPLATE if is_one_way else RETURN_QUERY_TEMPLATE, base_variables, max_pages
+    )
+    cached_itineraries = await kiwi_raw_cache.get(cache_key)
+    if cached_itineraries is not None:
+        logger.info(f"[{attempt_prefix}] Raw Kiwi cache hit: {len(cached_itineraries)} itineraries.")
+        return cached_itineraries
+
+    async def _fetch_session() -> List[dict]:
+        all_raw_itineraries = []
+        current_token = None
+        page = 1
+        has_more = True
+        session_error: Optional[str] = None
+        headers = kiwi_headers
+
+        async def _refresh_headers() -> None:
+            nonlocal headers
+            logger.warning(f"[{attempt_prefix}] Token error on page {page}. Forcing header refresh.")
+            headers = await refresh_headers()
+
+        while has_more and page <= max_pages:
+            try:
+                logger.info(f"[{attempt_prefix}] Requesting page {page}...")
+                raw_itineraries, new_token, has_more_pending = await kiwi_retry_policy.run(
+                    lambda: _task_fetch_kiwi_itineraries_page(
+                        variables=base_variables,
+                        kiwi_headers=headers,
+                        server_token=current_token,
+                        is_one_way=is_one_way,
+                        attempt_prefix=attempt_prefix,
+                        page_num=page
+                    ),
+                    desc=f"{attempt_prefix}-P{page}",
+                    on_token_error=_refresh_headers if refresh_headers else None
+                )
 
-            if raw_itineraries:
-                all_raw_itineraries.extend(raw_itineraries)
-                logger.info(f"[{attempt_prefix}-P{page}] Added {len(raw_itineraries)} itineraries. Total: {len(all_raw_itineraries)}")
+                if raw_itineraries:
+                    all_raw_itineraries.extend(raw_itineraries)
+                    logger.info(f"[{attempt_prefix}-P{page}] Added {len(raw_itineraries)} itineraries. Total: {len(all_raw_itineraries)}")
 
-            current_token = new_token
-            has_more = has_more_pending
+                current_token = new_token
+                has_more = has_more_pending
 
-            if not has_more_pending:
-                logger.info(f"[{attempt_prefix}-P{page}] No more pending results indicated by API.")
-                break
+                if not has_more_pending:
+                    logger.info(f"[{attempt_prefix}-P{page}] No more pending results indicated by API.")
+                    break
 
-            page += 1
-            await asyncio.sleep(0.5)
+                page += 1
 
-        except KiwiTokenError:
-            logger.error(f"[{attempt_prefix}] KiwiTokenError encountered during page {page} fetch. Aborting session.")
-            raise
-        except Exception as e:
-            logger.error(f"[{attempt_prefix}] Unexpected error during page {page} fetch in session: {e}", exc_info=True)
-            break
+            except UpstreamError as e:
+                logger.error(f"[{attempt_prefix}] Page {page} failed after retries ({e.kind}): {e}. Ending session with {len(all_raw_itineraries)} itineraries.")
+                session_error = f"page {page} failed ({e.kind}): {e}"
+                break
+            except CircuitOpenError as e:
+                logger.error(f"[{attempt_prefix}] Page {page} skipped, Kiwi circuit is open: {e}. Ending session with {len(all_raw_itineraries)} itineraries.")
+                session_error = f"page {page} skipped: {e}"
+                break
+            except Exception as e:
+                logger.error(f"[{attempt_prefix}] Unexpected error during page {page} fetch in session: {e}", exc_info=True)
+                session_error = f"page {page} failed: {e}"
+                break
 
-    if page > max_pages and has_more:
-         logger.warning(f"[{attempt_prefix}] Reached max_pages limit ({max_pages}) but API indicated more results might exist.")
+        if page > max_pages and has_more:
+             logger.warning(f"[{attempt_prefix}] Reached max_pages limit ({max_pages}) but API indicated more results might exist.")
 
-    logger.info(f"[{attempt_prefix}] Search session finished. Fetched {len(all_raw_itineraries)} itineraries in {page-1} pages.")
-    return all_raw_itineraries
+        logger.info(f"[{attempt_prefix}] Search session finished. Fetched {len(all_raw_itineraries)} itineraries in {page-1} pages.")
+        if session_error:
+            # Raising (rather than returning the truncated list) keeps it out of the raw cache, and the
+            # singleflight publishes a failure marker so waiting workers run their own session
+            raise KiwiSearchIncompleteError(
+                f"Kiwi search session incomplete, {session_error}", partial=all_raw_itineraries
+            )
+        await kiwi_raw_cache.set(cache_key, all_raw_itineraries)
+        return all_raw_itineraries
+
+    # Concurrent identical sessions (in this process or other workers) hit upstream only once
+    return await kiwi_search_singleflight.do(
+        cache_key, _fetch_session, encode=compress_itineraries, decode=decompress_itineraries
+    )
 
 
 def _task_build_kiwi_variables(params: schemas.FlightSearchRequest, is_one_way: bool, **overrides) -> dict:
@@ -916,75 +583,273 @@ def _task_build_kiwi_variables(params: schemas.FlightSearchRequest, is_one_way:
 
 
 async def _task_run_search_with_retry(
-    self, # Added self for retry mechanism
+    self, # Celery task (or a stand-in); only used to reschedule a real task when Kiwi headers stay unavailable
     variables: dict,
     attempt_desc: str,
     request_params: schemas.FlightSearchRequest, # Pass original request for max_pages
     force_one_way: bool = False
 ) -> List[dict]:
-    """Runs a search session with token refresh retry logic within a Celery task."""
-    kiwi_headers = {} # Initialize headers dict
+    """Runs a search session under the shared Kiwi retry policy.
+
+    Header fetches and individual pages are retried with jittered backoff by kiwi_retry_policy
+    (charged to the current search's retry budget); token errors refresh the headers once and
+    retry the failing page instead of restarting the whole session.
+
+    Raises:
+        KiwiSearchIncompleteError: headers stayed unavailable or the session ended on an error
+            after retries; `partial` holds whatever was fetched.
+    """
     search_is_one_way = force_one_way or request_params.return_date_from is None
     search_id = variables.get("search_id", "unknown") # Get search_id if passed
 
     try:
-        # Attempt 1: Get headers and run search
-        try:
-            kiwi_headers = await dynamic_fetcher.get_effective_kiwi_headers()
-        except HTTPException as e:
-             if e.status_code == 503:
-                 logger.warning(f"[{search_id}-{attempt_desc}] Initial Kiwi headers fetch returned 503. Retrying task in 30s...")
-                 logger.info(f"[{search_id}-{attempt_desc}] 503 error details: {e.detail}")
-                 raise self.retry(exc=e, countdown=30) # Increased from 15s to 30s
-             else:
-                 logger.error(f"[{search_id}-{attempt_desc}] Failed to get initial Kiwi headers: {e.detail}")
-                 raise # Re-raise other HTTP errors
-        except Exception as e:
-             logger.error(f"[{search_id}-{attempt_desc}] Unexpected error getting initial Kiwi headers: {e}", exc_info=True)
-             raise # Re-raise unexpected errors
-
-        return await _task_perform_kiwi_search_session(
-            base_variables=variables,
-            kiwi_headers=kiwi_headers,
-            is_one_way=search_is_one_way,
-            max_pages=request_params.max_pages_per_search,
-            attempt_prefix=f"{search_id}-{attempt_desc}"
+        kiwi_headers = await kiwi_retry_policy.run(
+            dynamic_fetcher.get_effective_kiwi_headers, desc=f"{search_id}-{attempt_desc}-headers"
         )
-    except KiwiTokenError:
-        # Attempt 2: Refresh headers and retry search
-        logger.warning(f"[{search_id}-{attempt_desc}] KiwiTokenError detected. Forcing header refresh and retrying search...")
-        try:
-            # Force refresh headers
-            kiwi_headers = await dynamic_fetcher.get_effective_kiwi_headers(force_refresh=True)
-            logger.info(f"[{search_id}-{attempt_desc}] Retrying search with refreshed headers.")
-            # Retry the search session
-            return await _task_perform_kiwi_search_session(
-                base_variables=variables,
-                kiwi_headers=kiwi_headers,
-                is_one_way=search_is_one_way,
-                max_pages=request_params.max_pages_per_search,
-                attempt_prefix=f"{search_id}-{attempt_desc}-retry"
-            )
-        except KiwiTokenError as retry_e:
-            logger.error(f"[{search_id}-{attempt_desc}] KiwiTokenError persisted after retry: {retry_e}")
-            # Decide task outcome: fail or return empty? Let's return empty list after failed retry.
-            return []
-        except HTTPException as e:
-             # Handle potential 503 on forced refresh
-             if e.status_code == 503:
-                 logger.error(f"[{search_id}-{attempt_desc}] Kiwi headers fetch returned 503 even on forced refresh. Retrying task in 45s...")
-                 logger.info(f"[{search_id}-{attempt_desc}] Forced refresh 503 error details: {e.detail}")
-                 raise self.retry(exc=e, countdown=45) # Increased from 30s to 45s for forced refresh
-             else:
-                 logger.error(f"[{search_id}-{attempt_desc}] Failed to get refreshed Kiwi headers: {e.detail}")
-                 return [] # Return empty list if header refresh fails definitively
-        except Exception as e:
-             logger.error(f"[{search_id}-{attempt_desc}] Unexpected error during search retry: {e}", exc_info=True)
-             return [] # Return empty list on unexpected retry error
+    except HTTPException as e:
+        logger.error(f"[{search_id}-{attempt_desc}] Failed to get Kiwi headers: {e.detail}")
+        if e.status_code == 503 and isinstance(self, Task):
+            # Headers still unavailable after in-process retries: reschedule the whole Celery task
+            raise self.retry(exc=e, countdown=30)
+        raise KiwiSearchIncompleteError(
+            f"Kiwi headers unavailable: {e.detail}", status_code=e.status_code
+        ) from e
+    except Exception as e:
+        logger.error(f"[{search_id}-{attempt_desc}] Unexpected error getting Kiwi headers: {e}", exc_info=True)
+        raise
+
+    return await _task_perform_kiwi_search_session(
+        base_variables=variables,
+        kiwi_headers=kiwi_headers,
+        is_one_way=search_is_one_way,
+        max_pages=request_params.max_pages_per_search,
+        attempt_prefix=f"{search_id}-{attempt_desc}",
+        refresh_headers=lambda: dynamic_fetcher.get_effective_kiwi_headers(force_refresh=True)
+    )
 
 
 # --- Flight Search Task ---
 
+def _task_is_direct_flight(flight: schemas.FlightItinerary, is_one_way: bool) -> bool:
+    # One-way direct flights have exactly 1 segment; round trips 2 (1 outbound + 1 inbound).
+    # This is a simplified check - in reality we should check outbound_segments and inbound_segments
+    return len(flight.segments) == (1 if is_one_way else 2)
+
+
+def _task_publish_progress(self, stage: str, search_id: str, progress: Dict[str, Any], partial_result: Dict[str, Any]) -> None:
+    """
+    Publish an intermediate PROGRESS state to the result backend so /tasks/results/{task_id}
+    can serve partial results while probes are still running. No-op outside a real Celery task.
+    """
+    if not settings.TASK_PROGRESS_ENABLED or not isinstance(self, Task):
+        return
+    try:
+        # Small synchronous write to the result backend; the final SUCCESS result overwrites it
+        self.update_state(
+            task_id=self.request.id,
+            state="PROGRESS",
+            meta={"stage": stage, "search_id": search_id, "progress": progress, "partial_result": partial_result}
+        )
+    except Exception as e:
+        # Progress is best-effort and must never fail the search itself
+        logger.warning(f"[{search_id} / Task {self.request.id}] Failed to publish progress '{stage}': {e}")
+
+
+def _task_can_dispatch_probe_chord(self) -> bool:
+    """Throwaway probes fan out as a chord only from a real, non-eager Celery task."""
+    return (
+        settings.CELERY_PROBE_CHORD_ENABLED
+        and isinstance(self, Task)
+        and not self.request.is_eager
+        and not self.request.called_directly
+    )
+
+
+async def _task_probe_throwaway_destination(
+    self,
+    request_params: schemas.FlightSearchRequest,
+    search_id: str,
+    dest_x: str
+) -> Dict[str, Any]:
+    """
+    Probe A -> X and keep the itineraries that stop at the user's destination B before their
+    final segment. Errors are reported in the result instead of raised, so one failing
+    destination never fails the whole search.
+    """
+    task_id = self.request.id
+    is_one_way = request_params.return_date_from is None
+    destination_b_iata = request_params.destination_iata.upper()
+    requested_currency = request_params.preferred_currency or "CNY"
+    probe_result: Dict[str, Any] = {"destination": dest_x, "raw_count": 0, "candidates": [], "error": None}
+
+    # Build variables for A -> X search
+    # Use the original is_one_way setting for the A->X search
+    variables = _task_build_kiwi_variables(request_params, is_one_way, destination=f"Station:airport:{dest_x}")
+    variables["search_id"] = search_id
+
+    try:
+        logger.info(f"[{search_id} / Task {task_id}] Probing A -> {dest_x}...")
+        with kiwi_rate_limiter.lane(LANE_PROBE):
+            try:
+                probe_raw_results = await _task_run_search_with_retry(
+                    self=self,
+                    variables=variables,
+                    attempt_desc=f"throwaway-{dest_x}",
+                    request_params=request_params,
+                    force_one_way=is_one_way # Ensure probe matches main search type
+                )
+            except KiwiSearchIncompleteError as e:
+                # Keep what was fetched, but report the probe as incomplete in probe_log["errors"]
+                logger.warning(f"[{search_id} / Task {task_id}] Probe A -> {dest_x} incomplete: {e}")
+                probe_raw_results = e.partial
+                probe_result["error"] = f"Probe A -> {dest_x} incomplete: {e}"
+        probe_result["raw_count"] = len(probe_raw_results)
+
+        # Filter results: Find itineraries A-...-B-...-X
+        for parsed_itinerary in parse_itineraries(probe_raw_results, is_one_way, requested_currency):
+            if not parsed_itinerary.segments: continue
+
+            for i, segment in enumerate(parsed_itinerary.segments):
+                # Check if a segment's destination is the user's target (B)
+                # AND it's not the *very last* segment of the A->X journey.
+                if segment.arrival_airport.upper() == destination_b_iata and i < len(parsed_itinerary.segments) - 1:
+                    # Found a potential A-...-B-...-X itinerary. Add it for later price comparison.
+                    probe_result["candidates"].append(parsed_itinerary)
+                    logger.debug(f"[{search_id} / Task {task_id}] Potential throwaway candidate found: A -> {dest_x} via B (ID: {parsed_itinerary.id}, Price: {parsed_itinerary.price} CNY)")
+                    # Break assuming the first B stop is the relevant one.
+                    break # Move to the next itinerary
+
+        logger.info(f"[{search_id} / Task {task_id}] Probe A -> {dest_x} found {len(probe_result['candidates'])} potential candidate itineraries stopping at B.")
+    except Retry:
+        # self.retry() rescheduled the task; swallowing it would also return a result and run the probe twice
+        raise
+    except MaxRetriesExceededError:
+        logger.error(f"[{search_id} / Task {task_id}] Max retries exceeded during probe A -> {dest_x}. Skipping destination.")
+        probe_result["error"] = f"Probe A -> {dest_x} failed after retries."
+    except Exception as e:
+        logger.error(f"[{search_id} / Task {task_id}] Error probing A -> {dest_x}: {e}", exc_info=True)
+        probe_result["error"] = f"Probe A -> {dest_x} failed: {str(e)}"
+    return probe_result
+
+
+def _task_merge_throwaway_probes(
+    search_id: str,
+    task_id: Optional[str],
+    probe_results: List[Dict[str, Any]],
+    min_direct_price_cny: Optional[float],
+    probe_log: Dict[str, Any],
+    disclaimers: List[str]
+) -> List[schemas.FlightItinerary]:
+    """
+    Fold per-destination probe results into probe_log and mark the candidates cheaper than the
+    cheapest direct A->B flight as throwaway deals. Shared by the in-process gather and the chord callback.
+    """
+    parsed_throwaway_deals: List[schemas.FlightItinerary] = []
+    try:
+        all_potential_throwaway_deals_via_b: List[schemas.FlightItinerary] = [] # Store parsed A->X itineraries that stop at B
+        for probe_result in probe_results:
+            probe_log["probe_raw_results_count"] += probe_result["raw_count"]
+            all_potential_throwaway_deals_via_b.extend(probe_result["candidates"])
+            if probe_result["error"]:
+                probe_log["errors"].append(probe_result["error"])
+        probe_log["potential_deals_via_b_count"] = len(all_potential_throwaway_deals_via_b)
+        logger.info(f"[{search_id} / Task {task_id}] Throwaway probe completed. Found {len(all_potential_throwaway_deals_via_b)} total candidate itineraries (A->X stopping at B).")
+
+        # Price Comparison: Check if the A->X itinerary (stopping at B) is cheaper than the cheapest direct A->B flight.
+        # Note: This compares the *full* A->X price against the A->B price.
+        # A more ideal comparison would use the price specifically for the A->B portion
+        # of the A->X itinerary, but this data is often unavailable or hard to extract reliably.
+        # This simplification might miss some deals or include deals where only the full A->X is cheaper.
+        if min_direct_price_cny is not None:
+            # Define a threshold (e.g., must be cheaper, or significantly cheaper)
+            # Let's require it to be strictly cheaper for now.
+            # price_threshold_factor = 0.9 # Example: Must be at least 10% cheaper
+            for deal_candidate in all_potential_throwaway_deals_via_b:
+                # Compare A->X price with the minimum direct A->B price found earlier
+                if deal_candidate.price < min_direct_price_cny: # Use '<' for strictly cheaper
+                    # Mark this itinerary as a throwaway deal
+                    deal_candidate.is_throwaway_deal = True
+                    parsed_throwaway_deals.append(deal_candidate)
+                    logger.debug(f"[{search_id} / Task {task_id}] Marked throwaway deal: ID {deal_candidate.id}, Price {deal_candidate.price} CNY (Direct A->B min: {min_direct_price_cny} CNY)")
+
+            probe_log["throwaway_deals_marked_count"] = len(parsed_throwaway_deals)
+            logger.info(f"[{search_id} / Task {task_id}] Marked {len(parsed_throwaway_deals)} throwaway deals as cheaper than direct A->B price ({min_direct_price_cny} CNY).")
+            if parsed_throwaway_deals:
+                 disclaimers.append(
+                     f"Found {len(parsed_throwaway_deals)} potential throwaway deals (flying A-X, exiting at B). "
+                     "These require buying the full A-X ticket and abandoning the final leg(s). "
+                     "This may violate airline rules and cause issues with checked bags or return flights. Verify risks before booking."
+                 )
+        else:
+            logger.info(f"[{search_id} / Task {task_id}] Skipping price comparison for throwaway deals as no direct A->B price was found for reference.")
+            # Do not mark any deals if no reference price exists.
+            probe_log["throwaway_deals_marked_count"] = 0
+
+        probe_log["status"] = "completed"
+
+    except Exception as e:
+         logger.error(f"[{search_id} / Task {task_id}] Error merging throwaway probe results: {e}", exc_info=True)
+         probe_log["status"] = "error_gathering_results"
+         probe_log["errors"].append(f"Error gathering throwaway probe results: {str(e)}")
+         parsed_throwaway_deals = []
+    return parsed_throwaway_deals
+
+
+def _task_build_search_response(
+    search_id: str,
+    task_id: Optional[str],
+    is_one_way: bool,
+    parsed_main_flights: List[schemas.FlightItinerary],
+    parsed_throwaway_deals: List[schemas.FlightItinerary],
+    disclaimers: List[str],
+    probe_log: Optional[Dict[str, Any]]
+) -> Dict[str, Any]:
+    """Combine main results and throwaway deals into the JSON form of FlightSearchResponse."""
+    # --- 4. Combine and Filter Final Results ---
+    # Separate direct flights and combo deals
+    direct_flights = []
+    combo_deals = []
+
+    # Combine main search results and valid throwaway deals
+    combined_flights = parsed_main_flights + parsed_throwaway_deals
+
+    # Remove duplicates based on 'id'
+    unique_flights_dict: Dict[str, schemas.FlightItinerary] = {}
+    for flight in combined_flights:
+        if flight:  # 添加None检查
+            # Prioritize non-throwaway deals if IDs collide? Or let the cheaper one win?
+            # Current logic: last one seen wins if ID is the same. Sorting later handles price.
+            unique_flights_dict[flight.id] = flight
+    final_flights = list(unique_flights_dict.values())
+
+    # Separate direct flights from combo deals
+    for flight in final_flights:
+        # Determine if it's a direct flight based on segment count
+        if _task_is_direct_flight(flight, is_one_way):
+            direct_flights.append(flight)
+        else:
+            combo_deals.append(flight)
+
+    # Sort by price
+    direct_flights.sort(key=lambda f: f.price)
+    combo_deals.sort(key=lambda f: f.price)
+
+    logger.info(f"[{search_id} / Task {task_id}] Search task finished. Returning {len(direct_flights)} direct flights and {len(combo_deals)} combo deals (including {len(parsed_throwaway_deals)} throwaway deals).")
+
+    # --- 5. Construct and Return Response ---
+    response_data = schemas.FlightSearchResponse(
+        search_id=search_id,
+        direct_flights=direct_flights,
+        combo_deals=combo_deals,
+        disclaimers=list(set(disclaimers)), # Ensure unique disclaimers
+        probe_details=probe_log # Use 'probe_details' to match schema definition if needed, or keep 'probe_log'
+    )
+
+    # Celery tasks should return JSON-serializable data
+    # Use mode='json' to ensure datetime objects are properly serialized
+    return response_data.model_dump(mode='json')
+
+
 @celery_app.task(bind=True, max_retries=2, default_retry_delay=30, acks_late=True)
 def find_flights_task(self, search_params_dict: Dict[str, Any]) -> Dict[str, Any]:
     """
@@ -992,8 +857,17 @@ def find_flights_task(self, search_params_dict: Dict[str, Any]) -> Dict[str, Any
     hub probing, and result combination. Returns a dictionary representation
     of FlightSearchResponse.
     """
-    # Run the async logic in a new event loop
-    return asyncio.run(_find_flights_task_async(self, search_params_dict))
+    # Run the async logic on the worker's event loop
+    # All upstream retries of this search (main search and probes) share one retry budget
+    return worker_runtime.run(kiwi_retry_policy.with_search_budget(
+        self.request.id or "unknown",
+        _task_store_search_result(self.request.id, _find_flights_task_async(self, search_params_dict))
+    ))
+
+
+async def _task_store_search_result(task_id: Optional[str], result: Awaitable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Store the full search response compressed under its own Redis key; the Celery result carries only a pointer."""
+    return await search_result_store.store(task_id, await result)
 
 
 async def _find_flights_task_async(self, search_params_dict: Dict[str, Any]) -> Dict[str, Any]:
@@ -1034,6 +908,10 @@ async def _find_flights_task_async(self, search_params_dict: Dict[str, Any]) ->
             attempt_desc="main",
             request_params=request_params
         )
+    except KiwiSearchIncompleteError as e:
+        logger.error(f"[{search_id} / Task {task_id}] Main search incomplete, continuing with {len(e.partial)} itineraries: {e}")
+        main_search_raw = e.partial
+        disclaimers.append("Flight results may be incomplete: the flight data source failed during the search.")
     except MaxRetriesExceededError:
          logger.error(f"[{search_id} / Task {task_id}] Max retries exceeded during main search header fetch. Failing task.")
          # Return error dict
@@ -1047,29 +925,18 @@ async def _find_flights_task_async(self, search_params_dict: Dict[str, Any]) ->
     logger.info(f"[{search_id} / Task {task_id}] Parsing {len(main_search_raw)} main search results...")
     min_direct_price_cny = float('inf')
     requested_currency = request_params.preferred_currency or "CNY"  # 获取请求的货币
-    for raw_itinerary in main_search_raw:
-        try:
-            parsed = await _task_parse_kiwi_itinerary(raw_itinerary, is_one_way, requested_currency)
-            if parsed:  # 添加None检查
-                parsed_main_flights.append(parsed)
-                # Check if it's a direct flight and update min price
-                # Note: Kiwi's `sector` (one-way) vs `outbound`/`inbound` (return) structure needs careful handling for segment count.
-                # Let's assume `len(parsed.segments)` works for both after parsing.
-                # A more robust check might involve `raw_itinerary.get("sector", {}).get("sectorSegments", [])` length for one-way.
-                if len(parsed.segments) == 1:
-                     min_direct_price_cny = min(min_direct_price_cny, parsed.price)
-                elif not is_one_way and len(parsed.segments) == 2: # Basic check for direct round trip
-                     # This check is simplistic. A true direct round trip has one outbound and one inbound segment.
-                     # Parsing logic in _task_parse_kiwi_itinerary combines segments, so this check might be inaccurate.
-                     # We rely on the price comparison later.
-                     min_direct_price_cny = min(min_direct_price_cny, parsed.price)
-            else:
-                logger.warning(f"[{search_id} / Task {task_id}] Parsed main flight to None - {raw_itinerary.get('id', 'UNKNOWN_ID')}")
-
-        except ValueError as e:
-            logger.warning(f"[{search_id} / Task {task_id}] Failed to parse main itinerary {raw_itinerary.get('id', 'N/A')}: {e}")
-        except Exception as e:
-             logger.error(f"[{search_id} / Task {task_id}] Unexpected error parsing main itinerary {raw_itinerary.get('id', 'N/A')}: {e}", exc_info=True)
+    parsed_main_flights.extend(parse_itineraries(main_search_raw, is_one_way, requested_currency))
+    for parsed in parsed_main_flights:
+        # Check if it's a direct flight and update min price
+        if len(parsed.segments) == 1:
+             min_direct_price_cny = min(min_direct_price_cny, parsed.price)
+        elif not is_one_way and len(parsed.segments) == 2: # Basic check for direct round trip
+             # This check is simplistic. A true direct round trip has one outbound and one inbound segment.
+             # The parser combines outbound and inbound into `segments`, so this check might be inaccurate.
+             # We rely on the price comparison later.
+             min_direct_price_cny = min(min_direct_price_cny, parsed.price)
+    if len(parsed_main_flights) < len(main_search_raw):
+        logger.warning(f"[{search_id} / Task {task_id}] {len(main_search_raw) - len(parsed_main_flights)} main itineraries could not be parsed.")
 
     if min_direct_price_cny == float('inf'):
         logger.info(f"[{search_id} / Task {task_id}] No direct flights found in main search results for price comparison.")
@@ -1077,13 +944,39 @@ async def _find_flights_task_async(self, search_params_dict: Dict[str, Any]) ->
     else:
         logger.info(f"[{search_id} / Task {task_id}] Minimum direct flight price (A->B): {min_direct_price_cny} CNY")
 
+    # Publish direct flights as soon as the main search is parsed; they don't change while probes run.
+    # Serialized once and reused by every later progress update.
+    partial_direct_flights = sorted(
+        (flight for flight in parsed_main_flights if _task_is_direct_flight(flight, is_one_way)),
+        key=lambda f: f.price
+    )
+    progress = {
+        "main_search_done": True,
+        "main_results_count": len(parsed_main_flights),
+        "direct_flights_count": len(partial_direct_flights),
+        "probes_total": 0,
+        "probes_done": 0,
+        "throwaway_candidates_count": 0,
+    }
+    partial_result = {
+        "direct_flights": [
+            flight.model_dump(mode='json') for flight in partial_direct_flights[:settings.TASK_PROGRESS_PARTIAL_LIMIT]
+        ],
+    }
+    _task_publish_progress(self, "main_search_done", search_id, progress, partial_result)
+
 
     # --- 3. Perform Throwaway Ticketing Probe (Search A -> X, check for intermediate stop B) ---
     # This logic attempts to find "throwaway" or "hidden city" deals where a flight
     # from the origin (A) to a sacrifice destination (X) stops at the user's desired
     # destination (B), and the A->X ticket is cheaper than the direct A->B ticket.
     # The user would discard the final leg (B->X). This carries risks (e.g., checked bags, airline penalties).
-    if request_params.enable_hub_probe:
+    if request_params.enable_hub_probe and kiwi_upstream_guard.degraded:
+        # Kiwi is failing or throttling; serve the primary results instead of fanning out more probes
+        logger.warning(f"[{search_id} / Task {task_id}] Kiwi circuit breaker is {kiwi_upstream_guard.state}, skipping throwaway probe.")
+        probe_log["status"] = "skipped_upstream_degraded"
+        disclaimers.append("Throwaway probe skipped: flight data source is temporarily degraded.")
+    elif request_params.enable_hub_probe:
         logger.info(f"[{search_id} / Task {task_id}] Starting Throwaway Ticketing Probe (Searching A->X via B)...")
         # Use configured list of sacrifice destinations (X)
         sacrifice_destinations = settings.CHINA_HUB_CITIES_FOR_PROBE # Example: ['HKG', 'MFM', 'TPE']
@@ -1093,8 +986,6 @@ async def _find_flights_task_async(self, search_params_dict: Dict[str, Any]) ->
         probe_log["potential_deals_via_b_count"] = 0 # Itineraries A->X that were found to stop at B
         probe_log["throwaway_deals_marked_count"] = 0 # Itineraries marked as throwaway deals after price check
         probe_log["errors"] = []
-        throwaway_tasks = []
-        all_potential_throwaway_deals_via_b: List[schemas.FlightItinerary] = [] # Store parsed A->X itineraries that stop at B
 
         if not sacrifice_destinations:
             logger.warning(f"[{search_id} / Task {task_id}] Throwaway probe enabled but sacrifice destinations list (CHINA_HUB_CITIES_FOR_PROBE) is empty.")
@@ -1111,158 +1002,102 @@ async def _find_flights_task_async(self, search_params_dict: Dict[str, Any]) ->
 
                 probe_log["sacrifice_destinations_queried"].append(dest_x_iata)
 
-                # Build variables for A -> X search
-                # Use the original is_one_way setting for the A->X search
-                probe_vars = _task_build_kiwi_variables(request_params, is_one_way, destination=f"Station:airport:{dest_x_iata}")
-                probe_vars["search_id"] = search_id
-
-                async def run_throwaway_probe(dest_x, variables):
-                    potential_deals_for_x: List[schemas.FlightItinerary] = []
-                    try:
-                        logger.info(f"[{search_id} / Task {task_id}] Probing A -> {dest_x}...")
-                        probe_raw_results = await _task_run_search_with_retry(
-                            self=self,
-                            variables=variables,
-                            attempt_desc=f"throwaway-{dest_x}",
-                            request_params=request_params,
-                            force_one_way=is_one_way # Ensure probe matches main search type
-                        )
-                        probe_log["probe_raw_results_count"] += len(probe_raw_results)
-
-                        # Filter results: Find itineraries A-...-B-...-X
-                        for raw_itinerary in probe_raw_results:
-                            try:
-                                parsed_itinerary = await _task_parse_kiwi_itinerary(raw_itinerary, is_one_way, requested_currency)
-                                if not parsed_itinerary or not parsed_itinerary.segments: continue
-
-                                for i, segment in enumerate(parsed_itinerary.segments):
-                                    # Check if segment destination is B and it's not the last segment
-                                    # Check if a segment's destination is the user's target (B)
-                                    # AND it's not the *very last* segment of the A->X journey.
-                                    if segment.arrival_airport.upper() == destination_b_iata and i < len(parsed_itinerary.segments) - 1:
-                                        # Found a potential A-...-B-...-X itinerary. Add it for later price comparison.
-                                        potential_deals_for_x.append(parsed_itinerary)
-                                        logger.debug(f"[{search_id} / Task {task_id}] Potential throwaway candidate found: A -> {dest_x} via B (ID: {parsed_itinerary.id}, Price: {parsed_itinerary.price} CNY)")
-                                        # Don't break yet, maybe multiple stops at B? (Unlikely but possible)
-                                        # Let's break for simplicity now, assuming first B stop is the relevant one.
-                                        break # Move to the next itinerary
-
-                            except ValueError as e:
-                                logger.warning(f"[{search_id} / Task {task_id}] Failed to parse potential throwaway deal for A->{dest_x} (ID: {raw_itinerary.get('id', 'N/A')}): {e}")
-                            except Exception as e:
-                                logger.error(f"[{search_id} / Task {task_id}] Unexpected error parsing potential throwaway deal for A->{dest_x} (ID: {raw_itinerary.get('id', 'N/A')}): {e}", exc_info=True)
-
-                        logger.info(f"[{search_id} / Task {task_id}] Probe A -> {dest_x} found {len(potential_deals_for_x)} potential candidate itineraries stopping at B.")
-                        return potential_deals_for_x
-                    except MaxRetriesExceededError:
-                         logger.error(f"[{search_id} / Task {task_id}] Max retries exceeded during probe A -> {dest_x}. Skipping destination.")
-                         probe_log["errors"].append(f"Probe A -> {dest_x} failed after retries.")
-                         return []
-                    except Exception as e:
-                        logger.error(f"[{search_id} / Task {task_id}] Error probing A -> {dest_x}: {e}", exc_info=True)
-                        probe_log["errors"].append(f"Probe A -> {dest_x} failed: {str(e)}")
-                        return []
-
-                throwaway_tasks.append(run_throwaway_probe(dest_x_iata, probe_vars))
-
-            # Gather results from all throwaway probes
-            try:
-                probe_results_lists = await asyncio.gather(*throwaway_tasks) # Collect results from all A->X searches
-                all_potential_throwaway_deals_via_b = [item for sublist in probe_results_lists for item in sublist]
-                probe_log["potential_deals_via_b_count"] = len(all_potential_throwaway_deals_via_b)
-                logger.info(f"[{search_id} / Task {task_id}] Throwaway probe completed. Found {len(all_potential_throwaway_deals_via_b)} total candidate itineraries (A->X stopping at B).")
-
-                # Price Comparison: Check if the A->X itinerary (stopping at B) is cheaper than the cheapest direct A->B flight.
-                # Note: This compares the *full* A->X price against the A->B price.
-                # A more ideal comparison would use the price specifically for the A->B portion
-                # of the A->X itinerary, but this data is often unavailable or hard to extract reliably.
-                # This simplification might miss some deals or include deals where only the full A->X is cheaper.
-                if min_direct_price_cny is not None:
-                    # Define a threshold (e.g., must be cheaper, or significantly cheaper)
-                    # Let's require it to be strictly cheaper for now.
-                    # price_threshold_factor = 0.9 # Example: Must be at least 10% cheaper
-                    for deal_candidate in all_potential_throwaway_deals_via_b:
-                        # Compare A->X price with the minimum direct A->B price found earlier
-                        if deal_candidate.price < min_direct_price_cny: # Use '<' for strictly cheaper
-                            # Mark this itinerary as a throwaway deal
-                            deal_candidate.is_throwaway_deal = True
-                            parsed_throwaway_deals.append(deal_candidate)
-                            logger.debug(f"[{search_id} / Task {task_id}] Marked throwaway deal: ID {deal_candidate.id}, Price {deal_candidate.price} CNY (Direct A->B min: {min_direct_price_cny} CNY)")
-
-                    probe_log["throwaway_deals_marked_count"] = len(parsed_throwaway_deals)
-                    logger.info(f"[{search_id} / Task {task_id}] Marked {len(parsed_throwaway_deals)} throwaway deals as cheaper than direct A->B price ({min_direct_price_cny} CNY).")
-                    if parsed_throwaway_deals:
-                         disclaimers.append(
-                             f"Found {len(parsed_throwaway_deals)} potential throwaway deals (flying A-X, exiting at B). "
-                             "These require buying the full A-X ticket and abandoning the final leg(s). "
-                             "This may violate airline rules and cause issues with checked bags or return flights. Verify risks before booking."
-                         )
-                else:
-                    logger.info(f"[{search_id} / Task {task_id}] Skipping price comparison for throwaway deals as no direct A->B price was found for reference.")
-                    # Do not mark any deals if no reference price exists.
-                    probe_log["throwaway_deals_marked_count"] = 0
-
-
-                probe_log["status"] = "completed"
-
-            except Exception as e:
-                 logger.error(f"[{search_id} / Task {task_id}] Error during asyncio.gather for throwaway probes: {e}", exc_info=True)
-                 probe_log["status"] = "error_gathering_results"
-                 probe_log["errors"].append(f"Error gathering throwaway probe results: {str(e)}")
-
+            probe_destinations = list(probe_log["sacrifice_destinations_queried"])
+            progress["probes_total"] = len(probe_destinations)
+
+            if probe_destinations and _task_can_dispatch_probe_chord(self):
+                # Fan the probes out across the worker fleet instead of gathering them in this process.
+                # The chord callback does the price comparison and merge; replace() hands this task's id
+                # to the callback, so /tasks/results/{task_id} returns the merged result when it finishes.
+                logger.info(f"[{search_id} / Task {task_id}] Dispatching {len(probe_destinations)} throwaway probes as a chord.")
+                _task_publish_progress(self, "probes_dispatched", search_id, progress, partial_result)
+                merge_context = {
+                    "search_id": search_id,
+                    "task_id": task_id,
+                    "is_one_way": is_one_way,
+                    "min_direct_price_cny": min_direct_price_cny,
+                    "main_flights": [flight.model_dump(mode='json') for flight in parsed_main_flights],
+                    "disclaimers": disclaimers,
+                    "probe_log": probe_log,
+                }
+                probe_group = group(
+                    throwaway_probe_task.s(search_params_dict, search_id, dest_x_iata, task_id)
+                    for dest_x_iata in probe_destinations
+                )
+                raise self.replace(chord(probe_group, merge_throwaway_probes_task.s(merge_context)))
+
+            async def run_throwaway_probe(dest_x):
+                probe_result = await _task_probe_throwaway_destination(self, request_params, search_id, dest_x)
+                progress["probes_done"] += 1
+                progress["throwaway_candidates_count"] += len(probe_result["candidates"])
+                _task_publish_progress(self, f"probe_done:{dest_x}", search_id, progress, partial_result)
+                return probe_result
+
+            # Gather results from all throwaway probes (in-process: sync calls, eager tasks or chord disabled)
+            probe_results = await asyncio.gather(*(run_throwaway_probe(dest_x) for dest_x in probe_destinations))
+            parsed_throwaway_deals = _task_merge_throwaway_probes(
+                search_id, task_id, probe_results, min_direct_price_cny, probe_log, disclaimers
+            )
 
-    # --- 4. Combine and Filter Final Results ---
-    # Separate direct flights and combo deals
-    direct_flights = []
-    combo_deals = []
+    return _task_build_search_response(
+        search_id, task_id, is_one_way, parsed_main_flights, parsed_throwaway_deals, disclaimers, probe_log
+    )
 
-    # Combine main search results and valid throwaway deals
-    combined_flights = parsed_main_flights + parsed_throwaway_deals
 
-    # Remove duplicates based on 'id'
-    unique_flights_dict: Dict[str, schemas.FlightItinerary] = {}
-    for flight in combined_flights:
-        if flight:  # 添加None检查
-            # Prioritize non-throwaway deals if IDs collide? Or let the cheaper one win?
-            # Current logic: last one seen wins if ID is the same. Sorting later handles price.
-            unique_flights_dict[flight.id] = flight
-    final_flights = list(unique_flights_dict.values())
+@celery_app.task(bind=True, max_retries=2, default_retry_delay=30, acks_late=True)
+def throwaway_probe_task(
+    self, search_params_dict: Dict[str, Any], search_id: str, dest_x: str, parent_task_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Chord header task: probes one sacrifice destination (A -> X via B) for find_flights_task.
+    Candidates are returned as JSON so the merge callback can run on any worker.
+    Progress is counted under `parent_task_id` so /tasks/results/{task_id} keeps reporting probes_done.
+    """
+    # Each probe subtask gets its own retry budget under the parent's search id
+    return worker_runtime.run(kiwi_retry_policy.with_search_budget(
+        f"{search_id}:{dest_x}",
+        _throwaway_probe_task_async(self, search_params_dict, search_id, dest_x, parent_task_id)
+    ))
 
-    # Separate direct flights from combo deals
-    for flight in final_flights:
-        # Determine if it's a direct flight based on segment count
-        if is_one_way:
-            # For one-way trips, direct flights have exactly 1 segment
-            if len(flight.segments) == 1:
-                direct_flights.append(flight)
-            else:
-                combo_deals.append(flight)
-        else:
-            # For round trips, direct flights have exactly 2 segments (1 outbound + 1 inbound)
-            # This is a simplified check - in reality we should check outbound_segments and inbound_segments
-            if len(flight.segments) == 2:
-                direct_flights.append(flight)
-            else:
-                combo_deals.append(flight)
 
-    # Sort by price
-    direct_flights.sort(key=lambda f: f.price)
-    combo_deals.sort(key=lambda f: f.price)
+async def _throwaway_probe_task_async(
+    self, search_params_dict: Dict[str, Any], search_id: str, dest_x: str, parent_task_id: Optional[str]
+) -> Dict[str, Any]:
+    request_params = schemas.FlightSearchRequest(**search_params_dict)
+    probe_result = await _task_probe_throwaway_destination(self, request_params, search_id, dest_x)
+    if settings.TASK_PROGRESS_ENABLED and parent_task_id:
+        try:
+            # Concurrent subtasks can't safely rewrite the parent's PROGRESS meta; count atomically instead
+            await search_progress_counters.incr(
+                parent_task_id, probes_done=1, throwaway_candidates_count=len(probe_result["candidates"])
+            )
+        except Exception as e:
+            logger.warning(f"[{search_id} / Task {self.request.id}] Failed to count probe progress for {dest_x}: {e}")
+    probe_result["candidates"] = [candidate.model_dump(mode='json') for candidate in probe_result["candidates"]]
+    return probe_result
 
-    logger.info(f"[{search_id} / Task {task_id}] Search task finished. Returning {len(direct_flights)} direct flights and {len(combo_deals)} combo deals (including {len(parsed_throwaway_deals)} throwaway deals).")
 
-    # --- 5. Construct and Return Response ---
-    response_data = schemas.FlightSearchResponse(
-        search_id=search_id,
-        direct_flights=direct_flights,
-        combo_deals=combo_deals,
-        disclaimers=list(set(disclaimers)), # Ensure unique disclaimers
-        probe_details=probe_log # Use 'probe_details' to match schema definition if needed, or keep 'probe_log'
+@celery_app.task(bind=True, acks_late=True)
+def merge_throwaway_probes_task(self, probe_results: List[Dict[str, Any]], merge_context: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Chord callback: price-compares the throwaway probe results against the main search and returns
+    the final FlightSearchResponse. Runs under the original find_flights_task id (see Task.replace).
+    """
+    search_id = merge_context["search_id"]
+    task_id = merge_context["task_id"]
+    for probe_result in probe_results:
+        probe_result["candidates"] = [schemas.FlightItinerary.model_validate(candidate) for candidate in probe_result["candidates"]]
+    parsed_main_flights = [schemas.FlightItinerary.model_validate(flight) for flight in merge_context["main_flights"]]
+    disclaimers = merge_context["disclaimers"]
+    probe_log = merge_context["probe_log"]
+
+    parsed_throwaway_deals = _task_merge_throwaway_probes(
+        search_id, task_id, probe_results, merge_context["min_direct_price_cny"], probe_log, disclaimers
     )
-
-    # Celery tasks should return JSON-serializable data
-    # Use mode='json' to ensure datetime objects are properly serialized
-    return response_data.model_dump(mode='json')
+    response_data = _task_build_search_response(
+        search_id, task_id, merge_context["is_one_way"], parsed_main_flights, parsed_throwaway_deals, disclaimers, probe_log
+    )
+    return worker_runtime.run(search_result_store.store(self.request.id, response_data))
 
 
 async def find_flights_sync_async(search_params_dict: Dict[str, Any]) -> Dict[str, Any]:
@@ -1284,7 +1119,7 @@ async def find_flights_sync_async(search_params_dict: Dict[str, Any]) -> Dict[st
     mock_self = MockSelf()
 
     # 调用原有的异步函数
-    return await _find_flights_task_async(mock_self, search_params_dict)
+    return await kiwi_retry_policy.with_search_budget("sync-call", _find_flights_task_async(mock_self, search_params_dict))
 
 
 @celery_app.task(bind=True, max_retries=2, default_retry_delay=30, acks_late=True)
@@ -1310,7 +1145,7 @@ def probe_china_hubs_task(
         包含探测结果的字典
     """
     # Run the async logic in a new event loop
-    return asyncio.run(_probe_china_hubs_task_async(
+    return worker_runtime.run(_probe_china_hubs_task_async(
         self, origin_iata, destination_iata, search_id, min_direct_price_eur, request_params_dict
     ))
 
@@ -1339,7 +1174,7 @@ async def _probe_china_hubs_task_async(
         hubs_to_probe = china_hubs[:request_params.max_probe_hubs]
 
         # 初始化结果变量
-        probe_log = {hub['iata_code']: {'status': 'pending', 'results': 0, 'a_b_deals': 0, 'a_b_x_deals': 0} for hub in hubs_to_probe}
+        probe_log = {hub['iata_code']: {'status': 'pending', 'results': 0, 'a_b_deals': 0, 'a_b_x_deals': 0, 'errors': []} for hub in hubs_to_probe}
         parsed_probe_deals = []
         disclaimers = []
 
@@ -1382,19 +1217,24 @@ async def _probe_china_hubs_task_async(
                 a_b_vars["search_id"] = search_id
 
                 # 执行A->B搜索
-                a_b_raw = await _task_run_search_with_retry(
-                    self=self,
-                    variables=a_b_vars,
-                    attempt_desc=f"probe-a-b-{hub_iata}",
-                    request_params=request_params,
-                    force_one_way=True
-                )
+                with kiwi_rate_limiter.lane(LANE_PROBE):
+                    try:
+                        a_b_raw = await _task_run_search_with_retry(
+                            self=self,
+                            variables=a_b_vars,
+                            attempt_desc=f"probe-a-b-{hub_iata}",
+                            request_params=request_params,
+                            force_one_way=True
+                        )
+                    except KiwiSearchIncompleteError as e:
+                        logger.warning(f"[{search_id} / Task {task_id}] A->B探测结果不完整 ({hub_iata}): {e}")
+                        a_b_raw = e.partial
+                        probe_log[hub_iata]['errors'].append(f"A->{hub_iata} 探测不完整: {e}")
                 logger.info(f"[{search_id} / Task {task_id}] 找到 {len(a_b_raw)} 个从A到B的航班。")
 
                 # 解析A->B结果并与A->C价格比较
-                for it_raw in a_b_raw:
+                for parsed_itinerary in parse_itineraries(a_b_raw, True, requested_currency):
                     try:
-                        parsed_itinerary = await _task_parse_kiwi_itinerary(it_raw, True, requested_currency)
 
                         # 价格比较: 如果A->B价格低于A->C最低直飞价格
                         if min_direct_price_eur != float('inf') and parsed_itinerary.price_eur < min_direct_price_eur * 0.9:  # 至少便宜10%
@@ -1412,9 +1252,9 @@ async def _probe_china_hubs_task_async(
                                 disclaimers.append("探测特惠机票可能提供更低价格，但可能需要您自行安排后续交通。")
 
                     except ValueError as e:
-                        logger.warning(f"[{search_id} / Task {task_id}] 解析A->B航班时出错 {it_raw.get('id')}: {e}")
+                        logger.warning(f"[{search_id} / Task {task_id}] 处理A->B航班时出错 {parsed_itinerary.id}: {e}")
                     except Exception as e:
-                        logger.error(f"[{search_id} / Task {task_id}] 解析A->B航班时发生意外错误 {it_raw.get('id')}: {e}", exc_info=True)
+                        logger.error(f"[{search_id} / Task {task_id}] 处理A->B航班时发生意外错误 {parsed_itinerary.id}: {e}", exc_info=True)
 
             except Exception as e:
                 logger.error(f"[{search_id} / Task {task_id}] A-B探测过程中发生错误: {e}", exc_info=True)
@@ -1443,19 +1283,24 @@ async def _probe_china_hubs_task_async(
                         a_b_x_vars["search_id"] = search_id
 
                         # 执行A->X via B搜索
-                        a_b_x_raw = await _task_run_search_with_retry(
-                            self=self,
-                            variables=a_b_x_vars,
-                            attempt_desc=f"probe-a-b-x-{hub_iata}-{dest_x}",
-                            request_params=request_params,
-                            force_one_way=True
-                        )
+                        with kiwi_rate_limiter.lane(LANE_PROBE):
+                            try:
+                                a_b_x_raw = await _task_run_search_with_retry(
+                                    self=self,
+                                    variables=a_b_x_vars,
+                                    attempt_desc=f"probe-a-b-x-{hub_iata}-{dest_x}",
+                                    request_params=request_params,
+                                    force_one_way=True
+                                )
+                            except KiwiSearchIncompleteError as e:
+                                logger.warning(f"[{search_id} / Task {task_id}] A->{dest_x}经由{hub_iata}探测结果不完整: {e}")
+                                a_b_x_raw = e.partial
+                                probe_log[hub_iata]['errors'].append(f"A->{dest_x} 经由 {hub_iata} 探测不完整: {e}")
                         logger.info(f"[{search_id} / Task {task_id}] 找到 {len(a_b_x_raw)} 个从A到X经由B的航班。")
 
                         # 解析A->X via B结果
-                        for it_raw in a_b_x_raw:
+                        for parsed_itinerary in parse_itineraries(a_b_x_raw, True, requested_currency):
                             try:
-                                parsed_itinerary = await _task_parse_kiwi_itinerary(it_raw, True, requested_currency)
 
                                 # 验证行程确实经过枢纽B
                                 segment_through_hub = None
@@ -1484,9 +1329,9 @@ async def _probe_china_hubs_task_async(
                                         disclaimers.append("隐藏城市票价可能提供更低价格，但存在法律风险，请谨慎考虑。")
 
                             except ValueError as e:
-                                logger.warning(f"[{search_id} / Task {task_id}] 解析A->X via B航班时出错 {it_raw.get('id')}: {e}")
+                                logger.warning(f"[{search_id} / Task {task_id}] 处理A->X via B航班时出错 {parsed_itinerary.id}: {e}")
                             except Exception as e:
-                                logger.error(f"[{search_id} / Task {task_id}] 解析A->X via B航班时发生意外错误 {it_raw.get('id')}: {e}", exc_info=True)
+                                logger.error(f"[{search_id} / Task {task_id}] 处理A->X via B航班时发生意外错误 {parsed_itinerary.id}: {e}", exc_info=True)
 
                     except Exception as e:
                         logger.error(f"[{search_id} / Task {task_id}] 探测A->{dest_x}经由{hub_iata}时发生错误: {e}", exc_info=True)
@@ -1500,7 +1345,6 @@ async def _probe_china_hubs_task_async(
             probe_log[hub_iata]['a_b_deals'] = a_b_deals_count
             probe_log[hub_iata]['a_b_x_deals'] = a_b_x_deals_count
             logger.debug(f"[{search_id} / Task {task_id}] 完成枢纽探测: {hub_iata} - {hub_results_count} 个航班")
-            await asyncio.sleep(1.0)  # 探测间隔
 
         logger.debug(f"[{search_id} / Task {task_id}] 中转城市探测完成: {len(parsed_probe_deals)} 个特惠")
 
@@ -1,92 +1,131 @@
 """
 Token 调度器
 
-负责在应用启动时预获取 token（可选）
-改为按需获取策略，避免频繁请求
+负责在应用启动时预获取 token，并在请求头过期前后台预刷新（refresh-ahead）：
+请求路径只读取内存快照，不会因为 token 过期而在搜索中同步等待刷新
 """
 
 import asyncio
 import logging
-from typing import Optional
-import time
+from typing import Awaitable, Callable, Optional
 
 from app.core.config import settings
-from app.core.dynamic_fetcher import _get_fresh_kiwi_headers_sync
-import app.core.dynamic_fetcher as df  # 导入模块以访问全局变量
+from app.core.header_snapshot import HeaderStore
+from app.core.identity_pool import kiwi_identity_pool
+import app.core.dynamic_fetcher as df
 
 logger = logging.getLogger(__name__)
 
 class TokenScheduler:
-    """Token 预获取调度器（简化版，无定时刷新）"""
-    
+    """Token 预获取与预刷新调度器"""
+
     def __init__(self):
         self.is_running = False
-    
+        self._task: Optional[asyncio.Task] = None
+
     async def start(self):
-        """启动 token 调度器（仅尝试预获取）"""
-        logger.info("启动 Token 调度器（按需获取模式）...")
+        """启动 token 调度器：预获取一次，然后启动后台预刷新循环"""
+        logger.info("启动 Token 调度器...")
         self.is_running = True
-        
+
         # 尝试预获取一次 Kiwi token（失败不影响应用启动）
         success = await self._try_fetch_kiwi_token_once()
-        
+
         if success:
-            logger.info("Token 调度器启动完成 - 预获取成功")
+            await self._validate_identities()
+            logger.info("Token 调度器预获取成功")
         else:
-            logger.info("Token 调度器启动完成 - 预获取失败，将依赖按需获取")
-    
+            logger.info("Token 调度器预获取失败，将依赖后台预刷新与按需获取")
+
+        if settings.HEADER_REFRESH_AHEAD_ENABLED:
+            self._task = asyncio.create_task(self._refresh_loop(), name="token-refresh-ahead")
+            logger.info(
+                f"Token 后台预刷新已启动：剩余有效期低于 {settings.HEADER_REFRESH_AHEAD_RATIO:.0%} "
+                f"时刷新，每 {settings.HEADER_REFRESH_CHECK_INTERVAL}s 检查一次"
+            )
+
     async def stop(self):
         """停止 token 调度器"""
         logger.info("停止 Token 调度器...")
         self.is_running = False
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
         logger.info("Token 调度器已停止")
-    
+
     async def _try_fetch_kiwi_token_once(self) -> bool:
         """尝试获取一次 Kiwi token（失败不抛出异常）"""
         logger.info("尝试预获取 Kiwi token...")
         try:
-            headers = await _get_fresh_kiwi_headers_sync()
-            if headers and 'kw-umbrella-token' in headers:
-                # 更新全局变量
-                df.KIWI_CURRENT_HEADERS = headers.copy()
-                df.KIWI_LAST_FETCH_TIME = time.time()
-                
-                # 保存到文件缓存
-                import json
-                try:
-                    with open(settings.KIWI_TOKEN_FILE, 'w') as f:
-                        json.dump(headers, f, indent=2)
-                    logger.info(f"Kiwi token 预获取成功，已保存到缓存: {settings.KIWI_TOKEN_FILE}")
-                except Exception as e:
-                    logger.warning(f"Kiwi token 获取成功但保存失败: {e}")
-                
-                return True
+            success = await df.refresh_kiwi_headers_ahead()
+            if success:
+                logger.info(f"Kiwi token 预获取成功，已保存到缓存: {settings.KIWI_TOKEN_FILE}")
             else:
                 logger.warning("Kiwi token 预获取失败：未获取到有效 token")
-                return False
+            return success
         except Exception as e:
             logger.warning(f"Kiwi token 预获取异常: {e}")
             return False
 
+    async def _refresh_loop(self):
+        """定期检查请求头年龄，在过期前预刷新"""
+        while self.is_running:
+            await asyncio.sleep(settings.HEADER_REFRESH_CHECK_INTERVAL)
+            await self._refresh_if_due(df.kiwi_header_store, df.refresh_kiwi_headers_ahead, always=True)
+            await self._validate_identities()
+            # Trip.com 仅在已有请求头时预刷新（未使用 Trip.com 时不主动请求）
+            await self._refresh_if_due(df.trip_header_store, df.refresh_trip_headers_ahead, always=False)
+
+    async def _validate_identities(self):
+        """用当前 Kiwi 请求头验证身份池中尚未验证的身份"""
+        snapshot = df.kiwi_header_store.snapshot
+        if snapshot is None:
+            return
+        try:
+            passed = await kiwi_identity_pool.validate(dict(snapshot.headers))
+            if passed:
+                logger.info(f"Kiwi 身份池验证通过 {passed} 个身份")
+        except Exception as e:
+            logger.warning(f"Kiwi 身份池验证异常: {e}")
+
+    async def _refresh_if_due(self, store: HeaderStore, refresh: Callable[[], Awaitable[bool]], always: bool):
+        try:
+            # 其他进程（如 Celery 任务）写入的更新文件优先
+            store.load_file()
+            snapshot = store.snapshot
+            if snapshot is None:
+                if not always:
+                    return
+            elif snapshot.age() < store.expiry_seconds * (1 - settings.HEADER_REFRESH_AHEAD_RATIO):
+                return
+            logger.info(f"{store.name} 请求头即将过期，开始后台预刷新")
+            if not await refresh():
+                logger.warning(f"{store.name} 请求头预刷新失败，继续使用当前快照，下次检查时重试")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"{store.name} 请求头预刷新异常: {e}")
+
 # 全局调度器实例
 _token_scheduler: Optional[TokenScheduler] = None
 
 async def start_token_scheduler():
     """启动全局 token 调度器"""
     global _token_scheduler
-    
+
     if _token_scheduler is None:
         _token_scheduler = TokenScheduler()
-    
+
     await _token_scheduler.start()
 
 async def stop_token_scheduler():
     """停止全局 token 调度器"""
     global _token_scheduler
-    
+
     if _token_scheduler:
         await _token_scheduler.stop()
 
 def get_token_scheduler() -> Optional[TokenScheduler]:
     """获取全局 token 调度器实例"""
-    return _token_scheduler 
\ No newline at end of file
+    return _token_scheduler
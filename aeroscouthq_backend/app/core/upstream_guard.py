@@ -0,0 +1,227 @@
+"""
+Kiwi 上游保护：AIMD 自适应并发 + 熔断器
+- 并发上限在延迟正常时缓慢加宽（加性增），遇到 429/5xx/超时或延迟突增时成倍收缩（乘性减）
+- 连续失败达到阈值后熔断器打开，期间请求直接失败，避免每个探测都等满请求超时；
+  冷却结束后放行单个试探请求（半开），成功则恢复
+状态为进程内状态，每个 uvicorn / Celery worker 进程独立判断上游健康度
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional, Set, Tuple
+
+import httpx
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """熔断器打开期间拒绝上游请求"""
+    pass
+
+
+class _GuardedCall:
+    """单次上游请求的结果记录（由 request() 上下文管理器使用）"""
+
+    def __init__(self, guard: "UpstreamGuard", trial: bool):
+        self.guard = guard
+        self.trial = trial
+        self.status_code: Optional[int] = None
+        self.started_at = 0.0
+
+    def observe(self, status_code: int) -> None:
+        """记录响应状态码，用于判断本次请求是否算作上游故障"""
+        self.status_code = status_code
+
+    async def __aenter__(self) -> "_GuardedCall":
+        try:
+            await self.guard._acquire_slot()
+        except BaseException:
+            self.guard._end_trial(self.trial)
+            raise
+        self.started_at = time.monotonic()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> bool:
+        latency = time.monotonic() - self.started_at
+        self.guard._release_slot()
+        if exc_type is None:
+            if self.status_code is not None and (self.status_code == 429 or self.status_code >= 500):
+                self.guard._on_failure(self.trial, f"HTTP {self.status_code}")
+            else:
+                self.guard._on_success(self.trial, latency)
+        elif issubclass(exc_type, (httpx.TimeoutException, httpx.TransportError)):
+            self.guard._on_failure(self.trial, exc_type.__name__)
+        else:
+            # 取消（如对冲请求被撤销）或与上游健康无关的异常，不计入统计
+            self.guard._end_trial(self.trial)
+        return False
+
+
+class UpstreamGuard:
+    """自适应并发限制与熔断器"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.limit = float(settings.KIWI_CONCURRENCY_INITIAL)
+        self.inflight = 0
+        self.state = STATE_CLOSED
+        self.consecutive_failures = 0
+        self._opened_at = 0.0
+        self._trial_inflight = False
+        self._last_decrease_at = 0.0
+        self._latency_ewma: Optional[float] = None
+        # asyncio.Condition 绑定事件循环，Celery 任务每次 asyncio.run 都是新循环
+        self._cond: Optional[Tuple[asyncio.AbstractEventLoop, asyncio.Condition]] = None
+        # 尚未执行完的唤醒任务（保留引用，避免任务被回收）
+        self._wake_tasks: Set[asyncio.Task] = set()
+        self.stats = {"success": 0, "failure": 0, "rejected": 0, "opened": 0}
+
+    @property
+    def degraded(self) -> bool:
+        """上游是否处于不健康状态（熔断打开或半开试探中），调用方可据此跳过探测类搜索"""
+        if not settings.KIWI_BREAKER_ENABLED:
+            return False
+        return self.state != STATE_CLOSED
+
+    def _get_cond(self) -> asyncio.Condition:
+        loop = asyncio.get_running_loop()
+        if self._cond is None or self._cond[0] is not loop:
+            self._cond = (loop, asyncio.Condition())
+        return self._cond[1]
+
+    def _notify(self) -> None:
+        """唤醒等待并发名额的请求（可能在没有运行中事件循环时调用）"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        if self._cond is None or self._cond[0] is not loop:
+            return
+        cond = self._cond[1]
+
+        async def _wake():
+            async with cond:
+                cond.notify_all()
+
+        task = loop.create_task(_wake())
+        self._wake_tasks.add(task)
+        task.add_done_callback(self._wake_tasks.discard)
+
+    def _check_breaker(self) -> bool:
+        """熔断器检查，打开时抛出 CircuitOpenError；返回本次请求是否为半开试探请求"""
+        if not settings.KIWI_BREAKER_ENABLED or self.state == STATE_CLOSED:
+            return False
+        if self.state == STATE_OPEN:
+            if time.monotonic() - self._opened_at < settings.KIWI_BREAKER_OPEN_SECONDS:
+                self.stats["rejected"] += 1
+                raise CircuitOpenError(f"{self.name} 熔断器打开中，拒绝上游请求")
+            self.state = STATE_HALF_OPEN
+            logger.info(f"{self.name} 熔断器进入半开状态，放行试探请求")
+        if self._trial_inflight:
+            self.stats["rejected"] += 1
+            raise CircuitOpenError(f"{self.name} 熔断器半开，试探请求进行中")
+        self._trial_inflight = True
+        return True
+
+    async def _acquire_slot(self) -> None:
+        if not settings.KIWI_ADAPTIVE_CONCURRENCY_ENABLED:
+            self.inflight += 1
+            return
+        cond = self._get_cond()
+        async with cond:
+            while self.inflight >= int(self.limit):
+                await cond.wait()
+                # 等待期间熔断器可能已打开，此时直接失败而不是继续排队
+                if settings.KIWI_BREAKER_ENABLED and self.state == STATE_OPEN:
+                    self.stats["rejected"] += 1
+                    raise CircuitOpenError(f"{self.name} 熔断器打开中，放弃排队的上游请求")
+            self.inflight += 1
+
+    def _release_slot(self) -> None:
+        self.inflight = max(0, self.inflight - 1)
+        self._notify()
+
+    def _end_trial(self, trial: bool) -> None:
+        if trial:
+            self._trial_inflight = False
+
+    def _decrease(self) -> None:
+        # 同一时间窗口内（约一个目标延迟）只收缩一次，避免同批失败的请求把上限连续减半
+        now = time.monotonic()
+        if now - self._last_decrease_at < settings.KIWI_CONCURRENCY_LATENCY_TARGET:
+            return
+        self._last_decrease_at = now
+        self.limit = max(
+            float(settings.KIWI_CONCURRENCY_MIN), self.limit * settings.KIWI_CONCURRENCY_DECREASE_FACTOR
+        )
+
+    def _on_success(self, trial: bool, latency: float) -> None:
+        self.stats["success"] += 1
+        self._latency_ewma = latency if self._latency_ewma is None else 0.8 * self._latency_ewma + 0.2 * latency
+        self.consecutive_failures = 0
+        if trial:
+            self._trial_inflight = False
+            self.state = STATE_CLOSED
+            logger.info(f"{self.name} 试探请求成功，熔断器关闭")
+
+        if latency > settings.KIWI_CONCURRENCY_LATENCY_TARGET:
+            self._decrease()
+        else:
+            # 每完成约 limit 个健康请求，上限加 1
+            self.limit = min(float(settings.KIWI_CONCURRENCY_MAX), self.limit + 1.0 / self.limit)
+
+    def _on_failure(self, trial: bool, reason: str) -> None:
+        self.stats["failure"] += 1
+        self.consecutive_failures += 1
+        self._decrease()
+        if not settings.KIWI_BREAKER_ENABLED:
+            return
+        if trial or (
+            self.state == STATE_CLOSED and self.consecutive_failures >= settings.KIWI_BREAKER_FAILURE_THRESHOLD
+        ):
+            self._trial_inflight = False
+            self.state = STATE_OPEN
+            self._opened_at = time.monotonic()
+            self.stats["opened"] += 1
+            logger.warning(
+                f"{self.name} 熔断器打开 ({reason}, 连续失败 {self.consecutive_failures} 次)，"
+                f"{settings.KIWI_BREAKER_OPEN_SECONDS}s 内上游请求将直接失败"
+            )
+            self._notify()
+
+    def request(self) -> _GuardedCall:
+        """包裹一次上游请求
+
+        用法::
+
+            async with kiwi_upstream_guard.request() as call:
+                response = await client.post(...)
+                call.observe(response.status_code)
+
+        Raises:
+            CircuitOpenError: 熔断器打开时立即抛出
+        """
+        return _GuardedCall(self, self._check_breaker())
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取自适应并发与熔断器状态"""
+        return {
+            "breaker_state": self.state if settings.KIWI_BREAKER_ENABLED else "disabled",
+            "consecutive_failures": self.consecutive_failures,
+            "concurrency_limit": round(self.limit, 2) if settings.KIWI_ADAPTIVE_CONCURRENCY_ENABLED else None,
+            "inflight": self.inflight,
+            "latency_ewma_ms": round(self._latency_ewma * 1000) if self._latency_ewma is not None else None,
+            **self.stats
+        }
+
+
+# 全局Kiwi上游保护实例
+kiwi_upstream_guard = UpstreamGuard("kiwi")
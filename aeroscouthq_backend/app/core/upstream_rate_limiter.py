@@ -0,0 +1,193 @@
+"""
+上游请求全局限速（令牌桶）
+所有 Kiwi 调用在发送请求前获取令牌，替代分页/探测之间的固定 sleep。
+令牌桶状态优先保存在 Redis 中，uvicorn 与各 Celery worker 共享同一个速率预算；
+Redis 不可用时回退到进程内令牌桶
+"""
+
+import asyncio
+import contextvars
+import logging
+import random
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+from app.core.config import settings
+from app.core.redis_manager import redis_manager
+from app.core.retry_policy import UpstreamThrottledError
+
+logger = logging.getLogger(__name__)
+
+# 优先级通道：用户主搜索 > 甩尾/枢纽探测 > 后台维护（token 校验、调试请求）
+LANE_SEARCH = "search"
+LANE_PROBE = "probe"
+LANE_BACKGROUND = "background"
+
+# 各通道取令牌后桶内至少保留的比例（相对 burst）。
+# 低优先级通道在桶快空时主动让出，剩余令牌留给高优先级通道
+_LANE_RESERVE = {
+    LANE_SEARCH: 0.0,
+    LANE_PROBE: 0.25,
+    LANE_BACKGROUND: 0.5,
+}
+
+
+
+class KiwiRateLimitError(UpstreamThrottledError):
+    """等待令牌超过 KIWI_RATE_LIMIT_MAX_WAIT：请求未发送，按限流错误由重试策略退避后重试"""
+
+
+# 当前协程所属通道，asyncio 任务创建时继承，调用方无需逐层传参
+_current_lane: contextvars.ContextVar[str] = contextvars.ContextVar("kiwi_rate_limit_lane", default=LANE_SEARCH)
+
+# 原子地补充并尝试取出一个令牌；返回 0 表示取到，否则返回建议等待的毫秒数。
+# 使用 Redis 服务器时间，避免多台主机时钟偏差
+_ACQUIRE_SCRIPT = """
+redis.replicate_commands()
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local floor = tonumber(ARGV[3])
+local t = redis.call("TIME")
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local state = redis.call("HMGET", KEYS[1], "tokens", "ts")
+local tokens = tonumber(state[1])
+local ts = tonumber(state[2])
+if tokens == nil or ts == nil then
+    tokens = burst
+    ts = now
+end
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate / 1000)
+local wait = 0
+if tokens >= floor + 1 then
+    tokens = tokens - 1
+else
+    wait = math.ceil((floor + 1 - tokens) * 1000 / rate)
+end
+redis.call("HSET", KEYS[1], "tokens", tokens, "ts", now)
+redis.call("PEXPIRE", KEYS[1], math.ceil(burst * 1000 / rate) + 1000)
+return wait
+"""
+
+
+class TokenBucketRateLimiter:
+    """带优先级通道的令牌桶限速器"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._tokens: Optional[float] = None
+        self._updated_at = 0.0
+        self.redis_errors = 0
+        self.lane_stats: Dict[str, Dict[str, float]] = {}
+
+    def _bucket_key(self) -> str:
+        return f"ratelimit:{self.name}:bucket"
+
+    def _get_redis(self):
+        """获取当前事件循环可用的Redis客户端，不可用时返回None"""
+        if not settings.KIWI_RATE_LIMIT_REDIS_ENABLED:
+            return None
+        try:
+            return redis_manager.get_loop_client()
+        except Exception as e:
+            logger.debug(f"限速器无法获取Redis客户端: {e}")
+            return None
+
+    def _try_acquire_local(self, rate: float, burst: float, floor: float) -> float:
+        """进程内令牌桶，返回需要等待的秒数（0 表示已取到）"""
+        now = time.monotonic()
+        if self._tokens is None:
+            self._tokens = burst
+        else:
+            self._tokens = min(burst, self._tokens + (now - self._updated_at) * rate)
+        self._updated_at = now
+        if self._tokens >= floor + 1:
+            self._tokens -= 1
+            return 0.0
+        return (floor + 1 - self._tokens) / rate
+
+    async def _try_acquire(self, rate: float, burst: float, floor: float) -> float:
+        redis_client = self._get_redis()
+        if redis_client is not None:
+            try:
+                wait_ms = await redis_client.eval(_ACQUIRE_SCRIPT, 1, self._bucket_key(), rate, burst, floor)
+                return int(wait_ms) / 1000
+            except Exception as e:
+                self.redis_errors += 1
+                logger.debug(f"Redis令牌桶不可用，回退到进程内令牌桶: {e}")
+        return self._try_acquire_local(rate, burst, floor)
+
+    def _record(self, lane: str, waited: float, timed_out: bool) -> None:
+        stats = self.lane_stats.setdefault(lane, {
+            "acquired": 0, "delayed": 0, "timeouts": 0, "wait_ms_total": 0.0, "wait_ms_max": 0.0
+        })
+        wait_ms = waited * 1000
+        stats["acquired"] += 1
+        stats["delayed"] += int(waited > 0)
+        stats["timeouts"] += int(timed_out)
+        stats["wait_ms_total"] += wait_ms
+        stats["wait_ms_max"] = max(stats["wait_ms_max"], wait_ms)
+
+    async def acquire(self, lane: Optional[str] = None) -> float:
+        """获取一个令牌，必要时异步等待
+
+        Args:
+            lane: 优先级通道，默认使用当前上下文的通道（见 lane()）
+
+        Returns:
+            实际等待的秒数
+
+        Raises:
+            KiwiRateLimitError: 超过 KIWI_RATE_LIMIT_MAX_WAIT 仍未取到令牌（不放行，避免突破速率预算）
+        """
+        if not settings.KIWI_RATE_LIMIT_ENABLED:
+            return 0.0
+
+        lane = lane or _current_lane.get()
+        rate = settings.KIWI_RATE_LIMIT_PER_SECOND
+        burst = float(settings.KIWI_RATE_LIMIT_BURST)
+        floor = burst * _LANE_RESERVE.get(lane, 0.0)
+
+        started_at = time.monotonic()
+        deadline = started_at + settings.KIWI_RATE_LIMIT_MAX_WAIT
+        while True:
+            wait = await self._try_acquire(rate, burst, floor)
+            if wait <= 0:
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._record(lane, time.monotonic() - started_at, timed_out=True)
+                logger.warning(f"Kiwi限速等待超过 {settings.KIWI_RATE_LIMIT_MAX_WAIT}s，放弃本次请求 (lane={lane})")
+                raise KiwiRateLimitError(
+                    f"Kiwi限速等待超过 {settings.KIWI_RATE_LIMIT_MAX_WAIT}s (lane={lane})", retry_after=wait
+                )
+            # 少量抖动，避免同时被唤醒的等待者再次同时争抢
+            await asyncio.sleep(min(wait * (1 + random.random() * 0.2), remaining))
+
+        waited = time.monotonic() - started_at
+        self._record(lane, waited, timed_out=False)
+        return waited
+
+    @contextmanager
+    def lane(self, lane: str) -> Iterator[None]:
+        """在该上下文内发出的上游请求使用指定优先级通道"""
+        token = _current_lane.set(lane)
+        try:
+            yield
+        finally:
+            _current_lane.reset(token)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取限速器指标"""
+        return {
+            "enabled": settings.KIWI_RATE_LIMIT_ENABLED,
+            "backend": "redis" if settings.KIWI_RATE_LIMIT_REDIS_ENABLED else "local",
+            "rate_per_second": settings.KIWI_RATE_LIMIT_PER_SECOND,
+            "burst": settings.KIWI_RATE_LIMIT_BURST,
+            "redis_errors": self.redis_errors,
+            "lanes": self.lane_stats
+        }
+
+
+# 全局Kiwi限速器实例
+kiwi_rate_limiter = TokenBucketRateLimiter("kiwi")
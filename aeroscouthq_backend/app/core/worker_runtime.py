@@ -0,0 +1,135 @@
+"""
+Celery worker 进程级异步运行时
+每个 worker 进程持有一个长期存在的事件循环（worker_process_init 时创建），任务通过 run() 在该循环上
+执行协程，不再每次 asyncio.run 新建/销毁事件循环。Kiwi HTTP 客户端、Redis 客户端、数据库连接以及
+按事件循环创建的锁/信号量都在同一个循环上复用，连接池跨任务保持 keep-alive。
+
+事件循环在调用任务的线程上运行（prefork / solo 池即进程主线程），任务协程内访问 self.request
+等 Celery 线程本地状态保持不变。以下情况回退为 asyncio.run：运行时被禁用、fork 后尚未初始化、
+在其他线程调用，或当前线程已有运行中的事件循环。
+"""
+
+import asyncio
+import logging
+import os
+import threading
+from typing import Any, Awaitable, Dict, Optional, TypeVar
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def _has_running_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+
+class WorkerAsyncRuntime:
+    """worker 进程级长期事件循环"""
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pid: Optional[int] = None
+        self._thread_id: Optional[int] = None
+        self.stats = {"runs": 0, "fallback_runs": 0}
+
+    def _owns_current_thread(self) -> bool:
+        return (
+            self._loop is not None
+            and not self._loop.is_closed()
+            and self._pid == os.getpid()
+            and self._thread_id == threading.get_ident()
+        )
+
+    def start(self) -> None:
+        """在当前线程创建长期事件循环并初始化共享客户端"""
+        if not settings.CELERY_PERSISTENT_LOOP_ENABLED or self._owns_current_thread():
+            return
+        if self._pid is not None and self._pid != os.getpid():
+            # fork 继承的父进程事件循环不可复用
+            self._loop = None
+
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._loop, self._pid, self._thread_id = loop, os.getpid(), threading.get_ident()
+        loop.run_until_complete(self._startup())
+        logger.info(f"Worker 异步运行时已启动 (pid={self._pid})")
+
+    async def _startup(self) -> None:
+        from app.core.kiwi_client import kiwi_client_manager
+        from app.core.redis_manager import redis_manager
+        from app.database.connection import connect_db
+
+        await kiwi_client_manager.initialize()
+        try:
+            await redis_manager.initialize()
+        except Exception as e:
+            # Redis 不可用时各模块按需回退，不影响 worker 启动
+            logger.warning(f"Worker 运行时 Redis 初始化失败: {e}")
+        await connect_db()
+
+    def run(self, awaitable: Awaitable[T]) -> T:
+        """在 worker 事件循环上执行协程并返回结果（Celery 任务入口使用）"""
+        in_running_loop = _has_running_loop()
+        if settings.CELERY_PERSISTENT_LOOP_ENABLED and self._loop is None and not in_running_loop:
+            # 未收到 worker_process_init（如 solo 池）时首次调用懒启动
+            self.start()
+
+        if in_running_loop or not self._owns_current_thread():
+            self.stats["fallback_runs"] += 1
+            return asyncio.run(awaitable)
+
+        self.stats["runs"] += 1
+        return self._loop.run_until_complete(awaitable)
+
+    def shutdown(self) -> None:
+        """关闭共享客户端与事件循环（worker_process_shutdown 时调用）"""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        if not self._owns_current_thread() or loop.is_running():
+            self._loop = None
+            return
+        try:
+            loop.run_until_complete(self._teardown())
+            loop.run_until_complete(loop.shutdown_asyncgens())
+        except Exception as e:
+            logger.error(f"关闭 Worker 异步运行时出错: {e}")
+        finally:
+            loop.close()
+            self._loop = None
+            logger.info("Worker 异步运行时已关闭")
+
+    async def _teardown(self) -> None:
+        from app.core.kiwi_client import kiwi_client_manager
+        from app.core.redis_manager import redis_manager
+        from app.database.connection import disconnect_db
+
+        # 取消任务遗留的后台协程（如被撤销的对冲请求）
+        current = asyncio.current_task()
+        pending = [task for task in asyncio.all_tasks() if task is not current]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+        await kiwi_client_manager.close()
+        await redis_manager.close()
+        await disconnect_db()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": settings.CELERY_PERSISTENT_LOOP_ENABLED,
+            "started": self._loop is not None and not self._loop.is_closed(),
+            "pid": self._pid,
+            **self.stats,
+        }
+
+
+# 全局实例（每个 worker 进程一个）
+worker_runtime = WorkerAsyncRuntime()
@@ -12,6 +12,8 @@ from app.core.config import settings
 from app.core import dynamic_fetcher # Added for initial cookie loading
 from app.core.token_scheduler import start_token_scheduler, stop_token_scheduler  # 添加 token 调度器
 from app.core.redis_manager import redis_manager  # 添加 Redis 管理器
+from app.core.kiwi_client import kiwi_client_manager  # Kiwi 共享HTTP客户端
+from app.core.cpu_executor import cpu_executor  # 搜索流水线 CPU 执行器
 from app.core.search_session_manager import search_session_manager  # 添加搜索会话管理器
 
 # Import API endpoint routers
@@ -49,6 +51,9 @@ async def lifespan(app: FastAPI):
         print(f"Redis initialization failed: {e}")
         print("Application will continue with memory-based session storage")
 
+    print("Application startup: Initializing shared Kiwi HTTP client...")
+    await kiwi_client_manager.initialize()
+
     print("Application startup: Initializing search session manager...")
     await search_session_manager.initialize()
 
@@ -61,6 +66,10 @@ async def lifespan(app: FastAPI):
     finally:
         print("Application shutdown: Stopping Token Scheduler...")
         await stop_token_scheduler()  # 停止 token 调度器
+        print("Application shutdown: Closing shared Kiwi HTTP client...")
+        await kiwi_client_manager.close()
+        print("Application shutdown: Stopping search CPU executor...")
+        cpu_executor.shutdown()
         print("Application shutdown: Closing Redis connection...")
         await redis_manager.close()
         print("Application shutdown: Disconnecting from database...")
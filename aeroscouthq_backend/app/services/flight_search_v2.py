@@ -11,9 +11,11 @@ from typing import List, Dict, Any, Optional
 
 from app.core.search_strategies import (
     SearchStrategy, SearchContext, SearchResult,
-    DirectFlightStrategy, HiddenCityStrategy, HubProbeStrategy
+    DirectFlightStrategy, HiddenCityStrategy, HubProbeStrategy,
+    ConcurrentStrategyExecutor
 )
 from app.core.search_session_manager import search_session_manager
+from app.core.upstream_guard import kiwi_upstream_guard
 from app.apis.v1.schemas.flights_v2 import (
     FlightSearchBaseRequest,
     PhaseOneSearchRequest,
@@ -73,16 +75,20 @@ class FlightSearchServiceV2:
                 'request': request.model_dump()
             })
 
-            # 并行执行直飞和甩尾搜索策略
-            direct_task = self._execute_strategy('direct_flight', context)
-            hidden_task = None
-
-            if request.include_hidden_city:
-                hidden_task = self._execute_strategy('hidden_city', context)
+            # 上游熔断期间降级为仅直飞搜索，避免甩尾探测扇出继续堆积请求
+            upstream_degraded = request.include_hidden_city and kiwi_upstream_guard.degraded
+            if upstream_degraded:
+                logger.warning(f"[{search_id}] Kiwi熔断器状态为 {kiwi_upstream_guard.state}，跳过甩尾搜索")
 
-            # 等待搜索完成
-            direct_result = await direct_task
-            hidden_result = await hidden_task if hidden_task else SearchResult(
+            # 并行执行直飞和甩尾搜索策略
+            jobs = {'direct_flight': self._execute_strategy('direct_flight', context)}
+            if request.include_hidden_city and not upstream_degraded:
+                jobs['hidden_city'] = self._execute_strategy('hidden_city', context)
+
+            # 等待搜索完成（整体耗时约等于最慢的策略）
+            report = await ConcurrentStrategyExecutor(search_id).run(jobs)
+            direct_result = report.results['direct_flight']
+            hidden_result = report.results.get('hidden_city') or SearchResult(
                 status="skipped", flights=[], execution_time_ms=0
             )
 
@@ -120,6 +126,14 @@ class FlightSearchServiceV2:
                 disclaimers.extend(direct_result.disclaimers)
             if hidden_result.disclaimers:
                 disclaimers.extend(hidden_result.disclaimers)
+            if upstream_degraded:
+                disclaimers.append("航班数据源暂时不稳定，本次仅返回直飞搜索结果")
+
+            phase_metrics = {
+                'strategy_timings': report.timings,
+                'wall_time_ms': report.wall_time_ms,
+                'deadline_hit': report.deadline_hit
+            }
 
             # 创建响应
             response = PhaseOneSearchResponse(
@@ -127,6 +141,7 @@ class FlightSearchServiceV2:
                 direct_flights=direct_flights,
                 hidden_city_flights=hidden_flights,
                 metrics=metrics,
+                phase_metrics=phase_metrics,
                 disclaimers=disclaimers,
                 next_phase_available=len(direct_flights) > 0  # 有直飞结果才能进行第二阶段
             )
@@ -138,7 +153,8 @@ class FlightSearchServiceV2:
                 'completed_at': datetime.now().isoformat(),
                 'phase_one_results': response.model_dump(),
                 'api_calls': context.api_call_count,
-                'cache_hit_rate': context.cache_hit_rate
+                'cache_hit_rate': context.cache_hit_rate,
+                'phase_metrics': phase_metrics
             })
 
             logger.debug(f"[{search_id}] 第一阶段完成: 直飞 {len(direct_flights)}, 甩尾 {len(hidden_flights)}, 用时 {total_execution_time}ms")
@@ -229,8 +245,23 @@ class FlightSearchServiceV2:
                 'request': request.model_dump()
             })
 
-            # 执行中转城市探测策略
-            hub_result = await self._execute_strategy('hub_probe', context)
+            # 探测任务逐个完成时，将部分 hub_analysis 写入搜索状态供状态查询接口读取
+            async def publish_hub_progress(hub_analysis: Dict[str, Any]) -> None:
+                await self._update_search_state(search_id, {
+                    'partial_results': {'hub_analysis': hub_analysis}
+                })
+
+            context.metadata['on_hub_progress'] = publish_hub_progress
+
+            # 执行中转城市探测策略（上游熔断期间跳过，避免探测扇出继续堆积请求）
+            if kiwi_upstream_guard.degraded:
+                logger.warning(f"[{search_id}] Kiwi熔断器状态为 {kiwi_upstream_guard.state}，跳过中转城市探测")
+                hub_result = SearchResult(
+                    status="skipped", flights=[], execution_time_ms=0,
+                    disclaimers=["航班数据源暂时不稳定，本次跳过中转城市探测"]
+                )
+            else:
+                hub_result = await self._execute_strategy('hub_probe', context)
 
             # 处理结果
             hub_flights = hub_result.flights if hub_result.success else []
@@ -439,7 +470,7 @@ class FlightSearchServiceV2:
                 error_message=f"策略 {strategy_name} 无法在当前阶段执行"
             )
 
-        return await strategy.execute(context)
+        return await strategy.execute_cached(context)
 
     def _apply_sort_strategy(self, flights: List[EnhancedFlightItinerary], sort_strategy: SortStrategy) -> List[EnhancedFlightItinerary]:
         """应用排序策略"""
@@ -2,13 +2,27 @@ import asyncio
 import json
 import logging
 import uuid
-from typing import List, Optional, Dict, Any, Tuple
+from typing import List, Optional, Dict, Any, Tuple, Awaitable, Callable
 from datetime import datetime, timedelta
 
 import httpx
 from fastapi import HTTPException, status
 
 from app.core import dynamic_fetcher
+from app.core.kiwi_client import kiwi_client_manager
+from app.core.kiwi_raw_cache import (
+    kiwi_raw_cache, make_query_key, compress_itineraries, decompress_itineraries
+)
+from app.core.singleflight import kiwi_search_singleflight
+from app.core.upstream_rate_limiter import kiwi_rate_limiter
+from app.core.upstream_guard import kiwi_upstream_guard, CircuitOpenError
+from app.core.request_hedging import is_http_success, kiwi_request_hedger
+from app.core.identity_pool import kiwi_identity_pool
+from app.core.retry_policy import (
+    kiwi_retry_policy, raise_for_upstream_status, UpstreamError, UpstreamTokenError, UpstreamTransientError
+)
+from app.core import fast_json
+from app.core.itinerary_parser import parse_itineraries
 from app.database.crud import hub_crud
 from app.apis.v1 import schemas
 from app.core.config import settings # 假设 settings 里可能有 KIWI_MAX_PAGES 等配置
@@ -300,181 +314,10 @@ query SearchReturnItinerariesQuery(
 """
 
 # --- Custom Exception ---
-class KiwiTokenError(Exception):
+class KiwiTokenError(UpstreamTokenError):
     """Custom exception for Kiwi API token-related errors."""
     pass
 
-# --- Helper Functions (Placeholders) ---
-
-def _parse_segment_list(raw_segments_list: List[dict], itinerary_id: str) -> Tuple[List[schemas.FlightSegment], bool]:
-    """Parses a list of raw segment data into FlightSegment objects and detects baggage recheck."""
-    parsed_segments = []
-    found_baggage_recheck = False
-    for seg_detail in raw_segments_list:
-        segment_data = seg_detail.get("segment")
-        layover_data = seg_detail.get("layover")
-
-        if not segment_data:
-            logger.warning(f"Skipping segment due to missing segment data in itinerary {itinerary_id}")
-            continue
-
-        # Check for self-transfer based on baggage recheck flag in layover
-        if layover_data and layover_data.get("isBaggageRecheck"):
-            found_baggage_recheck = True
-
-        # Parse segment details
-        try:
-            # Use .get with default None for potentially missing nested keys
-            source_station = segment_data.get("source", {}).get("station", {})
-            dest_station = segment_data.get("destination", {}).get("station", {})
-            hidden_destination = segment_data.get("hiddenDestination", {})
-            carrier = segment_data.get("carrier", {})
-            operating_carrier = segment_data.get("operatingCarrier", {})
-
-            departure_dt_str = segment_data.get("source", {}).get("localTime")
-            arrival_dt_str = segment_data.get("destination", {}).get("localTime")
-
-            departure_dt = datetime.fromisoformat(departure_dt_str) if departure_dt_str else None
-            arrival_dt = datetime.fromisoformat(arrival_dt_str) if arrival_dt_str else None
-
-            # Basic validation
-            if not source_station.get("code") or not dest_station.get("code") or not carrier.get("code"):
-                 logger.warning(f"Skipping segment due to missing essential codes (origin/dest/carrier) in itinerary {itinerary_id}")
-                 continue
-
-            # Process hidden destination information
-            hidden_destination_info = None
-            if hidden_destination and hidden_destination.get("code"):
-                hidden_destination_info = {
-                    "code": hidden_destination.get("code"),
-                    "name": hidden_destination.get("name"),
-                    "city_name": hidden_destination.get("city", {}).get("name"),
-                    "city_id": hidden_destination.get("city", {}).get("id"),
-                    "country_name": hidden_destination.get("country", {}).get("name"),
-                    "country_id": hidden_destination.get("country", {}).get("id"),
-                    "id": hidden_destination.get("id")
-                }
-                logger.debug(f"Found hidden destination for segment in itinerary {itinerary_id}: {hidden_destination_info}")
-
-            segment = schemas.FlightSegment(
-                # 使用与base_schemas.py中FlightSegment类匹配的字段名称
-                departure_airport=source_station.get("code"),
-                arrival_airport=dest_station.get("code"),
-                departure_airport_name=source_station.get("name"),
-                arrival_airport_name=dest_station.get("name"),
-                departure_city=source_station.get("city", {}).get("name"),
-                arrival_city=dest_station.get("city", {}).get("name"),
-                departure_time=departure_dt,
-                arrival_time=arrival_dt,
-                duration_minutes=int(segment_data.get("duration", 0) / 60),
-                carrier_code=carrier.get("code"),
-                carrier_name=carrier.get("name"),
-                operating_carrier_code=operating_carrier.get("code", carrier.get("code")),
-                operating_carrier_name=operating_carrier.get("name", carrier.get("name")),
-                flight_number=str(segment_data.get("flightNumber", "")),
-                cabin_class=segment_data.get("cabinClass", "ECONOMY"),
-                aircraft=segment_data.get("vehicle", {}).get("type"),
-                departure_terminal=source_station.get("terminal"),
-                arrival_terminal=dest_station.get("terminal"),
-                layover_duration_minutes=int(layover_data.get("duration", 0) / 60) if layover_data else None,
-                is_baggage_recheck=layover_data.get("isBaggageRecheck", False) if layover_data else None,
-                hidden_destination=hidden_destination_info  # Add hidden destination info
-            )
-            parsed_segments.append(segment)
-        except KeyError as e:
-            logger.warning(f"KeyError parsing segment detail in itinerary {itinerary_id}: {e}. Skipping segment.")
-            continue
-        except ValueError as e: # Catches potential datetime parsing errors
-             logger.warning(f"ValueError parsing segment detail (e.g., datetime) in itinerary {itinerary_id}: {e}. Skipping segment.")
-             continue
-        except Exception as e:
-             logger.warning(f"Unexpected error parsing segment detail in itinerary {itinerary_id}: {e}. Skipping segment.", exc_info=True)
-             continue
-
-    return parsed_segments, found_baggage_recheck
-
-
-async def _parse_kiwi_itinerary(raw_itinerary_data: dict, is_one_way: bool) -> Optional[schemas.FlightItinerary]:
-    """Parses a single raw itinerary from Kiwi API into our schema. Returns None if parsing fails critically."""
-    itinerary_id = raw_itinerary_data.get("id", "UNKNOWN_ID")
-    try:
-        outbound_segments: Optional[List[schemas.FlightSegment]] = None
-        inbound_segments: Optional[List[schemas.FlightSegment]] = None
-        found_outbound_recheck = False
-        found_inbound_recheck = False
-
-        total_duration = timedelta(seconds=raw_itinerary_data.get("duration", 0))
-        is_hidden_city = raw_itinerary_data.get("travelHack", {}).get("isTrueHiddenCity", False)
-        is_throwaway_ticket = raw_itinerary_data.get("travelHack", {}).get("isThrowawayTicket", False)
-        pnr_count = raw_itinerary_data.get("pnrCount", 1)
-        is_self_transfer_base = pnr_count > 1 # Base check on PNR count
-
-        if is_one_way:
-            sector = raw_itinerary_data.get("sector", {})
-            raw_segments = sector.get("sectorSegments", [])
-            outbound_segments, found_outbound_recheck = _parse_segment_list(raw_segments, itinerary_id)
-        else: # Return flight
-            outbound_raw = raw_itinerary_data.get("outbound", {}).get("sectorSegments", [])
-            inbound_raw = raw_itinerary_data.get("inbound", {}).get("sectorSegments", [])
-            outbound_segments, found_outbound_recheck = _parse_segment_list(outbound_raw, itinerary_id)
-            inbound_segments, found_inbound_recheck = _parse_segment_list(inbound_raw, itinerary_id)
-
-        # Final self-transfer check
-        is_self_transfer = is_self_transfer_base or found_outbound_recheck or found_inbound_recheck
-
-        # Validation: Ensure we have at least outbound segments
-        if not outbound_segments:
-             logger.error(f"Failed to parse any valid outbound segments for itinerary {itinerary_id}")
-             return None # Return None instead of raising error to allow processing other itineraries
-        else:
-            # Calculate next_segment_requires_airport_change for outbound segments
-            for i in range(len(outbound_segments) - 1):
-                current_seg = outbound_segments[i]
-                next_seg = outbound_segments[i+1]
-                current_seg.next_segment_requires_airport_change = current_seg.arrival_airport != next_seg.departure_airport
-            if outbound_segments: # Last segment has no next segment
-                outbound_segments[-1].next_segment_requires_airport_change = False
-
-
-        # Validation: For round trips, ensure we also have inbound segments
-        if not is_one_way:
-            if not inbound_segments:
-                 logger.error(f"Failed to parse any valid inbound segments for round-trip itinerary {itinerary_id}")
-                 return None # Return None for incomplete round trips
-            else:
-                # Calculate next_segment_requires_airport_change for inbound segments
-                for i in range(len(inbound_segments) - 1):
-                    current_seg = inbound_segments[i]
-                    next_seg = inbound_segments[i+1]
-                    current_seg.next_segment_requires_airport_change = current_seg.arrival_airport != next_seg.departure_airport
-                if inbound_segments: # Last segment has no next segment
-                    inbound_segments[-1].next_segment_requires_airport_change = False
-
-
-        itinerary = schemas.FlightItinerary(
-            id=itinerary_id,
-            price=raw_itinerary_data["priceEur"]["amount"],
-            booking_token=raw_itinerary_data.get("bookingToken"),
-            deep_link=f"https://www.kiwi.com/en/booking?token={raw_itinerary_data.get('bookingToken')}",
-            outbound_segments=outbound_segments,
-            inbound_segments=inbound_segments,
-            segments=outbound_segments + (inbound_segments if inbound_segments else []),
-            total_duration_minutes=int(total_duration.total_seconds() / 60),
-            is_self_transfer=is_self_transfer,
-            is_hidden_city=is_hidden_city,
-            is_throwaway_deal=is_throwaway_ticket,  # Add throwaway ticket flag
-            data_source="kiwi",
-            raw_data=None
-        )
-        return itinerary
-
-    except KeyError as e:
-        logger.error(f"KeyError while parsing itinerary {itinerary_id}: Missing key {e}")
-        return None # Return None on critical parsing error
-    except Exception as e:
-        logger.error(f"Unexpected error parsing itinerary {itinerary_id}: {e}", exc_info=True)
-        return None # Return None on critical parsing error
-
 
 async def _fetch_kiwi_itineraries_page(
     variables: dict,
@@ -494,9 +337,8 @@ async def _fetch_kiwi_itineraries_page(
             feature_name = "SearchReturnItinerariesQuery"
             itineraries_key = "returnItineraries"
     
-        # Deep copy variables to avoid modifying the original dict
-        current_variables = json.loads(json.dumps(variables))
-        current_variables["options"]["serverToken"] = server_token
+        # Only options.serverToken changes between pages: copy that level instead of a JSON round-trip deep copy
+        current_variables = {**variables, "options": {**variables["options"], "serverToken": server_token}}
     
         payload = {
             "query": query_template,
@@ -506,86 +348,101 @@ async def _fetch_kiwi_itineraries_page(
         api_url = f"{KIWI_GRAPHQL_ENDPOINT}?featureName={feature_name}"
         request_timeout = 45.0 # seconds
     
-        async with httpx.AsyncClient(timeout=request_timeout) as client:
-            try:
-                logger.debug(f"[{attempt_prefix}-P{page_num}] Sending request to {api_url} with token: {str(server_token)[:10]}...")
-                response = await client.post(api_url, headers=kiwi_headers, json=payload)
+        client = kiwi_client_manager.get_client()
+
+        async def _send() -> httpx.Response:
+            # Global pacing across all Kiwi callers replaces fixed sleeps between pages
+            await kiwi_rate_limiter.acquire()
+            async with kiwi_upstream_guard.request() as call:
+                with kiwi_identity_pool.lease(kiwi_headers) as identity:
+                    response = await client.post(api_url, headers=identity.headers, json=payload, timeout=request_timeout)
+                    identity.observe(response.status_code)
+                call.observe(response.status_code)
+            return response
+
+        try:
+            logger.debug(f"[{attempt_prefix}-P{page_num}] Sending request to {api_url} with token: {str(server_token)[:10]}...")
+            response = await kiwi_request_hedger.run(
+                _send, allow_hedge=not kiwi_upstream_guard.degraded, is_success=is_http_success
+            )
     
-                # Check for HTTP errors first
-                if response.status_code != 200:
-                    logger.error(f"[{attempt_prefix}-P{page_num}] Kiwi API HTTP Error: {response.status_code} - {response.text[:500]}")
-                    # Consider specific status codes that might indicate token issues
-                    if response.status_code in [401, 403]:
-                         logger.warning(f"[{attempt_prefix}-P{page_num}] Received HTTP {response.status_code}, potentially a token issue.")
-                         raise KiwiTokenError(f"Kiwi API returned HTTP {response.status_code}, likely token-related.")
-                    # For other errors, return empty results but don't raise KiwiTokenError unless sure
-                    return [], None, False
+            # Check for HTTP errors first
+            if response.status_code != 200:
+                logger.error(f"[{attempt_prefix}-P{page_num}] Kiwi API HTTP Error: {response.status_code} - {response.text[:500]}")
+                # Consider specific status codes that might indicate token issues
+                if response.status_code in [401, 403]:
+                     logger.warning(f"[{attempt_prefix}-P{page_num}] Received HTTP {response.status_code}, potentially a token issue.")
+                     raise KiwiTokenError(f"Kiwi API returned HTTP {response.status_code}, likely token-related.", status_code=response.status_code)
+                # 429 / 5xx are retried by the caller; other errors return empty results
+                raise_for_upstream_status(response, f"Kiwi API returned HTTP {response.status_code}")
+                return [], None, False
     
-                # Parse JSON response
-                try:
-                    data = response.json()
-                except json.JSONDecodeError:
-                    logger.error(f"[{attempt_prefix}-P{page_num}] Failed to decode JSON response: {response.text[:500]}")
-                    return [], None, False
+            # Parse JSON response
+            try:
+                data = fast_json.decode_response(response)
+            except json.JSONDecodeError:
+                logger.error(f"[{attempt_prefix}-P{page_num}] Failed to decode JSON response: {response.text[:500]}")
+                return [], None, False
     
-                # Check for GraphQL level errors (within the JSON response)
-                if 'errors' in data and data['errors']:
-                    error_message = json.dumps(data['errors'])
-                    logger.error(f"[{attempt_prefix}-P{page_num}] Kiwi GraphQL API Error: {error_message}")
-                    # Check if the error message indicates a token problem (heuristic)
-                    if "token" in error_message.lower() or "authorization" in error_message.lower() or "session" in error_message.lower():
-                         logger.warning(f"[{attempt_prefix}-P{page_num}] GraphQL error suggests a token issue: {error_message}")
-                         raise KiwiTokenError(f"Kiwi GraphQL error indicates potential token issue: {error_message}")
-                    return [], None, False # Return empty for other GraphQL errors
+            # Check for GraphQL level errors (within the JSON response)
+            if 'errors' in data and data['errors']:
+                error_message = json.dumps(data['errors'])
+                logger.error(f"[{attempt_prefix}-P{page_num}] Kiwi GraphQL API Error: {error_message}")
+                # Check if the error message indicates a token problem (heuristic)
+                if "token" in error_message.lower() or "authorization" in error_message.lower() or "session" in error_message.lower():
+                     logger.warning(f"[{attempt_prefix}-P{page_num}] GraphQL error suggests a token issue: {error_message}")
+                     raise KiwiTokenError(f"Kiwi GraphQL error indicates potential token issue: {error_message}")
+                return [], None, False # Return empty for other GraphQL errors
     
-                # Check for AppError within the data structure
-                if 'data' not in data or not data['data'] or itineraries_key not in data['data']:
-                     logger.error(f"[{attempt_prefix}-P{page_num}] Invalid response structure. Missing '{itineraries_key}'. Response: {json.dumps(data, indent=2, ensure_ascii=False)[:500]}")
-                     return [], None, False
+            # Check for AppError within the data structure
+            if 'data' not in data or not data['data'] or itineraries_key not in data['data']:
+                 logger.error(f"[{attempt_prefix}-P{page_num}] Invalid response structure. Missing '{itineraries_key}'. Response: {response.text[:500]}")
+                 return [], None, False
     
-                results_container = data['data'][itineraries_key]
-                if results_container is None:
-                    logger.warning(f"[{attempt_prefix}-P{page_num}] '{itineraries_key}' field is null in response.")
-                    # This might happen at the end of results, treat as no more data
-                    return [], None, False
+            results_container = data['data'][itineraries_key]
+            if results_container is None:
+                logger.warning(f"[{attempt_prefix}-P{page_num}] '{itineraries_key}' field is null in response.")
+                # This might happen at the end of results, treat as no more data
+                return [], None, False
     
-                if results_container.get('__typename') == 'AppError':
-                    error_message = results_container.get('error', 'Unknown AppError')
-                    logger.error(f"[{attempt_prefix}-P{page_num}] Kiwi API returned AppError: {error_message}")
-                     # Check if AppError indicates a token problem (heuristic)
-                    if "token" in error_message.lower() or "session" in error_message.lower() or "invalid parameters" in error_message.lower(): # "invalid parameters" sometimes relates to expired tokens
-                         logger.warning(f"[{attempt_prefix}-P{page_num}] AppError suggests a token issue: {error_message}")
-                         raise KiwiTokenError(f"Kiwi AppError indicates potential token issue: {error_message}")
-                    return [], None, False # Return empty for other AppErrors
+            if results_container.get('__typename') == 'AppError':
+                error_message = results_container.get('error', 'Unknown AppError')
+                logger.error(f"[{attempt_prefix}-P{page_num}] Kiwi API returned AppError: {error_message}")
+                 # Check if AppError indicates a token problem (heuristic)
+                if "token" in error_message.lower() or "session" in error_message.lower() or "invalid parameters" in error_message.lower(): # "invalid parameters" sometimes relates to expired tokens
+                     logger.warning(f"[{attempt_prefix}-P{page_num}] AppError suggests a token issue: {error_message}")
+                     raise KiwiTokenError(f"Kiwi AppError indicates potential token issue: {error_message}")
+                return [], None, False # Return empty for other AppErrors
     
-                # Extract data if successful
-                raw_itineraries = results_container.get('itineraries', [])
-                new_token = results_container.get('server', {}).get('serverToken')
-                has_more = results_container.get('metadata', {}).get('hasMorePending', False)
+            # Extract data if successful
+            raw_itineraries = results_container.get('itineraries', [])
+            new_token = results_container.get('server', {}).get('serverToken')
+            has_more = results_container.get('metadata', {}).get('hasMorePending', False)
     
-                logger.info(f"[{attempt_prefix}-P{page_num}] Fetched {len(raw_itineraries)} itineraries. HasMore: {has_more}. NewToken: {str(new_token)[:10]}...")
+            logger.info(f"[{attempt_prefix}-P{page_num}] Fetched {len(raw_itineraries)} itineraries. HasMore: {has_more}. NewToken: {str(new_token)[:10]}...")
     
-                # Sanity check: if has_more is True, we should ideally get a new token
-                if has_more and not new_token and server_token: # Only warn if we had a token before
-                     logger.warning(f"[{attempt_prefix}-P{page_num}] hasMorePending is True, but no new serverToken received.")
-                     # Don't stop pagination here, let the calling function decide based on max_pages
+            # Sanity check: if has_more is True, we should ideally get a new token
+            if has_more and not new_token and server_token: # Only warn if we had a token before
+                 logger.warning(f"[{attempt_prefix}-P{page_num}] hasMorePending is True, but no new serverToken received.")
+                 # Don't stop pagination here, let the calling function decide based on max_pages
     
-                return raw_itineraries, new_token, has_more
+            return raw_itineraries, new_token, has_more
     
-            except httpx.TimeoutException:
-                logger.error(f"[{attempt_prefix}-P{page_num}] Request to Kiwi API timed out after {request_timeout}s.")
-                # Timeout might indicate network issues or potentially an expired session/token causing delays
-                # Let's raise KiwiTokenError cautiously here, as retrying with a fresh token might help.
-                raise KiwiTokenError(f"Kiwi API request timed out (possible token/session issue).")
-            except httpx.RequestError as e:
-                logger.error(f"[{attempt_prefix}-P{page_num}] httpx RequestError contacting Kiwi API: {e}")
-                # Treat generic request errors as potentially recoverable without token refresh for now
-                return [], None, False
-            except KiwiTokenError: # Re-raise KiwiTokenError if caught
-                 raise
-            except Exception as e:
-                logger.error(f"[{attempt_prefix}-P{page_num}] Unexpected error during Kiwi API fetch: {e}", exc_info=True)
-                return [], None, False
+        except UpstreamError: # Re-raise classified errors (incl. KiwiTokenError) for the page-level retry
+             raise
+        except httpx.TimeoutException as e:
+            logger.error(f"[{attempt_prefix}-P{page_num}] Request to Kiwi API timed out after {request_timeout}s.")
+            # Timeouts are transient network failures: retry the page with the same headers
+            raise UpstreamTransientError(f"Kiwi API request timed out after {request_timeout}s.") from e
+        except httpx.RequestError as e:
+            logger.error(f"[{attempt_prefix}-P{page_num}] httpx RequestError contacting Kiwi API: {e}")
+            raise UpstreamTransientError(f"Kiwi API request failed: {e}") from e
+        except CircuitOpenError as e:
+            logger.warning(f"[{attempt_prefix}-P{page_num}] Skipping Kiwi request: {e}")
+            return [], None, False
+        except Exception as e:
+            logger.error(f"[{attempt_prefix}-P{page_num}] Unexpected error during Kiwi API fetch: {e}", exc_info=True)
+            return [], None, False
     
     
 async def _perform_kiwi_search_session(
@@ -593,56 +450,93 @@ async def _perform_kiwi_search_session(
     kiwi_headers: dict,           # Indented parameter
     is_one_way: bool,             # Indented parameter
     max_pages: int,               # Indented parameter
-    attempt_prefix: str           # Indented parameter
+    attempt_prefix: str,          # Indented parameter
+    refresh_headers: Optional[Callable[[], Awaitable[dict]]] = None
 ) -> List[dict]:                  # Indented return type
-    """Performs a full paginated search session with Kiwi API."""
-    all_raw_itineraries = []
-    current_token = None
-    page = 1
-    has_more = True # Start assuming there might be data
+    """Performs a full paginated search session with Kiwi API.
 
-    while has_more and page <= max_pages:
-        try:
-            logger.info(f"[{attempt_prefix}] Requesting page {page}...")
-            raw_itineraries, new_token, has_more_pending = await _fetch_kiwi_itineraries_page(
-                variables=base_variables,
-                kiwi_headers=kiwi_headers,
-                server_token=current_token,
-                is_one_way=is_one_way,
-                attempt_prefix=attempt_prefix,
-                page_num=page
-            )
+    Results are cached by the normalized query variables (serverToken and search_id
+    excluded), so identical A->X sessions from other strategies or users are reused;
+    concurrent misses for the same key are coalesced into a single upstream session.
+    Pages are retried in place by kiwi_retry_policy (token errors refresh headers via
+    `refresh_headers`); sessions that end on an error are not cached.
+    """
+    cache_key = make_query_key(
+        ONEWAY_QUERY_TEMPLATE if is_one_way else RETURN_QUERY_TEMPLATE, base_variables, max_pages
+    )
+    cached_itineraries = await kiwi_raw_cache.get(cache_key)
+    if cached_itineraries is not None:
+        logger.info(f"[{attempt_prefix}] Raw Kiwi cache hit: {len(cached_itineraries)} itineraries.")
+        return cached_itineraries
+
+    async def _fetch_session() -> List[dict]:
+        all_raw_itineraries = []
+        current_token = None
+        page = 1
+        has_more = True # Start assuming there might be data
+        session_failed = False
+        headers = kiwi_headers
+
+        async def _refresh_headers() -> None:
+            nonlocal headers
+            logger.warning(f"[{attempt_prefix}] Token error on page {page}. Forcing header refresh.")
+            headers = await refresh_headers()
+
+        while has_more and page <= max_pages:
+            try:
+                logger.info(f"[{attempt_prefix}] Requesting page {page}...")
+                raw_itineraries, new_token, has_more_pending = await kiwi_retry_policy.run(
+                    lambda: _fetch_kiwi_itineraries_page(
+                        variables=base_variables,
+                        kiwi_headers=headers,
+                        server_token=current_token,
+                        is_one_way=is_one_way,
+                        attempt_prefix=attempt_prefix,
+                        page_num=page
+                    ),
+                    desc=f"{attempt_prefix}-P{page}",
+                    on_token_error=_refresh_headers if refresh_headers else None
+                )
 
-            if raw_itineraries:
-                all_raw_itineraries.extend(raw_itineraries)
-                logger.info(f"[{attempt_prefix}-P{page}] Added {len(raw_itineraries)} itineraries. Total: {len(all_raw_itineraries)}")
+                if raw_itineraries:
+                    all_raw_itineraries.extend(raw_itineraries)
+                    logger.info(f"[{attempt_prefix}-P{page}] Added {len(raw_itineraries)} itineraries. Total: {len(all_raw_itineraries)}")
 
-            # Update token and has_more status for the next iteration
-            current_token = new_token
-            has_more = has_more_pending
+                # Update token and has_more status for the next iteration
+                current_token = new_token
+                has_more = has_more_pending
 
-            if not has_more_pending:
-                logger.info(f"[{attempt_prefix}-P{page}] No more pending results indicated by API.")
-                break # Exit loop if API says no more data
+                if not has_more_pending:
+                    logger.info(f"[{attempt_prefix}-P{page}] No more pending results indicated by API.")
+                    break # Exit loop if API says no more data
 
-            page += 1
+                page += 1
 
-            # Optional delay to avoid overwhelming the API
-            await asyncio.sleep(0.5) # 500ms delay between page requests
+            except KiwiTokenError:
+                logger.error(f"[{attempt_prefix}] KiwiTokenError persisted on page {page} after header refresh. Aborting session.")
+                raise # Re-raise the error to be handled by the caller
+            except UpstreamError as e:
+                logger.error(f"[{attempt_prefix}] Page {page} failed after retries ({e.kind}): {e}. Ending session.")
+                session_failed = True
+                break
+            except Exception as e:
+                logger.error(f"[{attempt_prefix}] Unexpected error during page {page} fetch in session: {e}", exc_info=True)
+                # Decide whether to break or continue? Let's break for safety.
+                session_failed = True
+                break
 
-        except KiwiTokenError:
-            logger.error(f"[{attempt_prefix}] KiwiTokenError encountered during page {page} fetch. Aborting session.")
-            raise # Re-raise the error to be handled by the caller
-        except Exception as e:
-            logger.error(f"[{attempt_prefix}] Unexpected error during page {page} fetch in session: {e}", exc_info=True)
-            # Decide whether to break or continue? Let's break for safety.
-            break
+        if page > max_pages and has_more:
+             logger.warning(f"[{attempt_prefix}] Reached max_pages limit ({max_pages}) but API indicated more results might exist.")
 
-    if page > max_pages and has_more:
-         logger.warning(f"[{attempt_prefix}] Reached max_pages limit ({max_pages}) but API indicated more results might exist.")
+        logger.info(f"[{attempt_prefix}] Search session finished. Fetched {len(all_raw_itineraries)} itineraries in {page-1} pages.")
+        if not session_failed:
+            await kiwi_raw_cache.set(cache_key, all_raw_itineraries)
+        return all_raw_itineraries
 
-    logger.info(f"[{attempt_prefix}] Search session finished. Fetched {len(all_raw_itineraries)} itineraries in {page-1} pages.")
-    return all_raw_itineraries
+    # Concurrent identical sessions (in this process or other workers) hit upstream only once
+    return await kiwi_search_singleflight.do(
+        cache_key, _fetch_session, encode=compress_itineraries, decode=decompress_itineraries
+    )
 
 
 # --- Helper Function for Variable Construction ---
@@ -742,9 +636,13 @@ async def find_flights(
         raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Failed to authenticate with flight provider.")
 
     # --- Helper for Search Session with Retry ---
+    async def _refresh_headers() -> dict:
+        nonlocal kiwi_headers # Later sessions reuse the refreshed headers
+        kiwi_headers = await dynamic_fetcher.get_effective_kiwi_headers(force_refresh=True)
+        return kiwi_headers
+
     async def _run_search_with_retry(variables: dict, attempt_desc: str, force_one_way: bool = False) -> List[dict]:
-        """Runs a search session with token refresh retry logic."""
-        nonlocal kiwi_headers # Allow modification of headers on retry
+        """Runs a search session; pages are retried (with one header refresh on token errors) by kiwi_retry_policy."""
         search_is_one_way = force_one_way or is_one_way # Use forced value or original request type
 
         try:
@@ -753,29 +651,14 @@ async def find_flights(
                 kiwi_headers=kiwi_headers,
                 is_one_way=search_is_one_way, # Use determined one-way status
                 max_pages=request_params.max_pages_per_search,
-                attempt_prefix=f"{search_id}-{attempt_desc}"
+                attempt_prefix=f"{search_id}-{attempt_desc}",
+                refresh_headers=_refresh_headers
             )
-        except KiwiTokenError:
-            logger.warning(f"[{search_id}-{attempt_desc}] KiwiTokenError detected. Forcing header refresh and retrying...")
-            try:
-                kiwi_headers = await dynamic_fetcher.get_effective_kiwi_headers(force_refresh=True)
-                logger.info(f"[{search_id}-{attempt_desc}] Retrying search with refreshed headers.")
-                return await _perform_kiwi_search_session(
-                    base_variables=variables,
-                    kiwi_headers=kiwi_headers,
-                    is_one_way=search_is_one_way, # Use determined one-way status on retry
-                    max_pages=request_params.max_pages_per_search,
-                    attempt_prefix=f"{search_id}-{attempt_desc}-retry"
-                )
-            except KiwiTokenError as retry_e:
-                logger.error(f"[{search_id}-{attempt_desc}] KiwiTokenError persisted after retry: {retry_e}")
-                raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Kiwi API authentication failed after retry.")
-            except Exception as retry_e:
-                 logger.error(f"[{search_id}-{attempt_desc}] Unexpected error during search retry: {retry_e}", exc_info=True)
-                 raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An unexpected error occurred during flight search retry.")
+        except KiwiTokenError as e:
+            logger.error(f"[{search_id}-{attempt_desc}] KiwiTokenError persisted after header refresh: {e}")
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Kiwi API authentication failed after retry.")
         except Exception as e:
-             logger.error(f"[{search_id}-{attempt_desc}] Unexpected error during initial search: {e}", exc_info=True)
-             # Don't raise HTTPException here, allow process to continue if possible, maybe return empty list?
+             logger.error(f"[{search_id}-{attempt_desc}] Unexpected error during search: {e}", exc_info=True)
              # Let's return empty list for unexpected errors during search session
              return []
 
@@ -787,48 +670,28 @@ async def find_flights(
     logger.info(f"[{search_id}] Main search completed. Found {len(main_search_raw)} raw itineraries.")
 
     # --- 3. Direct Flight Extraction & Parsing ---
+    requested_currency = request_params.preferred_currency or "EUR"
+    expected_direct_segments = 1 if is_one_way else 2 # 1 segment for one-way, 2 for return (outbound+inbound)
+    parsed_main_flights = parse_itineraries(main_search_raw, is_one_way, requested_currency, cny_only=False)
+    logger.info(f"[{search_id}] Parsed {len(parsed_main_flights)}/{len(main_search_raw)} main itineraries.")
+
     logger.info(f"[{search_id}] Extracting direct flights...")
     if request_params.direct_flights_only_for_primary:
         logger.info(f"[{search_id}] Performing dedicated direct flight search (maxStopsCount=0)...")
         direct_flight_vars = _build_kiwi_variables(request_params, is_one_way, maxStopsCount=0, enableSelfTransfer=False)
         direct_flights_raw = await _run_search_with_retry(direct_flight_vars, "direct")
         logger.info(f"[{search_id}] Dedicated direct search completed. Found {len(direct_flights_raw)} raw itineraries.")
-        for it_raw in direct_flights_raw:
-            try:
-                parsed = await _parse_kiwi_itinerary(it_raw, is_one_way)
-                # Double check it's actually direct (API might sometimes err)
-                if len(parsed.segments) == (1 if is_one_way else 2): # 1 segment for one-way, 2 for return (outbound+inbound)
-                    parsed_direct_flights.append(parsed)
-                else:
-                     logger.warning(f"[{search_id}] Itinerary {parsed.id} from direct search has {len(parsed.segments)} segments, expected {1 if is_one_way else 2}. Skipping.")
-            except ValueError as e:
-                logger.warning(f"[{search_id}] Failed to parse direct itinerary {it_raw.get('id')}: {e}")
-            except Exception as e:
-                 logger.error(f"[{search_id}] Unexpected error parsing direct itinerary {it_raw.get('id')}: {e}", exc_info=True)
+        for parsed in parse_itineraries(direct_flights_raw, is_one_way, requested_currency, cny_only=False):
+            # Double check it's actually direct (API might sometimes err)
+            if len(parsed.segments) == expected_direct_segments:
+                parsed_direct_flights.append(parsed)
+            else:
+                 logger.warning(f"[{search_id}] Itinerary {parsed.id} from direct search has {len(parsed.segments)} segments, expected {expected_direct_segments}. Skipping.")
     else:
         logger.info(f"[{search_id}] Filtering direct flights from main search results...")
-        for it_raw in main_search_raw:
-            try:
-                # Determine expected segment count for direct flight
-                expected_segments = 1 if is_one_way else 2 # Outbound + Inbound
-
-                # Check segment count directly from raw data if possible (more efficient)
-                segment_count = 0
-                if is_one_way:
-                    segment_count = len(it_raw.get("sector", {}).get("sectorSegments", []))
-                else:
-                    segment_count = len(it_raw.get("outbound", {}).get("sectorSegments", [])) + \
-                                    len(it_raw.get("inbound", {}).get("sectorSegments", []))
-
-                if segment_count == expected_segments:
-                    parsed = await _parse_kiwi_itinerary(it_raw, is_one_way)
-                    parsed_direct_flights.append(parsed)
-
-            except ValueError as e:
-                # This might happen if parsing fails even for potentially direct ones
-                logger.warning(f"[{search_id}] Failed to parse potential direct itinerary {it_raw.get('id')} from main results: {e}")
-            except Exception as e:
-                 logger.error(f"[{search_id}] Unexpected error parsing potential direct itinerary {it_raw.get('id')} from main results: {e}", exc_info=True)
+        parsed_direct_flights.extend(
+            parsed for parsed in parsed_main_flights if len(parsed.segments) == expected_direct_segments
+        )
 
     logger.info(f"[{search_id}] Found {len(parsed_direct_flights)} direct itineraries.")
     if any(f.is_self_transfer for f in parsed_direct_flights):
@@ -892,33 +755,16 @@ async def find_flights(
     parsed_combo_deals_from_main: List[schemas.FlightItinerary] = []
     direct_ids = {f.id for f in parsed_direct_flights}
 
-    # Parse non-direct flights from main search
-    for it_raw in main_search_raw:
-        if it_raw.get('id') not in direct_ids:
-            try:
-                 # Check segment count again to be sure it's not direct
-                 expected_segments = 1 if is_one_way else 2
-                 segment_count = 0
-                 if is_one_way:
-                     segment_count = len(it_raw.get("sector", {}).get("sectorSegments", []))
-                 else:
-                     segment_count = len(it_raw.get("outbound", {}).get("sectorSegments", [])) + \
-                                     len(it_raw.get("inbound", {}).get("sectorSegments", []))
-
-                 if segment_count > expected_segments:
-                     parsed = await _parse_kiwi_itinerary(it_raw, is_one_way)
-                     parsed_combo_deals_from_main.append(parsed)
-                     if parsed.is_self_transfer and "Self-transfer options included" not in disclaimers:
-                         disclaimers.append("Self-transfer options included (may require re-checkin).")
-                     if parsed.is_hidden_city and "Hidden city deals may be available" not in disclaimers:
-                          disclaimers.append("Hidden city deals may be available (require careful booking).")
-                     if parsed.is_throwaway_deal and "Throwaway ticket deals may be available" not in disclaimers:
-                          disclaimers.append("Throwaway ticket deals may be available (require careful booking and may violate airline terms).")
-
-            except ValueError as e:
-                logger.warning(f"[{search_id}] Failed to parse combo itinerary {it_raw.get('id')} from main results: {e}")
-            except Exception as e:
-                 logger.error(f"[{search_id}] Unexpected error parsing combo itinerary {it_raw.get('id')} from main results: {e}", exc_info=True)
+    # Collect non-direct flights from main search
+    for parsed in parsed_main_flights:
+        if parsed.id not in direct_ids and len(parsed.segments) > expected_direct_segments:
+            parsed_combo_deals_from_main.append(parsed)
+            if parsed.is_self_transfer and "Self-transfer options included" not in disclaimers:
+                disclaimers.append("Self-transfer options included (may require re-checkin).")
+            if parsed.is_hidden_city and "Hidden city deals may be available" not in disclaimers:
+                 disclaimers.append("Hidden city deals may be available (require careful booking).")
+            if parsed.is_throwaway_deal and "Throwaway ticket deals may be available" not in disclaimers:
+                 disclaimers.append("Throwaway ticket deals may be available (require careful booking and may violate airline terms).")
 
 
     # Combine main combo deals and probed deals
@@ -1,90 +1,207 @@
 import datetime
 import logging
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
 
 from fastapi import HTTPException, status
 
-# Assuming user_crud exists and has the update_api_call_count function
-from app.database.crud import user_crud
-from app.apis.v1.schemas import UserResponse # Assuming UserResponse schema includes id, api_call_count_today, last_api_call_date
+from app.apis.v1.schemas import UserResponse # Assuming UserResponse schema includes id
 from app.core.config import settings
+from app.core.redis_manager import redis_manager
 
 logger = logging.getLogger(__name__)
 
-async def check_and_update_limit(user: UserResponse, limit_type: str, max_calls: int):
+# Atomically checks the daily quota (and optional sliding-window burst limit) and counts the call.
+# KEYS[1]: daily counter (one key per UTC day), kept RATE_LIMIT_HISTORY_DAYS after the day ends for usage history
+# KEYS[2]: burst window (sorted set of call timestamps in ms)
+# ARGV: max_calls, expire_at (unix seconds), burst_limit (0 disables), burst_window_ms, member
+# Returns {status, count, retry_after_ms}: status 1 = allowed, 0 = daily limit, -1 = burst limit
+_CHECK_AND_INCR_SCRIPT = """
+redis.replicate_commands()
+local max_calls = tonumber(ARGV[1])
+local burst_limit = tonumber(ARGV[3])
+local window = tonumber(ARGV[4])
+local count = tonumber(redis.call("GET", KEYS[1]) or "0")
+if count >= max_calls then
+    return {0, count, 0}
+end
+if burst_limit > 0 then
+    local t = redis.call("TIME")
+    local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+    redis.call("ZREMRANGEBYSCORE", KEYS[2], 0, now - window)
+    if redis.call("ZCARD", KEYS[2]) >= burst_limit then
+        local oldest = redis.call("ZRANGE", KEYS[2], 0, 0, "WITHSCORES")
+        return {-1, count, math.max(1, tonumber(oldest[2]) + window - now)}
+    end
+    redis.call("ZADD", KEYS[2], now, ARGV[5])
+    redis.call("PEXPIRE", KEYS[2], window)
+end
+count = redis.call("INCR", KEYS[1])
+redis.call("EXPIREAT", KEYS[1], tonumber(ARGV[2]))
+return {1, count, 0}
+"""
+
+_STATUS_ALLOWED = 1
+_STATUS_DAILY_LIMIT = 0
+_STATUS_BURST_LIMIT = -1
+
+# Fallback counters when Redis is unavailable (per process): key -> count / key -> call timestamps
+_local_counts: Dict[str, int] = {}
+_local_windows: Dict[str, List[float]] = {}
+_local_day: Optional[datetime.date] = None
+
+
+def _today_utc() -> datetime.date:
+    return datetime.datetime.now(datetime.timezone.utc).date()
+
+
+def next_reset_at(today: Optional[datetime.date] = None) -> datetime.datetime:
+    """Daily counters reset at the next UTC midnight."""
+    tomorrow = (today or _today_utc()) + datetime.timedelta(days=1)
+    return datetime.datetime.combine(tomorrow, datetime.time.min, tzinfo=datetime.timezone.utc)
+
+
+def _daily_key(user_id: int, limit_type: str, day: datetime.date) -> str:
+    return f"ratelimit:user:{user_id}:{limit_type}:{day.isoformat()}"
+
+
+def _daily_key_expire_at(day: datetime.date) -> int:
+    return int((next_reset_at(day) + datetime.timedelta(days=settings.RATE_LIMIT_HISTORY_DAYS)).timestamp())
+
+
+def _burst_key(user_id: int, limit_type: str) -> str:
+    return f"ratelimit:user:{user_id}:{limit_type}:burst"
+
+
+def _get_redis():
+    """Redis client for the current event loop, or None to use the in-process fallback."""
+    if not settings.USER_RATE_LIMIT_REDIS_ENABLED:
+        return None
+    try:
+        return redis_manager.get_loop_client()
+    except Exception as e:
+        logger.debug(f"Rate limiter cannot get a Redis client: {e}")
+        return None
+
+
+def _check_and_incr_local(
+    day: datetime.date, daily_key: str, burst_key: str, max_calls: int, burst_limit: int, window_seconds: float
+) -> Tuple[int, int, float]:
+    """In-process equivalent of _CHECK_AND_INCR_SCRIPT (no await inside, so atomic within the event loop)."""
+    global _local_day
+    if _local_day != day:
+        # Daily reset: yesterday's counters are dropped
+        _local_counts.clear()
+        _local_day = day
+    count = _local_counts.get(daily_key, 0)
+    if count >= max_calls:
+        return _STATUS_DAILY_LIMIT, count, 0.0
+    if burst_limit > 0:
+        now = time.monotonic()
+        window = [ts for ts in _local_windows.get(burst_key, []) if ts > now - window_seconds]
+        if len(window) >= burst_limit:
+            _local_windows[burst_key] = window
+            return _STATUS_BURST_LIMIT, count, window[0] + window_seconds - now
+        window.append(now)
+        _local_windows[burst_key] = window
+    _local_counts[daily_key] = count + 1
+    return _STATUS_ALLOWED, count + 1, 0.0
+
+
+async def check_and_update_limit(user: UserResponse, limit_type: str, max_calls: int, burst_limit: int = 0):
     """
     Checks if the user has exceeded their daily API call limit for a specific type,
-    using the provided max_calls, and updates the count if the limit is not reached.
+    using the provided max_calls, and counts the call if the limit is not reached.
 
     Args:
-        user: The user object (schema) containing current limit info.
-        limit_type: The type of limit being checked (e.g., "poi", "flight").
-        max_calls: The maximum number of calls allowed for this limit_type.
+        user: The user object (schema); only its id is used.
+        limit_type: The type of limit being checked (e.g., "poi", "flight"). Each type has its own counter.
+        max_calls: The maximum number of calls allowed for this limit_type per UTC day.
+        burst_limit: Optional maximum number of calls within RATE_LIMIT_BURST_WINDOW_SECONDS (0 disables).
 
     Returns:
         None. Raises HTTPException if the limit is exceeded.
 
     Raises:
-        HTTPException: With status 429 if the limit is exceeded.
+        HTTPException: With status 429 if the daily or burst limit is exceeded.
 
     Implementation Notes:
-        - Current Approach: Relies on checking the date and updating the count in the database
-          during each request. This is generally acceptable for SQLite and moderate concurrency.
-        - Concurrency Issue (Race Condition): In high-concurrency scenarios, multiple requests
-          might simultaneously read the *same* old count before any single request can write
-          the updated count back to the database. This could lead to exceeding the intended limit.
-          Example: Limit is 10, current count is 9. Two requests arrive almost simultaneously.
-          Both read 9. Both increment to 10 and update. The user effectively made 11 calls.
-        - Future Improvements (Higher Concurrency / PostgreSQL):
-            - Atomic Updates: Use database features like `UPDATE ... SET count = count + 1 WHERE ...`
-              or SELECT FOR UPDATE (row locking) if using PostgreSQL to ensure atomic operations.
-            - Distributed Cache/Counter: Employ solutions like Redis with atomic increments (`INCR`)
-              for highly scalable and performant rate limiting, decoupling it from the main DB.
-        - Daily Reset Logic: The count reset currently happens *reactively* when a user makes
-          their first request on a new day. If a user doesn't make any requests for several days,
-          their count remains unchanged until their next interaction.
-        - Proactive Daily Reset (Alternative): A more robust approach involves a scheduled task
-          (e.g., using Celery Beat, APScheduler, or an external cron job) that runs daily at
-          midnight (UTC or server time) to explicitly reset `api_call_count_today` to 0 and
-          update `last_api_call_date` for all relevant users. This is outside the current scope.
+        - Counters live in Redis and are checked and incremented by a single Lua script, so concurrent
+          requests (across uvicorn workers too) cannot both pass on the same old count.
+        - The daily counter key embeds the UTC date, so counting restarts at the next UTC midnight; the
+          key is kept RATE_LIMIT_HISTORY_DAYS longer for usage history. No reset job or database write
+          is involved in the request path.
+        - Without Redis, per-process counters are used (limits then apply per process).
     """
-    today = datetime.date.today()
-    user_last_call_date = user.last_api_call_date
-    current_count = user.api_call_count_today
+    today = _today_utc()
+    daily_key = _daily_key(user.id, limit_type, today)
+    burst_key = _burst_key(user.id, limit_type)
+    window_seconds = settings.RATE_LIMIT_BURST_WINDOW_SECONDS
 
-    # Reset count if the last call was not today
-    if user_last_call_date != today:
-        logger.info(f"User {user.id}: First API call ({limit_type}) today. Resetting count.")
-        current_count = 0
-    else:
-        logger.debug(f"User {user.id}: API call count today ({limit_type}): {current_count}")
+    redis_client = _get_redis()
+    result = None
+    if redis_client is not None:
+        try:
+            result = await redis_client.eval(
+                _CHECK_AND_INCR_SCRIPT, 2, daily_key, burst_key,
+                max_calls, _daily_key_expire_at(today), burst_limit,
+                int(window_seconds * 1000), uuid.uuid4().hex
+            )
+            result = (int(result[0]), int(result[1]), int(result[2]) / 1000)
+        except Exception as e:
+            logger.warning(f"User {user.id}: Redis rate limiter unavailable, using in-process counters: {e}")
+            result = None
+    if result is None:
+        result = _check_and_incr_local(today, daily_key, burst_key, max_calls, burst_limit, window_seconds)
 
-
-    # Check against the limit
-    # Using >= because if count is already AT the limit, the *next* call is disallowed.
-    if current_count >= max_calls:
+    limit_status, count, retry_after = result
+    if limit_status == _STATUS_DAILY_LIMIT:
         logger.warning(f"User {user.id}: API call limit ({max_calls}) exceeded for {limit_type}.")
         raise HTTPException(
             status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-            detail=f"API call limit exceeded for today for '{limit_type}'. Limit: {max_calls} calls."
+            detail=f"API call limit exceeded for today for '{limit_type}'. Limit: {max_calls} calls.",
+            headers={"Retry-After": str(max(1, int((next_reset_at(today) - datetime.datetime.now(datetime.timezone.utc)).total_seconds())))}
         )
-
-    # Limit not reached, update the count and date in the database
-    new_count = current_count + 1
-    try:
-        # Ensure the CRUD function exists and accepts these parameters
-        await user_crud.update_api_call_count(
-            user_id=user.id,
-            new_count=new_count,
-            call_date=today
-        )
-        logger.info(f"User {user.id}: API call ({limit_type}) allowed. New count: {new_count}")
-        # No return needed as the function now only raises exceptions on failure/limit exceeded
-    except Exception as e:
-        # Log the error and potentially re-raise or handle differently
-        logger.error(f"User {user.id}: Failed to update API call count for {limit_type}: {e}")
-        # Depending on policy, you might still allow the call but log the failure,
-        # or deny the call by raising an exception. Raising 500 seems appropriate here.
+    if limit_status == _STATUS_BURST_LIMIT:
+        logger.warning(f"User {user.id}: Burst limit ({burst_limit}/{window_seconds:.0f}s) exceeded for {limit_type}.")
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to update API usage count."
-        )
\ No newline at end of file
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Too many '{limit_type}' requests. Limit: {burst_limit} calls per {window_seconds:.0f} seconds.",
+            headers={"Retry-After": str(max(1, int(retry_after + 0.999)))}
+        )
+    logger.info(f"User {user.id}: API call ({limit_type}) allowed. New count: {count}")
+
+
+async def get_usage_counts(user_id: int, limit_types: List[str]) -> Dict[str, int]:
+    """Today's real per-type call counts for a user (0 for types without calls)."""
+    history = await get_usage_history(user_id, limit_types, days=1)
+    return history[0][1]
+
+
+async def get_usage_history(
+    user_id: int, limit_types: List[str], days: int
+) -> List[Tuple[datetime.date, Dict[str, int]]]:
+    """Per-day, per-type call counts for the last `days` UTC days (oldest first, today last).
+
+    Read with a single MGET. Days older than RATE_LIMIT_HISTORY_DAYS, and past days under the
+    in-process fallback, report 0.
+    """
+    today = _today_utc()
+    dates = [today - datetime.timedelta(days=offset) for offset in range(days - 1, -1, -1)]
+    keys = [_daily_key(user_id, limit_type, day) for day in dates for limit_type in limit_types]
+    counts = None
+    redis_client = _get_redis()
+    if redis_client is not None:
+        try:
+            counts = [int(value or 0) for value in await redis_client.mget(keys)]
+        except Exception as e:
+            logger.warning(f"User {user_id}: Failed to read usage counters from Redis: {e}")
+    if counts is None:
+        counts = [_local_counts.get(key, 0) if _local_day == today else 0 for key in keys]
+
+    per_day = len(limit_types)
+    return [
+        (day, dict(zip(limit_types, counts[i * per_day:(i + 1) * per_day])))
+        for i, day in enumerate(dates)
+    ]
@@ -6,6 +6,20 @@ from datetime import datetime, timezone
 from typing import List, Dict, Any, Optional
 import httpx
 
+from app.core.kiwi_client import kiwi_client_manager
+from app.core.kiwi_raw_cache import (
+    kiwi_raw_cache, make_query_key, compress_itineraries, decompress_itineraries
+)
+from app.core.singleflight import kiwi_search_singleflight
+from app.core.upstream_rate_limiter import kiwi_rate_limiter, LANE_PROBE
+from app.core.upstream_guard import kiwi_upstream_guard, CircuitOpenError
+from app.core.request_hedging import is_http_success, kiwi_request_hedger
+from app.core.identity_pool import kiwi_identity_pool
+from app.core.retry_policy import kiwi_retry_policy, raise_for_upstream_status, UpstreamError
+from app.core.tasks import KiwiSearchIncompleteError
+from app.core import fast_json
+from app.core.itinerary_parser import PageLookups
+
 
 # 为了独立运行，我们用一个简单的Mock类
 class MockFlightSearchRequest:
@@ -46,6 +60,42 @@ logging.basicConfig(
 #     # ...
 #     pass
 
+SIMPLIFIED_ONEWAY_QUERY = """
+query SearchOneWayItinerariesQuery(
+  $search: SearchOnewayInput, $filter: ItinerariesFilterInput, $options: ItinerariesOptionsInput
+) {
+  onewayItineraries(search: $search, filter: $filter, options: $options) {
+    __typename
+    ... on AppError { error: message }
+    ... on Itineraries {
+      server { requestId }
+      metadata { itinerariesCount hasMorePending }
+      itineraries {
+        __typename
+        ... on ItineraryOneWay {
+          ... on Itinerary {
+            id price { amount } duration pnrCount
+            bookingOptions { edges { node { token bookingUrl price { amount } } } }
+            travelHack { isTrueHiddenCity isVirtualInterlining isThrowawayTicket }
+          }
+          sector {
+            duration
+            sectorSegments {
+              segment {
+                source { localTime utcTime station { name code city { name } country { code name } } }
+                destination { localTime utcTime station { name code city { name } country { code name } } }
+                hiddenDestination { code name city { name } country { code name } }
+                code carrier { name code } operatingCarrier { name code } duration
+              }
+            }
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
 class SimplifiedFlightHelpers:
     """简化航班搜索服务的辅助方法"""
 
@@ -154,42 +204,13 @@ class SimplifiedFlightHelpers:
         variables: Dict[str, Any], headers: Dict[str, str], search_id: str,
         base_url: str = "https://api.skypicker.com/umbrella/v2/graphql", timeout: float = 45.0
     ) -> List[Dict[str, Any]]:
-        query = """
-        query SearchOneWayItinerariesQuery(
-          $search: SearchOnewayInput, $filter: ItinerariesFilterInput, $options: ItinerariesOptionsInput
-        ) {
-          onewayItineraries(search: $search, filter: $filter, options: $options) {
-            __typename
-            ... on AppError { error: message }
-            ... on Itineraries {
-              server { requestId }
-              metadata { itinerariesCount hasMorePending }
-              itineraries {
-                __typename
-                ... on ItineraryOneWay {
-                  ... on Itinerary {
-                    id price { amount } duration pnrCount
-                    bookingOptions { edges { node { token bookingUrl price { amount } } } }
-                    travelHack { isTrueHiddenCity isVirtualInterlining isThrowawayTicket }
-                  }
-                  sector {
-                    duration
-                    sectorSegments {
-                      segment {
-                        source { localTime utcTime station { name code city { name } country { code name } } }
-                        destination { localTime utcTime station { name code city { name } country { code name } } }
-                        hiddenDestination { code name city { name } country { code name } }
-                        code carrier { name code } operatingCarrier { name code } duration
-                      }
-                    }
-                  }
-                }
-              }
-            }
-          }
-        }
+        """执行单程 GraphQL 搜索（带原始结果缓存与 singleflight 合并）
+
+        Raises:
+            KiwiSearchIncompleteError: 重试后仍失败、熔断或 GraphQL 返回错误。失败不会写入缓存，
+                也不会以空结果的形式通过 singleflight 分享给其他等待者
         """
-        payload = {"query": query, "variables": variables}
+        payload = {"query": SIMPLIFIED_ONEWAY_QUERY, "variables": variables}
 
         try:
             # 移除保存请求文件的逻辑
@@ -197,49 +218,93 @@ class SimplifiedFlightHelpers:
             # logger.debug(f"[{search_id}] GraphQL请求体: {json.dumps(payload)}") # 如果需要，可以记录请求体
 
             dest_info = variables.get('search',{}).get('itinerary',{}).get('destination',{}).get('ids',[''])[0]
-            logger.info(f"[{search_id}] -> 发送GraphQL请求到 {dest_info}")
-
-            async with httpx.AsyncClient(timeout=httpx.Timeout(timeout, connect=10.0)) as client:
-                response = await client.post(
-                    f"{base_url}?featureName=SearchOneWayItinerariesQuery", json=payload, headers=headers
-                )
-            logger.info(f"[{search_id}] <- HTTP响应状态: {response.status_code} for {dest_info}")
-
-            try: data = response.json()
-            except json.JSONDecodeError:
-                logger.error(f"[{search_id}] API响应不是有效的JSON: {response.text[:500]}...") # 记录部分文本
-                data = {"error": "Invalid JSON response", "status_code": response.status_code, "raw_text": response.text}
+
+            # 相同查询（忽略 serverToken / search_id）优先复用原始结果缓存
+            cache_key = make_query_key(SIMPLIFIED_ONEWAY_QUERY, variables)
+            cached_itineraries = await kiwi_raw_cache.get(cache_key)
+            if cached_itineraries is not None:
+                logger.info(f"[{search_id}] 命中原始结果缓存: {len(cached_itineraries)} 条行程 for {dest_info}")
+                return cached_itineraries
+
+            async def _fetch() -> List[Dict[str, Any]]:
+                logger.info(f"[{search_id}] -> 发送GraphQL请求到 {dest_info}")
+
+                client = kiwi_client_manager.get_client()
+
+                async def _send() -> httpx.Response:
+                    await kiwi_rate_limiter.acquire()
+                    async with kiwi_upstream_guard.request() as call:
+                        # 按身份池分配请求身份，分散单一身份的限流压力
+                        with kiwi_identity_pool.lease(headers) as identity:
+                            response = await client.post(
+                                f"{base_url}?featureName=SearchOneWayItinerariesQuery", json=payload,
+                                headers=identity.headers, timeout=httpx.Timeout(timeout, connect=10.0)
+                            )
+                            identity.observe(response.status_code)
+                        call.observe(response.status_code)
+                    return response
+
+                async def _request() -> httpx.Response:
+                    # 慢请求超过延迟分位数后发送对冲副本（需开启 KIWI_HEDGING_ENABLED）
+                    response = await kiwi_request_hedger.run(
+                        _send, allow_hedge=not kiwi_upstream_guard.degraded, is_success=is_http_success
+                    )
+                    raise_for_upstream_status(response, f"HTTP {response.status_code}: {response.text[:200]}")
+                    return response
+
+                # 限流、超时与 5xx 按统一重试策略退避重试（计入本次搜索的重试预算）
+                response = await kiwi_retry_policy.run(_request, desc=search_id)
+                logger.info(f"[{search_id}] <- HTTP响应状态: {response.status_code} for {dest_info}")
+
+                try: data = fast_json.decode_response(response)
+                except json.JSONDecodeError as e:
+                    logger.error(f"[{search_id}] API响应不是有效的JSON: {response.text[:500]}...") # 记录部分文本
+                    raise UpstreamError(f"Invalid JSON response (HTTP {response.status_code})") from e
             
-            # 移除保存响应文件的逻辑
-            # save_to_file(data, f"kiwi_response_{search_id}.json", "logs/kiwi_responses")
-            if response.status_code >= 400: # 如果是错误状态码，记录响应体用于调试
-                 logger.warning(f"[{search_id}] API错误响应体 ({response.status_code}): {json.dumps(data, ensure_ascii=False)}")
-
-
-            response.raise_for_status() # 确保在处理数据前检查HTTP错误
-
-            if "errors" in data and data["errors"]:
-                logger.error(f"[{search_id}] GraphQL API返回错误: {data['errors']}")
-                return []
-            oneway_data = data.get("data", {}).get("onewayItineraries", {})
-            if oneway_data.get("__typename") == "AppError":
-                logger.error(f"[{search_id}] GraphQL API应用错误: {oneway_data.get('error')}")
-                return []
-            itineraries = oneway_data.get("itineraries", [])
-            logger.info(f"[{search_id}] 获取到 {len(itineraries)} 条原始行程 for {dest_info}")
-            return itineraries
+                # 移除保存响应文件的逻辑
+                # save_to_file(data, f"kiwi_response_{search_id}.json", "logs/kiwi_responses")
+                if response.status_code >= 400: # 如果是错误状态码，记录响应体用于调试
+                     logger.warning(f"[{search_id}] API错误响应体 ({response.status_code}): {response.text[:1000]}")
+
+
+                response.raise_for_status() # 确保在处理数据前检查HTTP错误
+
+                if "errors" in data and data["errors"]:
+                    logger.error(f"[{search_id}] GraphQL API返回错误: {data['errors']}")
+                    raise UpstreamError(f"GraphQL errors: {str(data['errors'])[:200]}")
+                oneway_data = data.get("data", {}).get("onewayItineraries", {})
+                if oneway_data.get("__typename") == "AppError":
+                    logger.error(f"[{search_id}] GraphQL API应用错误: {oneway_data.get('error')}")
+                    raise UpstreamError(f"GraphQL AppError: {oneway_data.get('error')}")
+                itineraries = oneway_data.get("itineraries", [])
+                logger.info(f"[{search_id}] 获取到 {len(itineraries)} 条原始行程 for {dest_info}")
+                await kiwi_raw_cache.set(cache_key, itineraries)
+                return itineraries
+
+            # 相同查询的并发请求（本进程或其他 worker）只向上游发送一次
+            return await kiwi_search_singleflight.do(
+                cache_key, _fetch, encode=compress_itineraries, decode=decompress_itineraries
+            )
         except httpx.HTTPStatusError as exc:
             logger.error(f"[{search_id}] HTTP错误: {exc.response.status_code} for {exc.request.url}", exc_info=False) # exc_info=False 避免重复记录堆栈
             err_resp_text = exc.response.text
             logger.error(f"[{search_id}] HTTP错误响应内容: {err_resp_text[:1000]}") # 记录部分错误文本
             # 移除保存错误响应文件的逻辑
             # save_to_file(err_body, f"kiwi_error_response_{search_id}.json", "logs/kiwi_responses")
-            return []
+            raise KiwiSearchIncompleteError(
+                f"HTTP {exc.response.status_code}", status_code=exc.response.status_code
+            ) from exc
+        except CircuitOpenError as e:
+            logger.warning(f"[{search_id}] 跳过GraphQL请求: {e}")
+            raise KiwiSearchIncompleteError(str(e)) from e
+        except UpstreamError as e:
+            logger.error(f"[{search_id}] GraphQL请求重试后仍失败 ({e.kind}): {e}")
+            raise KiwiSearchIncompleteError(str(e), status_code=e.status_code) from e
         except Exception as e:
             logger.error(f"[{search_id}] GraphQL搜索执行中发生未知异常: {e}", exc_info=True)
             # 移除保存异常文件的逻辑
             # save_to_file({"error": str(e), "type": type(e).__name__}, f"kiwi_exception_{search_id}.json", "logs/kiwi_responses")
-            return []
+            raise KiwiSearchIncompleteError(f"Unexpected error: {e}") from e
 
     @staticmethod
     def _parse_datetime_flexible(time_str: Optional[str]) -> Optional[datetime]:
@@ -256,10 +321,27 @@ class SimplifiedFlightHelpers:
                 return None
 
     @staticmethod
-    async def parse_flight_itinerary(
-        raw_itinerary: Dict[str, Any],
+    def parse_flight_itineraries(
+        raw_itineraries: List[Dict[str, Any]],
         requested_currency: str
+    ) -> List[Dict[str, Any]]:
+        """批量解析一页原始行程，页内共享时间解析缓存，丢弃无法解析的条目"""
+        lookups = PageLookups()
+        parsed_list = []
+        for raw_itinerary in raw_itineraries:
+            parsed = SimplifiedFlightHelpers.parse_flight_itinerary(raw_itinerary, requested_currency, lookups)
+            if parsed:
+                parsed_list.append(parsed)
+        return parsed_list
+
+    @staticmethod
+    def parse_flight_itinerary(
+        raw_itinerary: Dict[str, Any],
+        requested_currency: str,
+        lookups: Optional[PageLookups] = None
     ) -> Optional[Dict[str, Any]]:
+        if lookups is None:
+            lookups = PageLookups()
         try:
             flight_id = raw_itinerary.get("id", f"unknown_id_{datetime.now(timezone.utc).timestamp()}") # 确保 flight_id 始终存在
             price_info_raw = raw_itinerary.get("price", {})
@@ -289,8 +371,8 @@ class SimplifiedFlightHelpers:
                             curr_dep_utc_str = parsed_seg["departure"].get("utc_time")
                             
                             if prev_arrival_utc_str and curr_dep_utc_str: #确保两个时间都存在
-                                prev_arrival_utc = SimplifiedFlightHelpers._parse_datetime_flexible(prev_arrival_utc_str)
-                                curr_dep_utc = SimplifiedFlightHelpers._parse_datetime_flexible(curr_dep_utc_str)
+                                prev_arrival_utc = lookups.datetime(prev_arrival_utc_str)
+                                curr_dep_utc = lookups.datetime(curr_dep_utc_str)
 
                                 if prev_arrival_utc and curr_dep_utc:
                                     if prev_arrival_utc.tzinfo is None or curr_dep_utc.tzinfo is None:
@@ -471,11 +553,9 @@ async def find_and_classify_flights(
     main_vars["filter"]["flightsApiLimit"] = 50
 
     raw_main_itineraries = await SimplifiedFlightHelpers.execute_graphql_search(main_vars, api_headers, main_search_id)
-    for raw_iti in raw_main_itineraries:
-        parsed = await SimplifiedFlightHelpers.parse_flight_itinerary(raw_iti, requested_currency)
-        if parsed:
-            parsed["_internal_debug_markers"]["search_type"] = "main_destination"
-            all_parsed_itineraries.append(parsed)
+    for parsed in SimplifiedFlightHelpers.parse_flight_itineraries(raw_main_itineraries, requested_currency):
+        parsed["_internal_debug_markers"]["search_type"] = "main_destination"
+        all_parsed_itineraries.append(parsed)
     logger.info(f"[{main_search_id}] 主要目的地搜索完成，解析到 {len([p for p in all_parsed_itineraries if p['_internal_debug_markers']['search_type'] == 'main_destination'])} 条有效行程。")
 
     # --- 步骤 2: 搜索周边/甩尾目的地 ---
@@ -500,7 +580,8 @@ async def find_and_classify_flights(
 
     if throwaway_search_tasks:
         logger.info(f"[{throwaway_search_id_prefix}] 并行执行 {len(throwaway_search_tasks)} 个甩尾搜索任务...")
-        results_from_throwaway = await asyncio.gather(*throwaway_search_tasks, return_exceptions=True)
+        with kiwi_rate_limiter.lane(LANE_PROBE):
+            results_from_throwaway = await asyncio.gather(*throwaway_search_tasks, return_exceptions=True)
         
         for i, res_or_exc in enumerate(results_from_throwaway):
             td_code = potential_throwaway_dests[i]
@@ -508,12 +589,10 @@ async def find_and_classify_flights(
                 logger.error(f"[{throwaway_search_id_prefix}] 甩尾搜索到 {td_code} 失败: {res_or_exc}")
                 continue
             if res_or_exc:
-                for raw_iti in res_or_exc:
-                    parsed = await SimplifiedFlightHelpers.parse_flight_itinerary(raw_iti, requested_currency)
-                    if parsed:
-                        parsed["_internal_debug_markers"]["search_type"] = "throwaway_search"
-                        parsed["_internal_debug_markers"]["throwaway_ticketed_dest"] = td_code
-                        all_parsed_itineraries.append(parsed)
+                for parsed in SimplifiedFlightHelpers.parse_flight_itineraries(res_or_exc, requested_currency):
+                    parsed["_internal_debug_markers"]["search_type"] = "throwaway_search"
+                    parsed["_internal_debug_markers"]["throwaway_ticketed_dest"] = td_code
+                    all_parsed_itineraries.append(parsed)
     logger.info(f"[{throwaway_search_id_prefix}] 周边/甩尾目的地搜索完成。")
 
     # --- 步骤 3: 结果整合与分类 ---
@@ -15,6 +15,10 @@ from app.core.config import settings
 from app.core import dynamic_fetcher
 from app.apis.v1.schemas import FlightSearchRequest, FlightItinerary, FlightSegment
 from app.services.simplified_flight_helpers import SimplifiedFlightHelpers
+from app.core.itinerary_parser import PageLookups
+from app.core.cpu_executor import cpu_executor
+from app.core.upstream_rate_limiter import kiwi_rate_limiter, LANE_PROBE
+from app.core.upstream_guard import kiwi_upstream_guard
 
 logger = logging.getLogger(__name__)
 
@@ -78,6 +82,11 @@ class SimplifiedFlightService:
                 results["direct_flights"] = direct_flights
                 logger.info(f"[{search_id}] 找到 {len(direct_flights)} 个直飞航班")
 
+            # 上游熔断期间跳过隐藏城市搜索（降级为仅直飞）
+            if include_hidden_city and kiwi_upstream_guard.degraded:
+                logger.warning(f"[{search_id}] Kiwi熔断器状态为 {kiwi_upstream_guard.state}，跳过隐藏城市搜索")
+                include_hidden_city = False
+
             # 搜索隐藏城市航班
             if include_hidden_city:
                 logger.info(f"[{search_id}] 搜索隐藏城市航班")
@@ -155,6 +164,7 @@ class SimplifiedFlightService:
             hidden_city_found_in_direct = 0
             valid_direct_flights = 0
 
+            lookups = PageLookups()  # 页内共享解析缓存
             for raw_itinerary in raw_results:
                 try:
                     flight_id = raw_itinerary.get("id", "UNKNOWN")
@@ -166,7 +176,7 @@ class SimplifiedFlightService:
                         hidden_city_found_in_direct += 1
                         logger.warning(f"[{search_id}] 直飞搜索中发现隐藏城市航班，转移到隐藏城市列表: {flight_id}")
 
-                        flight = await SimplifiedFlightHelpers.parse_flight_itinerary(raw_itinerary, request.preferred_currency)
+                        flight = SimplifiedFlightHelpers.parse_flight_itinerary(raw_itinerary, request.preferred_currency, lookups)
                         if flight:
                             # 标记这个航班来自主要目的地搜索
                             flight["_internal_debug_markers"]["search_type"] = "main_destination"
@@ -177,7 +187,7 @@ class SimplifiedFlightService:
 
                     # 解析航班并检查是否为直飞
                     else:
-                        flight = await SimplifiedFlightHelpers.parse_flight_itinerary(raw_itinerary, request.preferred_currency)
+                        flight = SimplifiedFlightHelpers.parse_flight_itinerary(raw_itinerary, request.preferred_currency, lookups)
                         if flight:
                             # 标记这个航班来自主要目的地搜索
                             flight["_internal_debug_markers"]["search_type"] = "main_destination"
@@ -256,10 +266,17 @@ class SimplifiedFlightService:
                 all_hidden_flights.extend(throwaway_flights)
 
             # 去重并按价格排序
-            unique_flights = SimplifiedFlightHelpers.deduplicate_flights(all_hidden_flights)
+            unique_flights = await cpu_executor.run(
+                "dedupe", SimplifiedFlightHelpers.deduplicate_flights, all_hidden_flights,
+                items=len(all_hidden_flights)
+            )
 
             # 使用新的分类逻辑重新分类隐藏城市航班
-            classified_hidden_flights = self._classify_hidden_city_flights(unique_flights, request.destination_iata.upper(), search_id)
+            classified_hidden_flights = await cpu_executor.run(
+                "classify", self._classify_hidden_city_flights,
+                unique_flights, request.destination_iata.upper(), search_id,
+                items=len(unique_flights)
+            )
 
             logger.debug(f"[{search_id}] 甩尾搜索完成: {len(classified_hidden_flights)} 个有效航班")
 
@@ -379,20 +396,22 @@ class SimplifiedFlightService:
             variables["filter"]["enableThrowAwayTicketing"] = True
 
             # 执行搜索
-            raw_results = await SimplifiedFlightHelpers.execute_graphql_search(
-                variables, headers, f"{search_id}_direct_hidden", self.base_url, self.timeout
-            )
+            with kiwi_rate_limiter.lane(LANE_PROBE):
+                raw_results = await SimplifiedFlightHelpers.execute_graphql_search(
+                    variables, headers, f"{search_id}_direct_hidden", self.base_url, self.timeout
+                )
 
             hidden_flights = []
 
             # 筛选出真正的隐藏城市航班
+            lookups = PageLookups()  # 页内共享解析缓存
             for raw_itinerary in raw_results:
                 try:
                     travel_hack = raw_itinerary.get("travelHack", {})
                     is_true_hidden_city = travel_hack.get("isTrueHiddenCity", False)
 
                     if is_true_hidden_city:
-                        flight = await SimplifiedFlightHelpers.parse_flight_itinerary(raw_itinerary, request.preferred_currency)
+                        flight = SimplifiedFlightHelpers.parse_flight_itinerary(raw_itinerary, request.preferred_currency, lookups)
                         if flight:
                             # 标记这个航班来自主要目的地搜索
                             flight["_internal_debug_markers"]["search_type"] = "main_destination"
@@ -449,17 +468,19 @@ class SimplifiedFlightService:
                 variables["filter"]["enableThrowAwayTicketing"] = True
 
                 # 执行搜索 - 使用统一的GraphQL搜索方法
-                raw_results = await SimplifiedFlightHelpers.execute_graphql_search(
-                    variables, headers, f"{search_id}_throwaway_{throwaway_dest}",
-                    self.base_url, self.timeout
-                )
+                with kiwi_rate_limiter.lane(LANE_PROBE):
+                    raw_results = await SimplifiedFlightHelpers.execute_graphql_search(
+                        variables, headers, f"{search_id}_throwaway_{throwaway_dest}",
+                        self.base_url, self.timeout
+                    )
 
                 # 解析结果并筛选出经过目标城市的航班
                 valid_throwaway_count = 0
+                lookups = PageLookups()  # 页内共享解析缓存
                 for raw_itinerary in raw_results:
                     try:
                         # 使用统一的航班解析方法
-                        flight = await SimplifiedFlightHelpers.parse_flight_itinerary(raw_itinerary, request.preferred_currency)
+                        flight = SimplifiedFlightHelpers.parse_flight_itinerary(raw_itinerary, request.preferred_currency, lookups)
                         if flight:
                             # 标记这个航班来自甩尾搜索
                             flight["_internal_debug_markers"]["search_type"] = "throwaway_search"
@@ -0,0 +1,66 @@
+"""
+认证依赖开销基准
+
+对已存在的用户签发访问令牌，连续调用 get_current_user + get_current_active_user，对比：
+  - no-cache:  原路径，每次请求 JWT 解码 + 按邮箱查询用户表
+  - cached:    principal 缓存（首次查库，之后进程内 LRU 命中；连接 Redis 时同时写入 Redis）
+
+用法（在 aeroscouthq_backend 目录下，使用配置中的数据库）:
+    python -m benchmarks.bench_auth_principal --email admin@example.com --calls 2000
+    python -m benchmarks.bench_auth_principal --email admin@example.com --redis
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from app.core.config import settings
+from app.core.dependencies import get_current_active_user, get_current_user
+from app.core.principal_cache import principal_cache
+from app.core.redis_manager import redis_manager
+from app.core.security import create_access_token
+from app.database.connection import connect_db, disconnect_db
+
+
+async def _bench(label: str, token: str, calls: int) -> float:
+    samples = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        await get_current_active_user(await get_current_user(token))
+        samples.append(time.perf_counter() - start)
+    mean_us = statistics.mean(samples) * 1e6
+    p99_us = sorted(samples)[int(len(samples) * 0.99) - 1] * 1e6
+    print(f"  {label:<10} mean {mean_us:>8.1f} us   p99 {p99_us:>8.1f} us")
+    return mean_us
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--email", required=True, help="数据库中已存在的用户邮箱")
+    parser.add_argument("--calls", type=int, default=2000, help="每种模式的调用次数")
+    parser.add_argument("--redis", action="store_true", help="连接 Redis（缓存同时写入 Redis）")
+    args = parser.parse_args()
+
+    await connect_db()
+    if args.redis:
+        await redis_manager.initialize()
+    try:
+        token = create_access_token({"sub": args.email})
+        print(f"{args.calls} authenticated calls for {args.email} (redis={'yes' if args.redis else 'no'})")
+
+        settings.PRINCIPAL_CACHE_ENABLED = False
+        uncached = await _bench("no-cache", token, args.calls)
+
+        settings.PRINCIPAL_CACHE_ENABLED = True
+        await principal_cache.invalidate(args.email)
+        cached = await _bench("cached", token, args.calls)
+        print(f"  speedup {uncached / cached:.2f}x  (cache stats: {principal_cache.get_stats()})")
+    finally:
+        if args.redis:
+            await redis_manager.close()
+        await disconnect_db()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
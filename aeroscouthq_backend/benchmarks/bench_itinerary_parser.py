@@ -0,0 +1,58 @@
+"""
+行程解析器单条耗时基准
+
+对比调试通道关闭（生产默认）、开启但抽样、全量开启三种情况下
+parse_itineraries 的平均单条耗时。
+
+用法（在 aeroscouthq_backend 目录下）:
+    python -m benchmarks.bench_itinerary_parser [--count 400] [--rounds 5]
+"""
+
+import argparse
+import logging
+import time
+
+from app.core.config import settings
+from app.core.itinerary_parser import parse_itineraries
+from app.core import search_debug
+from benchmarks.fixtures import make_itineraries
+
+
+def _run_case(label: str, itineraries, is_one_way: bool, rounds: int, enabled: bool, sample_rate: float) -> None:
+    settings.ENABLE_SEARCH_DEBUG_LOGS = enabled
+    settings.SEARCH_DEBUG_SAMPLE_RATE = sample_rate
+    search_debug.search_debug_logger.setLevel(logging.DEBUG if enabled else logging.CRITICAL + 1)
+
+    best = float("inf")
+    parsed = 0
+    for _ in range(rounds):
+        start = time.perf_counter()
+        parsed = len(parse_itineraries(itineraries, is_one_way, "CNY"))
+        best = min(best, time.perf_counter() - start)
+
+    per_item_us = best / len(itineraries) * 1e6
+    print(f"{label:<28} {per_item_us:>10.1f} µs/itinerary  (parsed {parsed}/{len(itineraries)})")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=400, help="每轮解析的行程数")
+    parser.add_argument("--rounds", type=int, default=5, help="重复轮数，取最快一轮")
+    parser.add_argument("--return-trip", action="store_true", help="使用往返行程数据")
+    args = parser.parse_args()
+
+    # 与生产默认一致：全局 WARNING，调试输出丢弃到空处理器
+    logging.basicConfig(level=logging.WARNING)
+    search_debug.search_debug_logger.propagate = False
+    search_debug.search_debug_logger.addHandler(logging.NullHandler())
+
+    is_one_way = not args.return_trip
+    itineraries = make_itineraries(args.count, is_one_way=is_one_way)
+
+    _run_case("debug off (default)", itineraries, is_one_way, args.rounds, False, 0.0)
+    _run_case("debug on, sampled 10%", itineraries, is_one_way, args.rounds, True, 0.1)
+    _run_case("debug on, every itinerary", itineraries, is_one_way, args.rounds, True, 1.0)
+
+
+if __name__ == "__main__":
+    main()
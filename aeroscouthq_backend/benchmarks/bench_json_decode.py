@@ -0,0 +1,114 @@
+"""
+Kiwi 页面响应 JSON 解码微基准
+
+在录制的 Kiwi 响应（或按页组装的合成数据）上对比延迟与峰值分配（tracemalloc）：
+  - decode:  response.json() 等价路径（bytes -> str -> json.loads） vs fast_json.loads(bytes)
+  - copy:    每页变量 json.loads(json.dumps(variables)) 深拷贝 vs 仅复制 options 层
+  - cache:   原始行程缓存编码 json.dumps(...).encode() vs fast_json.dumps_bytes
+
+用法（在 aeroscouthq_backend 目录下）:
+    python -m benchmarks.bench_json_decode --payload logs/kiwi_responses/*.json
+    python -m benchmarks.bench_json_decode --page-size 50 --pages 10
+"""
+
+import argparse
+import json
+import time
+import tracemalloc
+from typing import Any, Callable, List
+
+from app.core import fast_json
+from benchmarks.fixtures import load_recorded_itineraries, make_itineraries
+
+
+def _page_body(itineraries: List[dict]) -> bytes:
+    """按 ONEWAY_QUERY_TEMPLATE 的响应结构组装一页响应体"""
+    body = {
+        "data": {
+            "onewayItineraries": {
+                "__typename": "Itineraries",
+                "server": {"requestId": "bench", "serverToken": "x" * 600},
+                "metadata": {"hasMorePending": True},
+                "itineraries": itineraries,
+            }
+        }
+    }
+    return json.dumps(body, ensure_ascii=False).encode("utf-8")
+
+
+def _variables() -> dict:
+    return {
+        "search": {
+            "itinerary": {
+                "source": {"ids": ["Station:airport:PEK"]},
+                "destination": {"ids": ["Station:airport:LHR"]},
+                "outboundDepartureDate": {"start": "2025-06-01T00:00:00", "end": "2025-06-01T23:59:59"},
+            },
+            "passengers": {"adults": 1, "children": 0, "infants": 0, "adultsHoldBags": [0], "adultsHandBags": [1]},
+            "cabinClass": {"cabinClass": "ECONOMY", "applyMixedClasses": False},
+        },
+        "filter": {"allowChangeInboundDestination": True, "enableSelfTransfer": True, "maxStopsCount": 2, "limit": 50},
+        "options": {"sortBy": "PRICE", "currency": "cny", "locale": "cn", "serverToken": "x" * 600},
+    }
+
+
+def _bench(label: str, fn: Callable[[], Any], rounds: int) -> float:
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  {label:<10} {best * 1000:>9.3f} ms   peak alloc {peak / 1024:>9.1f} KiB")
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--payload", nargs="*", default=[], help="录制的 Kiwi 响应 JSON 文件")
+    parser.add_argument("--page-size", type=int, default=50, help="每页行程数")
+    parser.add_argument("--pages", type=int, default=10, help="未提供录制文件时生成的合成页数")
+    parser.add_argument("--rounds", type=int, default=7, help="重复轮数，取最快一轮")
+    args = parser.parse_args()
+
+    raw = (
+        load_recorded_itineraries(args.payload) if args.payload
+        else make_itineraries(args.page_size * args.pages)
+    )
+    if not raw:
+        raise SystemExit("录制文件中没有行程数据")
+    pages = [_page_body(raw[i:i + args.page_size]) for i in range(0, len(raw), args.page_size)]
+    print(
+        f"{len(pages)} pages / {len(raw)} itineraries ({'recorded' if args.payload else 'synthetic'}), "
+        f"{sum(len(p) for p in pages) / len(pages) / 1024:.1f} KiB per page, "
+        f"orjson={'yes' if fast_json.orjson_available() else 'no'}, best of {args.rounds} rounds"
+    )
+
+    print("decode (all pages):")
+    stdlib = _bench("stdlib", lambda: [json.loads(p.decode("utf-8")) for p in pages], args.rounds)
+    fast = _bench("fast_json", lambda: [fast_json.loads(p) for p in pages], args.rounds)
+    print(f"  speedup {stdlib / fast:.2f}x")
+
+    variables = _variables()
+    print("per-page variable copy (x1000):")
+    deep = _bench("json-copy", lambda: [json.loads(json.dumps(variables)) for _ in range(1000)], args.rounds)
+    shallow = _bench(
+        "options",
+        lambda: [{**variables, "options": {**variables["options"], "serverToken": "t"}} for _ in range(1000)],
+        args.rounds
+    )
+    print(f"  speedup {deep / shallow:.2f}x")
+
+    print("raw cache encode (all itineraries):")
+    enc_std = _bench(
+        "stdlib", lambda: json.dumps(raw, separators=(",", ":"), ensure_ascii=False).encode("utf-8"), args.rounds
+    )
+    enc_fast = _bench("fast_json", lambda: fast_json.dumps_bytes(raw), args.rounds)
+    print(f"  speedup {enc_std / enc_fast:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
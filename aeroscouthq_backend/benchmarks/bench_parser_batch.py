@@ -0,0 +1,71 @@
+"""
+批量行程解析微基准
+
+在录制的 Kiwi 响应（或合成数据）上对比：
+  - batch:     parse_itineraries，整页共享 PageLookups，model_construct 构建
+  - per-item:  逐条 parse_itinerary，每条使用独立的 PageLookups
+  - validated: 逐条解析后再经 Pydantic 完整校验（等价于旧解析器逐条构造模型的开销）
+
+用法（在 aeroscouthq_backend 目录下）:
+    python -m benchmarks.bench_parser_batch --payload logs/kiwi_responses/*.json
+    python -m benchmarks.bench_parser_batch --count 500
+"""
+
+import argparse
+import time
+from typing import Callable, List
+
+from app.apis.v1 import schemas
+from app.core.itinerary_parser import parse_itineraries, parse_itinerary
+from benchmarks.fixtures import load_recorded_itineraries, make_itineraries
+
+
+def _bench(label: str, fn: Callable[[], int], total: int, rounds: int) -> float:
+    best = float("inf")
+    parsed = 0
+    for _ in range(rounds):
+        start = time.perf_counter()
+        parsed = fn()
+        best = min(best, time.perf_counter() - start)
+    per_item_us = best / total * 1e6
+    print(f"{label:<12} {per_item_us:>10.1f} µs/itinerary  (parsed {parsed}/{total})")
+    return per_item_us
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--payload", nargs="*", default=[], help="录制的 Kiwi 响应 JSON 文件")
+    parser.add_argument("--count", type=int, default=500, help="未提供录制文件时生成的合成行程数")
+    parser.add_argument("--rounds", type=int, default=7, help="重复轮数，取最快一轮")
+    parser.add_argument("--return-trip", action="store_true", help="按往返行程解析")
+    args = parser.parse_args()
+
+    is_one_way = not args.return_trip
+    raw: List[dict] = load_recorded_itineraries(args.payload) if args.payload else make_itineraries(args.count, is_one_way)
+    if not raw:
+        raise SystemExit("录制文件中没有行程数据")
+    print(f"{len(raw)} itineraries ({'recorded' if args.payload else 'synthetic'}), best of {args.rounds} rounds")
+
+    def batch() -> int:
+        return len(parse_itineraries(raw, is_one_way, "CNY"))
+
+    def per_item() -> int:
+        return sum(1 for it in raw if parse_itinerary(it, is_one_way, "CNY") is not None)
+
+    def validated() -> int:
+        count = 0
+        for it in raw:
+            parsed = parse_itinerary(it, is_one_way, "CNY")
+            if parsed is not None:
+                schemas.FlightItinerary.model_validate(parsed.model_dump())
+                count += 1
+        return count
+
+    batch_us = _bench("batch", batch, len(raw), args.rounds)
+    _bench("per-item", per_item, len(raw), args.rounds)
+    validated_us = _bench("validated", validated, len(raw), args.rounds)
+    print(f"batch speedup vs validated: {validated_us / batch_us:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+搜索任务结果负载基准
+
+用解析后的合成/录制行程组装 FlightSearchResponse，对比每次轮询 /tasks/results/{task_id} 的代价：
+  - celery-json:  原方案，完整结果以 JSON 存在 Celery 结果后端，每次轮询 json.loads + 重新序列化响应
+  - zlib / zstd:  result_store 方案，结果编码压缩一次存入独立键，轮询时流式解压输出（不重建字典）
+
+输出存储/传输字节数、编码与轮询耗时、轮询峰值分配（tracemalloc）。
+
+用法（在 aeroscouthq_backend 目录下）:
+    python -m benchmarks.bench_result_payload --count 600
+    python -m benchmarks.bench_result_payload --payload logs/kiwi_responses/*.json
+"""
+
+import argparse
+import json
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+from app.core import result_store
+from app.core.itinerary_parser import parse_itineraries
+from benchmarks.fixtures import load_recorded_itineraries, make_itineraries
+
+
+def _build_response(raw: List[dict]) -> Dict[str, Any]:
+    flights = [flight.model_dump(mode="json") for flight in parse_itineraries(raw, True, "CNY")]
+    return {
+        "search_id": "bench",
+        "direct_flights": [flight for flight in flights if len(flight["segments"] or []) == 1],
+        "combo_deals": [flight for flight in flights if len(flight["segments"] or []) != 1],
+        "disclaimers": [],
+        "probe_details": None,
+    }
+
+
+def _bench(fn: Callable[[], Any], rounds: int) -> tuple:
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+def _drain(chunks) -> int:
+    """模拟 StreamingResponse 逐块写出"""
+    return sum(len(chunk) for chunk in chunks)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--payload", nargs="*", default=[], help="录制的 Kiwi 响应 JSON 文件")
+    parser.add_argument("--count", type=int, default=600, help="未提供录制文件时生成的合成行程数")
+    parser.add_argument("--rounds", type=int, default=7, help="重复轮数，取最快一轮")
+    args = parser.parse_args()
+
+    raw = load_recorded_itineraries(args.payload) if args.payload else make_itineraries(args.count)
+    response = _build_response(raw)
+    plain = json.dumps(response)
+    print(
+        f"{len(response['direct_flights'])} direct / {len(response['combo_deals'])} combo flights "
+        f"({'recorded' if args.payload else 'synthetic'}), best of {args.rounds} rounds"
+    )
+    print(f"  {'format':<12} {'stored':>10} {'encode':>10} {'poll':>10} {'poll peak':>12}")
+
+    # 原方案：Celery JSON 序列化，轮询时反序列化再由 FastAPI 重新序列化
+    encode_s, _ = _bench(lambda: json.dumps(response), args.rounds)
+    poll_s, poll_peak = _bench(lambda: json.dumps({"result": json.loads(plain)}).encode(), args.rounds)
+    print(
+        f"  {'celery-json':<12} {len(plain.encode()) / 1024:>8.1f}KB {encode_s * 1000:>8.2f}ms "
+        f"{poll_s * 1000:>8.2f}ms {poll_peak / 1024:>10.1f}KB"
+    )
+
+    codecs = [result_store.CODEC_ZLIB] + ([result_store.CODEC_ZSTD] if result_store.zstandard is not None else [])
+    for codec in codecs:
+        blob = result_store.encode_result(response, codec)
+        encode_s, _ = _bench(lambda: result_store.encode_result(response, codec), args.rounds)
+        poll_s, poll_peak = _bench(lambda: _drain(result_store.iter_decoded_json(blob)), args.rounds)
+        print(
+            f"  {codec:<12} {len(blob) / 1024:>8.1f}KB {encode_s * 1000:>8.2f}ms "
+            f"{poll_s * 1000:>8.2f}ms {poll_peak / 1024:>10.1f}KB"
+        )
+    if result_store.zstandard is None:
+        print("  (zstandard 未安装，跳过 zstd)")
+
+
+if __name__ == "__main__":
+    main()
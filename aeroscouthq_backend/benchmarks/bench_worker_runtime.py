@@ -0,0 +1,91 @@
+"""
+Celery 任务事件循环吞吐基准
+
+模拟 worker 连续执行 N 个任务，每个任务通过 kiwi_client_manager 的共享客户端发起若干请求，对比：
+  - asyncio.run:     每个任务新建/销毁事件循环，客户端随循环重建（连接池不跨任务复用）
+  - worker_runtime:  进程级长期事件循环，客户端与 keep-alive 连接跨任务复用
+
+默认请求本地 HTTP 服务（排除上游波动，只度量循环/连接建立开销）；--url 可指向任意 HTTPS 端点，
+此时 TLS 握手开销会体现在 asyncio.run 一侧。
+
+用法（在 aeroscouthq_backend 目录下）:
+    python -m benchmarks.bench_worker_runtime --tasks 200 --requests 5
+    python -m benchmarks.bench_worker_runtime --tasks 50 --url https://api.skypicker.com/umbrella/v2/graphql
+"""
+
+import argparse
+import asyncio
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+
+from app.core.config import settings
+from app.core.kiwi_client import kiwi_client_manager
+from app.core.worker_runtime import worker_runtime
+
+
+class _OkHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = b'{"ok":true}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _start_local_server() -> str:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _OkHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}/"
+
+
+async def _task_body(url: str, requests: int) -> None:
+    """模拟一个任务：取共享客户端并发请求若干次"""
+    client = kiwi_client_manager.get_client()
+    await asyncio.gather(*(client.get(url, timeout=10.0) for _ in range(requests)))
+
+
+def _bench(label: str, runner: Callable, url: str, tasks: int, requests: int) -> float:
+    start = time.perf_counter()
+    for _ in range(tasks):
+        runner(_task_body(url, requests))
+    elapsed = time.perf_counter() - start
+    print(f"  {label:<15} {tasks / elapsed:>9.1f} tasks/s   {elapsed / tasks * 1000:>8.2f} ms/task")
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=200, help="模拟任务数")
+    parser.add_argument("--requests", type=int, default=5, help="每个任务的并发请求数")
+    parser.add_argument("--url", default=None, help="请求地址（默认启动本地 HTTP 服务）")
+    args = parser.parse_args()
+
+    url: Optional[str] = args.url or _start_local_server()
+    print(f"{args.tasks} tasks x {args.requests} requests -> {url}")
+
+    # 基准只比较事件循环/客户端生命周期，不连接 Redis 与数据库
+    worker_runtime._startup = kiwi_client_manager.initialize
+
+    per_task = _bench("asyncio.run", asyncio.run, url, args.tasks, args.requests)
+    kiwi_client_manager.reset()
+
+    settings.CELERY_PERSISTENT_LOOP_ENABLED = True
+    worker_runtime.start()
+    try:
+        persistent = _bench("worker_runtime", worker_runtime.run, url, args.tasks, args.requests)
+    finally:
+        worker_runtime.shutdown()
+    print(f"  speedup {per_task / persistent:.2f}x  (runtime stats: {worker_runtime.get_stats()})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+基准测试用的合成 Kiwi 原始行程数据
+结构与 ONEWAY_QUERY_TEMPLATE / RETURN_QUERY_TEMPLATE 返回的 itineraries 字段一致
+"""
+
+import json
+import random
+from datetime import datetime, timedelta
+from typing import List
+
+_AIRPORTS = [
+    ("PEK", "Beijing Capital", "Beijing"),
+    ("PVG", "Shanghai Pudong", "Shanghai"),
+    ("CAN", "Guangzhou Baiyun", "Guangzhou"),
+    ("HKG", "Hong Kong International", "Hong Kong"),
+    ("NRT", "Narita International", "Tokyo"),
+    ("ICN", "Incheon International", "Seoul"),
+    ("SIN", "Changi", "Singapore"),
+    ("LHR", "Heathrow", "London"),
+]
+_CARRIERS = [("CA", "Air China"), ("MU", "China Eastern"), ("CX", "Cathay Pacific"), ("SQ", "Singapore Airlines")]
+
+
+def _station(code: str, name: str, city: str) -> dict:
+    return {"name": name, "code": code, "city": {"name": city}}
+
+
+def make_segment(rng: random.Random, origin: tuple, destination: tuple, departure: datetime, hidden: bool) -> dict:
+    """生成一个 sectorSegments 元素"""
+    duration = rng.randint(60, 720) * 60
+    arrival = departure + timedelta(seconds=duration)
+    carrier = rng.choice(_CARRIERS)
+    segment = {
+        "source": {
+            "localTime": departure.strftime("%Y-%m-%dT%H:%M:%S"),
+            "utcTimeIso": departure.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "station": _station(*origin),
+        },
+        "destination": {
+            "localTime": arrival.strftime("%Y-%m-%dT%H:%M:%S"),
+            "utcTimeIso": arrival.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "station": _station(*destination),
+        },
+        "code": f"{carrier[0]}{rng.randint(100, 9999)}",
+        "duration": duration,
+        "carrier": {"name": carrier[1], "code": carrier[0]},
+        "operatingCarrier": {"name": carrier[1], "code": carrier[0]},
+        "cabinClass": "ECONOMY",
+    }
+    if hidden:
+        segment["hiddenDestination"] = {"code": destination[0], "name": destination[1]}
+    return {"segment": segment, "layover": {"duration": rng.randint(3600, 14400), "isBaggageRecheck": rng.random() < 0.2}}
+
+
+def make_sector(rng: random.Random, segments: int, departure: datetime, hidden: bool) -> dict:
+    """生成一个 sector / outbound / inbound 结构"""
+    route = rng.sample(_AIRPORTS, segments + 1)
+    sector_segments = []
+    current = departure
+    for i in range(segments):
+        sector_segments.append(make_segment(rng, route[i], route[i + 1], current, hidden and i == segments - 1))
+        current += timedelta(hours=rng.randint(4, 10))
+    return {"duration": int((current - departure).total_seconds()), "sectorSegments": sector_segments}
+
+
+def make_itinerary(rng: random.Random, index: int, is_one_way: bool = True) -> dict:
+    """生成一条原始行程"""
+    departure = datetime(2025, 6, 1, 8, 0) + timedelta(hours=rng.randint(0, 72))
+    hidden = rng.random() < 0.3
+    price = round(rng.uniform(800, 9000), 2)
+    itinerary = {
+        "__typename": "ItineraryOneWay" if is_one_way else "ItineraryReturn",
+        "id": f"bench-itinerary-{index}",
+        "shareId": f"share-{index}",
+        "price": {"amount": str(price), "priceBeforeDiscount": str(price)},
+        "priceEur": {"amount": str(round(price / 7.8, 2))},
+        "provider": {"name": "Kiwi.com", "code": "KIWI"},
+        "duration": rng.randint(4, 30) * 3600,
+        "pnrCount": rng.choice([1, 1, 1, 2]),
+        "travelHack": {"isTrueHiddenCity": hidden and rng.random() < 0.5, "isVirtualInterlining": False, "isThrowawayTicket": False},
+        "bookingOptions": {"edges": [{"node": {
+            "token": f"token-{index}", "bookingUrl": f"/booking?token=token-{index}",
+            "price": {"amount": str(price)}, "priceEur": {"amount": str(round(price / 7.8, 2))}
+        }}]},
+    }
+    if is_one_way:
+        itinerary["sector"] = make_sector(rng, rng.randint(1, 3), departure, hidden)
+    else:
+        itinerary["outbound"] = make_sector(rng, rng.randint(1, 3), departure, hidden)
+        itinerary["inbound"] = make_sector(rng, rng.randint(1, 3), departure + timedelta(days=7), False)
+    return itinerary
+
+
+def make_itineraries(count: int, is_one_way: bool = True, seed: int = 42) -> List[dict]:
+    """生成 count 条可复现的原始行程"""
+    rng = random.Random(seed)
+    return [make_itinerary(rng, i, is_one_way) for i in range(count)]
+
+
+def load_recorded_itineraries(paths: List[str]) -> List[dict]:
+    """读取录制的 Kiwi 响应文件
+
+    支持完整的 GraphQL 响应（data.onewayItineraries / data.returnItineraries）
+    或直接保存的 itineraries 列表。
+    """
+    itineraries: List[dict] = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            payload = json.load(f)
+        if isinstance(payload, list):
+            itineraries.extend(payload)
+            continue
+        data = payload.get("data") or {}
+        for key in ("onewayItineraries", "returnItineraries"):
+            if key in data:
+                itineraries.extend(data[key].get("itineraries") or [])
+    return itineraries
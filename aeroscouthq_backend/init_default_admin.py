@@ -33,7 +33,12 @@ async def create_default_admin():
         # 检查管理员账户是否已存在
         existing_admin = await user_crud.get_user_by_email(DEFAULT_ADMIN_EMAIL)
         if existing_admin:
-            print(f"[WARNING] 管理员账户 {DEFAULT_ADMIN_EMAIL} 已存在，跳过创建")
+            if existing_admin["is_admin"] and existing_admin["is_active"]:
+                print(f"[WARNING] 管理员账户 {DEFAULT_ADMIN_EMAIL} 已存在，跳过创建")
+            else:
+                # 经 user_crud 更新标记，同时失效该用户的认证缓存，新权限立即生效
+                await user_crud.update_user_flags(existing_admin["id"], is_active=True, is_admin=True)
+                print(f"[SUCCESS] 账户 {DEFAULT_ADMIN_EMAIL} 已存在，已恢复启用状态与管理员权限")
             return
 
         # 创建默认邀请码（如果需要）
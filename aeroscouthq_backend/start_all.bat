@@ -65,7 +65,7 @@ start "AeroScout Uvicorn" cmd /c "python -m uvicorn app.main:app --reload --host
 REM 启动Celery工作进程
 echo.
 echo 启动Celery工作进程...
-start "AeroScout Celery" cmd /c "python -m celery -A app.celery_worker worker --loglevel=info -Q main-queue"
+start "AeroScout Celery" cmd /c "python -m celery -A app.celery_worker worker --loglevel=info -Q session-queue,main-queue,probe-queue"
 
 echo.
 echo AeroScout后端服务已启动
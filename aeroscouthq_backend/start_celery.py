@@ -22,9 +22,9 @@ def check_redis():
         print(f"检查Redis状态时出错: {e}")
         return False
 
-def start_celery_worker():
-    """启动Celery工作进程"""
-    print("正在启动Celery工作进程...")
+def start_celery_worker(queue, concurrency):
+    """启动消费指定队列的Celery工作进程"""
+    print(f"正在启动Celery工作进程 (队列: {queue}, 并发: {concurrency})...")
     try:
         # 使用Python解释器启动Celery工作进程
         celery_cmd = [
@@ -33,17 +33,25 @@ def start_celery_worker():
             "-A", "app.celery_worker",
             "worker",
             "--loglevel=info",
-            "-Q", "main-queue"
+            "-Q", queue,
+            "--concurrency", str(concurrency),
+            "-n", f"{queue}@%h"
         ]
         
         # 启动Celery工作进程
         process = subprocess.Popen(celery_cmd, cwd=os.getcwd())
-        print(f"Celery工作进程已启动，PID: {process.pid}")
+        print(f"Celery工作进程已启动 ({queue})，PID: {process.pid}")
         return process
     except Exception as e:
-        print(f"启动Celery工作进程时出错: {e}")
+        print(f"启动Celery工作进程时出错 ({queue}): {e}")
         return None
 
+def start_celery_workers():
+    """按队列启动独立的工作进程池（会话刷新 / 交互式搜索 / 后台探测互不抢占）"""
+    from app.celery_worker import WORKER_POOLS
+    processes = [start_celery_worker(queue, concurrency) for queue, concurrency in WORKER_POOLS.items()]
+    return [process for process in processes if process]
+
 def main():
     """主函数"""
     print("AeroScout Celery工作进程启动脚本")
@@ -64,9 +72,9 @@ def main():
             return
     
     # 启动Celery工作进程
-    celery_process = start_celery_worker()
-    if celery_process:
-        print("\nCelery工作进程已启动")
+    celery_processes = start_celery_workers()
+    if celery_processes:
+        print(f"\n已启动 {len(celery_processes)} 个Celery工作进程")
         print("按Ctrl+C停止Celery工作进程")
         try:
             # 保持脚本运行，直到用户按Ctrl+C
@@ -74,8 +82,10 @@ def main():
                 time.sleep(1)
         except KeyboardInterrupt:
             print("\n正在停止Celery工作进程...")
-            celery_process.terminate()
-            celery_process.wait()
+            for celery_process in celery_processes:
+                celery_process.terminate()
+            for celery_process in celery_processes:
+                celery_process.wait()
             print("Celery工作进程已停止")
     else:
         print("无法启动Celery工作进程")